@@ -4,6 +4,7 @@ import logging
 from PIL import Image
 from .visual_analysis_agent import VisualAnalysisAgent
 from .market_intelligence_agent import MarketIntelligenceAgent
+from app.services.tracing import traced
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +23,7 @@ class ListingGenerator:
         self.market_agent = MarketIntelligenceAgent()
         logger.info("✅ ListingGenerator Initialized")
 
+    @traced("agent.listing.generate")
     def generate_listing(self, image: Image.Image) -> dict:
         """
         Full flow: Image -> Listing (with Price & Metadata)
@@ -66,6 +68,7 @@ class ListingGenerator:
 
         return final_listing
 
+    @traced("agent.listing.refine")
     def refine_listing(self, product_name: str, condition: str = "good") -> dict:
         """
         Refine listing based on text input (e.g. user edits title).
@@ -10,6 +10,7 @@ except ImportError:
     from duckduckgo_search import DDGS
     
 from googlesearch import search as google_search
+from app.services.tracing import traced
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -40,6 +41,7 @@ class MarketIntelligenceAgent:
         
         logger.info("✅ MarketIntelligenceAgent Initialized")
 
+    @traced("agent.market.find_price_and_stock")
     def find_price_and_stock(self, product_name: str, condition: str = "good") -> dict:
         """
         Main entry point to find price intelligence.
@@ -84,6 +86,7 @@ class MarketIntelligenceAgent:
             "context": search_results
         }
 
+    @traced("groq.knowledge")
     def _ask_groq_knowledge(self, product_name: str, condition: str) -> str:
         """
         Tertiary fallback: Ask Groq (Llama 3) based on its training data.
@@ -121,6 +124,7 @@ class MarketIntelligenceAgent:
             logger.error(f"   ❌ Groq Knowledge Failed: {e}")
             return None
 
+    @traced("gemini.knowledge")
     def _ask_gemini_knowledge(self, product_name: str, condition: str) -> str:
         """
         Quaternary fallback: Ask Gemini LLM directly based on its training data.
@@ -161,6 +165,7 @@ class MarketIntelligenceAgent:
             logger.error(f"   ❌ Gemini Knowledge Failed: {e}")
             return None
 
+    @traced("duckduckgo.search")
     def _search_duckduckgo(self, query: str) -> str:
         """
         Primary search method using DuckDuckGo.
@@ -180,6 +185,7 @@ class MarketIntelligenceAgent:
             logger.error(f"   ❌ DDGS Failed: {e}")
             return None
 
+    @traced("google.search")
     def _search_google(self, query: str) -> str:
         """
         Secondary search method using Google Search (unofficial).
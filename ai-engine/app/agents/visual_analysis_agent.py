@@ -9,6 +9,7 @@ from PIL import Image
 from google import genai
 from google.genai import types
 from groq import Groq
+from app.services.tracing import traced
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -41,6 +42,7 @@ class VisualAnalysisAgent:
             except Exception as e:
                  logger.warning(f"⚠️ VisualAnalysisAgent: Groq Init Failed: {e}")
 
+    @traced("agent.visual.analyze")
     def analyze(self, image: Image.Image) -> dict:
         """
         Analyze the image and return structured product data.
@@ -88,6 +90,7 @@ class VisualAnalysisAgent:
 
         return {"error": "Visual Analysis failed on all providers"}
 
+    @traced("groq.vision")
     def _analyze_with_groq(self, image: Image.Image, prompt: str) -> dict:
         """
         Execute analysis using Groq's Llama 3.2 Vision model.
@@ -2,13 +2,16 @@ import os
 import psutil
 from functools import lru_cache
 
-# torch is optional — only available in local/GPU environments
-try:
-    import torch
-    _TORCH_AVAILABLE = True
-except ImportError:
-    torch = None
-    _TORCH_AVAILABLE = False
+
+def _torch():
+    """torch if installed (optional — only in local/GPU environments). Imported
+    on first use: every module imports config, and torch costs seconds."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
 
 class Settings:
     PROJECT_NAME: str = "Guardian AI Engine"
@@ -21,6 +24,128 @@ class Settings:
     # Feature Flags
     ENABLE_MPS: bool = True  # Enable Apple Silicon GPU
 
+    # Async Job API (long studio pipelines)
+    # "memory" = in-process queues, "local" = SQLite broker shared by all workers on the host
+    JOB_BROKER: str = os.getenv("JOB_BROKER", "memory")
+    JOB_BROKER_PATH: str = os.getenv("JOB_BROKER_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+    JOB_QUEUE_SIZE: int = int(os.getenv("JOB_QUEUE_SIZE", "8"))  # max queued jobs per device
+    JOB_GPU_WORKERS: int = int(os.getenv("JOB_GPU_WORKERS", "1"))
+    JOB_CPU_WORKERS: int = int(os.getenv("JOB_CPU_WORKERS", "2"))
+    JOB_RETENTION: int = int(os.getenv("JOB_RETENTION", "200"))  # finished jobs kept for polling
+    # SQLite broker: a running job whose worker stops renewing its claim for this long is requeued
+    JOB_LEASE_S: float = float(os.getenv("JOB_LEASE_S", "60"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))  # claims before a lost job fails instead
+
+    # Inference Executor (GPU owner thread per device + CPU process pool + I/O threads)
+    INFERENCE_CPU_WORKERS: int = int(os.getenv("INFERENCE_CPU_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+    INFERENCE_IO_WORKERS: int = int(os.getenv("INFERENCE_IO_WORKERS", "8"))
+    # Max concurrent calls per model, e.g. "stock=2,gemini=2" (unlisted models: lane limit only)
+    INFERENCE_MODEL_LIMITS: str = os.getenv("INFERENCE_MODEL_LIMITS", "stock=2,gemini=2,listing=2")
+
+    # BiRefNet dynamic micro-batching (opt-in): concurrent segmentation requests
+    # arriving within the window share one batched forward pass
+    BIREFNET_BATCHING: bool = os.getenv("BIREFNET_BATCHING", "0").lower() in ("1", "true", "yes")
+    BIREFNET_BATCH_WINDOW_MS: float = float(os.getenv("BIREFNET_BATCH_WINDOW_MS", "10"))
+    BIREFNET_MAX_BATCH: int = int(os.getenv("BIREFNET_MAX_BATCH", "4"))
+    # BiRefNet serving mode: a variant (massive, general, general-lite, base),
+    # optionally "-int8" (dynamic int8 Linear layers, CPU only). Requests can
+    # ask for another mode. See benchmarks/bench_birefnet_variants.py.
+    BIREFNET_MODE: str = os.getenv("BIREFNET_MODE", "massive")
+    BIREFNET_CPU_MODE: str = os.getenv("BIREFNET_CPU_MODE", "general-lite-int8")
+    # Precision / kernels for the torch backend: "auto" (per device: float16 +
+    # channels_last on CUDA, float32 on MPS/CPU) or overrides over it, e.g.
+    # "dtype=bfloat16,compile=max-autotune" (keys: dtype, channels_last, compile, cudnn_benchmark, tf32)
+    BIREFNET_POLICY: str = os.getenv("BIREFNET_POLICY", "auto")
+    # Coarse-to-fine: photos of at least BIREFNET_REFINE_MIN_MP megapixels get a
+    # native-resolution pass over tiles along the uncertain mask boundary
+    BIREFNET_REFINE: bool = os.getenv("BIREFNET_REFINE", "1").lower() in ("1", "true", "yes")
+    BIREFNET_REFINE_MIN_MP: float = float(os.getenv("BIREFNET_REFINE_MIN_MP", "4"))
+    BIREFNET_REFINE_MAX_TILES: int = int(os.getenv("BIREFNET_REFINE_MAX_TILES", "12"))
+    # "torch" or "onnx" (exported graph on onnxruntime; python -m app.services.birefnet_onnx export ...)
+    BIREFNET_BACKEND: str = os.getenv("BIREFNET_BACKEND", "torch")
+    BIREFNET_ONNX_BATCH: str = os.getenv("BIREFNET_ONNX_BATCH", "1")  # fixed batch size, or "dynamic"
+    # onnxruntime threads per session; 0 = one per physical core
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+    ONNX_INTER_OP_THREADS: int = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
+    # rembg sessions (onnx_session_pool): sessions per model and intra-op threads per session;
+    # 0 = sized to the cores (one session per two cores, at most 4; the cores split between them)
+    REMBG_SESSIONS: int = int(os.getenv("REMBG_SESSIONS", "0"))
+    REMBG_SESSION_THREADS: int = int(os.getenv("REMBG_SESSION_THREADS", "0"))
+
+    # Content-addressed result cache for studio outputs (memory LRU + disk)
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+    RESULT_CACHE_DIR: str = os.getenv("RESULT_CACHE_DIR", os.path.join(CACHE_DIR, "results"))
+    RESULT_CACHE_MEMORY_MB: int = int(os.getenv("RESULT_CACHE_MEMORY_MB", "256"))
+    RESULT_CACHE_DISK_MB: int = int(os.getenv("RESULT_CACHE_DISK_MB", "2048"))
+    RESULT_CACHE_TTL_S: int = int(os.getenv("RESULT_CACHE_TTL_S", str(24 * 3600)))
+
+    # Segmentation cache: masks keyed by a perceptual hash of the decoded pixels, shared across endpoints
+    SEGMENTATION_CACHE_ENABLED: bool = os.getenv("SEGMENTATION_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+    SEGMENTATION_CACHE_DIR: str = os.getenv("SEGMENTATION_CACHE_DIR", os.path.join(CACHE_DIR, "segmentation"))
+    SEGMENTATION_CACHE_MEMORY_MB: int = int(os.getenv("SEGMENTATION_CACHE_MEMORY_MB", "64"))
+    SEGMENTATION_CACHE_DISK_MB: int = int(os.getenv("SEGMENTATION_CACHE_DISK_MB", "1024"))
+    SEGMENTATION_CACHE_TTL_S: int = int(os.getenv("SEGMENTATION_CACHE_TTL_S", str(7 * 24 * 3600)))
+    # Max mean abs difference (0-255) between 32x32 thumbnails for a hash match to count as the same photo
+    SEGMENTATION_CACHE_MAX_DIFF: float = float(os.getenv("SEGMENTATION_CACHE_MAX_DIFF", "2.0"))
+
+    # Models stored already converted to their target dtype (safetensors,
+    # memory-mapped at load). Pre-populate with python -m app.services.artifact_cache
+    ARTIFACT_CACHE_ENABLED: bool = os.getenv("ARTIFACT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+    ARTIFACT_CACHE_DIR: str = os.getenv("ARTIFACT_CACHE_DIR", os.path.join(CACHE_DIR, "artifacts"))
+
+    # `python main.py --profile-startup` fails above this cold-import time
+    STARTUP_IMPORT_BUDGET_MS: float = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "3000"))
+
+    # Prometheus-style /metrics (near no-op when off)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+    # Request tracing: every request is traced in memory; written to TRACE_DIR
+    # for all requests when enabled, otherwise only when the client sends a debug id
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "0").lower() in ("1", "true", "yes")
+    TRACE_DIR: str = os.getenv("TRACE_DIR", os.path.join("debug_runs", "traces"))
+    TRACE_FORMAT: str = os.getenv("TRACE_FORMAT", "chrome")  # "chrome" or "otlp"
+
+    # Shared model host for multi-worker deployments (python -m app.services.model_host).
+    # Empty address = every worker loads its own models in-process.
+    MODEL_HOST_ADDRESS: str = os.getenv("MODEL_HOST_ADDRESS", "")  # unix socket path
+    # Empty = the host generates a random key per launch (<address>.key, 0600) that workers read
+    MODEL_HOST_AUTHKEY: str = os.getenv("MODEL_HOST_AUTHKEY", "")
+    MODEL_HOST_RING_MB: int = int(os.getenv("MODEL_HOST_RING_MB", "128"))  # shared memory per worker
+    MODEL_HOST_TIMEOUT_S: float = float(os.getenv("MODEL_HOST_TIMEOUT_S", "120"))
+
+    # Model residency budgets (model_registry). 0 = auto: 90% of CUDA device 0 /
+    # 60% of system RAM. On MPS/CPU the accelerator models count against RAM.
+    MODEL_VRAM_BUDGET_MB: int = int(os.getenv("MODEL_VRAM_BUDGET_MB", "0"))
+    MODEL_RAM_BUDGET_MB: int = int(os.getenv("MODEL_RAM_BUDGET_MB", "0"))
+
+    # Evicted CUDA models that were requested within the last MODEL_MIX_WINDOW
+    # acquires wait in pinned host RAM (0 = 25% of system RAM) instead of
+    # being unloaded, so bringing them back is a copy rather than a reload.
+    MODEL_HOST_TIER_ENABLED: bool = os.getenv("MODEL_HOST_TIER_ENABLED", "1").lower() in ("1", "true", "yes")
+    MODEL_HOST_TIER_MB: int = int(os.getenv("MODEL_HOST_TIER_MB", "0"))
+    MODEL_MIX_WINDOW: int = int(os.getenv("MODEL_MIX_WINDOW", "200"))
+
+    # Startup warmup (warmup_service): "model@shape[,shape]; ..." with shapes WxH
+    # or N, optionally *batch, e.g. "u2netp@512; birefnet@1024*1,1024*4;
+    # realesrgan@256,512; clipseg@352". /ready answers 503 until it finishes.
+    WARMUP_PLAN: str = os.getenv("WARMUP_PLAN", "u2netp@512")
+    CUDNN_BENCHMARK: bool = os.getenv("CUDNN_BENCHMARK", "1").lower() in ("1", "true", "yes")
+
+    # Admission control on memory pressure (max of cgroup/host RAM and VRAM use):
+    # lighter model variants from DEGRADE_AT, new requests wait from QUEUE_AT,
+    # 503 from SHED_AT (or after waiting MEMORY_QUEUE_TIMEOUT_S)
+    ADMISSION_CONTROL_ENABLED: bool = os.getenv("ADMISSION_CONTROL_ENABLED", "1").lower() in ("1", "true", "yes")
+    MEMORY_SAMPLE_INTERVAL_S: float = float(os.getenv("MEMORY_SAMPLE_INTERVAL_S", "0.5"))
+    MEMORY_DEGRADE_AT: float = float(os.getenv("MEMORY_DEGRADE_AT", "0.80"))
+    MEMORY_QUEUE_AT: float = float(os.getenv("MEMORY_QUEUE_AT", "0.90"))
+    MEMORY_SHED_AT: float = float(os.getenv("MEMORY_SHED_AT", "0.97"))
+    MEMORY_QUEUE_TIMEOUT_S: float = float(os.getenv("MEMORY_QUEUE_TIMEOUT_S", "30"))
+    MEMORY_QUEUE_MAX: int = int(os.getenv("MEMORY_QUEUE_MAX", "16"))
+
+    # Read the next pipeline stage's weights into the page cache while the
+    # current stage runs (weight_prefetcher). Only files already on disk.
+    WEIGHT_PREFETCH_ENABLED: bool = os.getenv("WEIGHT_PREFETCH_ENABLED", "1").lower() in ("1", "true", "yes")
+
 @lru_cache()
 def get_settings():
     return Settings()
@@ -32,7 +157,8 @@ class DeviceConfig:
     """
     @staticmethod
     def get_device():
-        if not _TORCH_AVAILABLE:
+        torch = _torch()
+        if torch is None:
             return "cpu"
         if torch.cuda.is_available():
             print("🚀 Device: NVIDIA CUDA Detected")
@@ -62,7 +188,8 @@ class DeviceProfile:
     def get_profile() -> dict:
         mem_gb = round(psutil.virtual_memory().total / (1024**3), 1)
 
-        if not _TORCH_AVAILABLE:
+        torch = _torch()
+        if torch is None:
             return {
                 "device": "cpu",
                 "vram_gb": mem_gb,
@@ -2,16 +2,9 @@ from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from typing import Optional
 from app.services.central_brain import CentralBrainService
 from app.services.haggle_service import HaggleService, HaggleState
-try:
-    from app.services.turbo_service import turbo_service
-    from app.services.qwen_service import qwen_service
-except Exception as e:
-    print(f"⚠️  Brain missing GPU services (no torch): {e}")
-    turbo_service = None
-    qwen_service = None
-
-from app.services.gemini_analysis_service import gemini_analysis_service
-from app.services.stock_service import stock_service
+# GPU services (turbo, qwen) and stock search are imported on first use
+from app.services.service_registry import services
+from app.utils.image_result import encode_for_json
 import logging
 
 # Configure Logging
@@ -87,6 +80,7 @@ async def edit_image_fast(
     strength = plan.get("refining_strength") or 0.65
     
     # 3. Call Turbo Service (Hybrid Pipeline)
+    turbo_service = services.require("turbo")
     result_path = await turbo_service.agentic_edit(
         image, 
         target, 
@@ -119,7 +113,7 @@ async def edit_image_smart(
     Agentic Vision (Local Smart)
     """
     thought = CentralBrainService.think(user_input)
-    result_path = await qwen_service.edit(image, user_input)
+    result_path = await services.require("qwen").edit(image, user_input)
 
     return {
         "mode": "Smart Lane (Qwen)",
@@ -130,18 +124,25 @@ async def edit_image_smart(
 
 # --- 4. System / Memory Management ---
 @router.post("/unload")
-async def unload_resources(target: str = "all"):
+async def unload_resources(target: str = "all", tier: Optional[str] = None):
+    """tier: "host" keeps SDXL in pinned RAM for a fast comeback, "disk" drops it; default per request mix."""
     import gc
+    if tier not in (None, "host", "disk"):
+        raise HTTPException(status_code=400, detail="tier must be 'host' or 'disk'")
     status = []
     
+    # Only services that are already loaded; unloading shouldn't import torch
+    turbo_service = services.loaded("turbo")
+    qwen_service = services.loaded("qwen")
+
     if target in ["sdxl", "all"]:
-        if turbo_service.pipeline:
-            del turbo_service.pipeline
-            turbo_service.pipeline = None
-            status.append("SDXL Unloaded")
+        if turbo_service is not None:
+            from app.services.model_registry import model_registry
+            if model_registry.evict("turbo", to=tier):
+                status.append("SDXL Demoted to host RAM" if model_registry.is_demoted("turbo") else "SDXL Unloaded")
             
     if target in ["qwen", "all"]:
-        if qwen_service.pipeline:
+        if qwen_service is not None and qwen_service.pipeline:
             del qwen_service.pipeline
             qwen_service.pipeline = None
             status.append("Qwen Unloaded")
@@ -158,6 +159,8 @@ async def unload_resources(target: str = "all"):
 
 @router.get("/status")
 async def get_brain_status():
+    turbo_service = services.loaded("turbo")
+    qwen_service = services.loaded("qwen")
     return {
         "sdxl_loaded": turbo_service is not None and getattr(turbo_service, 'pipeline', None) is not None,
         "qwen_loaded": qwen_service is not None and getattr(qwen_service, 'pipeline', None) is not None
@@ -190,14 +193,14 @@ async def analyze_image(image: UploadFile = File(...)):
             logger.error(f"DEBUG: Pillow failed to open image: {e}")
             raise e
         
-        from starlette.concurrency import run_in_threadpool
+        from app.services.inference_executor import inference_executor
         from app.agents.listing_generator import ListingGenerator
         
         # Initialize Supervisor
         supervisor = ListingGenerator()
         
         # Run full multi-agent flow
-        result = await run_in_threadpool(supervisor.generate_listing, pil_image)
+        result = await inference_executor.run_io("listing", supervisor.generate_listing, pil_image)
         
         return {"status": "success", "analysis": result}
     except Exception as e:
@@ -212,8 +215,9 @@ async def get_stock_image(query: str):
     """
     Fetch a stock image for the given query.
     """
-    result = stock_service.find_product_image(query)
+    from app.services.inference_executor import inference_executor
+    result = await inference_executor.run_io("stock", services.require("stock").find_product_image, query)
     if result:
-        return {"status": "success", "results": [result]} # Return as array for future expansion
+        return {"status": "success", "results": [encode_for_json(result)]} # Return as array for future expansion
     else:
         return {"status": "error", "message": "No image found"}
@@ -0,0 +1,154 @@
+"""
+Jobs Router - Async job API for the long studio pipelines
+
+SOTA V2, Local Enhanced and Plan B take 10-30s per image. Instead of holding
+the request open, clients submit a job (202 + job_id), then either poll
+GET /{job_id} or subscribe to GET /{job_id}/events (Server-Sent Events) for
+per-stage progress, and fetch the images from GET /{job_id}/result.
+"""
+import json
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.config import get_settings
+from app.services.job_service import JobStatus, QueueFullError, job_service
+
+router = APIRouter()
+
+
+async def _submit(pipeline: str, file: UploadFile, params: dict) -> JSONResponse:
+    contents = await file.read()
+    try:
+        job = await job_service.submit(pipeline, contents, params)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"{e.device} queue is full, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    base = f"{get_settings().API_V1_STR}/jobs/{job.id}"
+    return JSONResponse(status_code=202, content={
+        **job.to_dict(),
+        "links": {
+            "status": base,
+            "events": f"{base}/events",
+            "result": f"{base}/result",
+        }
+    })
+
+
+@router.post("/sota-v2")
+async def submit_sota_v2(
+    file: UploadFile = File(...),
+    remove_occlusions: bool = Form(True),
+    enable_relighting: bool = Form(True),
+    lighting_style: str = Form("soft_studio"),
+    enable_upscaling: bool = Form(True),
+    upscale_factor: int = Form(2),
+    custom_prompt: Optional[str] = Form(None)
+):
+    """Queue a SOTA V2 job (same parameters as /studio/v1/studio/process-sota-v2)."""
+    return await _submit("sota-v2", file, {
+        "enable_flux_regeneration": remove_occlusions,
+        "enable_relighting": enable_relighting,
+        "lighting_style": lighting_style,
+        "enable_upscaling": enable_upscaling,
+        "upscale_factor": upscale_factor,
+        "custom_prompt": custom_prompt,
+    })
+
+
+@router.post("/local-enhanced")
+async def submit_local_enhanced(
+    file: UploadFile = File(...),
+    enable_inpainting: bool = Form(True),
+    enable_relighting: bool = Form(True),
+    lighting_style: str = Form("soft_studio"),
+    enable_upscaling: bool = Form(True),
+    upscale_factor: int = Form(2)
+):
+    """Queue a Local Enhanced job (same parameters as /studio/v1/studio/process-local-enhanced)."""
+    return await _submit("local-enhanced", file, {
+        "enable_inpainting": enable_inpainting,
+        "enable_relighting": enable_relighting,
+        "lighting_style": lighting_style,
+        "enable_upscaling": enable_upscaling,
+        "upscale_factor": upscale_factor,
+    })
+
+
+@router.post("/plan-b")
+async def submit_plan_b(
+    file: UploadFile = File(...),
+    angles: str = Form("front,side,back"),
+    add_shadow: bool = Form(True),
+    upscale: bool = Form(True)
+):
+    """Queue a Plan B job (same parameters as /studio/process-3d-plan-b)."""
+    return await _submit("plan-b", file, {
+        "angles": [a.strip() for a in angles.split(",") if a.strip()],
+        "add_shadow": add_shadow,
+        "upscale": upscale,
+    })
+
+
+async def _get_job(job_id: str):
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Job status, timings and (once finished) the names of its result images."""
+    return (await _get_job(job_id)).to_dict()
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, after: int = 0):
+    """
+    Server-Sent Events stream: `status` and `stage` events until the job
+    finishes. Reconnecting clients pass `after=<last seq>` to resume.
+    """
+    await _get_job(job_id)
+
+    async def event_stream():
+        async for event in job_service.stream(job_id, after):
+            yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str, name: Optional[str] = None, return_binary: bool = False):
+    """
+    Result images. JSON by default ({name: data_uri, metadata}); with
+    return_binary=true the single image `name` (default: the first) as raw bytes.
+    """
+    job = await _get_job(job_id)
+    if job.status == JobStatus.FAILED:
+        raise HTTPException(status_code=500, detail=job.error or "Job failed")
+    if job.status != JobStatus.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    images = job.result["images"]
+    if return_binary:
+        key = name or next(iter(images))
+        if key not in images:
+            raise HTTPException(status_code=404, detail=f"No result image named '{key}'")
+        image = images[key]
+        return Response(content=image.data, media_type=image.media_type, headers={
+            "Content-Disposition": f"inline; filename={job.pipeline}_{key}.{image.extension}"
+        })
+
+    return {
+        "success": True,
+        "images": {key: image.to_data_uri() for key, image in images.items()},
+        "metadata": job.result["metadata"],
+    }
@@ -1,10 +1,24 @@
 """
 Studio Router - API endpoints for AI-powered product enhancement
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from typing import List, Optional
 from app.services.ai_pipeline import pipeline_service
-from app.services.stock_service import stock_service
+from app.services.service_registry import services
+from app.services.inference_executor import as_blocking, inference_executor
+from app.services.segmentation_batcher import segmentation_batcher
+from app.services.segmentation_cache import segmentation_cache
+from app.services.onnx_session_pool import onnx_session_pool
+from app.services.result_cache import CacheEntry, result_cache
+from app.services.model_host import model_host_client
+from app.services.admission_control import admission_controller, track_degradations
+from app.services.model_handles import model_handles
+from app.services.model_registry import model_registry
+from app.services.tracing import tracer
+from app.services.weight_prefetcher import weight_prefetcher
+from app.utils.image_context import ImageContext
+from app.utils.image_result import ImageResult, encode_for_json
 from pydantic import BaseModel
 from PIL import Image
 from io import BytesIO
@@ -12,6 +26,60 @@ import base64
 
 router = APIRouter()
 
+NO_CACHE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0"
+}
+
+
+# Cached routes: clients may keep the response but must revalidate with If-None-Match
+REVALIDATE_HEADERS = {
+    "Cache-Control": "no-cache"
+}
+
+
+def _image_response(image: ImageResult, filename: str, headers: dict = NO_CACHE_HEADERS) -> Response:
+    """Send an ImageResult as raw bytes (encoded once, never base64'd)."""
+    return Response(content=image.data, media_type=image.media_type, headers={
+        "Content-Disposition": f"inline; filename={filename}.{image.extension}",
+        **headers
+    })
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Strong If-None-Match comparison."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+def _cached_response(
+    request: Request,
+    entry: CacheEntry,
+    cache_status: str,
+    return_binary: bool,
+    filename: str,
+    json_body=encode_for_json
+) -> Response:
+    """
+    Respond from a result-cache entry: 304 when the client already has this
+    representation, otherwise raw image bytes or JSON, tagged with a strong ETag.
+    """
+    headers = {
+        # JSON hits say "cached": true, a different body from the miss that stored them
+        "ETag": entry.etag("bin" if return_binary else "json-hit" if cache_status == "HIT" else "json"),
+        "X-Cache": cache_status,
+        **REVALIDATE_HEADERS
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if return_binary:
+        return _image_response(entry.result["image_data"], filename, headers)
+    # Hits carry the timings of the run that made them: flag them so clients don't read them as this request's
+    return JSONResponse(content=json_body({**entry.result, "cached": cache_status == "HIT"}), headers=headers)
+
 
 @router.post("/v1/studio/process-local")
 async def process_local_plan_a(file: UploadFile = File(...)):
@@ -33,8 +101,8 @@ async def process_local_plan_a(file: UploadFile = File(...)):
         print(f"📥 Processing uploaded image: {image.size}")
 
         from app.services.local_pipeline import local_pipeline
-        # Run Plan A pipeline (synchronous)
-        result_image, metadata = local_pipeline.process(image)
+        # Run Plan A pipeline (synchronous) on the GPU owner thread
+        result_image, metadata = await inference_executor.run_gpu("local-pipeline", local_pipeline.process, image)
 
         # Convert to base64
         buffer = BytesIO()
@@ -105,8 +173,10 @@ async def process_plan_b(
         angle_list = [a.strip() for a in angles.split(",")]
         print(f"   📐 Angles: {angle_list}")
 
-        # Process through Plan B
-        rendered_views, metadata = await plan_b_pipeline.process(
+        # Process through Plan B (its model stages hop to the GPU owner thread themselves)
+        rendered_views, metadata = await inference_executor.run_io(
+            "plan-b",
+            as_blocking(plan_b_pipeline.process),
             image,
             angles=angle_list,
             add_shadow=add_shadow,
@@ -162,32 +232,24 @@ async def process_plan_b(
 
 @router.post("/fetch_stock")
 async def fetch_stock_image(
+    request: Request,
     product_name: str = Form(...),
     return_binary: bool = Form(True)
 ):
     """
     Finds a professional stock photo for the product.
     """
-    import base64
-    from fastapi.responses import Response
-    from starlette.concurrency import run_in_threadpool
+    key = result_cache.make_key("fetch_stock", product_name=product_name)
+    entry, cache_status = await result_cache.get(key), "HIT"
+    if entry is None:
+        cache_status = "MISS"
+        result = await inference_executor.run_io("stock", services.require("stock").find_product_image, product_name)
+        if not result:
+            return {"status": "error", "message": "No suitable stock image found"}
+        entry = await result_cache.put(key, result)
 
-    result = await run_in_threadpool(stock_service.find_product_image, product_name)
-    if result:
-        if return_binary:
-            # Decode the base64 string provided by service
-            # Format: "data:image/jpeg;base64,......"
-            b64_str = result["image_data"].split(",")[1]
-            b64_str = result["image_data"].split(",")[1]
-            return Response(content=base64.b64decode(b64_str), media_type="image/jpeg", headers={
-                "Content-Disposition": "inline; filename=stock.jpg",
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache", 
-                "Expires": "0"
-            })
-        return result
-        
-    return {"status": "error", "message": "No suitable stock image found"}
+    # Downloaded bytes go out untouched
+    return _cached_response(request, entry, cache_status, return_binary, "stock")
 
 
 @router.post("/refine_listing")
@@ -202,8 +264,6 @@ async def refine_listing(
     Uses Multi-Agent Supervisor.
     """
     from app.agents.listing_generator import ListingGenerator
-    from app.services.stock_service import stock_service
-    from starlette.concurrency import run_in_threadpool
 
     print(f"🔄 Refinement Triggered (Agent Mode): {product_name} ({condition})")
 
@@ -211,10 +271,11 @@ async def refine_listing(
     supervisor = ListingGenerator()
     
     # 1. Fetch Stock Image (Legacy Service for now, handled by Supervisor eventually)
-    stock_result = await run_in_threadpool(stock_service.find_product_image, product_name)
+    stock_result = await inference_executor.run_io("stock", services.require("stock").find_product_image, product_name)
 
     # 2. Re-calculate Price via Market Agent
-    market_data = await run_in_threadpool(
+    market_data = await inference_executor.run_io(
+        "listing",
         supervisor.refine_listing,
         product_name=product_name,
         condition=condition
@@ -227,7 +288,7 @@ async def refine_listing(
     }
     
     if stock_result:
-        response_data["stock_image"] = stock_result["image_data"]
+        response_data["stock_image"] = stock_result["image_data"].to_data_uri()
     
     return response_data
 
@@ -238,18 +299,9 @@ async def view_stock_image(product_name: str):
     Browser-friendly endpoint to view stock image directly.
     Usage: /api/v1/studio/stock_view?product_name=JBL%20Soundbar
     """
-    import base64
-    from fastapi.responses import Response
-
-    result = stock_service.find_product_image(product_name)
+    result = await inference_executor.run_io("stock", services.require("stock").find_product_image, product_name)
     if result:
-        b64_str = result["image_data"].split(",")[1]
-        return Response(content=base64.b64decode(b64_str), media_type="image/jpeg", headers={
-            "Content-Disposition": "inline; filename=stock.jpg",
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache", 
-            "Expires": "0"
-        })
+        return _image_response(result["image_data"], "stock")
         
     raise HTTPException(status_code=404, detail="Stock image not found")
 
@@ -291,39 +343,44 @@ async def generate_3d(
 
 @router.post("/showcase")
 async def create_showcase(
+    request: Request,
     file: UploadFile = File(...),
     background: str = Form("white"),  # white, gradient, transparent
     add_shadow: bool = Form(True),
-    return_binary: bool = Form(True)
+    return_binary: bool = Form(True),
+    segmentation: Optional[str] = Form(None)  # BiRefNet mode, e.g. massive, general-lite, general-lite-int8
 ):
     """
     Create a professional e-commerce showcase photo.
+    Identical uploads + params are served from the result cache (ETag / 304).
     """
-    import base64
-    from fastapi.responses import Response
-
+    if segmentation:
+        from app.services.birefnet_service import parse_mode
+        try:
+            parse_mode(segmentation)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
         content = await file.read()
-        result = await pipeline_service.create_showcase_photo(
-            image_bytes=content,
-            background=background,
-            add_shadow=add_shadow
+        key = result_cache.make_key(
+            "showcase", content,
+            background=background, add_shadow=add_shadow, output_size=(1024, 1024),
+            segmentation=segmentation or "default"
         )
-        
-        if return_binary:
-            try:
-                # Format: "data:image/png;base64,......"
-                b64_str = result["image_data"].split(",")[1]
-                return Response(content=base64.b64decode(b64_str), media_type="image/png", headers={
-                    "Content-Disposition": "inline; filename=showcase.png",
-                    "Cache-Control": "no-cache, no-store, must-revalidate",
-                    "Pragma": "no-cache", 
-                    "Expires": "0"
-                })
-            except:
-                pass # Fallback to JSON if parsing fails
-                
-        return result
+        entry, cache_status = await result_cache.get(key), "HIT"
+        if entry is None:
+            cache_status = "MISS"
+            with track_degradations() as degradations:
+                result = await pipeline_service.create_showcase_photo(
+                    image_context=ImageContext.from_bytes(content),
+                    background=background,
+                    add_shadow=add_shadow,
+                    segmentation=segmentation
+                )
+            # Output of a memory-pressure fallback is served, not cached under the normal key
+            entry = await result_cache.put(key, result, store=not degradations)
+
+        return _cached_response(request, entry, cache_status, return_binary, "showcase")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -331,6 +388,7 @@ async def create_showcase(
 
 @router.post("/enhance")
 async def enhance_product(
+    request: Request,
     file: UploadFile = File(...),
     secondary_files: List[UploadFile] = File([]),
     product_name: str = Form(""),
@@ -345,11 +403,6 @@ async def enhance_product(
     Enhanced SOTA Pipeline with Multi-Photo Context and Identity Locking.
     """
     import time
-    from app.services.vision_service import vision_service
-    from fastapi.responses import Response
-    from PIL import Image
-    import io
-    import base64
     
     start_time = time.time()
     
@@ -357,50 +410,62 @@ async def enhance_product(
     print("═" * 60)
     print(f"🎨 PYTHON ENHANCE ENDPOINT CALLED (Mode: {mode})")
     print(f"🆔 Debug ID: {debug_id or 'none'}")
+    tracer.adopt(debug_id)
     print("═" * 60)
     
     try:
         content = await file.read()
-        input_image = Image.open(io.BytesIO(content)).convert("RGB")
-        
-        # SOTA MODE (VisionService with Identity Lock)
-        # Both fast and pro run the same CPU-safe pipeline (CLAHE + rembg + white composite).
-        # Pro relighting via Replicate IC-Light is planned but not yet wired — when it is,
-        # this block becomes the IC-Light branch and fast stays CPU-only.
-        print(f"⚡ Running {'Pro' if mode == 'pro' else 'Fast'} Enhancement Pipeline (CLAHE + rembg + white bg)...")
-        result = await pipeline_service.enhance_product_image(
-            image_bytes=content,
-            product_name=product_name,
-            reference_url=reference_image_url if has_exact_match.lower() == 'true' else None,
-            category=category
+        reference_url = reference_image_url if has_exact_match.lower() == 'true' else None
+        key = result_cache.make_key(
+            "enhance", content,
+            mode=mode, product_name=product_name, reference_url=reference_url, category=category,
+            background="white", add_shadow=False, output_size=(1024, 1024)
         )
-        if mode == 'pro':
-            result["pro_note"] = "IC-Light relighting coming soon — using studio-clean pipeline for now."
+        entry, cache_status = await result_cache.get(key), "HIT"
+        tracer.annotate(cache=cache_status if entry is not None else "MISS")
+
+        if entry is None:
+            cache_status = "MISS"
+            # Decode once; the showcase stages share this context's pixels
+            image_context = ImageContext.from_bytes(content)
+            print(f"📥 Input: {image_context.size}")
+
+            # SOTA MODE (VisionService with Identity Lock)
+            # Both fast and pro run the same CPU-safe pipeline (CLAHE + rembg + white composite).
+            # Pro relighting via Replicate IC-Light is planned but not yet wired — when it is,
+            # this block becomes the IC-Light branch and fast stays CPU-only.
+            print(f"⚡ Running {'Pro' if mode == 'pro' else 'Fast'} Enhancement Pipeline (CLAHE + rembg + white bg)...")
+            with track_degradations() as degradations:
+                result = await pipeline_service.enhance_product_image(
+                    image_context=image_context,
+                    product_name=product_name,
+                    reference_url=reference_url,
+                    category=category
+                )
+            if mode == 'pro':
+                result["pro_note"] = "IC-Light relighting coming soon — using studio-clean pipeline for now."
+            result["processing_time_ms"] = int((time.time() - start_time) * 1000)
+            entry = await result_cache.put(key, result, store=not degradations)
         
         elapsed = time.time() - start_time
-        print(f"✅ ENHANCEMENT COMPLETE in {elapsed:.2f}s")
-        
-        if return_binary and result.get("image_data"):
-            try:
-                b64_str = result["image_data"].split(",")[1]
-                return Response(content=base64.b64decode(b64_str), media_type="image/png", headers={
-                    "Content-Disposition": "inline; filename=result.png",
-                    "Cache-Control": "no-cache, no-store, must-revalidate",
-                    "Pragma": "no-cache", 
-                    "Expires": "0"
-                })
-            except:
-                pass
-
-        return {
-            "success": True,
-            "image_data": result.get("image_data"),
-            "original_image_data": result.get("original_image_data"),
-            "dimensions": result.get("dimensions"),
-            "alpha_quality": result.get("alpha_quality"),
-            "low_quality": result.get("low_quality", False),
-            "processing_time_ms": int(elapsed * 1000)
-        }
+        print(f"✅ ENHANCEMENT COMPLETE in {elapsed:.2f}s (cache {cache_status})")
+
+        def json_body(result):
+            # JSON edge: the only place the images get base64-encoded
+            result = encode_for_json(result)
+            return {
+                "success": True,
+                "image_data": result.get("image_data"),
+                "original_image_data": result.get("original_image_data"),
+                "dimensions": result.get("dimensions"),
+                "alpha_quality": result.get("alpha_quality"),
+                "low_quality": result.get("low_quality", False),
+                "processing_time_ms": result.get("processing_time_ms"),
+                "cached": result.get("cached", False)
+            }
+
+        return_binary = return_binary and entry.result.get("image_data") is not None
+        return _cached_response(request, entry, cache_status, return_binary, "result", json_body)
         
     except Exception as e:
         import traceback
@@ -432,6 +497,7 @@ async def enhance_multi_product(
     print("═" * 60)
     print(f"🧬 PYTHON ENHANCE_MULTI CALLED ({len(files)} images)")
     print(f"🆔 Debug ID: {debug_id or 'none'}")
+    tracer.adopt(debug_id)
     print("═" * 60)
     
     try:
@@ -455,8 +521,10 @@ async def enhance_multi_product(
         # 3. Enhance
         lighting_prompt = f"{product_name or 'product'}, professional commercial studio setup"
         
-        relit_image = vision_service.relight_product(
-            main_image, 
+        relit_image = await inference_executor.run_gpu(
+            "vision",
+            vision_service.relight_product,
+            main_image,
             prompt=lighting_prompt,
             reference_images=reference_images,
             debug_prefix=debug_id
@@ -503,8 +571,6 @@ async def generate_image(
     Generate a lifestyle/marketing image from a product photo.
     Supports 1-Shot Style Transfer via 'reference_image'.
     """
-    import base64
-    from fastapi.responses import Response
 
     try:
         content = await file.read()
@@ -522,18 +588,9 @@ async def generate_image(
         )
         
         if return_binary and isinstance(result, dict) and "image_data" in result:
-            try:
-                b64_str = result["image_data"].split(",")[1]
-                return Response(content=base64.b64decode(b64_str), media_type="image/png", headers={
-                    "Content-Disposition": "inline; filename=marketing_gen.png",
-                    "Cache-Control": "no-cache, no-store, must-revalidate",
-                    "Pragma": "no-cache", 
-                    "Expires": "0"
-                })
-            except:
-                pass
+            return _image_response(result["image_data"], "marketing_gen")
 
-        return result
+        return encode_for_json(result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -561,7 +618,7 @@ async def generate_turbo_image(
         input_image = Image.open(io.BytesIO(content)).convert("RGB")
         
         # Run Turbo Pipeline
-        result_image = turbo_service.generate(input_image, prompt, strength)
+        result_image = await inference_executor.run_gpu("turbo", turbo_service.generate, input_image, prompt, strength)
         
         # Return
         output_buffer = io.BytesIO()
@@ -599,7 +656,10 @@ async def qwen_edit_image(
         
         # Run Qwen Pipeline
         # Prompt acts as "Instruction" (e.g. "Add a cat", "Make it sunny")
-        result_image = qwen_service.edit(input_image, prompt)
+        result_path = await inference_executor.run_gpu("qwen", qwen_service.edit_image, input_image, prompt)
+        if result_path == "error.png":
+            raise RuntimeError("Qwen edit failed")
+        result_image = Image.open(result_path).convert("RGB")
         
         # Return
         output_buffer = io.BytesIO()
@@ -722,7 +782,7 @@ async def process_sota_v2(
     import time
     import base64
     from fastapi.responses import Response
-    from app.services.sota_pipeline_v2 import sota_pipeline
+    sota_pipeline = services.require("sota-v2")
 
     pipeline_start = time.time()
 
@@ -749,7 +809,9 @@ async def process_sota_v2(
         )
 
         # Run SOTA Pipeline V2 (async-compatible)
-        result_image, metadata = await sota_pipeline.process(
+        result_image, metadata = await inference_executor.run_gpu(
+            "sota-v2",
+            as_blocking(sota_pipeline.process),
             image,
             enable_flux_regeneration=remove_occlusions,
             enable_relighting=enable_relighting,
@@ -807,7 +869,7 @@ async def sota_v2_status():
     Check SOTA V2 pipeline status, device info, and GPU memory.
     Automatically reports whether using FLUX regeneration (cloud) or Clean & Enhance (local).
     """
-    from app.services.sota_pipeline_v2 import sota_pipeline
+    sota_pipeline = services.require("sota-v2")
 
     device_info = sota_pipeline.get_device_info()
     memory_info = sota_pipeline.get_memory_usage()
@@ -870,7 +932,7 @@ async def process_local_enhanced(
         Includes metadata with processing times and device info
     """
     import time
-    from app.services.local_enhanced_pipeline import local_enhanced_pipeline
+    local_enhanced_pipeline = services.require("local-enhanced")
     from fastapi.responses import Response
 
     pipeline_start = time.time()
@@ -888,7 +950,9 @@ async def process_local_enhanced(
         print(f"   🖥️  Device: {local_enhanced_pipeline.device_profile['device_name']} ({local_enhanced_pipeline.device_profile['vram_gb']}GB)")
 
         # Run Local Enhanced pipeline (async)
-        result_image, metadata = await local_enhanced_pipeline.process(
+        result_image, metadata = await inference_executor.run_gpu(
+            "local-enhanced",
+            as_blocking(local_enhanced_pipeline.process),
             image,
             enable_inpainting=enable_inpainting,
             enable_relighting=enable_relighting,
@@ -952,9 +1016,6 @@ async def pro_cleanup(file: UploadFile = File(...)):
     """
     from app.services.gemini_studio_service import gemini_studio_service
     from app.services.upscale_service import upscale_service
-    from starlette.concurrency import run_in_threadpool
-    import base64, io as _io
-    from PIL import Image
 
     if not gemini_studio_service.available:
         raise HTTPException(status_code=503, detail="Gemini not configured on this server")
@@ -962,15 +1023,13 @@ async def pro_cleanup(file: UploadFile = File(...)):
     image_bytes = await file.read()
 
     try:
-        result = await run_in_threadpool(gemini_studio_service.cleanup_product_photo, image_bytes)
+        result = await inference_executor.run_io("gemini", gemini_studio_service.cleanup_product_photo, image_bytes)
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=str(e))
 
     # Upscale: Gemini gives ~864x1184; push to ~1728x2368 via Pillow (free, CPU)
     try:
-        raw_b64 = result["image_data"].split(",", 1)[1]
-        raw_bytes = base64.b64decode(raw_b64)
-        up_result = await upscale_service.upscale_image(raw_bytes, target_size=(2048, 2048), enhance_colors=True)
+        up_result = await upscale_service.upscale_image(result["image_data"], target_size=(2048, 2048), enhance_colors=True)
         result["image_data"] = up_result["image_data"]
         result["dimensions"] = list(up_result["final_size"])
         result["upscaled"] = True
@@ -981,7 +1040,7 @@ async def pro_cleanup(file: UploadFile = File(...)):
 
     return {
         "success": True,
-        "image_data": result["image_data"],
+        "image_data": result["image_data"].to_data_uri(),
         "dimensions": result.get("dimensions"),
         "processing_time_ms": result.get("processing_time_ms"),
         "provider": result.get("provider"),
@@ -1003,5 +1062,16 @@ async def health_check():
             "sota_v2": "ready",
             "marketing_image": "coming_soon",
             "plan_b_3d": "ready"
-        }
+        },
+        "executor": inference_executor.stats(),
+        "segmentation_batching": segmentation_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "segmentation_cache": segmentation_cache.stats(),
+        "onnx_sessions": onnx_session_pool.stats(),
+        "model_host": model_host_client.stats(),
+        "models": model_registry.stats(),
+        "model_handles": model_handles.stats(),
+        "weight_prefetch": weight_prefetcher.stats(),
+        "lazy_services": services.stats(),
+        "admission": admission_controller.stats(),
     }
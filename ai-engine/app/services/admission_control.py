@@ -0,0 +1,151 @@
+"""
+Admission Control - Back off under memory pressure instead of getting OOM-killed.
+
+The memory sampler's pressure (the tighter of cgroup/host RAM and VRAM, 0..1)
+maps to a level:
+
+    ok       below MEMORY_DEGRADE_AT
+    degrade  lighter variants: BiRefNet general-lite instead of massive when
+             it has to be loaded, Pillow instead of Real-ESRGAN
+    queue    new requests wait (up to MEMORY_QUEUE_TIMEOUT_S, at most
+             MEMORY_QUEUE_MAX of them) for pressure to drop; segmentation
+             that would load BiRefNet uses u2netp
+    shed     at MEMORY_SHED_AT new requests get 503 + Retry-After at once
+
+Requests that already run are never interrupted; the levels only decide what
+starts next. Heavy routes go through admit() (the HTTP middleware in main.py),
+queued jobs wait in the job queue, and services ask degraded(model) before
+loading something big. Routes that cache their output collect the
+degradations of a request with track_degradations() and don't cache it.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.services.memory_sampler import memory_sampler
+from app.services.metrics import metrics
+
+LEVELS = ("ok", "degrade", "queue", "shed")
+
+# Per-request list of "model->fallback" swaps (see track_degradations)
+_request_degradations: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "admission_request_degradations", default=None
+)
+
+
+@contextmanager
+def track_degradations():
+    """Collect every degraded() swap made within this context (thread lanes included)."""
+    degradations: List[str] = []
+    token = _request_degradations.set(degradations)
+    try:
+        yield degradations
+    finally:
+        _request_degradations.reset(token)
+
+
+def note_degradation(swap: str):
+    """Record a fallback the request got without asking degraded() itself (e.g. a shared batched pass)."""
+    tracked = _request_degradations.get()
+    if tracked is not None:
+        tracked.append(swap)
+
+
+class Overloaded(RuntimeError):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.ADMISSION_CONTROL_ENABLED
+        self.degrade_at = settings.MEMORY_DEGRADE_AT
+        self.queue_at = settings.MEMORY_QUEUE_AT
+        self.shed_at = settings.MEMORY_SHED_AT
+        self.queue_timeout_s = settings.MEMORY_QUEUE_TIMEOUT_S
+        self.queue_max = settings.MEMORY_QUEUE_MAX
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.degradations: Dict[str, int] = {}
+
+    def level(self) -> str:
+        if not self.enabled:
+            return "ok"
+        pressure = memory_sampler.sample().pressure
+        if pressure >= self.shed_at:
+            return "shed"
+        if pressure >= self.queue_at:
+            return "queue"
+        if pressure >= self.degrade_at:
+            return "degrade"
+        return "ok"
+
+    def at_least(self, level: str) -> bool:
+        return LEVELS.index(self.level()) >= LEVELS.index(level)
+
+    def degraded(self, model: str, to: str, at: str = "degrade") -> bool:
+        """True if model should be swapped for `to` at the current pressure (and counts it)."""
+        if not self.at_least(at):
+            return False
+        self.degradations[f"{model}->{to}"] = self.degradations.get(f"{model}->{to}", 0) + 1
+        note_degradation(f"{model}->{to}")
+        metrics.inc("admission_degraded_total", model=model, to=to)
+        print(f"🪶 Memory pressure {memory_sampler.sample().pressure:.0%}: {model} -> {to}")
+        return True
+
+    async def admit(self, route: str = ""):
+        """Return when the request may start; raises Overloaded when it should be shed."""
+        level = self.level()
+        if level in ("ok", "degrade"):
+            self.admitted += 1
+            return
+        if level == "shed" or self.waiting >= self.queue_max:
+            self._shed(route, "memory pressure" if level == "shed" else "admission queue full")
+        start = time.perf_counter()
+        self.waiting += 1
+        metrics.set("admission_waiting", self.waiting)
+        try:
+            while True:
+                await asyncio.sleep(memory_sampler.interval_s)
+                level = self.level()
+                if level in ("ok", "degrade"):
+                    break
+                if level == "shed" or time.perf_counter() - start > self.queue_timeout_s:
+                    self._shed(route, "memory pressure")
+        finally:
+            self.waiting -= 1
+            metrics.set("admission_waiting", self.waiting)
+        metrics.observe("admission_wait_seconds", time.perf_counter() - start, route=route)
+        self.admitted += 1
+
+    async def wait_for_room(self):
+        """For work that is already queued (jobs): wait as long as it takes, never shed."""
+        while self.at_least("queue"):
+            await asyncio.sleep(memory_sampler.interval_s)
+
+    def _shed(self, route: str, reason: str):
+        self.shed += 1
+        metrics.inc("admission_shed_total", route=route)
+        raise Overloaded(f"Server is low on memory ({reason}), retry shortly", retry_after=max(1, round(self.queue_timeout_s)))
+
+    def stats(self) -> dict:
+        sample = memory_sampler.sample()
+        return {
+            "enabled": self.enabled,
+            "level": self.level(),
+            "memory": sample.to_dict(),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "degraded": dict(self.degradations),
+        }
+
+
+# Singleton
+admission_controller = AdmissionController()
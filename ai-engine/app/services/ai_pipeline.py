@@ -6,19 +6,11 @@ Manages:
 3. Marketing Image Generation (SDXL - future)
 """
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from app.utils.image_context import ImageContext
 from .showcase_service import showcase_service
-from .stock_service import stock_service
-
-try:
-    from .triposr_service import triposr_service
-    from .vision_service import vision_service
-    from .upscale_service import upscale_service
-except Exception as e:
-    print(f"⚠️  GPU services skipped (no torch): {e}")
-    triposr_service = None
-    vision_service = None
-    upscale_service = None
+from app.services.service_registry import services
+from app.services.tracing import traced
 
 class AiPipelineService:
     """
@@ -29,13 +21,20 @@ class AiPipelineService:
     def __init__(self):
         print("🚀 AI Pipeline Service initialized")
         self.showcase = showcase_service
-        self.triposr = triposr_service
 
+    @property
+    def triposr(self):
+        """TripoSR (torch) is imported on the first 3D request, not at startup."""
+        return services.require("triposr")
+
+    @traced("pipeline.create_showcase_photo")
     async def create_showcase_photo(
         self,
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         background: str = "white",
-        add_shadow: bool = True
+        add_shadow: bool = True,
+        image_context: Optional[ImageContext] = None,
+        segmentation: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Create a professional e-commerce showcase photo.
@@ -44,9 +43,12 @@ class AiPipelineService:
         return await self.showcase.create_showcase(
             image_bytes=image_bytes,
             background=background,
-            add_shadow=add_shadow
+            add_shadow=add_shadow,
+            image_context=image_context,
+            segmentation=segmentation
         )
 
+    @traced("pipeline.generate_3d_preview")
     async def generate_3d_preview(
         self, 
         images: List[bytes], 
@@ -77,6 +79,7 @@ class AiPipelineService:
                 metadata=metadata
             )
 
+    @traced("pipeline.generate_marketing_image")
     async def generate_marketing_image(
         self, 
         prompt: str, 
@@ -90,8 +93,8 @@ class AiPipelineService:
         """
         print(f"📸 2D Studio: Generating marketing shot for '{prompt}'...")
         import io
-        import base64
         from PIL import Image
+        from app.services.inference_executor import inference_executor
 
         # Convert bytes to PIL
         input_image = Image.open(io.BytesIO(product_image)).convert("RGB")
@@ -111,15 +114,13 @@ class AiPipelineService:
         # 2. Fallback to Stock Search (Zero-Shot RAG)
         if not reference_images and product_name:
             print(f"   🔮 Quantum Info Retrieval: Searching for Official Look of '{product_name}'...")
-            stock_data = stock_service.find_product_image(product_name)
+            stock_data = await inference_executor.run_io("stock", services.require("stock").find_product_image, product_name)
             
             if stock_data:
                 print("   ✅ Official Asset Found! Extracting Style DNA...")
                 try:
-                    # stock_data["image_data"] is "data:image/jpeg;base64,..."
-                    b64_str = stock_data["image_data"].split(",")[1]
-                    stock_bytes = base64.b64decode(b64_str)
-                    stock_img = Image.open(io.BytesIO(stock_bytes)).convert("RGB")
+                    # stock_data["image_data"] is an ImageResult holding the downloaded bytes
+                    stock_img = stock_data["image_data"].to_pil().convert("RGB")
                     
                     if stock_img.size[0] > 64 and stock_img.size[1] > 64:
                         reference_images = [stock_img]
@@ -133,20 +134,19 @@ class AiPipelineService:
         full_prompt = f"{prompt}, isolated on white background, product view, front angle, professional photography, high quality, 8k, highly detailed"
         
         # VISION: Relight with SDXL Modular (No Compromise)
-        result_image = vision_service.relight_product(
+        result_image = await inference_executor.run_gpu(
+            "vision",
+            services.require("vision").relight_product,
             input_image,
             prompt=full_prompt,
             reference_images=reference_images
         )
         
         # QUANTUM PORTAL: PIPE TO SHOWCASE (Post-Process: Cutout + White BG + Upscale)
-        # Convert base generation to bytes
-        temp_buffer = io.BytesIO()
-        result_image.save(temp_buffer, format="PNG")
-        
+        # Hand the generated pixels over directly (no PNG encode/decode)
         print("   🚀 Quantum Portal: Engaging Studio Showcase (Rembg + Upscale)...")
         showcase_result = await self.showcase.create_showcase(
-            image_bytes=temp_buffer.getvalue(),
+            image_context=ImageContext.from_pil(result_image),
             background="white",
             add_shadow=True, # Add artificial shadow since we removed real one
             apply_upscale=True, # Run Real-ESRGAN on the cutout
@@ -160,12 +160,14 @@ class AiPipelineService:
             "pipeline": "SDXL (Relight) + Rembg + RealESRGAN (Showcase)"
         }
 
+    @traced("pipeline.enhance_product_image")
     async def enhance_product_image(
         self,
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         product_name: str = "",
         reference_url: str = None,  # NEW: Reference image URL for exact matches
-        category: str = ""  # NEW: Product category for styling
+        category: str = "",  # NEW: Product category for styling
+        image_context: Optional[ImageContext] = None  # decoded upload shared with the router
     ) -> Dict[str, Any]:
         """
         Quick enhancement for product images.
@@ -182,6 +184,7 @@ class AiPipelineService:
         
         return await self.showcase.create_showcase(
             image_bytes=image_bytes,
+            image_context=image_context,
             background="white",
             add_shadow=False,  # Disabled per user request (Step 3 removed)
             output_size=(1024, 1024),
@@ -0,0 +1,325 @@
+"""
+Artifact Cache - Models stored already converted, memory-mapped at load.
+
+BiRefNet ships half-precision weights that every process start loads through
+trust_remote_code and then converts with .float(). The converted state dict
+is written once as safetensors under ARTIFACT_CACHE_DIR, keyed by
+
+    (model id, HF revision, dtype, device class)
+
+and later loads build the model skeleton from its config (no weight init when
+accelerate is installed) and assign the memory-mapped tensors directly, so a
+cold start skips the conversion and pages weights in as they are touched.
+
+Each artifact directory has a manifest.json with the file sizes, a SHA-256 of
+each file and of its safetensors header. Loads check sizes and the header
+hash (cheap, doesn't page the weights in); `verify` checks the full hashes.
+A broken artifact is deleted and rebuilt from the HuggingFace weights.
+
+    python -m app.services.artifact_cache populate birefnet birefnet:general-lite --device-class cuda
+    python -m app.services.artifact_cache list
+    python -m app.services.artifact_cache verify
+    python -m app.services.artifact_cache purge ZhengPeng7/BiRefNet-massive
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import get_settings
+
+MANIFEST_FORMAT = 1
+_WEIGHTS_FILE = "model.safetensors"
+
+
+class ArtifactKey(NamedTuple):
+    model_id: str
+    revision: str
+    dtype: str
+    device_class: str
+
+    @property
+    def relative_path(self) -> str:
+        return os.path.join(self.model_id.replace("/", "--"), self.revision, f"{self.dtype}-{self.device_class}")
+
+    def __str__(self) -> str:
+        return f"{self.model_id}@{self.revision[:12]} ({self.dtype}, {self.device_class})"
+
+
+def device_class(device: str) -> str:
+    """'cuda:1' -> 'cuda'; artifacts don't depend on the device index."""
+    return device.split(":")[0]
+
+
+def resolve_revision(model_id: str) -> str:
+    """Commit hash the local HuggingFace cache resolves main to ("main" if the repo isn't cached)."""
+    try:
+        from huggingface_hub.constants import HF_HUB_CACHE
+    except ImportError:
+        return "main"
+    ref = os.path.join(HF_HUB_CACHE, "models--" + model_id.replace("/", "--"), "refs", "main")
+    try:
+        with open(ref) as f:
+            return f.read().strip() or "main"
+    except OSError:
+        return "main"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _header_sha256(path: str) -> str:
+    """Hash of the safetensors header (names, dtypes, shapes, offsets) without reading the tensors."""
+    with open(path, "rb") as f:
+        (length,) = struct.unpack("<Q", f.read(8))
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.ARTIFACT_CACHE_ENABLED
+        self.directory = settings.ARTIFACT_CACHE_DIR
+
+    def key(self, model_id: str, dtype: str, device: str, revision: Optional[str] = None) -> ArtifactKey:
+        return ArtifactKey(model_id, revision or resolve_revision(model_id), dtype, device_class(device))
+
+    def path(self, key: ArtifactKey) -> str:
+        return os.path.join(self.directory, key.relative_path)
+
+    # ---- read ----
+
+    def manifest(self, key: ArtifactKey) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path(key), "manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def check(self, key: ArtifactKey, deep: bool = False) -> Tuple[bool, str]:
+        """(ok, reason). Sizes and header hashes always; full file hashes when deep."""
+        manifest = self.manifest(key)
+        if manifest is None:
+            return False, "missing"
+        if manifest.get("format") != MANIFEST_FORMAT:
+            return False, f"manifest format {manifest.get('format')}"
+        for name, info in manifest["files"].items():
+            path = os.path.join(self.path(key), name)
+            try:
+                if os.path.getsize(path) != info["bytes"]:
+                    return False, f"{name}: size mismatch"
+                if _header_sha256(path) != info["header_sha256"]:
+                    return False, f"{name}: header hash mismatch"
+                if deep and _sha256(path) != info["sha256"]:
+                    return False, f"{name}: content hash mismatch"
+            except (OSError, struct.error) as e:
+                return False, f"{name}: {e}"
+        return True, "ok"
+
+    def load_state_dict(self, key: ArtifactKey) -> Optional[Dict[str, Any]]:
+        """Memory-mapped tensors of a cached artifact, or None (a broken artifact is removed)."""
+        ok, reason = self.check(key)
+        if not ok:
+            if reason != "missing":
+                print(f"⚠️ Artifact {key} is broken ({reason}), rebuilding")
+                self.remove(key)
+            return None
+        from safetensors.torch import load_file
+        return load_file(os.path.join(self.path(key), _WEIGHTS_FILE))
+
+    # ---- write ----
+
+    def store(self, key: ArtifactKey, state_dict: Dict[str, Any]) -> dict:
+        """Write the state dict (already in key.dtype) and its manifest; atomic per artifact."""
+        import torch
+        import safetensors
+        from safetensors.torch import save_file
+
+        # safetensors refuses tensors that share storage (tied weights): store copies
+        seen = set()
+        tensors = {}
+        for name, tensor in state_dict.items():
+            tensor = tensor.detach().to("cpu")
+            pointer = tensor.untyped_storage().data_ptr()
+            tensors[name] = tensor.clone().contiguous() if pointer in seen else tensor.contiguous()
+            seen.add(pointer)
+
+        final = self.path(key)
+        staging = f"{final}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        weights = os.path.join(staging, _WEIGHTS_FILE)
+        save_file(tensors, weights, metadata={"model_id": key.model_id, "revision": key.revision, "dtype": key.dtype})
+
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "model_id": key.model_id,
+            "revision": key.revision,
+            "dtype": key.dtype,
+            "device_class": key.device_class,
+            "created_at": time.time(),
+            "tensors": len(tensors),
+            "files": {
+                _WEIGHTS_FILE: {
+                    "bytes": os.path.getsize(weights),
+                    "sha256": _sha256(weights),
+                    "header_sha256": _header_sha256(weights),
+                },
+            },
+            "versions": {"torch": torch.__version__, "safetensors": safetensors.__version__},
+        }
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(final, ignore_errors=True)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(staging, final)
+        print(f"💾 Cached {key} ({manifest['files'][_WEIGHTS_FILE]['bytes'] / 1024 ** 2:.0f}MB)")
+        return manifest
+
+    def remove(self, key: ArtifactKey):
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+    # ---- models ----
+
+    def load_pretrained(self, model_cls, model_id: str, dtype: str, device: str, **kwargs):
+        """
+        model_cls.from_pretrained(model_id, **kwargs) converted to dtype and
+        moved to device, from the cache when possible (and cached on a miss).
+        """
+        import torch
+        key = self.key(model_id, dtype, device)
+        if self.enabled:
+            model = self._from_artifact(model_cls, key, **kwargs)
+            if model is not None:
+                return model.to(device)
+
+        model = model_cls.from_pretrained(model_id, **kwargs).to(getattr(torch, dtype))
+        if self.enabled:
+            try:
+                self.store(self.key(model_id, dtype, device), model.state_dict())  # revision is known now
+            except Exception as e:
+                print(f"⚠️ Could not cache {key}: {e}")
+        return model.to(device)
+
+    def _from_artifact(self, model_cls, key: ArtifactKey, **kwargs):
+        start = time.perf_counter()
+        state = self.load_state_dict(key)
+        if state is None:
+            return None
+        try:
+            from transformers import AutoConfig
+            try:
+                from accelerate import init_empty_weights
+            except ImportError:
+                init_empty_weights = nullcontext  # builds with random init, then replaced
+            config_kwargs = {"trust_remote_code": kwargs.get("trust_remote_code", False)}
+            if key.revision != "main":
+                config_kwargs["revision"] = key.revision
+            config = AutoConfig.from_pretrained(key.model_id, **config_kwargs)
+            with init_empty_weights():
+                model = model_cls.from_config(config, trust_remote_code=config_kwargs["trust_remote_code"])
+            model.load_state_dict(state, strict=True, assign=True)
+        except Exception as e:
+            print(f"⚠️ Artifact {key} didn't load ({e}), using the HuggingFace weights")
+            return None
+        print(f"⚡ {key} from artifact cache in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def entries(self) -> List[dict]:
+        manifests = []
+        for root, _, names in os.walk(self.directory):
+            if "manifest.json" in names and ".tmp-" not in root:
+                try:
+                    with open(os.path.join(root, "manifest.json")) as f:
+                        manifests.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return manifests
+
+
+# Singleton
+artifact_cache = ArtifactCache()
+
+
+def _key_of(manifest: dict) -> ArtifactKey:
+    return ArtifactKey(manifest["model_id"], manifest["revision"], manifest["dtype"], manifest["device_class"])
+
+
+def _populate(spec: str, device: str):
+    """spec: birefnet[:variant]"""
+    name, _, variant = spec.partition(":")
+    if name != "birefnet":
+        raise SystemExit(f"Unknown model '{name}' (cached models: birefnet[:variant])")
+    from app.services.birefnet_service import BIREFNET_DTYPE, BIREFNET_VARIANTS, inference_policy, parse_mode
+    from app.config import get_settings
+    from transformers import AutoModelForImageSegmentation
+    variant, quantized = parse_mode(variant or "massive")
+    model_id = BIREFNET_VARIANTS[variant]
+    # int8 modes quantize the float32 artifact at load; others load in the device policy's dtype
+    dtype = BIREFNET_DTYPE if quantized else inference_policy(device, get_settings().BIREFNET_POLICY).dtype
+    key = artifact_cache.key(model_id, dtype, device)
+    if artifact_cache.check(key)[0]:
+        print(f"✅ {key} already cached")
+        return
+    # Convert on the CPU; the artifact is what a `device` process loads
+    model = AutoModelForImageSegmentation.from_pretrained(model_id, trust_remote_code=True)
+    import torch
+    model = model.to(getattr(torch, dtype))
+    artifact_cache.store(artifact_cache.key(model_id, dtype, device), model.state_dict())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converted-model artifact cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    populate = commands.add_parser("populate", help="Download (if needed), convert and cache models")
+    populate.add_argument("models", nargs="+", help="birefnet[:massive|general|general-lite|base][-int8]")
+    populate.add_argument("--device-class", default=None, help="cuda, mps or cpu (default: this machine)")
+    commands.add_parser("list", help="Show cached artifacts")
+    commands.add_parser("verify", help="Check every artifact's full hashes; delete broken ones")
+    purge = commands.add_parser("purge", help="Delete artifacts (all, or for the given model ids)")
+    purge.add_argument("model_ids", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "populate":
+        device = args.device_class
+        if device is None:
+            from app.services.birefnet_service import birefnet_service
+            device = birefnet_service.device
+        for spec in args.models:
+            _populate(spec, device)
+    elif args.command == "list":
+        for manifest in artifact_cache.entries():
+            size = sum(f["bytes"] for f in manifest["files"].values())
+            print(f"{_key_of(manifest)}  {size / 1024 ** 2:.0f}MB  {time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest['created_at']))}")
+    elif args.command == "verify":
+        broken = 0
+        for manifest in artifact_cache.entries():
+            key = _key_of(manifest)
+            ok, reason = artifact_cache.check(key, deep=True)
+            print(f"{'✅' if ok else '❌'} {key}: {reason}")
+            if not ok:
+                artifact_cache.remove(key)
+                broken += 1
+        if broken:
+            raise SystemExit(1)
+    elif args.command == "purge":
+        for manifest in artifact_cache.entries():
+            if not args.model_ids or manifest["model_id"] in args.model_ids:
+                key = _key_of(manifest)
+                artifact_cache.remove(key)
+                print(f"🧹 Removed {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+BiRefNet ONNX - Export BiRefNet to ONNX and serve it with onnxruntime.
+
+For CPU boxes (they already run onnxruntime for rembg): BIREFNET_BACKEND=onnx
+makes BiRefNetService run the exported graph instead of PyTorch.
+
+- Export: the float32 model (from the artifact cache) is traced once to
+  `model-b<N>.onnx` (fixed batch N) or `model-dynamic.onnx` (any batch) under
+  ARTIFACT_CACHE_DIR. "-int8" modes are quantized with onnxruntime's dynamic
+  quantization (int8 MatMul weights). Serving an exported graph needs
+  onnxruntime only, not torch.
+- Session: all graph optimizations, sequential execution and
+  ONNX_INTRA_OP_THREADS / ONNX_INTER_OP_THREADS (0 = onnxruntime's default,
+  one thread per physical core).
+- IO binding: input and output buffers are allocated once per batch shape and
+  bound to the session, so a call writes the preprocessed pixels straight
+  into the bound input and reads the masks from the bound output, with no
+  per-call tensor allocation or copy. A fixed-batch graph runs larger
+  batches in chunks (the last one padded).
+
+    python -m app.services.birefnet_onnx export general-lite --batch 1 dynamic
+    python -m app.services.birefnet_onnx export general-lite-int8 --batch 4
+"""
+import argparse
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.config import get_settings
+
+INPUT_SIZE = 1024
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+
+
+def parse_batch(value) -> Optional[int]:
+    """'dynamic' -> None, '4' -> 4."""
+    return None if str(value).lower() in ("dynamic", "0", "") else int(value)
+
+
+def onnx_path(model_id: str, batch: Optional[int], quantized: bool = False) -> str:
+    from app.services.artifact_cache import artifact_cache
+    key = artifact_cache.key(model_id, "qint8" if quantized else "float32", "onnx")
+    name = f"model-b{batch}.onnx" if batch else "model-dynamic.onnx"
+    return os.path.join(artifact_cache.path(key), name)
+
+
+def export(model_id: str, batch: Optional[int], quantized: bool = False, opset: int = 17) -> str:
+    """Export (and quantize) model_id to ONNX unless it's already there; returns the path."""
+    path = onnx_path(model_id, batch, quantized)
+    if os.path.exists(path):
+        return path
+    if quantized:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        source = export(model_id, batch, quantized=False, opset=opset)
+        staging = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        quantize_dynamic(source, staging, weight_type=QuantType.QInt8)
+        os.replace(staging, path)
+        print(f"💾 Quantized {os.path.basename(source)} -> {path}")
+        return path
+
+    import torch
+    from transformers import AutoModelForImageSegmentation
+    from app.services.artifact_cache import artifact_cache
+    try:
+        # BiRefNet's decoder uses torchvision's deform_conv2d, which has no stock ONNX symbolic
+        from deform_conv2d_onnx_exporter import register_deform_conv2d_onnx_op
+        register_deform_conv2d_onnx_op()
+    except ImportError:
+        print("⚠️ deform_conv2d_onnx_exporter not installed; the export fails if the graph uses deform_conv2d")
+
+    model = artifact_cache.load_pretrained(
+        AutoModelForImageSegmentation, model_id, "float32", "cpu", trust_remote_code=True,
+    ).eval()
+
+    class _Masks(torch.nn.Module):
+        """Just the final prediction, already through the sigmoid (what the service uses)."""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, pixel_values):
+            return self.inner(pixel_values)[-1].sigmoid()
+
+    staging = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dummy = torch.zeros(batch or 1, 3, INPUT_SIZE, INPUT_SIZE)
+    print(f"⏳ Exporting {model_id} to ONNX (batch {batch or 'dynamic'}, opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Masks(model), dummy, staging,
+            input_names=["pixel_values"], output_names=["masks"], opset_version=opset,
+            dynamic_axes=None if batch else {"pixel_values": {0: "batch"}, "masks": {0: "batch"}},
+        )
+    os.replace(staging, path)
+    print(f"💾 Exported {path} ({os.path.getsize(path) / 1024 ** 2:.0f}MB)")
+    return path
+
+
+def session_options(intra_op_threads: int = 0, inter_op_threads: int = 1):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL  # one graph, no independent branches worth a pool
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.enable_mem_pattern = True
+    return options
+
+
+class OnnxBiRefNet:
+    """An onnxruntime session over an exported BiRefNet plus its IO-bound buffers."""
+
+    def __init__(self, path: str, device: str = "cpu", intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+        settings = get_settings()
+        providers = ["CPUExecutionProvider"]
+        if device.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.path = path
+        self.session = ort.InferenceSession(path, session_options(
+            settings.ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads,
+            settings.ONNX_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads,
+        ), providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        batch = self.session.get_inputs()[0].shape[0]
+        self.fixed_batch: Optional[int] = batch if isinstance(batch, int) else None
+        self._lock = threading.Lock()
+        # batch size -> (input buffer, output buffer, binding)
+        self._bindings: Dict[int, Tuple[np.ndarray, np.ndarray, object]] = {}
+
+    def _binding(self, batch: int):
+        if batch not in self._bindings:
+            inputs = np.zeros((batch, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+            outputs = np.zeros((batch, 1, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+            binding = self.session.io_binding()
+            binding.bind_cpu_input(self.input_name, inputs)
+            binding.bind_output(self.output_name, "cpu", 0, np.float32, list(outputs.shape), outputs.ctypes.data)
+            self._bindings[batch] = (inputs, outputs, binding)
+        return self._bindings[batch]
+
+    def predict(self, images: List[Image.Image]) -> List[np.ndarray]:
+        """Masks (INPUT_SIZE x INPUT_SIZE float32, 0..1) for RGB images of any size."""
+        chunk = self.fixed_batch or len(images)
+        masks = []
+        with self._lock:  # the bound buffers are per session, not per call
+            for offset in range(0, len(images), chunk):
+                part = images[offset:offset + chunk]
+                inputs, outputs, binding = self._binding(chunk)
+                for i, image in enumerate(part):
+                    preprocess_into(image, inputs[i])
+                inputs[len(part):] = 0.0  # padding of the last fixed-size chunk
+                self.session.run_with_iobinding(binding)
+                masks.extend(outputs[i, 0].copy() for i in range(len(part)))
+        return masks
+
+
+def preprocess_into(image: Image.Image, out: np.ndarray):
+    """Resize + ImageNet-normalize into a (3, INPUT_SIZE, INPUT_SIZE) slot, like the torch transform."""
+    pixels = np.asarray(image.convert("RGB").resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR), dtype=np.float32)
+    np.divide(pixels.transpose(2, 0, 1), 255.0, out=out)
+    out -= _MEAN
+    out /= _STD
+
+
+def load(model_id: str, device: str = "cpu", quantized: bool = False, batch=None) -> OnnxBiRefNet:
+    """Session for model_id, exporting the graph first if it isn't cached yet."""
+    batch = parse_batch(get_settings().BIREFNET_ONNX_BATCH if batch is None else batch)
+    path = onnx_path(model_id, batch, quantized)
+    if not os.path.exists(path):
+        path = export(model_id, batch, quantized)
+    return OnnxBiRefNet(path, device)
+
+
+def main():
+    from app.services.birefnet_service import BIREFNET_VARIANTS, parse_mode
+    parser = argparse.ArgumentParser(description="Export BiRefNet to ONNX")
+    commands = parser.add_subparsers(dest="command", required=True)
+    exporter = commands.add_parser("export", help="Export (and quantize) modes into the artifact cache")
+    exporter.add_argument("modes", nargs="+", help="massive|general|general-lite|base, optionally -int8")
+    exporter.add_argument("--batch", nargs="+", default=["1", "dynamic"], help="Fixed batch sizes and/or 'dynamic'")
+    exporter.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        variant, quantized = parse_mode(mode)
+        for batch in args.batch:
+            print(f"✅ {export(BIREFNET_VARIANTS[variant], parse_batch(batch), quantized, args.opset)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,116 @@ except ImportError:
 import numpy as np
 from PIL import Image
 from io import BytesIO
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from contextlib import nullcontext
 import os
+import threading
+
+from app.config import get_settings
+from app.utils.image_context import ImageContext
+from app.utils.mask_info import ALPHA_MID_HIGH, ALPHA_MID_LOW, MaskInfo
+from app.services.admission_control import admission_controller
+from app.services.metrics import metrics
+from app.services.model_handles import HandleKey, model_handles
+from app.services.model_registry import model_registry
+from app.services.onnx_session_pool import onnx_session_pool
+from app.services.tracing import traced, tracer
+
+# Available variants: BiRefNet, BiRefNet-massive, BiRefNet-general, BiRefNet-general-lite
+# BiRefNet-massive: Trained on larger dataset, better quality
+BIREFNET_VARIANTS = {
+    "base": "ZhengPeng7/BiRefNet",
+    "massive": "ZhengPeng7/BiRefNet-massive",
+    "general": "ZhengPeng7/BiRefNet-general",
+    "general-lite": "ZhengPeng7/BiRefNet-general-lite",
+}
+# Reference precision (artifact default, ONNX export, int8 source). The weights
+# ship in half precision but MPS needs float32; per-device: InferencePolicy
+BIREFNET_DTYPE = "float32"
+# Approximate float32 weights per variant; "-int8" modes quantize the Linear
+# layers (most of the Swin backbone) to roughly a third of that
+BIREFNET_SIZES_MB = {"base": 900, "massive": 900, "general": 900, "general-lite": 180}
+
+
+def parse_mode(mode: str) -> Tuple[str, bool]:
+    """Serving mode -> (variant, int8). Modes: a variant name, optionally with "-int8" (CPU only)."""
+    variant, quantized = (mode[:-5], True) if mode.endswith("-int8") else (mode, False)
+    if variant not in BIREFNET_VARIANTS:
+        raise ValueError(f"Unknown BiRefNet mode '{mode}' (variants: {', '.join(BIREFNET_VARIANTS)}, optionally -int8)")
+    return variant, quantized
+
+
+def default_mode(device: str) -> str:
+    """Serving policy: BIREFNET_CPU_MODE on CPU-only hosts, BIREFNET_MODE on CUDA/MPS."""
+    settings = get_settings()
+    return settings.BIREFNET_CPU_MODE if device == "cpu" else settings.BIREFNET_MODE
+
+
+class InferencePolicy(NamedTuple):
+    """How the torch backend runs BiRefNet on a device."""
+    dtype: str  # weights and activations: float32 | float16 | bfloat16
+    channels_last: bool  # NHWC activations/weights for the decoder convs (cuDNN / oneDNN)
+    compile: str  # torch.compile mode, or "off"
+    cudnn_benchmark: bool  # autotune conv algorithms per input shape
+    tf32: bool  # TF32 matmuls/convs for float32 on Ampere+
+
+    def __str__(self) -> str:
+        flags = [self.dtype] + ["channels_last"] * self.channels_last + ["tf32"] * (self.tf32 and self.dtype == "float32")
+        if self.compile != "off":
+            flags.append(f"compile={self.compile}")
+        return ", ".join(flags)
+
+
+POLICY_DTYPES = ("float32", "float16", "bfloat16")
+COMPILE_MODES = ("off", "default", "reduce-overhead", "max-autotune", "max-autotune-no-cudagraphs")
+
+
+def inference_policy(device: str, spec: str = "auto") -> InferencePolicy:
+    """
+    The device's default policy, overridden by spec: "auto" or comma-separated
+    key=value pairs over it, e.g. "dtype=bfloat16,compile=max-autotune".
+
+    - cuda: float16 (BiRefNet's reference inference runs in half), channels_last,
+      cuDNN autotuning (CUDNN_BENCHMARK), TF32 for anything left in float32
+    - mps: float32 (half precision masks come out wrong on MPS)
+    - cpu: float32, contiguous; the int8 modes are the CPU speed lever
+    torch.compile stays opt-in: it's minutes per input shape at startup.
+    """
+    kind = device.split(":")[0]
+    if kind == "cuda":
+        policy = InferencePolicy("float16", True, "off", get_settings().CUDNN_BENCHMARK, True)
+    else:
+        policy = InferencePolicy("float32", False, "off", False, False)
+    if not spec or spec == "auto":
+        return policy
+
+    overrides = {}
+    for part in spec.split(","):
+        key, _, value = (p.strip() for p in part.partition("="))
+        if key not in InferencePolicy._fields:
+            raise ValueError(f"Unknown BiRefNet policy key '{key}' (keys: {', '.join(InferencePolicy._fields)})")
+        if key == "dtype" and value not in POLICY_DTYPES:
+            raise ValueError(f"Unknown BiRefNet dtype '{value}' ({', '.join(POLICY_DTYPES)})")
+        if key == "compile" and value not in COMPILE_MODES:
+            raise ValueError(f"Unknown torch.compile mode '{value}' ({', '.join(COMPILE_MODES)})")
+        overrides[key] = value if key in ("dtype", "compile") else value.lower() in ("1", "true", "yes")
+    policy = policy._replace(**overrides)
+    if kind == "mps" and policy.dtype != "float32":
+        print(f"⚠️ BiRefNet needs float32 on MPS, ignoring dtype={policy.dtype}")
+        policy = policy._replace(dtype="float32")
+    return policy
+
+
+BIREFNET_BACKENDS = ("torch", "onnx")
+INPUT_SIZE = 1024
+THUMBNAIL_INPUT_SIZE = 512  # inputs no larger than this run at 512 (torch backend): ~4x less compute
+REFINE_TILE_OVERLAP = 128
+
 
 class BiRefNetService:
-    def __init__(self):
+    def __init__(self, mode: Optional[str] = None, backend: Optional[str] = None):
         self.model = None
-        self._rembg_session = None  # cached u2netp session
+        self._handle = None  # share of the pooled weights (model_handles)
         # Quality score (0-100) of the LAST mask produced. Set by remove_background.
         # High = crisp, confident cutout. Low = lots of ambiguous mid-grey edges
         # (cluttered/low-contrast scene) — caller may want to retry or warn the user.
@@ -27,42 +131,76 @@ class BiRefNetService:
             self.device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
         else:
             self.device = "cpu"
+        self.mode = mode or default_mode(self.device)
+        parse_mode(self.mode)
+        # "torch", or "onnx": the exported graph on onnxruntime (app/services/birefnet_onnx.py)
+        self.backend = backend or get_settings().BIREFNET_BACKEND
+        if self.backend not in BIREFNET_BACKENDS:
+            print(f"⚠️ Unknown BiRefNet backend '{self.backend}', using torch")
+            self.backend = "torch"
+        settings = get_settings()
+        # dtype / memory format / compile for the torch backend (BIREFNET_POLICY overrides the device default)
+        try:
+            self.policy = inference_policy(self.device, settings.BIREFNET_POLICY)
+        except ValueError as e:
+            print(f"⚠️ {e}, using the {self.device} defaults")
+            self.policy = inference_policy(self.device)
+        # Coarse-to-fine on large photos: re-segment only the uncertain boundary band at native resolution
+        self.refine = settings.BIREFNET_REFINE
+        self.refine_min_px = int(settings.BIREFNET_REFINE_MIN_MP * 1_000_000)
+        self.refine_max_tiles = max(1, settings.BIREFNET_REFINE_MAX_TILES)
+        self.loaded_mode = None  # what load_model actually loaded (an int8 request on a GPU loads float)
+        self._registry_name = None  # set for instances the model registry manages
         self.transform = None
+        self._input_dtype = None  # torch dtype / memory format the loaded weights take
+        self._input_format = None
         
-    def load_model(self, variant: str = "massive"):
+    @metrics.timed_load("birefnet", lambda s: s.model is not None)
+    def load_model(self, variant: Optional[str] = None):
+        """Load the service's mode (or `variant`, any serving mode)."""
         if self.model is not None:
             return
         
-        # Available variants: BiRefNet, BiRefNet-massive, BiRefNet-general, BiRefNet-general-lite
-        # BiRefNet-massive: Trained on larger dataset, better quality
-        variants = {
-            "base": "ZhengPeng7/BiRefNet",
-            "massive": "ZhengPeng7/BiRefNet-massive",
-            "general": "ZhengPeng7/BiRefNet-general",
-            "general-lite": "ZhengPeng7/BiRefNet-general-lite",
-        }
-        
-        model_id = variants.get(variant, variants["massive"])
-        print(f"⚡ Loading BiRefNet ({variant}) - SOTA Background Removal...")
-        
+        try:
+            variant, quantized = parse_mode(variant or self.mode)
+        except ValueError as e:
+            print(f"⚠️ {e}, using massive")
+            variant, quantized = "massive", False
+        if quantized and self.device != "cpu":
+            print(f"⚠️ int8 BiRefNet is CPU-only, loading {variant} in {self.policy.dtype} on {self.device}")
+            quantized = False
+        model_id = BIREFNET_VARIANTS[variant]
+        mode = f"{variant}-int8" if quantized else variant
+        print(f"⚡ Loading BiRefNet ({mode}, {self.backend}) - SOTA Background Removal...")
+
+        if self.backend == "onnx":
+            self._load_onnx(model_id, variant, mode, quantized)
+            return
+
         if not torch:
             print("⚠️ No torch available. Forcing rembg fallback.")
             self.model = "rembg"
             return
             
+        # int8 weights are float32 underneath; the dynamic quantization kernels don't take NHWC
+        policy = self.policy._replace(dtype=BIREFNET_DTYPE, channels_last=False) if quantized else self.policy
         try:
-            from transformers import AutoModelForImageSegmentation
-            
-            self.model = AutoModelForImageSegmentation.from_pretrained(
-                model_id, 
-                trust_remote_code=True
+            _apply_backend_flags(policy)
+            # Shared with every other BiRefNetService in the process (with the same precision / layout)
+            self._handle = model_handles.acquire(
+                HandleKey(
+                    model_id, variant + ("-nhwc" if policy.channels_last else ""), self.device,
+                    "qint8" if quantized else policy.dtype,
+                ),
+                lambda: _load_birefnet_weights(model_id, self.device, quantized, policy),
             )
-            
-            # CRITICAL: Convert entire model to float32 for MPS compatibility
-            # The model is saved in half precision but MPS needs float32
-            self.model = self.model.float()
-            self.model.to(self.device)
-            self.model.eval()
+            self.model = self._handle.value
+            if policy.compile != "off":
+                # Per instance (the pooled module stays eager); compiles on the first call per input shape
+                self.model = torch.compile(self.model, mode=policy.compile, dynamic=False)
+            self._input_dtype = getattr(torch, policy.dtype)
+            self._input_format = torch.channels_last if policy.channels_last else torch.contiguous_format
+            self.loaded_mode = mode
             
             # Standard ImageNet normalization
             self.transform = transforms.Compose([
@@ -71,111 +209,263 @@ class BiRefNetService:
                 transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
             ])
             
-            print(f"✅ BiRefNet loaded on {self.device} (float32)")
+            print(f"✅ BiRefNet ({mode}) ready on {self.device} ({'int8 dynamic' if quantized else policy})")
 
         except Exception as e:
             print(f"❌ BiRefNet load failed: {e}")
             import traceback
             traceback.print_exc()
             self.model = "rembg"  # Fallback
-    
-    def remove_background(self, image: Image.Image) -> Image.Image:
+
+    def _load_onnx(self, model_id: str, variant: str, mode: str, quantized: bool):
+        """Exported graph on onnxruntime; torch is only needed if it still has to be exported."""
+        try:
+            from app.services import birefnet_onnx
+            batch = get_settings().BIREFNET_ONNX_BATCH
+            self._handle = model_handles.acquire(
+                HandleKey(model_id, f"{variant}-onnx-{batch}", self.device, "qint8" if quantized else BIREFNET_DTYPE),
+                lambda: birefnet_onnx.load(model_id, self.device, quantized),
+            )
+            self.model = self._handle.value
+            self.loaded_mode = mode
+            print(f"✅ BiRefNet ({mode}) ready on onnxruntime ({os.path.basename(self.model.path)})")
+        except Exception as e:
+            print(f"❌ BiRefNet ONNX load failed: {e}")
+            import traceback
+            traceback.print_exc()
+            self.model = "rembg"
+
+    def remove_background(
+        self, image: Image.Image, mode: Optional[str] = None, return_info: bool = False
+    ) -> Union[Image.Image, Tuple[Image.Image, MaskInfo]]:
         """
         Remove background from image and return RGBA image with transparent background.
-        Uses official BiRefNet inference pattern.
+        Uses official BiRefNet inference pattern. mode picks another serving
+        mode for this call (e.g. "general-lite-int8"); default: the service's.
+        return_info: return (rgba, MaskInfo) so later stages can work on the
+        product's bounding box without rescanning the alpha.
         """
-        self.load_model()
+        from app.services.segmentation_cache import segmentation_cache
         self.last_alpha_quality = None
+        service = birefnet_for(mode) if mode and mode != self.mode else self
+        ctx = image if isinstance(image, ImageContext) else ImageContext.from_pil(image)
+        cached = segmentation_cache.lookup(ctx, service.cache_source())
+        if cached is not None:
+            rgba, info = cached
+            self.last_alpha_quality = info.quality
+        else:
+            rgba, self.last_alpha_quality = service.segment_batch([ctx])[0]
+            segmentation_cache.store(ctx, rgba)
+        if not return_info:
+            return rgba
+        return rgba, ctx.cached("mask_info", lambda: MaskInfo.from_image(rgba))
 
+    def cache_source(self) -> str:
+        """Which segmenter a call would run on, the segmentation cache's key prefix."""
+        from app.services.model_host import model_host_client
+        if model_host_client.enabled:
+            return "model-host"
         if self.model == "rembg":
-            rgba = self._rembg_remove(image)
-            self.last_alpha_quality = self._score_alpha_quality(rgba)
-            print(f"   📊 Alpha quality: {self.last_alpha_quality}")
-            return rgba
+            return "u2netp"
+        return f"birefnet:{self.loaded_mode or self.mode}:{self.backend}" + (":refine" if self.refine else "")
+
+    @traced("birefnet.segment_batch")
+    def segment_batch(self, images: List[Union[Image.Image, ImageContext]]) -> List[Tuple[Image.Image, Optional[float]]]:
+        """
+        Remove backgrounds for several images with one batched forward pass.
+        Returns [(rgba, alpha_quality), ...] in input order. Used directly by
+        the segmentation batcher so concurrent requests share a GPU pass.
+        ImageContext inputs keep their 1024 input tensor and alpha mask cached.
+        Runs on the shared model host when MODEL_HOST_ADDRESS is set.
+        """
+        from app.services.model_host import ModelHostUnavailable, model_host_client
+        tracer.annotate(batch=len(images))
+        if model_host_client.enabled:
+            try:
+                return self._segment_remote(images)
+            except ModelHostUnavailable as e:
+                model_host_client.note_fallback()
+                print(f"⚠️ Model host unavailable ({e}), segmenting in-process")
+
+        with self._holding("birefnet"):
+            return self._segment_local(images)
+
+    def _segment_local(self, images: List[Union[Image.Image, ImageContext]]) -> List[Tuple[Image.Image, Optional[float]]]:
+        # Don't load BiRefNet into a nearly full container: u2netp is ~5MB
+        use_rembg = self.model is None and admission_controller.degraded("birefnet", "u2netp", at="queue")
+        lite = not use_rembg and self._lite_stand_in()
+        if lite is not None:
+            # This call only: the next one at lower pressure loads the service's own mode
+            with lite._holding("birefnet"):
+                results = lite._segment_local(images)
+            _mark(images, f"{lite.cache_source()}:transient")
+            return results
+        if not use_rembg:
+            self.load_model()
+        contexts = [item if isinstance(item, ImageContext) else None for item in images]
+        images = [item.pil if isinstance(item, ImageContext) else item for item in images]
+
+        if use_rembg or self.model == "rembg":
+            # A pressure fallback stands in for BiRefNet this once; the segmentation cache skips it
+            _mark(contexts, "u2netp:transient" if use_rembg else "u2netp")
+            return [self._scored(self._rembg_remove(image), ctx) for image, ctx in zip(images, contexts)]
 
         try:
-            # Store original size for resizing mask back
-            original_size = image.size
-            
-            # Preprocess
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # For MPS, ensure float32
-            if self.device == "mps":
-                input_tensor = input_tensor.float()
-            
-            # Inference - CRITICAL: use [-1] to get final output, then .sigmoid()
-            with torch.no_grad():
-                preds = self.model(input_tensor)[-1].sigmoid().cpu()
-            
-            # Extract mask
-            pred = preds[0].squeeze()
-            
-            # Convert to PIL mask
-            pred_pil = transforms.ToPILImage()(pred)
-            mask = pred_pil.resize(original_size, Image.LANCZOS)
-            
-            # POST-PROCESSING: Clean up mask to remove artifacts
-            mask = self._cleanup_mask(mask)
-            
-            # Apply mask to original image
-            rgba = image.convert("RGBA")
-            rgba.putalpha(mask)
+            # Coarse pass: the whole image at the model's input size (512 for thumbnails)
+            sizes = [self._input_size(image) for image in images]
+            preds: List[Optional[np.ndarray]] = [None] * len(images)
+            for size in sorted(set(sizes)):
+                group = [i for i, s in enumerate(sizes) if s == size]
+                for i, pred in zip(group, self._predict([images[i] for i in group], size, [contexts[i] for i in group])):
+                    preds[i] = pred
 
-            self.last_alpha_quality = self._score_alpha_quality(rgba)
-            print(f"   📊 Alpha quality: {self.last_alpha_quality}")
+            results = []
+            for image, ctx, pred in zip(images, contexts, preds):
+                mask = Image.fromarray(pred).resize(image.size, Image.LANCZOS)
+                if self.refine and image.size[0] * image.size[1] >= self.refine_min_px:
+                    mask = self._refine(image, mask)
+                results.append(self._apply_mask(image, ctx, mask))
+            _mark(contexts, self.cache_source())
+            return results
 
-            return rgba
-            
         except Exception as e:
             print(f"⚠️ BiRefNet inference failed: {e}")
             import traceback
             traceback.print_exc()
-            rgba = self._rembg_remove(image)
-            self.last_alpha_quality = self._score_alpha_quality(rgba)
-            print(f"   📊 Alpha quality: {self.last_alpha_quality}")
-            return rgba
+            _mark(contexts, "u2netp:transient")
+            return [self._scored(self._rembg_remove(image), ctx) for image, ctx in zip(images, contexts)]
+
+    def _lite_stand_in(self) -> Optional["BiRefNetService"]:
+        """general-lite in its own instance when massive would have to be loaded under memory pressure."""
+        if self.model is not None:
+            return None
+        variant, quantized = parse_mode(self.mode)
+        if variant != "massive" or not admission_controller.degraded("birefnet", "general-lite"):
+            return None
+        return birefnet_for("general-lite-int8" if quantized else "general-lite")
+
+    def _input_size(self, image: Image.Image) -> int:
+        # The ONNX graphs are exported at 1024x1024
+        return THUMBNAIL_INPUT_SIZE if self.backend == "torch" and max(image.size) <= THUMBNAIL_INPUT_SIZE else INPUT_SIZE
+
+    def _predict(self, images: List[Image.Image], size: int = INPUT_SIZE, contexts=None) -> List[np.ndarray]:
+        """uint8 masks (size x size) for a batch of RGB images, on whichever backend is loaded."""
+        if self.backend == "onnx":
+            return [(pred * 255).round().astype(np.uint8) for pred in self.model.predict(images)]
+
+        transform = self.transform if size == INPUT_SIZE else transforms.Compose([
+            transforms.Resize((size, size)), *self.transform.transforms[1:],
+        ])
+        contexts = contexts or [None] * len(images)
+        # Preprocess: every image is resized to size x size, so they stack
+        input_tensor = torch.stack([
+            ctx.cached(f"birefnet_input_{size}", lambda: transform(image)) if ctx else transform(image)
+            for image, ctx in zip(images, contexts)
+        ]).to(self.device, dtype=self._input_dtype, memory_format=self._input_format)
+
+        # Inference - CRITICAL: use [-1] to get final output, then .sigmoid() (in float32 for the mask)
+        with torch.no_grad():
+            preds = self.model(input_tensor)[-1].float().sigmoid().cpu()
+        return [(pred.squeeze(0).numpy() * 255).round().astype(np.uint8) for pred in preds]
+
+    @traced("birefnet.refine")
+    def _refine(self, image: Image.Image, mask: Image.Image) -> Image.Image:
+        """
+        Fine pass for a large photo: the upsampled coarse mask is only soft
+        along the object's outline. Tiles covering that band are segmented at
+        native resolution (1024px crops, 1:1) and blended back, feathered
+        where tiles overlap; everything outside the band keeps the coarse mask.
+        """
+        import cv2
+        alpha = np.asarray(mask)
+        band = ((alpha > ALPHA_MID_LOW) & (alpha < ALPHA_MID_HIGH)).astype(np.uint8)
+        if not band.any():
+            return mask
+        # The coarse edge is blurred over about one coarse pixel, i.e. `scale` full-res pixels
+        scale = max(image.size) / INPUT_SIZE
+        radius = max(4, int(round(scale * 4)))
+        band = cv2.dilate(band, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))) > 0
+
+        tile = INPUT_SIZE
+        tiles = _band_tiles(band, tile)
+        while len(tiles) > self.refine_max_tiles:
+            tile = int(tile * 1.5)  # fewer, downscaled tiles: still finer than the coarse pass
+            tiles = _band_tiles(band, tile)
+        tracer.annotate(tiles=len(tiles), tile=tile)
+
+        acc = np.zeros(alpha.shape, dtype=np.float32)
+        weight = np.zeros(alpha.shape, dtype=np.float32)
+        batch = max(1, get_settings().BIREFNET_MAX_BATCH)
+        for start in range(0, len(tiles), batch):
+            boxes = tiles[start:start + batch]
+            preds = self._predict([image.crop(box) for box in boxes])
+            for (x0, y0, x1, y1), pred in zip(boxes, preds):
+                fine = np.asarray(Image.fromarray(pred).resize((x1 - x0, y1 - y0), Image.BILINEAR), dtype=np.float32)
+                ramp = _feather(x1 - x0, y1 - y0)
+                acc[y0:y1, x0:x1] += fine * ramp
+                weight[y0:y1, x0:x1] += ramp
+
+        refined = alpha.astype(np.float32)
+        use = band & (weight > 0)
+        refined[use] = acc[use] / weight[use]
+        return Image.fromarray(refined.round().clip(0, 255).astype(np.uint8))
+
+    def _apply_mask(self, image: Image.Image, ctx: Optional[ImageContext], mask: Image.Image) -> Tuple[Image.Image, Optional[float]]:
+        """Full-size mask -> cleaned + analyzed in one pass -> applied to the image -> scored RGBA."""
+        # POST-PROCESSING: keep the largest component (drops hands, reflections)
+        info = MaskInfo.analyze(np.asarray(mask))
+
+        # Apply mask to original image
+        rgba = image.convert("RGBA")
+        rgba.putalpha(info.mask())
+        return self._scored(rgba, ctx, info)
+
+    def _holding(self, name: str):
+        """Registry reference while a registered instance runs; private instances manage themselves."""
+        if name == "birefnet":
+            name = self._registry_name
+        elif self is not birefnet_service:
+            name = None
+        return model_registry.use(name) if name else nullcontext()
+
+    @traced("birefnet.segment_remote")
+    def _segment_remote(self, images: List[Union[Image.Image, ImageContext]]) -> List[Tuple[Image.Image, Optional[float]]]:
+        """Send RGB pixels to the model host (via shared memory), apply the masks it returns."""
+        from app.services.model_host import model_host_client
+        contexts = [item if isinstance(item, ImageContext) else None for item in images]
+        images = [item.pil if isinstance(item, ImageContext) else item.convert("RGB") for item in images]
+        masks, qualities = model_host_client.segment_batch([
+            ctx.rgb if ctx else np.asarray(image) for image, ctx in zip(images, contexts)
+        ])
+
+        results = []
+        for image, ctx, mask, quality in zip(images, contexts, masks, qualities):
+            alpha = Image.fromarray(mask)
+            rgba = image.convert("RGBA")
+            rgba.putalpha(alpha)
+            if ctx is not None:
+                ctx.set("alpha_mask", alpha)
+                ctx.set("segmented_by", "model-host")
+            results.append((rgba, quality))
+        return results
+
+    def _scored(self, rgba: Image.Image, ctx: Optional[ImageContext] = None, info: Optional[MaskInfo] = None) -> Tuple[Image.Image, Optional[float]]:
+        if info is None:
+            info = MaskInfo.from_image(rgba)
+        print(f"   📊 Alpha quality: {info.quality}")
+        if ctx is not None:
+            ctx.set("alpha_mask", info.mask())
+            ctx.set("mask_info", info)
+        return rgba, info.quality
     
     def _cleanup_mask(self, mask: Image.Image) -> Image.Image:
         """
         Clean up segmentation mask by:
         1. Keeping only the largest connected component
         2. Removing small fragments (like hands, reflections)
+        Soft edges of the kept component stay soft (thin details like fretboards).
         """
-        import cv2
-        
-        # Convert to numpy
-        mask_np = np.array(mask)
-        
-        # OPTIMIZED CLEANUP - SOFT MODE
-        # We need to preserve thin details (fretboards) which might have lower confidence values.
-        # A hard threshold of 127 kills them.
-        
-        # 1. Very low threshold just to find the main object
-        _, binary_c = cv2.threshold(mask_np, 10, 255, cv2.THRESH_BINARY)
-        
-        # 2. Find connected components on this broad mask
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary_c, connectivity=8)
-        
-        if num_labels <= 1:
-            return mask
-        
-        # 3. Find largest component
-        areas = stats[1:, cv2.CC_STAT_AREA]
-        largest_idx = np.argmax(areas) + 1
-        
-        # 4. Create a "Keep Mask" (Binary)
-        # We only keep pixels that belong to the largest component
-        keep_mask = np.where(labels == largest_idx, 255, 0).astype(np.uint8)
-        
-        # 5. Apply "Keep Mask" to the ORIGINAL soft mask
-        # This preserves the alpha/transparency of edges
-        result = cv2.bitwise_and(mask_np, mask_np, mask=keep_mask)
-        
-        # 6. Optional: Very subtle gamma correction to boost faint details
-        # result = np.power(result / 255.0, 0.8) * 255.0
-        
-        return Image.fromarray(result.astype(np.uint8))
+        return MaskInfo.analyze(np.asarray(mask)).mask()
     
     def _score_alpha_quality(self, rgba: Image.Image) -> float:
         """
@@ -184,53 +474,40 @@ class BiRefNetService:
         A clean cutout has alpha pixels that are almost all fully opaque (255)
         or fully transparent (0). Ambiguous masks — cluttered scene, low contrast
         between subject and a dark/blurry background — leave a large band of
-        mid-grey pixels (the model "isn't sure"). We measure the fraction of
-        edge/foreground pixels that fall in that uncertain mid-band and invert it.
+        mid-grey pixels (the model "isn't sure"). See mask_info.score_alpha.
 
         Returns 100 for a crisp mask, lower as ambiguity rises. Returns 0 if the
         cutout is degenerate (almost nothing kept, or almost nothing removed).
         """
         try:
-            alpha = np.asarray(rgba.split()[-1], dtype=np.uint8)
-            total = alpha.size
-            if total == 0:
-                return 0.0
-
-            # Foreground = anything not fully transparent.
-            fg = alpha > 10
-            fg_count = int(fg.sum())
-            fg_frac = fg_count / total
-
-            # Degenerate: removed everything, or removed nothing.
-            if fg_frac < 0.01 or fg_frac > 0.99:
-                return 0.0
-
-            # Of the foreground pixels, how many sit in the ambiguous mid-band
-            # (neither clearly object nor clearly transparent edge)?
-            mid = fg & (alpha < 230) & (alpha > 40)
-            mid_frac = int(mid.sum()) / max(fg_count, 1)
-
-            # Empirically calibrated against u2netp output (which always leaves a
-            # soft antialiased rim, so even clean cutouts run ~0.20-0.25 mid):
-            #   clean product on plain bg     ~0.25 -> ~78  (pass, >=60)
-            #   subject occluded / ghosting   ~0.45 -> ~46  (warn)
-            #   low-contrast / cluttered scene ~0.70 -> ~16  (warn)
-            # Anchor 0.25 -> 78 and slope so 0.45 -> ~46.
-            score = max(0.0, 100.0 - ((mid_frac - 0.25) * 160.0) - 22.0)
-            return round(min(100.0, score), 1)
+            return MaskInfo.from_image(rgba).quality
         except Exception as e:
             print(f"⚠️ alpha quality scoring failed: {e}")
             return None
 
+    @traced("birefnet.rembg")
     def _rembg_remove(self, image: Image.Image) -> Image.Image:
-        """Fallback using rembg library (u2netp — fast 4MB model, session cached)"""
+        """Fallback using rembg library (u2netp — fast 4MB model, on a pooled session)"""
         print("⚠️ Using rembg fallback (u2netp)...")
-        from rembg import remove, new_session
-        if self._rembg_session is None:
-            print("⏳ Loading u2netp session (first call)...")
-            self._rembg_session = new_session(model_name="u2netp", providers=["CPUExecutionProvider"])
-            print("✅ u2netp session ready")
-        return remove(image, session=self._rembg_session)
+        with self._holding("u2netp"):
+            return onnx_session_pool.remove(image, "u2netp")
+
+    def load_rembg_session(self):
+        onnx_session_pool.warm("u2netp")
+
+    def unload_rembg_session(self):
+        onnx_session_pool.close("u2netp")
+
+    @metrics.timed_unload("birefnet", lambda s: s.model not in (None, "rembg"))
+    def unload_model(self):
+        """Free the BiRefNet weights (the u2netp session is separate)."""
+        if self.model is not None:
+            if self._handle is not None:
+                self._handle.release()  # freed once no other instance holds it
+                self._handle = None
+            self.model = None
+            self.loaded_mode = None
+            print("🧹 BiRefNet unloaded")
     
     def remove_and_place_on_white(self, image: Image.Image) -> Image.Image:
         """
@@ -279,5 +556,110 @@ class BiRefNetService:
         # Simple implementation - just return as-is for now
         return image
 
+def _load_birefnet_weights(model_id: str, device: str, quantized: bool = False, policy: Optional[InferencePolicy] = None):
+    from transformers import AutoModelForImageSegmentation
+    from app.services.artifact_cache import artifact_cache
+    policy = policy or inference_policy(device)
+    # Converted once per dtype and cached (ARTIFACT_CACHE_DIR), then memory-mapped on later starts
+    model = artifact_cache.load_pretrained(
+        AutoModelForImageSegmentation, model_id, policy.dtype, device, trust_remote_code=True,
+    )
+    model.eval()
+    if policy.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if quantized:
+        # Weights of the Linear layers to int8, activations quantized on the fly (fbgemm/qnnpack kernels)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _apply_backend_flags(policy: InferencePolicy):
+    """Process-wide cuDNN / TF32 switches; only ever turned on (other CUDA models benefit too)."""
+    if not torch.cuda.is_available():
+        return
+    if policy.cudnn_benchmark:
+        torch.backends.cudnn.benchmark = True
+    if policy.tf32:
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
+
+def _mark(contexts: List[Optional[Union[ImageContext, Image.Image]]], source: str):
+    """Record which segmenter produced these masks (see segmentation_cache.store)."""
+    for ctx in contexts:
+        if isinstance(ctx, ImageContext):
+            ctx.set("segmented_by", source)
+
+
+def _band_tiles(band: np.ndarray, tile: int) -> List[Tuple[int, int, int, int]]:
+    """Overlapping tile boxes (x0, y0, x1, y1) on a regular grid that contain any band pixel."""
+    height, width = band.shape
+    step = max(1, tile - REFINE_TILE_OVERLAP)
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        positions = list(range(0, length - tile + 1, step))
+        if positions[-1] + tile < length:
+            positions.append(length - tile)
+        return positions
+
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in starts(height) for x in starts(width)
+        if band[y:y + tile, x:x + tile].any()
+    ]
+
+
+def _feather(width: int, height: int) -> np.ndarray:
+    """Blend weights for a tile: 1 inside, ramping down over the overlap towards its edges."""
+    ramp = lambda n: np.minimum(1.0, (np.minimum(np.arange(n), np.arange(n)[::-1]) + 1) / REFINE_TILE_OVERLAP)
+    return np.outer(ramp(height), ramp(width)).astype(np.float32)
+
+
+def _size_mb(mode: str, policy: Optional[InferencePolicy] = None) -> float:
+    variant, quantized = parse_mode(mode)
+    if quantized:
+        return BIREFNET_SIZES_MB[variant] * 0.35
+    return BIREFNET_SIZES_MB[variant] * (1.0 if policy is None or policy.dtype == "float32" else 0.5)
+
+
 # Singleton instance
 birefnet_service = BiRefNetService()
+birefnet_service._registry_name = "birefnet"
+model_registry.register(
+    "birefnet", birefnet_service, size_mb=_size_mb(birefnet_service.mode, birefnet_service.policy),
+    weights=[BIREFNET_VARIANTS[parse_mode(birefnet_service.mode)[0]]],
+    loaded=lambda s: s.model not in (None, "rembg"),
+)
+model_registry.register(
+    "u2netp", birefnet_service, size_mb=5 * onnx_session_pool.size, pool="cpu", load_cost_s=1.0,
+    load="load_rembg_session", unload="unload_rembg_session",
+    loaded=lambda s: onnx_session_pool.loaded("u2netp"),
+)
+
+_mode_services: Dict[str, BiRefNetService] = {}
+_mode_lock = threading.Lock()
+
+
+def birefnet_for(mode: Optional[str]) -> BiRefNetService:
+    """
+    The service for a serving mode: the singleton for its own mode (or None),
+    else one instance per mode, registered with the model registry as
+    "birefnet:<mode>" so it loads and gets evicted like any other model.
+    Unknown modes raise ValueError.
+    """
+    if not mode or mode == birefnet_service.mode:
+        return birefnet_service
+    parse_mode(mode)
+    with _mode_lock:
+        if mode not in _mode_services:
+            service = BiRefNetService(mode)
+            service._registry_name = f"birefnet:{mode}"
+            model_registry.register(
+                service._registry_name, service, size_mb=_size_mb(mode, service.policy),
+                weights=[BIREFNET_VARIANTS[parse_mode(mode)[0]]],
+                loaded=lambda s: s.model not in (None, "rembg"),
+            )
+            _mode_services[mode] = service
+        return _mode_services[mode]
@@ -5,7 +5,9 @@ Plan A: Fully Local Implementation
 """
 import numpy as np
 from PIL import Image, ImageDraw, ImageFilter, ImageOps
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
+
+from app.utils.mask_info import MaskInfo
 
 
 class CompositingService:
@@ -22,7 +24,9 @@ class CompositingService:
         product_image: Image.Image,
         background_size: Tuple[int, int] = (1024, 1024),
         padding_percent: float = 0.1,
-    ) -> Image.Image:
+        mask_info: Optional[MaskInfo] = None,
+        return_info: bool = False,
+    ) -> Union[Image.Image, Tuple[Image.Image, MaskInfo]]:
         """
         Place a product image (RGBA with transparency) on a white background.
 
@@ -30,6 +34,10 @@ class CompositingService:
             product_image: PIL Image (RGBA preferred)
             background_size: Target output size (width, height)
             padding_percent: Padding around product as % of image size
+            mask_info: The cutout's MaskInfo (from remove_background); the
+                product's bounding box is what gets fitted, not the whole photo
+            return_info: Also return the MaskInfo of the placed product
+                (canvas coordinates), for add_drop_shadow
 
         Returns:
             PIL Image (RGB) with product on white background
@@ -37,6 +45,8 @@ class CompositingService:
         # Ensure product is RGBA
         if product_image.mode != "RGBA":
             product_image = product_image.convert("RGBA")
+        if mask_info is not None:
+            product_image = product_image.crop(mask_info.roi())
 
         # Create white background
         white_bg = Image.new("RGB", background_size, (255, 255, 255))
@@ -71,7 +81,11 @@ class CompositingService:
         # Paste with alpha channel
         white_bg.paste(scaled_product, (x_offset, y_offset), scaled_product)
 
-        return white_bg
+        if not return_info:
+            return white_bg
+        source = mask_info if mask_info is not None else MaskInfo.from_image(product_image)
+        placed = source.placed(np.asarray(scaled_product.getchannel("A")), (x_offset, y_offset), background_size)
+        return white_bg, placed
 
     def add_drop_shadow(
         self,
@@ -80,6 +94,7 @@ class CompositingService:
         offset: Tuple[int, int] = (5, 10),
         blur_radius: int = 15,
         shadow_opacity: float = 0.3,
+        mask_info: Optional[MaskInfo] = None,
     ) -> Image.Image:
         """
         Add a subtle drop shadow to a product on white background.
@@ -90,51 +105,42 @@ class CompositingService:
             offset: Shadow offset (x, y)
             blur_radius: Gaussian blur radius for shadow
             shadow_opacity: Shadow transparency (0.0-1.0)
+            mask_info: MaskInfo of the placed product (place_on_white_background
+                with return_info=True); used instead of mask, nothing rescanned
 
         Returns:
             PIL Image with shadow effect
         """
-        # Convert to RGBA for compositing
-        result = image.convert("RGBA")
-
-        # If no mask provided, assume product is not pure white
-        if mask is None:
-            # Simple approach: anything not pure white is product
-            img_array = np.array(image)
-            # Product pixels are slightly off-white or colored
-            mask_array = np.where(
-                (
-                    (img_array[:, :, 0] < 250)
-                    | (img_array[:, :, 1] < 250)
-                    | (img_array[:, :, 2] < 250)
-                ),
-                255,
-                0,
-            ).astype(np.uint8)
-            mask = Image.fromarray(mask_array)
-
-        # Create shadow layer
-        shadow = Image.new("RGBA", image.size, (0, 0, 0, 0))
-        shadow_data = np.array(mask) / 255.0  # Normalize mask to 0-1
-
-        # Create shadow color (dark gray with opacity)
-        shadow_color = (50, 50, 50, int(255 * shadow_opacity))
-        shadow_array = np.zeros((*mask.size[::-1], 4), dtype=np.uint8)
-        shadow_array[..., :3] = shadow_color[:3]
-        shadow_array[..., 3] = (shadow_data * shadow_color[3]).astype(np.uint8)
-        shadow = Image.fromarray(shadow_array)
-
-        # Blur shadow
+        if mask_info is None:
+            if mask is None:
+                # Simple approach: anything not pure white is product
+                img_array = np.asarray(image.convert("RGB"))
+                mask_array = np.where((img_array < 250).any(axis=2), 255, 0).astype(np.uint8)
+            else:
+                mask_array = np.asarray(mask.convert("L"))
+            mask_info = MaskInfo.analyze(mask_array, cleanup=False)
+        if mask_info.bbox is None:
+            return image.convert("RGB")
+
+        # Only the product's neighbourhood can receive any shadow
+        x0, y0, x1, y1 = mask_info.roi(3 * blur_radius + max(abs(offset[0]), abs(offset[1])))
+        region = image.crop((x0, y0, x1, y1)).convert("RGBA")
+        alpha = mask_info.alpha[y0:y1, x0:x1]
+
+        # Shadow: dark gray, product-shaped, blurred and offset
+        shadow = Image.new("RGBA", region.size, (50, 50, 50, 0))
+        shadow.putalpha(Image.fromarray((alpha * shadow_opacity).astype(np.uint8)))
         shadow = shadow.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+        shadow_offset = Image.new("RGBA", region.size, (0, 0, 0, 0))
+        shadow_offset.paste(shadow, offset)
 
-        # Offset shadow
-        shadow_offset = Image.new("RGBA", image.size, (0, 0, 0, 0))
-        shadow_offset.paste(shadow, offset, shadow)
+        # Shadow over the background, then the product back on top of it
+        shaded = Image.alpha_composite(region, shadow_offset)
+        shaded = Image.composite(region, shaded, Image.fromarray(alpha))
 
-        # Composite shadow behind product
-        result = Image.alpha_composite(shadow_offset, result)
-
-        return result.convert("RGB")
+        result = image.convert("RGB")
+        result.paste(shaded.convert("RGB"), (x0, y0))
+        return result
 
     def center_and_pad(
         self,
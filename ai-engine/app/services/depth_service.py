@@ -8,6 +8,8 @@ import numpy as np
 from PIL import Image
 from io import BytesIO
 import os
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class DepthService:
@@ -16,10 +18,13 @@ class DepthService:
         self.transform = None
         self.device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
         
+    @metrics.timed_load("dpt-depth", lambda s: s.model is not None)
     def load_model(self):
         """Load DPT model for depth estimation"""
         if self.model is not None:
             return
+        if model_registry.restore("dpt-depth"):
+            return
             
         print("⚡ Loading DPT Depth Estimation Model...")
         try:
@@ -137,6 +142,7 @@ class DepthService:
         
         return depth_path, viz_path
     
+    @metrics.timed_unload("dpt-depth", lambda s: s.model is not None)
     def unload(self):
         """Free memory by unloading the model"""
         if self.model is not None:
@@ -159,3 +165,7 @@ class DepthService:
 
 # Singleton instance
 depth_service = DepthService()
+model_registry.register(
+    "dpt-depth", depth_service, size_mb=1400, unload="unload", loaded=lambda s: s.model is not None,
+    weights=["Intel/dpt-large"], host_attr="model",
+)
@@ -40,39 +40,7 @@ class EnhanceService:
             if img is None:
                 raise ValueError("Could not decode image")
 
-            # Decide whether to sharpen BEFORE denoise softens edges.
-            if sharpen is None:
-                sharpness = self.measure_sharpness(img)
-                sharpen = sharpness >= self.BLUR_THRESHOLD
-                if not sharpen:
-                    print(f"   🩹 Skipping sharpen — soft input (sharpness {sharpness:.0f} < {self.BLUR_THRESHOLD:.0f})")
-
-            # --- Step 1: Denoise ---
-            # Remove grain/noise which is common in phone photos
-            # h=3 is mild, keeps details but reduces speckles
-            img = cv2.fastNlMeansDenoisingColored(img, None, 3, 3, 7, 21)
-
-            # --- Step 2: Lighting Correction (CLAHE) ---
-            # Convert to LAB color space to separate Luminance from Color
-            lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-            l, a, b = cv2.split(lab)
-
-            # Apply Contrast Limited Adaptive Histogram Equalization to L channel
-            # This brings out details in shadows without blowing out highlights
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            cl = clahe.apply(l)
-
-            # Merge enhanced L with original A/B
-            limg = cv2.merge((cl, a, b))
-            enhanced_img = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-
-            # --- Step 3: Mild Sharpening (skipped on blurry inputs) ---
-            # Brings out texture details (like speaker mesh)
-            if sharpen:
-                kernel = np.array([[0, -1, 0],
-                                   [-1, 5,-1],
-                                   [0, -1, 0]])
-                enhanced_img = cv2.filter2D(enhanced_img, -1, kernel)
+            enhanced_img = self.enhance_array(img, sharpen)
 
             # Convert back to bytes (JPEG)
             success, encoded_img = cv2.imencode('.jpg', enhanced_img, [int(cv2.IMWRITE_JPEG_QUALITY), 95])
@@ -85,5 +53,46 @@ class EnhanceService:
             print(f"⚠️ Enhancement failed: {e}. Returning original.")
             return image_bytes
 
+    def enhance_array(self, img: np.ndarray, sharpen: bool = None) -> np.ndarray:
+        """
+        Same 'Studio' filter on an already-decoded BGR array (e.g. an
+        ImageContext's .bgr view). Returns a new BGR array; no JPEG round trip.
+        """
+        # Decide whether to sharpen BEFORE denoise softens edges.
+        if sharpen is None:
+            sharpness = self.measure_sharpness(img)
+            sharpen = sharpness >= self.BLUR_THRESHOLD
+            if not sharpen:
+                print(f"   🩹 Skipping sharpen — soft input (sharpness {sharpness:.0f} < {self.BLUR_THRESHOLD:.0f})")
+
+        # --- Step 1: Denoise ---
+        # Remove grain/noise which is common in phone photos
+        # h=3 is mild, keeps details but reduces speckles
+        img = cv2.fastNlMeansDenoisingColored(img, None, 3, 3, 7, 21)
+
+        # --- Step 2: Lighting Correction (CLAHE) ---
+        # Convert to LAB color space to separate Luminance from Color
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+
+        # Apply Contrast Limited Adaptive Histogram Equalization to L channel
+        # This brings out details in shadows without blowing out highlights
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        cl = clahe.apply(l)
+
+        # Merge enhanced L with original A/B
+        limg = cv2.merge((cl, a, b))
+        enhanced_img = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+
+        # --- Step 3: Mild Sharpening (skipped on blurry inputs) ---
+        # Brings out texture details (like speaker mesh)
+        if sharpen:
+            kernel = np.array([[0, -1, 0],
+                               [-1, 5,-1],
+                               [0, -1, 0]])
+            enhanced_img = cv2.filter2D(enhanced_img, -1, kernel)
+
+        return enhanced_img
+
 # Singleton
 enhance_service = EnhanceService()
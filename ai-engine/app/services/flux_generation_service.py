@@ -9,6 +9,8 @@ from PIL import Image
 import gc
 import time
 from app.config import DeviceConfig
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class FluxGenerationService:
@@ -28,6 +30,7 @@ class FluxGenerationService:
         self.model_id = "black-forest-labs/FLUX.1-dev"
         self.fallback_model = None
 
+    @metrics.timed_load("flux", lambda s: s.pipeline is not None)
     def load_pipeline(self):
         """
         Load FLUX.1-dev model in fp16 precision.
@@ -338,6 +341,7 @@ class FluxGenerationService:
             return f"{prompt}, {enhanced}"
         return prompt
 
+    @metrics.timed_unload("flux", lambda s: s.pipeline is not None)
     def unload_model(self):
         """
         Unload FLUX.1-dev model to free GPU memory.
@@ -379,3 +383,7 @@ class FluxGenerationService:
 
 # Singleton instance for the API
 flux_service = FluxGenerationService()
+model_registry.register(
+    "flux", flux_service, size_mb=22000, load="load_pipeline", weights=["black-forest-labs/FLUX.1-dev"],
+    loaded=lambda s: s.pipeline not in (None, "fallback"),
+)
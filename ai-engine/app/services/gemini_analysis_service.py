@@ -9,6 +9,7 @@ import os
 import json
 import re
 import io
+from app.services.tracing import traced
 
 class GeminiAnalysisService:
     """
@@ -38,6 +39,7 @@ class GeminiAnalysisService:
         else:
             print("⚠️ No GEMINI_API_KEY found for Analysis Service")
     
+    @traced("gemini.analyze_product")
     def analyze_product(self, image: Image.Image) -> dict:
         """
         Analyze product image and return metadata.
@@ -129,6 +131,7 @@ ONLY return the JSON, no other text."""
             print(f"   ❌ Analysis Error: {e}")
             return {"error": str(e)}
 
+    @traced("gemini.calculate_price_context")
     def calculate_price_context(self, product_name: str, condition: str, condition_report: str) -> dict:
         """
         Synthesizes price based on Market Search + Condition.
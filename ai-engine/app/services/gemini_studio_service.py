@@ -16,6 +16,8 @@ import time
 import base64
 import json
 from PIL import Image
+from app.utils.image_result import ImageResult
+from app.services.tracing import traced
 
 ANALYSIS_PROMPT = (
     "Describe this product for use as a reference during hand-removal editing. "
@@ -85,6 +87,7 @@ class GeminiStudioService:
             self._configure_api()
         return self._available
 
+    @traced("gemini.studio_analyze")
     def _analyze_product(self, pil_image: "Image.Image") -> str:
         """
         Pass 1: cheap vision call to describe the product's exact shape and features.
@@ -124,6 +127,7 @@ class GeminiStudioService:
                 return Image.open(io.BytesIO(raw)).convert("RGB")
         return None
 
+    @traced("gemini.cleanup_product_photo")
     def cleanup_product_photo(self, image_bytes: bytes) -> dict:
         """
         Smart two-pass cleanup:
@@ -193,13 +197,9 @@ class GeminiStudioService:
             alpha_quality = None
             bg_method = "none"
 
-        buf = io.BytesIO()
-        final.save(buf, format="PNG")
-        b64 = base64.b64encode(buf.getvalue()).decode()
-
         return {
             "status": "success",
-            "image_data": f"data:image/png;base64,{b64}",
+            "image_data": ImageResult.from_pil(final, format="PNG"),
             "dimensions": list(final.size),
             "processing_time_ms": int((time.time() - start) * 1000),
             "inpaint_ms": inpaint_ms,
@@ -13,6 +13,8 @@ from PIL import Image, ImageFilter, ImageEnhance
 from typing import Optional
 import os
 
+from app.services.model_registry import model_registry
+
 
 class HybridEnhanceService:
     """
@@ -34,6 +36,8 @@ class HybridEnhanceService:
     
     def _load_sdxl_turbo(self):
         """Lazy load SDXL Turbo for fast regeneration."""
+        if self.sdxl_turbo is None and model_registry.restore("sdxl-turbo"):
+            return self.sdxl_turbo
         if self.sdxl_turbo is None:
             print("⚡ Loading SDXL Turbo for regeneration...")
             from diffusers import AutoPipelineForImage2Image
@@ -47,29 +51,11 @@ class HybridEnhanceService:
             print(f"✅ SDXL Turbo loaded on {self.device}")
         return self.sdxl_turbo
     
-    def _offload_birefnet(self):
-        """Offload BiRefNet from GPU to free memory."""
-        if self.birefnet is not None and self.birefnet.model is not None:
-            print("  🧹 Offloading BiRefNet from GPU...")
-            self.birefnet.model.to("cpu")
-            torch.mps.empty_cache() if self.device == "mps" else torch.cuda.empty_cache()
-            del self.birefnet
-            self.birefnet = None
-            import gc
-            gc.collect()
-            print("  ✅ BiRefNet offloaded, memory freed")
-    
     def _offload_sdxl(self):
-        """Offload SDXL Turbo from GPU to free memory."""
+        """Drop SDXL Turbo (the registry clears the device cache, or keeps it in host RAM instead)."""
         if self.sdxl_turbo is not None:
-            print("  🧹 Offloading SDXL Turbo from GPU...")
-            self.sdxl_turbo.to("cpu")
-            torch.mps.empty_cache() if self.device == "mps" else torch.cuda.empty_cache()
-            del self.sdxl_turbo
             self.sdxl_turbo = None
-            import gc
-            gc.collect()
-            print("  ✅ SDXL Turbo offloaded, memory freed")
+            print("  ✅ SDXL Turbo unloaded")
     
     def enhance(
         self,
@@ -82,7 +68,7 @@ class HybridEnhanceService:
     ) -> dict:
         """
         Full enhancement pipeline: BiRefNet + optional SDXL regeneration.
-        Memory-optimized: offloads each model after use.
+        Models stay resident between calls; the model registry evicts them under memory pressure.
         
         Args:
             image: Input product image
@@ -110,42 +96,37 @@ class HybridEnhanceService:
         results['birefnet'] = birefnet_result.resize(original_size, Image.LANCZOS)
         print("  ✅ BiRefNet complete")
         
-        # OFFLOAD BiRefNet before loading SDXL
-        if use_regeneration:
-            self._offload_birefnet()
-        
         # Step 2: Optional SDXL Turbo regeneration
         if use_regeneration:
             print(f"🎨 Step 2: SDXL Turbo enhancement (strength={regeneration_strength})...")
             try:
-                pipe = self._load_sdxl_turbo()
-                generator = torch.Generator(device=self.device).manual_seed(seed)
-                
-                # Convert BiRefNet result to RGB for SDXL
-                input_image = birefnet_result.convert("RGB")
+                # Held while it runs; stays resident unless the memory budget needs the room
+                with model_registry.use("sdxl-turbo"):
+                    pipe = self.sdxl_turbo
+                    generator = torch.Generator(device=self.device).manual_seed(seed)
                 
-                # SDXL Turbo needs minimum 2 effective steps
-                # With strength=0.5 and steps=4, we get 2 effective steps
-                # Lower strength = more preservation but needs more steps
-                effective_steps = max(2, int(4 * regeneration_strength))
-                actual_strength = max(0.3, regeneration_strength)  # Minimum 0.3 for Turbo
+                    # Convert BiRefNet result to RGB for SDXL
+                    input_image = birefnet_result.convert("RGB")
                 
-                print(f"    Using steps={effective_steps}, strength={actual_strength}")
+                    # SDXL Turbo needs minimum 2 effective steps
+                    # With strength=0.5 and steps=4, we get 2 effective steps
+                    # Lower strength = more preservation but needs more steps
+                    effective_steps = max(2, int(4 * regeneration_strength))
+                    actual_strength = max(0.3, regeneration_strength)  # Minimum 0.3 for Turbo
                 
-                enhanced = pipe(
-                    prompt=prompt,
-                    image=input_image,
-                    num_inference_steps=4,
-                    strength=actual_strength,  # Ensure at least 2 steps
-                    guidance_scale=0.0,  # Turbo uses 0.0 guidance
-                    generator=generator
-                ).images[0]
+                    print(f"    Using steps={effective_steps}, strength={actual_strength}")
                 
-                results['enhanced'] = enhanced.resize(original_size, Image.LANCZOS)
-                print("  ✅ SDXL enhancement complete")
+                    enhanced = pipe(
+                        prompt=prompt,
+                        image=input_image,
+                        num_inference_steps=4,
+                        strength=actual_strength,  # Ensure at least 2 steps
+                        guidance_scale=0.0,  # Turbo uses 0.0 guidance
+                        generator=generator
+                    ).images[0]
                 
-                # OFFLOAD SDXL after use
-                self._offload_sdxl()
+                    results['enhanced'] = enhanced.resize(original_size, Image.LANCZOS)
+                    print("  ✅ SDXL enhancement complete")
                 
             except Exception as e:
                 print(f"  ⚠️ SDXL enhancement failed: {e}")
@@ -189,6 +170,11 @@ class HybridEnhanceService:
 
 # Singleton
 hybrid_service = HybridEnhanceService()
+model_registry.register(
+    "sdxl-turbo", hybrid_service, size_mb=7000, load="_load_sdxl_turbo", unload="_offload_sdxl",
+    weights=["stabilityai/sdxl-turbo"], host_attr="sdxl_turbo",
+    loaded=lambda s: s.sdxl_turbo is not None,
+)
 
 
 def test_hybrid():
@@ -13,6 +13,8 @@ from PIL import Image
 from typing import Optional, List
 import os
 import math
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class ICLightService:
@@ -34,6 +36,7 @@ class ICLightService:
         self.unet_original_forward = None
         self.is_loaded = False
         
+    @metrics.timed_load("iclight", lambda s: s.is_loaded)
     def load_model(self):
         """Load IC-Light model with correct OFFSET weight merging."""
         if self.is_loaded:
@@ -152,6 +155,14 @@ class ICLightService:
             traceback.print_exc()
             self.is_loaded = False
     
+    def unload_model(self):
+        """Drop the IC-Light components (the registry clears the device cache)."""
+        if self.is_loaded:
+            self.unet = self.vae = self.text_encoder = self.tokenizer = self.scheduler = self.pipe = None
+            self.unet_original_forward = None
+            self.is_loaded = False
+            print("🧹 IC-Light unloaded")
+
     def _encode_prompt(self, prompt: str, negative_prompt: str = ""):
         """Encode prompts to match IC-Light's approach."""
         # Positive
@@ -356,6 +367,10 @@ class ICLightService:
 
 # Singleton instance
 iclight_service = ICLightService()
+model_registry.register(
+    "iclight", iclight_service, size_mb=2500, loaded=lambda s: s.is_loaded,
+    weights=["runwayml/stable-diffusion-v1-5", "lllyasviel/ic-light"],
+)
 
 
 def test_iclight():
@@ -0,0 +1,226 @@
+"""
+Inference Executor - Keeps blocking model/image work off the asyncio loop.
+
+Lanes:
+- gpu: one single-thread executor per device. That thread is the only one
+  that touches the device, so models never race for VRAM and CUDA/MPS state
+  stays on one thread.
+- cpu: a process pool for OpenCV/PIL work (releases the GIL for real).
+  Functions and arguments must be picklable (module-level functions/bytes).
+- native: a thread pool (INFERENCE_CPU_WORKERS threads) for OpenCV/numpy
+  work on arrays that are already decoded. cv2 releases the GIL, and the
+  arrays are passed by reference instead of pickled to another process.
+- io:  a thread pool for network-bound service calls (stock search, Gemini,
+  agent LLM calls).
+
+Every call can additionally be capped per model (INFERENCE_MODEL_LIMITS),
+and reports how long it waited in the queue vs. how long it ran.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import get_settings
+
+# Per-request list of call timings (set by the HTTP middleware in main.py)
+_request_calls: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar(
+    "inference_request_calls", default=None
+)
+
+
+@contextmanager
+def track_calls():
+    """Collect timings of every executor call made within this context."""
+    calls: List[dict] = []
+    token = _request_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _request_calls.reset(token)
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Runs inside the worker; wall-clock stamps are comparable across processes."""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+def as_blocking(coro_fn: Callable) -> Callable:
+    """
+    Adapt an async service method that blocks internally (the studio
+    pipelines) so it can run on a lane thread inside its own event loop.
+    """
+    @functools.wraps(coro_fn)
+    def call(*args, **kwargs):
+        return asyncio.run(coro_fn(*args, **kwargs))
+    return call
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class InferenceExecutor:
+    """
+    Central executor for service entry points. Use:
+        await inference_executor.run_gpu("turbo", turbo_service.generate, img, prompt)
+        await inference_executor.run_cpu("enhance", enhance_service.enhance_product, data)
+        await inference_executor.run_native("enhance", enhance_service.enhance_array, ctx.bgr)
+        await inference_executor.run_io("stock", stock_service.find_product_image, name)
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self._gpu: Dict[str, ThreadPoolExecutor] = {}
+        self._cpu: Optional[ProcessPoolExecutor] = None
+        self._io = ThreadPoolExecutor(max_workers=settings.INFERENCE_IO_WORKERS, thread_name_prefix="io")
+        self._native = ThreadPoolExecutor(max_workers=settings.INFERENCE_CPU_WORKERS, thread_name_prefix="native")
+        self._cpu_workers = settings.INFERENCE_CPU_WORKERS
+        self._limits = _parse_limits(settings.INFERENCE_MODEL_LIMITS)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._device: Optional[str] = None
+        self._pending: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        print(f"🧵 Inference Executor initialized (cpu procs: {self._cpu_workers}, limits: {self._limits or 'none'})")
+
+    # ---- lanes ----
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            from app.config import DeviceConfig
+            self._device = str(DeviceConfig.get_device())
+        return self._device
+
+    def _gpu_executor(self, device: str) -> ThreadPoolExecutor:
+        if device not in self._gpu:
+            self._gpu[device] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"gpu-{device}")
+        return self._gpu[device]
+
+    def _cpu_executor(self) -> ProcessPoolExecutor:
+        if self._cpu is None:
+            # spawn: never fork a process that may hold CUDA/MPS state
+            self._cpu = ProcessPoolExecutor(
+                max_workers=self._cpu_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._cpu
+
+    def _semaphore(self, model: str) -> Optional[asyncio.Semaphore]:
+        limit = self._limits.get(model)
+        if limit is None:
+            return None
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(limit)
+        return self._semaphores[model]
+
+    async def run_gpu(self, model: str, fn: Callable, *args, device: Optional[str] = None, **kwargs) -> Any:
+        """Run on the device's single owner thread."""
+        device = device or self.device
+        return await self._run(f"gpu:{device}", self._gpu_executor(device), model, fn, args, kwargs)
+
+    async def run_cpu(self, model: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run in the CPU process pool (fn/args must be picklable)."""
+        return await self._run("cpu", self._cpu_executor(), model, fn, args, kwargs, copy_context=False)
+
+    async def run_native(self, model: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run GIL-releasing array work (cv2) in the native thread pool; no copies."""
+        return await self._run("native", self._native, model, fn, args, kwargs)
+
+    async def run_io(self, model: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run a network-bound call in the I/O thread pool."""
+        return await self._run("io", self._io, model, fn, args, kwargs)
+
+    async def _run(
+        self,
+        lane: str,
+        executor: Executor,
+        model: str,
+        fn: Callable,
+        args: tuple,
+        kwargs: dict,
+        copy_context: bool = True
+    ) -> Any:
+        from app.services.tracing import tracer
+        loop = asyncio.get_running_loop()
+        enqueued = time.time()
+        self._pending[lane] = self._pending.get(lane, 0) + 1
+        semaphore = self._semaphore(model)
+        with tracer.span(f"{lane}/{model}", lane=lane, model=model) as span:
+            try:
+                if semaphore is not None:
+                    await semaphore.acquire()
+                try:
+                    if copy_context:
+                        # Thread lanes keep request-scoped contextvars (debug ids, traces)
+                        ctx = contextvars.copy_context()
+                        future = loop.run_in_executor(executor, ctx.run, _timed_call, fn, args, kwargs)
+                    else:
+                        future = loop.run_in_executor(executor, _timed_call, fn, args, kwargs)
+                    result, started, finished = await future
+                finally:
+                    if semaphore is not None:
+                        semaphore.release()
+            finally:
+                self._pending[lane] -= 1
+            if span is not None:
+                span.set(queue_wait_ms=round((started - enqueued) * 1000, 1), run_ms=round((finished - started) * 1000, 1))
+
+        self._record(lane, model, started - enqueued, finished - started)
+        return result
+
+    # ---- reporting ----
+
+    def _record(self, lane: str, model: str, queue_wait_s: float, run_s: float):
+        call = {"lane": lane, "model": model, "queue_wait_s": round(queue_wait_s, 4), "run_s": round(run_s, 4)}
+        calls = _request_calls.get()
+        if calls is not None:
+            calls.append(call)
+
+        from app.services.metrics import metrics
+        metrics.observe("inference_queue_wait_seconds", queue_wait_s, lane=lane, model=model)
+        metrics.observe("inference_run_seconds", run_s, lane=lane, model=model)
+
+        stats = self._stats.setdefault(f"{lane}/{model}", {"calls": 0, "queue_wait_s": 0.0, "run_s": 0.0, "max_queue_wait_s": 0.0})
+        stats["calls"] += 1
+        stats["queue_wait_s"] += queue_wait_s
+        stats["run_s"] += run_s
+        stats["max_queue_wait_s"] = max(stats["max_queue_wait_s"], queue_wait_s)
+        print(f"⏱️  [{lane}/{model}] queued {queue_wait_s * 1000:.0f}ms, ran {run_s * 1000:.0f}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": dict(self._pending),
+            "calls": {
+                key: {
+                    "calls": s["calls"],
+                    "avg_queue_wait_ms": round(s["queue_wait_s"] * 1000 / s["calls"], 1),
+                    "max_queue_wait_ms": round(s["max_queue_wait_s"] * 1000, 1),
+                    "avg_run_ms": round(s["run_s"] * 1000 / s["calls"], 1),
+                }
+                for key, s in self._stats.items()
+            },
+        }
+
+    def shutdown(self):
+        for executor in self._gpu.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._io.shutdown(wait=False, cancel_futures=True)
+        self._native.shutdown(wait=False, cancel_futures=True)
+        if self._cpu is not None:
+            self._cpu.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton
+inference_executor = InferenceExecutor()
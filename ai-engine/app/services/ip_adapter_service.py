@@ -7,6 +7,7 @@ import torch
 from PIL import Image
 from diffusers import StableDiffusionXLPipeline, AutoencoderKL
 import os
+from app.services.metrics import metrics
 
 
 class IPAdapterStudioService:
@@ -21,6 +22,7 @@ class IPAdapterStudioService:
         self.pipe = None
         self.device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
         
+    @metrics.timed_load("ip-adapter", lambda s: s.pipe is not None)
     def load_models(self):
         """Load SDXL + IP-Adapter models"""
         if self.pipe is not None:
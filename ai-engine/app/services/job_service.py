@@ -0,0 +1,576 @@
+"""
+Job Service - Asynchronous submit / poll / stream API for the long studio pipelines.
+
+SOTA V2, Local Enhanced and Plan B take 15-30s. Instead of holding the HTTP
+request open, a request submits a job and gets an id back; the job waits in a
+bounded per-device queue until a worker picks it up, and stage progress is
+published as events (served over SSE by routers/jobs.py).
+
+Two brokers share one interface:
+- InProcessBroker: asyncio queues in this process (default).
+- LocalBroker: SQLite file on the host, so several uvicorn workers (or a
+  separate worker process) share one queue. Stand-in for Redis when we scale out.
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.utils.image_result import ImageResult
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    TERMINAL = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised on submit when the device queue is at capacity."""
+
+    def __init__(self, device: str, retry_after: int):
+        super().__init__(f"{device} queue is full, retry in {retry_after}s")
+        self.device = device
+        self.retry_after = retry_after
+
+
+class Job:
+    """A unit of pipeline work plus its progress events and result."""
+
+    def __init__(self, pipeline: str, device: str, params: Dict[str, Any], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.pipeline = pipeline
+        self.device = device
+        self.params = params
+        self.status = JobStatus.QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        # {"images": {name: ImageResult}, "metadata": {...}}
+        self.result: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "pipeline": self.pipeline,
+            "device": self.device,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_s": round(self.started_at - self.created_at, 3) if self.started_at else None,
+            "run_time_s": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "error": self.error,
+            "images": sorted(self.result["images"]) if self.result else [],
+        }
+
+
+# ============ BROKERS ============
+# submit() also publishes the job's first "queued" status event.
+
+def _queued_event(job: Job) -> dict:
+    return {"type": "status", "status": JobStatus.QUEUED, "ts": job.created_at}
+
+
+class InProcessBroker:
+    """Bounded asyncio queues per device; job state kept in memory."""
+
+    BLOCKING = False  # sync methods are cheap enough to call on the event loop
+    lease_s = None  # jobs live and die with this process: nothing to lease
+
+    def __init__(self, queue_size: int, retention: int):
+        self.queue_size = queue_size
+        self.retention = retention
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._payloads: Dict[str, bytes] = {}
+        self._events: Dict[str, List[dict]] = {}
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def _queue(self, device: str) -> asyncio.Queue:
+        if device not in self._queues:
+            self._queues[device] = asyncio.Queue(maxsize=self.queue_size)
+        return self._queues[device]
+
+    def depth(self, device: str) -> int:
+        return self._queue(device).qsize()
+
+    async def submit(self, job: Job, payload: bytes, retry_after: int):
+        queue = self._queue(job.device)
+        if queue.full():
+            raise QueueFullError(job.device, retry_after)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._payloads[job.id] = payload
+            self._events[job.id] = []
+        queue.put_nowait(job.id)
+        self.publish(job.id, _queued_event(job))
+        self._evict()
+
+    async def claim(self, device: str) -> Tuple[Job, bytes]:
+        job_id = await self._queue(device).get()
+        with self._lock:
+            return self._jobs[job_id], self._payloads.pop(job_id, b"")
+
+    def save(self, job: Job):
+        # Jobs are live objects here - nothing to persist
+        pass
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def publish(self, job_id: str, event: dict):
+        """Thread-safe: pipelines report progress from worker threads."""
+        with self._lock:
+            events = self._events.setdefault(job_id, [])
+            event["seq"] = len(events) + 1
+            events.append(event)
+            # Set even when nobody is waiting yet so a subscriber that is
+            # between reading events and waiting does not miss the wakeup.
+            waiter = self._waiters.setdefault(job_id, asyncio.Event())
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(waiter.set)
+
+    def events(self, job_id: str, after: int = 0) -> List[dict]:
+        with self._lock:
+            return list(self._events.get(job_id, [])[after:])
+
+    async def wait(self, job_id: str, timeout: float):
+        with self._lock:
+            waiter = self._waiters.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        waiter.clear()
+
+    def _evict(self):
+        """Drop the oldest finished jobs beyond the retention window."""
+        with self._lock:
+            finished = [jid for jid, j in self._jobs.items() if j.status in JobStatus.TERMINAL]
+            for job_id in finished[: max(0, len(finished) - self.retention)]:
+                self._jobs.pop(job_id, None)
+                self._events.pop(job_id, None)
+                self._waiters.pop(job_id, None)
+
+
+class LocalBroker:
+    """
+    SQLite-backed broker. Every process on the host that points at the same
+    file shares queues, job state, results and events. Workers claim jobs with
+    an atomic UPDATE, so it is safe to run workers in several processes.
+
+    A claim is a lease: the worker renews it while the job runs, and a job
+    whose lease lapses (its worker process died) is requeued by the next
+    claim, or failed once it has been claimed max_attempts times.
+
+    The sync methods block on SQLite (up to its 10s lock timeout); the event
+    loop calls them through JobService._broker_io, in a thread.
+    """
+
+    BLOCKING = True
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path: str, queue_size: int, retention: int, lease_s: float = 60.0, max_attempts: int = 2):
+        self.path = path
+        self.queue_size = queue_size
+        self.retention = retention
+        self.lease_s = lease_s
+        self.max_attempts = max(1, max_attempts)
+        self._depths: Dict[str, int] = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, pipeline TEXT, device TEXT, status TEXT,
+                    params TEXT, payload BLOB, created_at REAL, started_at REAL,
+                    finished_at REAL, error TEXT, metadata TEXT, claimed_by TEXT,
+                    claimed_at REAL, attempts INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (device, status, created_at);
+                CREATE TABLE IF NOT EXISTS job_images (
+                    job_id TEXT, name TEXT, media_type TEXT, data BLOB, PRIMARY KEY (job_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT, seq INTEGER, body TEXT, PRIMARY KEY (job_id, seq)
+                );
+            """)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("claimed_at", "REAL"), ("attempts", "INTEGER DEFAULT 0")):
+                if column not in columns:  # files created before leases
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        pass
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    def depth(self, device: str) -> int:
+        """Queued jobs as of this process's last submit/claim (metrics scrapes run on the event loop)."""
+        return self._depths.get(device, 0)
+
+    def _count_queued(self, db, device: str) -> int:
+        queued = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE device = ? AND status = ?", (device, JobStatus.QUEUED)
+        ).fetchone()[0]
+        self._depths[device] = queued
+        return queued
+
+    async def submit(self, job: Job, payload: bytes, retry_after: int):
+        await asyncio.to_thread(self._submit, job, payload, retry_after)
+
+    def _submit(self, job: Job, payload: bytes, retry_after: int):
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            queued = self._count_queued(db, job.device)
+            if queued >= self.queue_size:
+                db.execute("ROLLBACK")
+                raise QueueFullError(job.device, retry_after)
+            db.execute(
+                "INSERT INTO jobs (id, pipeline, device, status, params, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.pipeline, job.device, job.status, json.dumps(job.params), payload, job.created_at),
+            )
+            # In the same transaction, so a worker's "running" can't be published before it
+            event = {**_queued_event(job), "seq": 1}
+            db.execute("INSERT INTO job_events (job_id, seq, body) VALUES (?, ?, ?)", (job.id, 1, json.dumps(event)))
+            db.execute("COMMIT")
+        self._depths[job.device] = queued + 1
+        self._evict()
+
+    async def claim(self, device: str) -> Tuple[Job, bytes]:
+        worker_tag = uuid.uuid4().hex
+        while True:
+            claimed = await asyncio.to_thread(self._claim_once, device, worker_tag)
+            if claimed:
+                return claimed
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def _claim_once(self, device: str, worker_tag: str) -> Optional[Tuple[Job, bytes]]:
+        self._recover(device)
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, claimed_by = ?, claimed_at = ?, attempts = COALESCE(attempts, 0) + 1"
+                " WHERE id = (SELECT id FROM jobs WHERE device = ? AND status = ? ORDER BY created_at LIMIT 1)"
+                " AND status = ?",
+                (JobStatus.RUNNING, worker_tag, time.time(), device, JobStatus.QUEUED, JobStatus.QUEUED),
+            )
+            row = db.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? AND claimed_by = ?", (JobStatus.RUNNING, worker_tag)
+            ).fetchone()
+            self._count_queued(db, device)
+        return (self.get(row[0]), row[1]) if row else None
+
+    def _recover(self, device: str):
+        """Requeue (or fail, after max_attempts) running jobs whose lease lapsed."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            lost = db.execute(
+                "SELECT id, COALESCE(attempts, 0) FROM jobs WHERE device = ? AND status = ?"
+                " AND (claimed_at IS NULL OR claimed_at < ?)",
+                (device, JobStatus.RUNNING, now - self.lease_s),
+            ).fetchall()
+            for job_id, attempts in lost:
+                if attempts >= self.max_attempts:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, finished_at = ?, error = ?, claimed_by = NULL, payload = NULL WHERE id = ?",
+                        (JobStatus.FAILED, now, f"Worker lost {attempts} times", job_id),
+                    )
+                else:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, started_at = NULL, claimed_by = NULL, claimed_at = NULL WHERE id = ?",
+                        (JobStatus.QUEUED, job_id),
+                    )
+            db.execute("COMMIT")
+        for job_id, attempts in lost:
+            failed = attempts >= self.max_attempts
+            print(f"⚠️ Job {job_id[:8]} lost its worker, {'failed' if failed else 'requeued'}")
+            self.publish(job_id, {
+                "type": "status", "status": JobStatus.FAILED if failed else JobStatus.QUEUED,
+                "error": f"Worker lost {attempts} times" if failed else None, "requeued": not failed, "ts": now,
+            })
+
+    def renew(self, job_id: str):
+        """Extend a running job's lease (called periodically by its worker)."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET claimed_at = ? WHERE id = ? AND status = ?", (time.time(), job_id, JobStatus.RUNNING)
+            )
+
+    def save(self, job: Job):
+        """Persist status and result (encodes the result images: call it off the event loop)."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, finished_at = ?, error = ?, metadata = ? WHERE id = ?",
+                (
+                    job.status, job.started_at, job.finished_at, job.error,
+                    json.dumps(job.result["metadata"], default=str) if job.result else None, job.id,
+                ),
+            )
+            if job.result:
+                db.executemany(
+                    "INSERT OR REPLACE INTO job_images (job_id, name, media_type, data) VALUES (?, ?, ?, ?)",
+                    [(job.id, name, img.media_type, img.data) for name, img in job.result["images"].items()],
+                )
+                db.execute("UPDATE jobs SET payload = NULL WHERE id = ?", (job.id,))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT pipeline, device, status, params, created_at, started_at, finished_at, error, metadata"
+                " FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = Job(row[0], row[1], json.loads(row[3] or "{}"), job_id=job_id)
+            job.status, job.created_at, job.started_at, job.finished_at = row[2], row[4], row[5], row[6]
+            job.error = row[7] if row[2] == JobStatus.FAILED else None
+            if row[8] is not None:
+                images = db.execute(
+                    "SELECT name, media_type, data FROM job_images WHERE job_id = ?", (job_id,)
+                ).fetchall()
+                job.result = {
+                    "images": {name: ImageResult.from_bytes(data, media_type) for name, media_type, data in images},
+                    "metadata": json.loads(row[8]),
+                }
+        return job
+
+    def publish(self, job_id: str, event: dict):
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+            event["seq"] = seq
+            db.execute("INSERT INTO job_events (job_id, seq, body) VALUES (?, ?, ?)", (job_id, seq, json.dumps(event, default=str)))
+            db.execute("COMMIT")
+
+    def events(self, job_id: str, after: int = 0) -> List[dict]:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT body FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    async def wait(self, job_id: str, timeout: float):
+        await asyncio.sleep(min(timeout, self.POLL_INTERVAL))
+
+    def _evict(self):
+        with self._connect() as db:
+            stale = db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY finished_at DESC LIMIT -1 OFFSET ?",
+                (JobStatus.SUCCEEDED, JobStatus.FAILED, self.retention),
+            ).fetchall()
+            for (job_id,) in stale:
+                db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                db.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+
+
+# ============ PIPELINE RUNNERS ============
+# Each runner: (image_bytes, params, progress) -> ({name: ImageResult}, metadata)
+# progress(stage, state, **info) is called from the pipeline as stages start/finish.
+
+ProgressCallback = Callable[..., None]
+Runner = Callable[[bytes, Dict[str, Any], ProgressCallback], Awaitable[Tuple[Dict[str, ImageResult], Dict]]]
+
+
+def _open_rgb(image_bytes: bytes):
+    from io import BytesIO
+    from PIL import Image
+    return Image.open(BytesIO(image_bytes)).convert("RGB")
+
+
+async def _run_sota_v2(image_bytes: bytes, params: Dict[str, Any], progress: ProgressCallback):
+    from app.services.service_registry import services
+    sota_pipeline = services.require("sota-v2")
+    result_image, metadata = await sota_pipeline.process(_open_rgb(image_bytes), progress_callback=progress, **params)
+    return {"image": ImageResult.from_pil(result_image, format="JPEG", quality=95)}, metadata
+
+
+async def _run_local_enhanced(image_bytes: bytes, params: Dict[str, Any], progress: ProgressCallback):
+    from app.services.service_registry import services
+    local_enhanced_pipeline = services.require("local-enhanced")
+    result_image, metadata = await local_enhanced_pipeline.process(_open_rgb(image_bytes), progress_callback=progress, **params)
+    return {"image": ImageResult.from_pil(result_image, format="JPEG", quality=95)}, metadata
+
+
+async def _run_plan_b(image_bytes: bytes, params: Dict[str, Any], progress: ProgressCallback):
+    from app.services.plan_b_pipeline import plan_b_pipeline
+    views, metadata = await plan_b_pipeline.process(_open_rgb(image_bytes), progress_callback=progress, **params)
+    return {angle: ImageResult.from_pil(img, format="JPEG", quality=95) for angle, img in views.items()}, metadata
+
+
+# pipeline name -> (runner, device lane). Diffusion/relighting pipelines own the
+# accelerator; Plan B is cloud reconstruction + CPU rendering, and sends only
+# its model stages (segmentation, upscaling) to the GPU owner thread.
+PIPELINES: Dict[str, Tuple[Runner, str]] = {
+    "sota-v2": (_run_sota_v2, "gpu"),
+    "local-enhanced": (_run_local_enhanced, "gpu"),
+    "plan-b": (_run_plan_b, "cpu"),
+}
+
+
+# ============ SERVICE ============
+
+class JobService:
+    """
+    Owns the broker and the per-device worker pools.
+    Workers run each job on a worker thread with its own event loop, so the
+    pipelines' blocking model calls never stall the API event loop.
+    """
+
+    DEFAULT_JOB_SECONDS = 20.0
+
+    def __init__(self):
+        settings = get_settings()
+        if settings.JOB_BROKER == "local":
+            self.broker = LocalBroker(
+                settings.JOB_BROKER_PATH, settings.JOB_QUEUE_SIZE, settings.JOB_RETENTION,
+                settings.JOB_LEASE_S, settings.JOB_MAX_ATTEMPTS,
+            )
+        else:
+            self.broker = InProcessBroker(settings.JOB_QUEUE_SIZE, settings.JOB_RETENTION)
+        self.workers = {"gpu": settings.JOB_GPU_WORKERS, "cpu": settings.JOB_CPU_WORKERS}
+        self._tasks: List[asyncio.Task] = []
+        # EWMA of job run time per device, used for Retry-After
+        self._avg_run_s: Dict[str, float] = {}
+        print(f"📬 Job Service initialized ({settings.JOB_BROKER} broker, workers: {self.workers})")
+
+    async def start(self):
+        if self._tasks:
+            return
+        self.broker.bind(asyncio.get_running_loop())
+        for device, count in self.workers.items():
+            for slot in range(count):
+                self._tasks.append(asyncio.create_task(self._worker(device, slot)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def retry_after(self, device: str) -> int:
+        """Seconds until a queue slot is likely to free up (one job finishing)."""
+        avg = self._avg_run_s.get(device, self.DEFAULT_JOB_SECONDS)
+        return max(1, math.ceil(avg / max(1, self.workers.get(device, 1))))
+
+    async def _broker_io(self, fn: Callable, *args):
+        """
+        Broker calls from the event loop. The SQLite broker's run in a thread
+        (asyncio.to_thread, not the executor's I/O lane: SSE clients poll it
+        several times a second and would flood the lane's per-call log).
+        """
+        if not self.broker.BLOCKING:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {device: self.broker.depth(device) for device in self.workers}
+
+    async def submit(self, pipeline: str, image_bytes: bytes, params: Dict[str, Any]) -> Job:
+        if pipeline not in PIPELINES:
+            raise KeyError(f"Unknown pipeline: {pipeline}")
+        _, device = PIPELINES[pipeline]
+        job = Job(pipeline, device, params)
+        await self.broker.submit(job, image_bytes, self.retry_after(device))
+        print(f"📬 Job {job.id[:8]} queued ({pipeline} on {device}, depth {self.broker.depth(device)})")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._broker_io(self.broker.get, job_id)
+
+    async def stream(self, job_id: str, after: int = 0):
+        """Yield events for a job until it reaches a terminal state."""
+        cursor = after
+        while True:
+            for event in await self._broker_io(self.broker.events, job_id, cursor):
+                cursor = event["seq"]
+                yield event
+            job = await self.get(job_id)
+            if job is None or job.status in JobStatus.TERMINAL:
+                # Drain anything published between the read and the status check
+                for event in await self._broker_io(self.broker.events, job_id, cursor):
+                    cursor = event["seq"]
+                    yield event
+                return
+            await self.broker.wait(job_id, timeout=15.0)
+
+    async def _worker(self, device: str, slot: int):
+        print(f"👷 Job worker {device}-{slot} ready")
+        while True:
+            from app.services.admission_control import admission_controller
+            await admission_controller.wait_for_room()  # jobs stay queued while memory is tight
+            job, payload = await self.broker.claim(device)
+            await self._execute(job, payload)
+
+    async def _execute(self, job: Job, payload: bytes):
+        runner, device = PIPELINES[job.pipeline]
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        await self._broker_io(self.broker.save, job)
+        await self._broker_io(self.broker.publish, job.id, {"type": "status", "status": JobStatus.RUNNING, "ts": job.started_at})
+
+        def progress(stage: str, state: str, **info):
+            # Called from the pipeline's lane thread, where blocking is fine
+            self.broker.publish(job.id, {"type": "stage", "stage": stage, "state": state, "ts": time.time(), **info})
+
+        # Keep the broker's lease on the job while it runs; a dead process stops renewing it
+        heartbeat = asyncio.create_task(self._renew_lease(job.id)) if self.broker.lease_s else None
+        try:
+            # GPU jobs share the device's owner thread with the sync endpoints
+            from app.services.inference_executor import as_blocking, inference_executor
+            from app.services.tracing import tracer
+            run = inference_executor.run_gpu if device == "gpu" else inference_executor.run_io
+            with tracer.trace(f"job {job.pipeline}", trace_id=job.id):
+                images, metadata = await run(job.pipeline, as_blocking(runner), payload, job.params, progress)
+            job.result = {"images": images, "metadata": metadata}
+            job.status = JobStatus.SUCCEEDED
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+        job.finished_at = time.time()
+        run_s = job.finished_at - job.started_at
+        self._avg_run_s[device] = 0.7 * self._avg_run_s.get(device, run_s) + 0.3 * run_s
+        await self._broker_io(self.broker.save, job)
+        await self._broker_io(self.broker.publish, job.id, {"type": "status", "status": job.status, "error": job.error, "ts": job.finished_at})
+        print(f"📬 Job {job.id[:8]} {job.status} in {run_s:.1f}s")
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.broker.lease_s / 3)
+            try:
+                await self._broker_io(self.broker.renew, job_id)
+            except sqlite3.Error as e:
+                print(f"⚠️ Job {job_id[:8]} lease renewal failed: {e}")
+
+
+# Singleton
+job_service = JobService()
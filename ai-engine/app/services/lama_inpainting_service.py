@@ -2,10 +2,15 @@
 LaMa Inpainting Service
 Uses LaMa (Large Mask Inpainting) for high-quality edge extension
 """
+import os
 from simple_lama_inpainting import SimpleLama
 from PIL import Image, ImageOps
 import numpy as np
 import torch
+from typing import Optional
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
+from app.utils.mask_info import MaskInfo
 
 
 class LamaInpaintingService:
@@ -21,6 +26,7 @@ class LamaInpaintingService:
         self.device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
         self.expansion_pixels = 64
         
+    @metrics.timed_load("lama", lambda s: s.model is not None)
     def load_model(self):
         """Load LaMa model (lazy loading)"""
         if self.model is not None:
@@ -29,9 +35,16 @@ class LamaInpaintingService:
         print("⚡ Loading LaMa Inpainting Model...")
         self.model = SimpleLama()
         print(f"✅ LaMa loaded on {self.device}")
+
+    def unload_model(self):
+        if self.model is not None:
+            self.model = None
+            print("🧹 LaMa unloaded")
     
-    def detect_crop(self, image: Image.Image) -> dict:
+    def detect_crop(self, image: Image.Image, mask_info: Optional[MaskInfo] = None) -> dict:
         """Detect if product touches edges (cropped)"""
+        if mask_info is not None:
+            return mask_info.crop_info()
         if image.mode != "RGBA":
             image = image.convert("RGBA")
             
@@ -50,12 +63,12 @@ class LamaInpaintingService:
         crop_info["is_cropped"] = any([crop_info[k] for k in ["top", "bottom", "left", "right"]])
         return crop_info
     
-    def smart_repair(self, image: Image.Image) -> Image.Image:
+    def smart_repair(self, image: Image.Image, mask_info: Optional[MaskInfo] = None) -> Image.Image:
         """
         Main entry: Detect crop -> Expand -> LaMa Inpaint -> Return on White BG
         """
         print("🔍 Checking for cropped edges...")
-        crop_info = self.detect_crop(image)
+        crop_info = self.detect_crop(image, mask_info)
         
         if not crop_info["is_cropped"]:
             print("   ✅ No cropping detected. Placing on white.")
@@ -125,3 +138,7 @@ class LamaInpaintingService:
 
 # Singleton
 lama_service = LamaInpaintingService()
+model_registry.register(
+    "lama", lama_service, size_mb=200, loaded=lambda s: s.model is not None,
+    weights=[os.getenv("LAMA_MODEL", "~/.cache/torch/hub/checkpoints/big-lama.pt")],
+)
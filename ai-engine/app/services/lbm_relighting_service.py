@@ -10,6 +10,8 @@ import gc
 import time
 from typing import Optional, Tuple
 from app.config import DeviceConfig
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class LBMRelightingService:
@@ -32,6 +34,7 @@ class LBMRelightingService:
         self.is_loaded = False
         self.use_fallback = False
 
+    @metrics.timed_load("lbm", lambda s: s.is_loaded)
     def load_model(self):
         """
         Load LBM relighting model or fallback to IC-Light.
@@ -108,9 +111,10 @@ class LBMRelightingService:
         IC-Light is production-ready and well-tested.
         """
         try:
-            from app.services.iclight_service import ICLightService
+            from app.services.iclight_service import iclight_service
 
-            self.ic_light = ICLightService()
+            # The process-wide instance: its weights are shared, not loaded twice
+            self.ic_light = iclight_service
             self.ic_light.load_model()
             return True
 
@@ -274,7 +278,7 @@ class LBMRelightingService:
         total_light = np.clip(total_light, 0.5, 2.0)
 
         # Apply only to product (via mask)
-        lighting_map = (total_light - 1.0) * mask_array[:, :, None]
+        lighting_map = (total_light - 1.0)[:, :, None] * mask_array[:, :, None]
 
         # Apply to image
         result_array = img_array + lighting_map
@@ -358,6 +362,7 @@ class LBMRelightingService:
 
         return params
 
+    @metrics.timed_unload("lbm", lambda s: s.is_loaded)
     def unload_model(self):
         """
         Unload model to free GPU memory.
@@ -370,6 +375,7 @@ class LBMRelightingService:
             del self.ic_light
             self.ic_light = None
 
+        self.is_loaded = False
         gc.collect()
         torch.cuda.empty_cache() if torch.cuda.is_available() else None
         print("🧹 Relighting model unloaded from GPU")
@@ -381,3 +387,7 @@ class LBMRelightingService:
 
 # Singleton instance for the API
 lbm_service = LBMRelightingService()
+model_registry.register(
+    "lbm", lbm_service, size_mb=6000, loaded=lambda s: s.is_loaded,
+    weights=["lllyasviel/control_v11f1p_sd15_depth", "stable-diffusion-v1-5/stable-diffusion-v1-5"],
+)
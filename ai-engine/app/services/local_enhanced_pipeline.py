@@ -12,19 +12,17 @@ Works on Mac 32GB + RTX 3060 Ti 8GB, preserves real product details
 Total: 10-15s on CUDA, 15-25s on MPS, peak <8GB VRAM, $0 cost
 """
 
-import torch
 import gc
 import time
 from PIL import Image
-from typing import Tuple, Dict, Optional
+from typing import Callable, Tuple, Dict, Optional
 from io import BytesIO
 
 from app.config import DeviceProfile
-from app.services.birefnet_service import BiRefNetService
-from app.services.lama_inpainting_service import LamaInpaintingService
-from app.services.lbm_relighting_service import LBMRelightingService
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
+from app.services.weight_prefetcher import weight_prefetcher
 from app.services.compositing_service import CompositingService
-from app.services.upscale_service import UpscaleService
 
 
 class LocalEnhancedPipeline:
@@ -35,14 +33,11 @@ class LocalEnhancedPipeline:
 
     def __init__(self):
         self.device_profile = DeviceProfile.get_profile()
+        import torch
         self.device = torch.device(self.device_profile["device"])
 
-        # Lazy-loaded services
-        self._birefnet = None
-        self._lama = None
-        self._relighting = None
+        # Models are held per phase through the model registry
         self._compositing = None
-        self._upscaler = None
 
         self.config = {
             "enable_inpainting": True,
@@ -60,68 +55,12 @@ class LocalEnhancedPipeline:
    Pipeline: BiRefNet → LaMa → LBM → Compositing → Real-ESRGAN
         """)
 
-    # Lazy loading properties
-    @property
-    def birefnet(self) -> BiRefNetService:
-        if self._birefnet is None:
-            print("⏳ Loading BiRefNet...")
-            self._birefnet = BiRefNetService()
-            self._birefnet.load_model(variant="massive")
-        return self._birefnet
-
-    @property
-    def lama(self) -> LamaInpaintingService:
-        if self._lama is None and self.config["enable_inpainting"]:
-            print("⏳ Loading LaMa Inpainting...")
-            self._lama = LamaInpaintingService()
-            self._lama.load_model()
-        return self._lama
-
-    @property
-    def relighting(self) -> LBMRelightingService:
-        if self._relighting is None and self.config["enable_relighting"]:
-            print("⏳ Loading LBM Relighting...")
-            self._relighting = LBMRelightingService()
-            self._relighting.load_model()
-        return self._relighting
-
     @property
     def compositing(self) -> CompositingService:
         if self._compositing is None:
             self._compositing = CompositingService()
         return self._compositing
 
-    @property
-    def upscaler(self) -> UpscaleService:
-        if self._upscaler is None and self.config["enable_upscaling"]:
-            print("⏳ Loading Real-ESRGAN...")
-            self._upscaler = UpscaleService()
-            self._upscaler.load_model()
-        return self._upscaler
-
-    def _cleanup_model(self, model_name: str):
-        """Unload a model to free VRAM."""
-        if model_name == "birefnet" and self._birefnet is not None:
-            del self._birefnet
-            self._birefnet = None
-        elif model_name == "lama" and self._lama is not None:
-            del self._lama
-            self._lama = None
-        elif model_name == "relighting" and self._relighting is not None:
-            self._relighting.unload_model()
-            del self._relighting
-            self._relighting = None
-        elif model_name == "upscaler" and self._upscaler is not None:
-            self._upscaler.unload_model()
-            del self._upscaler
-            self._upscaler = None
-
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        elif torch.backends.mps.is_available():
-            torch.mps.empty_cache()
-
     async def process(
         self,
         image: Image.Image,
@@ -130,6 +69,7 @@ class LocalEnhancedPipeline:
         lighting_style: str = "soft_studio",
         enable_upscaling: bool = True,
         upscale_factor: int = 2,
+        progress_callback: Optional[Callable[..., None]] = None,
     ) -> Tuple[Image.Image, Dict]:
         """
         Process image through Clean & Enhance pipeline.
@@ -141,10 +81,12 @@ class LocalEnhancedPipeline:
             lighting_style: Lighting preset (soft_studio, dramatic, natural, bright)
             enable_upscaling: Use Real-ESRGAN for enhancement
             upscale_factor: Upscaling multiplier (2 or 4)
+            progress_callback: Called as progress(stage, "started"/"completed", **info)
 
         Returns:
             (result_image, metadata) - Final result and processing stats
         """
+        progress = metrics.stage_reporter("local-enhanced", progress_callback)
         pipeline_start = time.time()
         metadata = {
             "stages": {},
@@ -157,42 +99,46 @@ class LocalEnhancedPipeline:
             # Phase 1: BiRefNet Segmentation (2-3s, 2-3GB)
             print("\n📦 Phase 1: BiRefNet Segmentation...")
             phase_start = time.time()
+            progress("segmentation", "started")
 
             # Convert to RGB if needed
             if image.mode != "RGB":
                 image = image.convert("RGB")
 
-            # Get product with transparent background
-            product_rgba = self.birefnet.remove_background(image)
+            # Get product with transparent background (reading the next stage's weights meanwhile)
+            self._prefetch_after("segmentation", enable_inpainting, enable_relighting, enable_upscaling)
+            with model_registry.use("birefnet") as birefnet:
+                product_rgba, mask_info = birefnet.remove_background(image, return_info=True)
             metadata["stages"]["segmentation"] = "BiRefNet"
             metadata["timings"]["segmentation"] = time.time() - phase_start
             print(f"   ✅ Complete in {metadata['timings']['segmentation']:.1f}s")
-
-            # Cleanup BiRefNet to free VRAM
-            self._cleanup_model("birefnet")
+            progress("segmentation", "completed", seconds=metadata["timings"]["segmentation"])
 
             # Phase 2: LaMa Inpainting (1-2s, <1GB) - Optional
             if enable_inpainting:
                 print("🖼️  Phase 2: LaMa Inpainting (remove hands/clutter)...")
                 phase_start = time.time()
+                progress("inpainting", "started")
 
                 # Use LaMa to repair cropped edges and clean up artifacts
-                cleaned_rgba = self.lama.smart_repair(product_rgba)
+                self._prefetch_after("inpainting", enable_inpainting, enable_relighting, enable_upscaling)
+                with model_registry.use("lama") as lama:
+                    cleaned_rgba = lama.smart_repair(product_rgba, mask_info)
 
                 metadata["stages"]["inpainting"] = "LaMa"
                 metadata["timings"]["inpainting"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['inpainting']:.1f}s")
+                progress("inpainting", "completed", seconds=metadata["timings"]["inpainting"])
 
-                # Use cleaned image for next phase
+                # Use cleaned image for next phase (a new canvas: the mask info no longer applies)
                 product_rgba = cleaned_rgba
-
-                # Cleanup LaMa
-                self._cleanup_model("lama")
+                mask_info = None
 
             # Phase 3: LBM Relighting (2-3s, <8GB) - Optional
             if enable_relighting:
                 print("💡 Phase 3: LBM Relighting...")
                 phase_start = time.time()
+                progress("relighting", "started")
 
                 # Create mask from alpha channel
                 if product_rgba.mode == "RGBA":
@@ -201,70 +147,76 @@ class LocalEnhancedPipeline:
                     mask = Image.new("L", product_rgba.size, 255)
 
                 # Apply professional studio lighting
-                relit, relight_meta = self.relighting.apply_studio_lighting(
-                    product_rgba.convert("RGB"),
-                    mask=mask,
-                    style=lighting_style,
-                    intensity=1.0
-                )
+                self._prefetch_after("relighting", enable_inpainting, enable_relighting, enable_upscaling)
+                with model_registry.use("lbm") as relighting:
+                    relit, relight_meta = relighting.apply_studio_lighting(
+                        product_rgba.convert("RGB"),
+                        mask=mask,
+                        style=lighting_style,
+                        intensity=1.0
+                    )
 
                 metadata["stages"]["relighting"] = "LBM"
                 metadata["timings"]["relighting"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['relighting']:.1f}s")
+                progress("relighting", "completed", seconds=metadata["timings"]["relighting"])
 
                 product_rgba = relit.convert("RGBA") if relit.mode != "RGBA" else relit
-
-                # Cleanup relighting
-                self._cleanup_model("relighting")
+                mask_info = None
 
             # Phase 4: Compositing (1s, CPU) - Always done
             print("🎨 Phase 4: Compositing (white background + shadow)...")
             phase_start = time.time()
+            progress("compositing", "started")
 
             # Ensure RGBA
             if product_rgba.mode != "RGBA":
                 product_rgba = product_rgba.convert("RGBA")
 
             # Place on white background with shadow
-            composed = self.compositing.place_on_white_background(
+            composed, placed = self.compositing.place_on_white_background(
                 product_rgba,
                 background_size=(1024, 1024),
-                padding_percent=0.05
+                padding_percent=0.05,
+                mask_info=mask_info,
+                return_info=True
             )
 
             # Add drop shadow for professional look
             composed = self.compositing.add_drop_shadow(
                 composed,
-                shadow_opacity=0.2
+                shadow_opacity=0.2,
+                mask_info=placed if mask_info is not None else None
             )
 
             metadata["stages"]["compositing"] = "PIL"
             metadata["timings"]["compositing"] = time.time() - phase_start
             print(f"   ✅ Complete in {metadata['timings']['compositing']:.1f}s")
+            progress("compositing", "completed", seconds=metadata["timings"]["compositing"])
 
             # Phase 5: Real-ESRGAN Upscaling (3-5s, 2-4GB) - Optional
             if enable_upscaling:
                 print(f"🔍 Phase 5: Real-ESRGAN Upscaling ({upscale_factor}x)...")
                 phase_start = time.time()
+                progress("upscaling", "started")
 
                 # Convert to RGB for upscaler
                 upscale_input = composed.convert("RGB")
 
                 # Upscale
-                upscaled = self.upscaler.upscale(
-                    upscale_input,
-                    scale=upscale_factor
-                )
+                with model_registry.use("realesrgan") as upscaler:
+                    upscaled = upscaler.enhance(
+                        upscale_input,
+                        scale=upscale_factor
+                    )
 
                 metadata["stages"]["upscaling"] = "Real-ESRGAN"
                 metadata["timings"]["upscaling"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['upscaling']:.1f}s")
+                progress("upscaling", "completed", seconds=metadata["timings"]["upscaling"])
 
                 composed = upscaled
 
-                # Cleanup upscaler
-                self._cleanup_model("upscaler")
-
             # Final stats
             total_time = time.time() - pipeline_start
             metadata["total_time"] = total_time
@@ -279,6 +231,7 @@ class LocalEnhancedPipeline:
 
             # Final cleanup
             gc.collect()
+            import torch  # already loaded by the stages; kept out of the module import
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             elif torch.backends.mps.is_available():
@@ -294,13 +247,21 @@ class LocalEnhancedPipeline:
             metadata["error"] = str(e)
             raise RuntimeError(f"Local Enhanced Pipeline failed: {e}") from e
 
+    def _prefetch_after(self, stage: str, inpainting: bool, relighting: bool, upscaling: bool):
+        """Start reading the weights of the first enabled model stage after `stage`."""
+        stages = [("inpainting", "lama", inpainting), ("relighting", "lbm", relighting), ("upscaling", "realesrgan", upscaling)]
+        names = [name for name, _, _ in stages]
+        following = stages[names.index(stage) + 1:] if stage in names else stages
+        for next_stage, model, enabled in following:
+            if enabled:
+                weight_prefetcher.prefetch(model, stage=next_stage)
+                return
+
     def cleanup(self):
-        """Force cleanup of all loaded models."""
+        """Unload this pipeline's models now (those not in use by another request)."""
         print("\n🧹 Cleaning up all models...")
-        self._cleanup_model("birefnet")
-        self._cleanup_model("lama")
-        self._cleanup_model("relighting")
-        self._cleanup_model("upscaler")
+        for name in ("birefnet", "lama", "lbm", "realesrgan"):
+            model_registry.evict(name)
         print("   ✅ Cleanup complete")
 
 
@@ -7,7 +7,6 @@ import time
 from typing import Tuple, Optional
 from PIL import Image
 from io import BytesIO
-import psutil
 import gc
 import torch
 
@@ -15,6 +14,9 @@ from app.services.birefnet_service import BiRefNetService
 from app.services.vlm_director_service import VLMDirectorService
 from app.services.compositing_service import CompositingService
 from app.services.upscale_service import UpscaleService
+from app.services.admission_control import admission_controller
+from app.services.memory_sampler import memory_sampler
+from app.services.metrics import metrics
 
 
 class PipelineConfig:
@@ -86,18 +88,15 @@ class LocalPipeline:
         return self._upscaler
 
     def _check_memory(self) -> bool:
-        """Check if we have enough memory to continue."""
-        mem = psutil.virtual_memory()
-        available_gb = mem.available / (1024 ** 3)
-        return available_gb > 1.0  # Need at least 1GB free
+        """False once memory pressure calls for lighter work (see admission_control)."""
+        return not admission_controller.at_least("degrade")
 
     def _log_memory(self, stage: str):
-        """Log current memory usage."""
-        mem = psutil.virtual_memory()
-        used_gb = mem.used / (1024 ** 3)
-        available_gb = mem.available / (1024 ** 3)
-        percent = mem.percent
-        print(f"   📊 Memory: {used_gb:.1f}GB used, {available_gb:.1f}GB available ({percent:.1f}%)")
+        """Log current memory usage (cgroup-aware)."""
+        sample = memory_sampler.sample()
+        used_gb = sample.ram_used / (1024 ** 3)
+        available_gb = sample.ram_available / (1024 ** 3)
+        print(f"   📊 Memory: {used_gb:.1f}GB used, {available_gb:.1f}GB available ({sample.ram_pressure:.1%})")
 
     def process(self, image: Image.Image) -> Tuple[Image.Image, dict]:
         """
@@ -136,15 +135,16 @@ class LocalPipeline:
             print("-" * 40)
             stage_start = time.time()
 
-            rgba_product = self.birefnet.remove_background(image)
+            rgba_product, mask_info = self.birefnet.remove_background(image, return_info=True)
             stage_time = time.time() - stage_start
             self._log_memory("PHASE 1")
             metadata["stages"]["segmentation"] = stage_time
             print(f"   ✅ Completed in {stage_time:.1f}s")
 
-            if not self._check_memory():
+            if not self._check_memory() and self._birefnet is not None:
                 print("   ⚠️ Low memory, unloading BiRefNet")
-                del self.birefnet
+                self._birefnet.unload_model()
+                self._birefnet = None
                 gc.collect()
 
             # PHASE 2: ANALYZE (Qwen VLM) - Optional
@@ -155,10 +155,14 @@ class LocalPipeline:
 
             # For Plan A, only do full VLM analysis for medium/complex cases
             # Use a quick heuristic first
-            complexity = self._estimate_complexity(image, rgba_product)
+            complexity = self._estimate_complexity(image, rgba_product, mask_info)
             metadata["estimated_complexity"] = complexity
 
-            if complexity in ["medium", "complex"]:
+            if complexity in ["medium", "complex"] and admission_controller.degraded("qwen-vlm", "heuristics"):
+                print(f"   Complexity: {complexity} → Skipping VLM (memory pressure)")
+                metadata["stages"]["analysis"] = 0
+                edit_plan = None
+            elif complexity in ["medium", "complex"]:
                 print(f"   Complexity: {complexity} → Running VLM analysis")
                 edit_plan = self.vlm.analyze(image)
                 metadata["edit_plan"] = {
@@ -182,10 +186,12 @@ class LocalPipeline:
             print("-" * 40)
             stage_start = time.time()
 
-            composited = self.compositing.place_on_white_background(
+            composited, placed = self.compositing.place_on_white_background(
                 rgba_product,
                 background_size=self.config.target_size,
                 padding_percent=self.config.padding_percent,
+                mask_info=mask_info,
+                return_info=True,
             )
 
             if self.config.add_shadow:
@@ -193,6 +199,7 @@ class LocalPipeline:
                 composited = self.compositing.add_drop_shadow(
                     composited,
                     shadow_opacity=0.2,
+                    mask_info=placed,
                 )
 
             stage_time = time.time() - stage_start
@@ -230,6 +237,9 @@ class LocalPipeline:
             total_time = time.time() - start_time
             metadata["total_time"] = total_time
             metadata["success"] = True
+            for stage, seconds in metadata["stages"].items():
+                if seconds:
+                    metrics.observe("stage_duration_seconds", seconds, pipeline="local", stage=stage)
 
             print("\n" + "=" * 60)
             print(f"✅ PIPELINE COMPLETE in {total_time:.1f}s")
@@ -252,19 +262,21 @@ class LocalPipeline:
             metadata["success"] = False
             return image, metadata  # Return original image on error
 
-    def _estimate_complexity(self, original: Image.Image, segmented: Image.Image) -> str:
+    def _estimate_complexity(self, original: Image.Image, segmented: Image.Image, mask_info=None) -> str:
         """
         Quick heuristic to estimate editing complexity.
         Avoids running full VLM analysis for simple cases.
         """
         import numpy as np
 
-        # If segmentation is clean (large connected component), probably simple
-        seg_array = np.array(segmented)
-        alpha = seg_array[:, :, 3] if seg_array.shape[2] == 4 else np.ones(seg_array.shape[:2])
-
         # Ratio of product area to total image
-        product_ratio = np.sum(alpha > 128) / (alpha.shape[0] * alpha.shape[1])
+        if mask_info is not None:
+            product_ratio = mask_info.area / mask_info.alpha.size
+        else:
+            # If segmentation is clean (large connected component), probably simple
+            seg_array = np.array(segmented)
+            alpha = seg_array[:, :, 3] if seg_array.shape[2] == 4 else np.ones(seg_array.shape[:2])
+            product_ratio = np.sum(alpha > 128) / (alpha.shape[0] * alpha.shape[1])
 
         # If product is >50% of image, likely well-framed
         if product_ratio > 0.5:
@@ -280,9 +292,13 @@ class LocalPipeline:
     def cleanup(self):
         """Unload all models and free memory."""
         print("\n🧹 Cleanup...")
-        self.birefnet = None
-        self.vlm.unload()
-        self.upscaler.cleanup()
+        # Each releases this pipeline's share; weights other services hold stay loaded
+        if self._birefnet is not None:
+            self._birefnet.unload_model()
+        if self._vlm is not None:
+            self._vlm.unload()
+        if self._upscaler is not None:
+            self._upscaler.cleanup()
         gc.collect()
         print("✅ All models unloaded")
 
@@ -0,0 +1,164 @@
+"""
+Memory Sampler - How close this container is to running out of memory.
+
+Reads what the kernel and the CUDA allocator would use to decide an OOM:
+
+- RAM: the cgroup v2 limit (memory.max / memory.current, minus inactive page
+  cache, which the kernel reclaims before it OOM-kills) when the process runs
+  in a limited cgroup, else the host's psutil numbers. psutil alone reports
+  the whole host inside a container, which is how a "half free" box gets
+  OOM-killed.
+- VRAM: cudaMemGetInfo, counting the caching allocator's reserved-but-unused
+  blocks as free, when torch is already imported.
+
+Idle models the model registry keeps resident (and its demoted host copies)
+count as free too: the registry evicts them as soon as a load needs the room,
+and they would otherwise hold pressure near its budget all the time.
+
+Samples are cached for MEMORY_SAMPLE_INTERVAL_S, so asking on every request
+costs a dict lookup most of the time and a few small file reads otherwise.
+"""
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from app.config import get_settings
+from app.services.metrics import metrics
+
+_CGROUP = "/sys/fs/cgroup"
+_MB = 1024 ** 2
+_GB = 1024 ** 3
+
+
+class MemorySample(NamedTuple):
+    ram_used: int
+    ram_limit: int
+    ram_source: str  # "cgroup" or "host"
+    gpu_used: Optional[int] = None
+    gpu_total: Optional[int] = None
+    gpu_allocated: Optional[int] = None
+    taken_at: float = 0.0
+
+    @property
+    def ram_available(self) -> int:
+        return max(0, self.ram_limit - self.ram_used)
+
+    @property
+    def ram_pressure(self) -> float:
+        return self.ram_used / self.ram_limit if self.ram_limit else 0.0
+
+    @property
+    def gpu_pressure(self) -> Optional[float]:
+        return self.gpu_used / self.gpu_total if self.gpu_total else None
+
+    @property
+    def pressure(self) -> float:
+        """The tighter of RAM and VRAM, 0..1."""
+        return max(self.ram_pressure, self.gpu_pressure or 0.0)
+
+    def to_dict(self) -> dict:
+        return {
+            "ram_used_gb": round(self.ram_used / _GB, 2),
+            "ram_limit_gb": round(self.ram_limit / _GB, 2),
+            "ram_available_gb": round(self.ram_available / _GB, 2),
+            "ram_source": self.ram_source,
+            "ram_pressure": round(self.ram_pressure, 3),
+            "gpu_used_gb": round(self.gpu_used / _GB, 2) if self.gpu_used is not None else None,
+            "gpu_total_gb": round(self.gpu_total / _GB, 2) if self.gpu_total is not None else None,
+            "gpu_pressure": round(self.gpu_pressure, 3) if self.gpu_pressure is not None else None,
+            "pressure": round(self.pressure, 3),
+        }
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return None if value == "max" else int(value)
+
+
+def _cgroup_dir() -> Optional[str]:
+    """This process's cgroup v2 directory, if it has a memory controller."""
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    path = os.path.join(_CGROUP, line.strip()[3:].lstrip("/"))
+                    if os.path.exists(os.path.join(path, "memory.current")):
+                        return path
+    except OSError:
+        pass
+    # Inside a container the namespace root is the container's own cgroup
+    return _CGROUP if os.path.exists(os.path.join(_CGROUP, "memory.current")) else None
+
+
+def _inactive_file(cgroup: str) -> int:
+    try:
+        with open(os.path.join(cgroup, "memory.stat")) as f:
+            for line in f:
+                if line.startswith("inactive_file "):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _reclaimable_mb():
+    registry = getattr(sys.modules.get("app.services.model_registry"), "model_registry", None)
+    if registry is None:
+        return {"vram": 0.0, "ram": 0.0}
+    return registry.reclaimable_mb()
+
+
+class MemorySampler:
+    def __init__(self):
+        self.interval_s = get_settings().MEMORY_SAMPLE_INTERVAL_S
+        self._lock = threading.Lock()
+        self._last: Optional[MemorySample] = None
+        self._cgroup = _cgroup_dir()
+
+    def sample(self, fresh: bool = False) -> MemorySample:
+        last = self._last
+        if not fresh and last is not None and time.monotonic() - last.taken_at < self.interval_s:
+            return last
+        with self._lock:
+            sample = self._take()
+            self._last = sample
+        metrics.set("memory_pressure_ratio", sample.ram_pressure, resource="ram")
+        if sample.gpu_pressure is not None:
+            metrics.set("memory_pressure_ratio", sample.gpu_pressure, resource="gpu")
+        return sample
+
+    def _take(self) -> MemorySample:
+        ram_used, ram_limit, source = self._ram()
+        reclaimable = _reclaimable_mb()
+        ram_used = max(0, ram_used - int(reclaimable["ram"] * _MB))
+        gpu_used = gpu_total = gpu_allocated = None
+        torch = sys.modules.get("torch")  # never import torch just to measure it
+        if torch is not None and torch.cuda.is_available():
+            try:
+                free, gpu_total = torch.cuda.mem_get_info()
+                gpu_allocated = torch.cuda.memory_allocated()
+                cached = torch.cuda.memory_reserved() - gpu_allocated  # reusable without the driver
+                gpu_used = max(0, gpu_total - free - cached - int(reclaimable["vram"] * _MB))
+            except Exception:
+                gpu_used = gpu_total = gpu_allocated = None
+        return MemorySample(ram_used, ram_limit, source, gpu_used, gpu_total, gpu_allocated, time.monotonic())
+
+    def _ram(self):
+        import psutil
+        host = psutil.virtual_memory()
+        if self._cgroup is not None:
+            limit = _read_int(os.path.join(self._cgroup, "memory.max"))
+            current = _read_int(os.path.join(self._cgroup, "memory.current"))
+            if limit is not None and current is not None and limit < host.total:
+                return max(0, current - _inactive_file(self._cgroup)), limit, "cgroup"
+        return host.total - host.available, host.total, "host"
+
+
+# Singleton
+memory_sampler = MemorySampler()
@@ -0,0 +1,304 @@
+"""
+Metrics - Prometheus-style counters, gauges and histograms, served at /metrics.
+
+Recorded as things happen:
+- HTTP latency per route template (main.py middleware)
+- pipeline stage latency (sota-v2, local-enhanced, plan-b, local, showcase)
+- executor queue wait / run time per lane and model
+- model load / unload durations
+- weight prefetch time hidden behind the previous stage
+- Replicate spend
+
+Collected at scrape time from services that are already loaded: executor,
+job and batcher queue depths, result cache hit ratios, today's Replicate
+spend, process RSS and VRAM, model residency.
+
+Everything is a no-op with METRICS_ENABLED=0 (one attribute check per call).
+Each uvicorn worker keeps its own registry, so scrape every worker (or run
+one) when using --workers.
+"""
+import functools
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import get_settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name -> (type, help, buckets)
+_DEFINITIONS: Dict[str, Tuple[str, str, Optional[Sequence[float]]]] = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route template", LATENCY_BUCKETS),
+    "stage_duration_seconds": ("histogram", "Pipeline stage latency", LATENCY_BUCKETS),
+    "inference_queue_wait_seconds": ("histogram", "Time a call waited for its executor lane", LATENCY_BUCKETS),
+    "inference_run_seconds": ("histogram", "Time a call ran on its executor lane", LATENCY_BUCKETS),
+    "model_load_seconds": ("histogram", "Model load duration", LATENCY_BUCKETS),
+    "model_unload_seconds": ("histogram", "Model unload duration", LATENCY_BUCKETS),
+    "replicate_spend_usd_total": ("counter", "Replicate spend recorded by this process", None),
+    "replicate_spend_today_usd": ("gauge", "Replicate spend today (all processes, from the spend file)", None),
+    "queue_depth": ("gauge", "Items waiting or running per queue", None),
+    "cache_requests_total": ("counter", "Cache lookups by result", None),
+    "cache_hit_ratio": ("gauge", "Cache hits / lookups", None),
+    "process_resident_memory_bytes": ("gauge", "Resident set size of this process", None),
+    "device_memory_allocated_bytes": ("gauge", "Accelerator memory allocated by tensors", None),
+    "device_memory_reserved_bytes": ("gauge", "Accelerator memory reserved by the allocator", None),
+    "model_resident_bytes": ("gauge", "Estimated memory of each registered model (0 when unloaded)", None),
+    "model_budget_bytes": ("gauge", "Model residency budget per pool", None),
+    "model_evictions_total": ("counter", "Models unloaded by the model registry", None),
+    "model_demotions_total": ("counter", "Models moved from VRAM to pinned host RAM by the model registry", None),
+    "model_promotion_seconds": ("histogram", "Time to bring a model back to the device, by source tier", LATENCY_BUCKETS),
+    "memory_pressure_ratio": ("gauge", "Memory in use / limit (cgroup or host RAM, VRAM)", None),
+    "admission_waiting": ("gauge", "Requests waiting for memory pressure to drop", None),
+    "admission_wait_seconds": ("histogram", "Time a request waited for memory pressure to drop", LATENCY_BUCKETS),
+    "admission_shed_total": ("counter", "Requests rejected under memory pressure", None),
+    "admission_degraded_total": ("counter", "Lighter model variants used under memory pressure", None),
+    "warmup_step_seconds": ("histogram", "Startup warmup time per model (load plus every planned shape)", LATENCY_BUCKETS),
+    "prefetch_hidden_seconds": ("histogram", "Weight read time overlapped with the previous pipeline stage", LATENCY_BUCKETS),
+    "prefetch_wait_seconds": ("histogram", "Time a model load waited for its unfinished weight prefetch", LATENCY_BUCKETS),
+    "prefetch_bytes_total": ("counter", "Weight bytes read ahead by the prefetcher", None),
+    "onnx_sessions": ("gauge", "Pooled rembg sessions per model by state (idle, busy)", None),
+    "onnx_session_checkouts_total": ("counter", "rembg session checkouts per model, and how many had to wait", None),
+    "onnx_session_wait_seconds": ("histogram", "Time a call waited for a pooled rembg session", LATENCY_BUCKETS),
+}
+
+_PREFIX = "guardian_"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelKey, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = get_settings().METRICS_ENABLED
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List]] = {}  # -> [bucket counts, sum, count]
+        self._collectors: List[Callable[["Metrics"], None]] = [
+            _collect_queues, _collect_caches, _collect_replicate, _collect_memory, _collect_models,
+        ]
+
+    # ---- recording ----
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values.setdefault(name, {})[self._key(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = _DEFINITIONS[name][2]
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            state[0][bisect_left(buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the duration of the block (also when it raises)."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage_reporter(self, pipeline: str, progress: Optional[Callable] = None) -> Callable:
+        """
+        Wrap a pipeline's progress callback so every completed stage also
+        lands in stage_duration_seconds and each stage becomes a trace span.
+        Returns a callable even when progress is None.
+        """
+        from app.services.tracing import tracer
+        spans = {}
+
+        def report(stage: str, state: str, **info):
+            if state == "started":
+                spans[stage] = tracer.start_span(f"{pipeline}.{stage}")
+            elif state == "completed":
+                tracer.end_span(spans.pop(stage, None))
+                if info.get("seconds") is not None:
+                    self.observe("stage_duration_seconds", info["seconds"], pipeline=pipeline, stage=stage)
+            if progress is not None:
+                progress(stage, state, **info)
+        return report
+
+    def timed_load(self, model: str, loaded: Callable[[object], bool]):
+        """
+        Decorator for lazy load_model()-style methods: records model_load_seconds
+        only when the call actually loads (loaded(self) was False before).
+        """
+        return self._timed_transition("model_load_seconds", model, skip=loaded)
+
+    def timed_unload(self, model: str, loaded: Callable[[object], bool]):
+        """Decorator for unload methods: records model_unload_seconds if something was loaded."""
+        return self._timed_transition("model_unload_seconds", model, skip=lambda service: not loaded(service))
+
+    def _timed_transition(self, name: str, model: str, skip: Callable[[object], bool]):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(service, *args, **kwargs):
+                if not self.enabled or skip(service):
+                    return fn(service, *args, **kwargs)
+                with self.timer(name, model=model):
+                    return fn(service, *args, **kwargs)
+            return wrapper
+        return decorate
+
+    # ---- exposition ----
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        for collect in self._collectors:
+            try:
+                collect(self)
+            except Exception as e:
+                print(f"⚠️ Metrics collector {collect.__name__} failed: {e}")
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in _DEFINITIONS.items():
+                full = _PREFIX + name
+                if kind == "histogram":
+                    series = self._histograms.get(name)
+                    if not series:
+                        continue
+                    lines += [f"# HELP {full} {help_text}", f"# TYPE {full} histogram"]
+                    for labels, (counts, total, count) in sorted(series.items()):
+                        cumulative = 0
+                        for bound, bucket in zip(list(buckets) + [float("inf")], counts):
+                            cumulative += bucket
+                            le = 'le="' + _format_value(bound) + '"'
+                            lines.append(f"{full}_bucket{_format_labels(labels, le)} {cumulative}")
+                        lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(total)}")
+                        lines.append(f"{full}_count{_format_labels(labels)} {count}")
+                else:
+                    series = self._values.get(name)
+                    if not series:
+                        continue
+                    lines += [f"# HELP {full} {help_text}", f"# TYPE {full} {kind}"]
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# ---- scrape-time collectors (only read services that are already imported) ----
+
+def _loaded(module: str, attr: str):
+    return getattr(sys.modules.get(module), attr, None)
+
+
+def _collect_queues(metrics: Metrics):
+    executor = _loaded("app.services.inference_executor", "inference_executor")
+    if executor is not None:
+        for lane, pending in executor.stats()["pending"].items():
+            metrics.set("queue_depth", pending, queue=f"executor:{lane}")
+    jobs = _loaded("app.services.job_service", "job_service")
+    if jobs is not None:
+        for device, depth in jobs.queue_depths().items():
+            metrics.set("queue_depth", depth, queue=f"jobs:{device}")
+    batcher = _loaded("app.services.segmentation_batcher", "segmentation_batcher")
+    if batcher is not None:
+        metrics.set("queue_depth", batcher.pending, queue="segmentation_batch")
+    sessions = _loaded("app.services.onnx_session_pool", "onnx_session_pool")
+    if sessions is not None:
+        for model, pool in sessions.stats()["models"].items():
+            metrics.set("queue_depth", pool["waiting"], queue=f"onnx:{model}")
+            metrics.set("onnx_sessions", pool["idle"], model=model, state="idle")
+            metrics.set("onnx_sessions", pool["busy"], model=model, state="busy")
+            metrics.set("onnx_session_checkouts_total", pool["checkouts"], model=model, result="all")
+            metrics.set("onnx_session_checkouts_total", pool["waited"], model=model, result="waited")
+
+
+def _collect_caches(metrics: Metrics):
+    for name, module, attr in (
+        ("result", "app.services.result_cache", "result_cache"),
+        ("segmentation", "app.services.segmentation_cache", "segmentation_cache"),
+    ):
+        cache = _loaded(module, attr)
+        if cache is None or not cache.enabled:
+            continue
+        stats = cache.stats()
+        for result, field in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses")):
+            metrics.set("cache_requests_total", stats[field], cache=name, result=result)
+        if stats["hit_ratio"] is not None:
+            metrics.set("cache_hit_ratio", stats["hit_ratio"], cache=name)
+
+
+def _collect_replicate(metrics: Metrics):
+    replicate = _loaded("app.services.replicate_3d_service", "replicate_3d_service")
+    if replicate is not None:
+        metrics.set("replicate_spend_today_usd", replicate._get_today_spend())
+
+
+def _collect_memory(metrics: Metrics):
+    import psutil
+    metrics.set("process_resident_memory_bytes", psutil.Process().memory_info().rss)
+
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if torch.cuda.is_available():
+        for index in range(torch.cuda.device_count()):
+            metrics.set("device_memory_allocated_bytes", torch.cuda.memory_allocated(index), device=f"cuda:{index}")
+            metrics.set("device_memory_reserved_bytes", torch.cuda.memory_reserved(index), device=f"cuda:{index}")
+    elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        metrics.set("device_memory_allocated_bytes", torch.mps.current_allocated_memory(), device="mps")
+        metrics.set("device_memory_reserved_bytes", torch.mps.driver_allocated_memory(), device="mps")
+
+
+def _collect_models(metrics: Metrics):
+    registry = _loaded("app.services.model_registry", "model_registry")
+    if registry is None:
+        return
+    stats = registry.stats()
+    for pool, usage in stats["pools"].items():
+        metrics.set("model_budget_bytes", usage["budget_mb"] * 1024 * 1024, pool=pool)
+    for name, model in stats["models"].items():
+        size = model["size_mb"] * 1024 * 1024
+        metrics.set("model_resident_bytes", size if model["tier"] == "device" else 0, model=name, pool=model["pool"])
+        if "host" in stats["pools"]:
+            metrics.set("model_resident_bytes", size if model["tier"] == "host" else 0, model=name, pool="host")
+
+
+# Singleton
+metrics = Metrics()
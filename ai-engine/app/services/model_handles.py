@@ -0,0 +1,129 @@
+"""
+Model Handles - One copy of each set of weights per process, shared by refcount.
+
+Services don't call from_pretrained / new_session for weights another
+service may already hold; they resolve them here, keyed by what makes two
+copies identical:
+
+    key = HandleKey("ZhengPeng7/BiRefNet-massive", "massive", "cuda", "float32")
+    self._handle = model_handles.acquire(key, lambda: load_birefnet(...))
+    self.model = self._handle.value
+    ...
+    self._handle.release()  # in unload_model()
+
+The first acquire of a key runs its loader (once, even when several threads
+ask at the same time); later ones get the same object and add a holder. If
+the loader fails, the threads already waiting on it get the same exception
+instead of each running the loader again. The slot (and its error) goes away
+only when the last of them has released it; the acquire after that starts a
+fresh load. The
+weights are dropped when the last holder releases, so a service instance
+that unloads only gives up its own share: a second BiRefNetService (a
+pipeline's own instance) keeps using the weights the singleton loaded, and
+vice versa.
+
+This sits under the model registry: the registry decides *when* a service
+unloads, the pool makes sure that unload frees memory only once nobody else
+holds the same weights.
+"""
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class HandleKey(NamedTuple):
+    model_id: str
+    variant: str = ""
+    device: str = "cpu"
+    dtype: str = "float32"
+
+    def __str__(self) -> str:
+        variant = f":{self.variant}" if self.variant else ""
+        return f"{self.model_id}{variant}@{self.device}/{self.dtype}"
+
+
+class _Slot:
+    __slots__ = ("value", "holders", "loading", "error")
+
+    def __init__(self):
+        self.value: Any = None
+        self.holders = 0
+        self.loading = threading.Lock()
+        self.error: Optional[BaseException] = None  # the failed load every current waiter sees
+
+
+class ModelHandle:
+    """One holder's share of a pooled model. release() is idempotent."""
+
+    def __init__(self, pool: "ModelHandlePool", key: HandleKey, value: Any, slot: "_Slot"):
+        self._pool = pool
+        self.key = key
+        self.value = value
+        self._slot = slot
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.value = None
+        self._pool._release(self.key, self._slot)
+
+
+class ModelHandlePool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots: Dict[HandleKey, _Slot] = {}
+
+    def acquire(self, key: HandleKey, loader: Callable[[], Any]) -> ModelHandle:
+        """Handle on the weights for key, running loader() if nobody holds them yet. Loader errors propagate."""
+        with self._lock:
+            slot = self._slots.setdefault(key, _Slot())
+            slot.holders += 1
+        try:
+            with slot.loading:
+                if slot.error is not None:
+                    raise slot.error
+                if slot.value is None:
+                    try:
+                        value = loader()
+                        if value is None:
+                            raise RuntimeError(f"Loader for {key} returned nothing")
+                    except BaseException as e:
+                        slot.error = e
+                        raise
+                    slot.value = value
+                    print(f"🔗 {key} loaded (shared)")
+                else:
+                    print(f"🔗 {key} already loaded, sharing ({slot.holders} holders)")
+                value = slot.value
+        except BaseException:
+            self._release(key, slot)
+            raise
+        return ModelHandle(self, key, value, slot)
+
+    def _release(self, key: HandleKey, slot: _Slot):
+        with self._lock:
+            slot.holders -= 1
+            if slot.holders > 0:
+                return
+            if self._slots.get(key) is slot:  # by identity: never another load's slot for the same key
+                del self._slots[key]
+        if slot.value is not None:
+            print(f"🧹 {key} released by its last holder")
+        slot.value = None
+
+    def holders(self, key: HandleKey) -> int:
+        with self._lock:
+            slot = self._slots.get(key)
+            return slot.holders if slot is not None else 0
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"model": str(key), "holders": slot.holders, "loaded": slot.value is not None}
+                for key, slot in self._slots.items()
+            ]
+
+
+# Singleton
+model_handles = ModelHandlePool()
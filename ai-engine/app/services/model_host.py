@@ -0,0 +1,588 @@
+"""
+Model Host - One process owns the models, every HTTP worker shares them.
+
+With `uvicorn --workers N` each worker imported its own BiRefNet, rembg
+session and Real-ESRGAN upsampler, so RAM/VRAM grew with N. Setting
+MODEL_HOST_ADDRESS (a unix socket path) turns the workers into clients of a
+separate host process:
+
+    python -m app.services.model_host --preload birefnet realesrgan
+    MODEL_HOST_ADDRESS=~/.cache/guardian-ai/model-host.sock uvicorn main:app --workers 4
+
+Transport:
+- pixels: each worker creates one shared-memory segment (MODEL_HOST_RING_MB)
+  used as a ring buffer. A call writes its input arrays into a slot and
+  reserves room for the outputs next to them; the host maps the same segment
+  and reads/writes in place. Pixel data is never pickled.
+- control: a multiprocessing.connection socket carrying small dicts
+  (op, slot offsets, shapes, dtypes, qualities).
+
+The host drains requests from all workers into one queue, so segmentation
+calls arriving within BIREFNET_BATCH_WINDOW_MS are run as one batched pass
+(up to BIREFNET_MAX_BATCH images) no matter which worker sent them.
+
+Auth: workers must present MODEL_HOST_AUTHKEY. Left empty (the default),
+the host generates a random key per launch and writes it to
+`<address>.key` (mode 0600), and workers read it from there when they
+connect, so no shared default key exists.
+
+If the host is unreachable the worker logs it and runs the model in-process,
+so a host restart degrades to the old behaviour instead of failing requests.
+Diffusion pipelines (Turbo/Qwen/Flux) still load per process.
+"""
+import argparse
+import itertools
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import Counter, deque
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.config import get_settings
+
+_ALIGN = 64
+_RETRY_S = 10.0  # back-off before reconnecting to a host that was down
+
+
+class ModelHostUnavailable(Exception):
+    """The host can't take this call; the caller should run the model in-process."""
+
+
+def key_path(address: str) -> str:
+    return f"{os.path.expanduser(address)}.key"
+
+
+def new_launch_key(address: str) -> bytes:
+    """A random authkey for this host launch, written next to the socket for workers of the same user."""
+    key = secrets.token_hex(32)
+    path = key_path(address)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    staging = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(staging, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    os.replace(staging, path)
+    return key.encode()
+
+
+def read_launch_key(address: str) -> bytes:
+    try:
+        with open(key_path(address)) as f:
+            return f.read().strip().encode()
+    except OSError as e:
+        raise ModelHostUnavailable(f"no MODEL_HOST_AUTHKEY and no host key file ({e})") from e
+
+
+def _array(shm: shared_memory.SharedMemory, spec: Sequence) -> np.ndarray:
+    """View of (offset, shape, dtype) inside a shared-memory segment."""
+    offset, shape, dtype = spec
+    return np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+
+_attach_lock = threading.Lock()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Map a worker's segment without tracking it: the worker created it and
+    unlinks it, and our resource tracker must not unlink it when we exit.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    from multiprocessing import resource_tracker
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class _Ring:
+    """Slot allocator over the worker's shared-memory segment (FIFO reuse)."""
+
+    def __init__(self, size: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.size = size
+        self._live: deque = deque()  # [start, end, released], oldest first
+        self._tail = 0
+        self._cond = threading.Condition()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def alloc(self, nbytes: int) -> int:
+        nbytes = max(_ALIGN, (nbytes + _ALIGN - 1) // _ALIGN * _ALIGN)
+        if nbytes > self.size:
+            raise ModelHostUnavailable(
+                f"call needs {nbytes / 2**20:.0f} MB, ring is {self.size / 2**20:.0f} MB (MODEL_HOST_RING_MB)"
+            )
+        with self._cond:
+            while True:
+                start = self._fit(nbytes)
+                if start is not None:
+                    self._live.append([start, start + nbytes, False])
+                    self._tail = start + nbytes
+                    return start
+                self._cond.wait()
+
+    def _fit(self, nbytes: int) -> Optional[int]:
+        if not self._live:
+            return 0
+        head = self._live[0][0]
+        if self._tail > head:
+            # Free space is [tail, size) and, after wrapping, [0, head)
+            if self._tail + nbytes <= self.size:
+                return self._tail
+            return 0 if nbytes <= head else None
+        # Wrapped: free space is [tail, head)
+        return self._tail if self._tail + nbytes <= head else None
+
+    def release(self, start: int):
+        with self._cond:
+            for slot in self._live:
+                if slot[0] == start and not slot[2]:
+                    slot[2] = True
+                    break
+            while self._live and self._live[0][2]:
+                self._live.popleft()
+            if not self._live:
+                self._tail = 0
+            self._cond.notify_all()
+
+    def close(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a call still holds a view; the mapping goes when it does
+
+
+class ModelHostClient:
+    """
+    Worker side. Calls block (they run on the GPU lane thread) until the host
+    replies; replies are matched by id, so several threads can share the
+    connection.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.address = os.path.expanduser(settings.MODEL_HOST_ADDRESS) if settings.MODEL_HOST_ADDRESS else ""
+        self.authkey = settings.MODEL_HOST_AUTHKEY.encode()  # empty: read the host's per-launch key file
+        self.ring_bytes = settings.MODEL_HOST_RING_MB * 1024 * 1024
+        self.timeout_s = settings.MODEL_HOST_TIMEOUT_S
+        self.enabled = bool(self.address)
+        self._conn = None
+        self._ring: Optional[_Ring] = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._waiters: Dict[int, list] = {}
+        self._ids = itertools.count(1)
+        self._retry_at = 0.0
+        # Metrics
+        self._stats = {"calls": 0, "items": 0, "fallbacks": 0, "roundtrip_s": 0.0}
+        self.host_batch_sizes: Counter = Counter()
+        if self.enabled:
+            print(f"🔌 Model host client → {self.address} (ring {settings.MODEL_HOST_RING_MB} MB)")
+
+    # ---- connection ----
+
+    def _connect(self):
+        with self._lock:
+            if self._conn is not None:
+                return self._conn
+            if time.time() < self._retry_at:
+                raise ModelHostUnavailable("host down, retrying later")
+            try:
+                # The key file is re-read per connect: a restarted host has a new key
+                authkey = self.authkey or read_launch_key(self.address)
+                conn = Client(self.address, family="AF_UNIX", authkey=authkey)
+            except ModelHostUnavailable:
+                self._retry_at = time.time() + _RETRY_S
+                raise
+            except (OSError, AuthenticationError) as e:
+                self._retry_at = time.time() + _RETRY_S
+                raise ModelHostUnavailable(str(e)) from e
+            if self._ring is None:
+                self._ring = _Ring(self.ring_bytes)
+            conn.send({"op": "hello", "shm": self._ring.name, "pid": os.getpid()})
+            self._conn = conn
+            threading.Thread(target=self._read_replies, args=(conn,), daemon=True, name="model-host-reader").start()
+            print(f"🔌 Connected to model host at {self.address}")
+            return conn
+
+    def _read_replies(self, conn):
+        try:
+            while True:
+                reply = conn.recv()
+                waiter = self._waiters.pop(reply["id"], None)
+                if waiter is not None:
+                    waiter[1] = reply
+                    waiter[0].set()
+        except (EOFError, OSError):
+            pass
+        self._drop(conn, "model host disconnected")
+
+    def _drop(self, conn, reason: str):
+        """Forget a dead connection and fail everything waiting on it."""
+        with self._lock:
+            if self._conn is not conn:
+                return
+            self._conn = None
+            ring, self._ring = self._ring, None
+        try:
+            conn.close()
+        except OSError:
+            pass
+        for rid in list(self._waiters):
+            waiter = self._waiters.pop(rid, None)
+            if waiter is not None:
+                waiter[1] = {"id": rid, "ok": False, "unavailable": True, "error": reason}
+                waiter[0].set()
+        if ring is not None:
+            # The old host may still hold a mapping; a fresh ring avoids reusing its slots
+            ring.close()
+        print(f"⚠️ {reason}")
+
+    # ---- calls ----
+
+    def _call(self, op: str, inputs: List[np.ndarray], output_shapes: List[Tuple[int, ...]], **params) -> Tuple[dict, List[np.ndarray]]:
+        """Write inputs into one ring slot, run `op` on the host, copy the outputs out."""
+        conn = self._connect()
+        ring = self._ring
+        layout, total = [], 0
+        for array, out_shape in zip(inputs, output_shapes):
+            in_at = total
+            total += (array.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+            layout.append((in_at, total))
+            total += (int(np.prod(out_shape)) + _ALIGN - 1) // _ALIGN * _ALIGN
+
+        start = time.perf_counter()
+        base = ring.alloc(total)
+        release = True
+        try:
+            items = []
+            for array, out_shape, (in_at, out_at) in zip(inputs, output_shapes, layout):
+                in_spec = (base + in_at, array.shape, "uint8")
+                _array(ring.shm, in_spec)[...] = array
+                items.append({"in": in_spec, "out": (base + out_at, tuple(out_shape), "uint8")})
+
+            rid = next(self._ids)
+            waiter = [threading.Event(), None]
+            self._waiters[rid] = waiter
+            try:
+                with self._send_lock:
+                    conn.send({"op": op, "id": rid, "items": items, **params})
+            except (OSError, ValueError) as e:
+                self._waiters.pop(rid, None)
+                self._drop(conn, f"model host send failed: {e}")
+                raise ModelHostUnavailable(str(e)) from e
+
+            if not waiter[0].wait(self.timeout_s):
+                # The host may still write into this slot: abandon the whole ring
+                self._waiters.pop(rid, None)
+                release = False
+                self._drop(conn, f"model host timed out after {self.timeout_s:.0f}s")
+                raise ModelHostUnavailable("timeout")
+
+            reply = waiter[1]
+            if not reply["ok"]:
+                if reply.get("unavailable"):
+                    release = False
+                    raise ModelHostUnavailable(reply["error"])
+                raise RuntimeError(f"model host {op} failed: {reply['error']}")
+
+            outputs = [
+                np.array(_array(ring.shm, item["out"][:1] + (shape, "uint8")))
+                for item, shape in zip(items, reply.get("shapes") or [item["out"][1] for item in items])
+            ]
+        finally:
+            if release and self._ring is ring:
+                ring.release(base)
+
+        self._stats["calls"] += 1
+        self._stats["items"] += len(inputs)
+        self._stats["roundtrip_s"] += time.perf_counter() - start
+        if reply.get("batch"):
+            self.host_batch_sizes[reply["batch"]] += 1
+        return reply, outputs
+
+    def segment_batch(self, images: List[np.ndarray]) -> Tuple[List[np.ndarray], List[Optional[float]]]:
+        """BiRefNet on the host. RGB uint8 arrays in, (alpha masks, qualities) out."""
+        reply, masks = self._call("segment", images, [image.shape[:2] for image in images])
+        return masks, reply["quality"]
+
+    def upscale(self, image: np.ndarray, outscale: int = 4):
+        """Real-ESRGAN on the host; same return shape as RealESRGANer.enhance."""
+        height, width = image.shape[:2]
+        out_shape = (height * outscale, width * outscale) + image.shape[2:]
+        _, (output,) = self._call("upscale", [image], [out_shape], outscale=outscale)
+        return output, None
+
+    def note_fallback(self):
+        self._stats["fallbacks"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self._stats["calls"]
+        return {
+            "enabled": self.enabled,
+            "connected": self._conn is not None,
+            "calls": calls,
+            "items": self._stats["items"],
+            "fallbacks": self._stats["fallbacks"],
+            "avg_roundtrip_ms": round(self._stats["roundtrip_s"] * 1000 / calls, 1) if calls else None,
+            "host_batch_size_histogram": {str(k): v for k, v in sorted(self.host_batch_sizes.items())},
+        }
+
+    def close(self):
+        with self._lock:
+            conn = self._conn
+        if conn is not None:
+            self._drop(conn, "model host connection closed")
+
+
+class _HostedWorker:
+    """Host-side handle for one connected worker (its connection + mapped ring)."""
+
+    def __init__(self, conn, shm: shared_memory.SharedMemory, pid: int):
+        self.conn = conn
+        self.shm = shm
+        self.pid = pid
+
+    def reply(self, message: dict):
+        try:
+            self.conn.send(message)
+        except OSError:
+            pass  # worker went away; its disconnect is handled by the reader
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+
+class ModelHost:
+    """
+    Host side. One thread per worker connection feeds a queue; the model
+    thread drains it, batching segmentation across workers.
+    """
+
+    def __init__(self, address: str, authkey: bytes, window_s: float, max_batch: int):
+        self.address = os.path.expanduser(address)
+        self.authkey = authkey
+        self.window_s = window_s
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Tuple[_HostedWorker, Optional[dict]]]" = queue.Queue()
+        self._deferred: deque = deque()
+        self.batch_sizes: Counter = Counter()
+        # This process runs the models itself, never through a host
+        from app.services.model_host import model_host_client
+        model_host_client.enabled = False
+
+    def preload(self, models: Sequence[str]):
+        for name in models:
+            if name == "birefnet":
+                from app.services.birefnet_service import birefnet_service
+                birefnet_service.load_model()
+            elif name == "rembg":
+                from app.services.birefnet_service import birefnet_service
+                birefnet_service._rembg_remove(Image.new("RGB", (512, 512), (128, 128, 128)))
+            elif name == "realesrgan":
+                from app.services.upscale_service import upscale_service
+                upscale_service._ensure_initialized()
+            else:
+                print(f"⚠️ Unknown model to preload: {name}")
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        os.makedirs(os.path.dirname(self.address) or ".", exist_ok=True)
+        listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)  # only this user's workers may connect at all
+        threading.Thread(target=self._accept, args=(listener,), daemon=True, name="model-host-accept").start()
+        print(f"🏠 Model host listening on {self.address} (batch window {self.window_s * 1000:.0f}ms, max batch {self.max_batch})")
+        try:
+            self._model_loop()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            print("🛑 Model host stopped")
+
+    # ---- connections ----
+
+    def _accept(self, listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError as e:
+                print(f"⚠️ Rejected model host client: {e}")
+                continue
+            except OSError:
+                return  # listener closed
+            threading.Thread(target=self._serve_worker, args=(conn,), daemon=True).start()
+
+    def _serve_worker(self, conn):
+        try:
+            hello = conn.recv()
+            worker = _HostedWorker(conn, _attach(hello["shm"]), hello["pid"])
+        except (EOFError, OSError, KeyError, FileNotFoundError) as e:
+            print(f"⚠️ Bad model host handshake: {e}")
+            conn.close()
+            return
+        print(f"🔌 Worker {worker.pid} connected")
+        try:
+            while True:
+                self._queue.put((worker, conn.recv()))
+        except (EOFError, OSError):
+            print(f"🔌 Worker {worker.pid} disconnected")
+        # Unmap on the model thread, after anything it already queued
+        self._queue.put((worker, None))
+
+    # ---- model thread ----
+
+    def _next(self, timeout: Optional[float] = None):
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _model_loop(self):
+        while True:
+            worker, request = self._next()
+            try:
+                if request is None:
+                    worker.close()
+                elif request.get("op") == "segment":
+                    self._segment(self._gather(worker, request))
+                elif request.get("op") == "upscale":
+                    self._run(worker, request, self._upscale)
+                else:
+                    worker.reply({"id": request.get("id"), "ok": False, "error": f"unknown op {request.get('op')}"})
+            except Exception as e:
+                # Whatever one client sent, the host keeps serving the others
+                print(f"⚠️ Model host request failed: {e}")
+
+    def _gather(self, worker: _HostedWorker, request: dict) -> List[Tuple[_HostedWorker, dict]]:
+        """Collect segmentation requests from any worker for up to window_s."""
+        batch = [(worker, request)]
+        count = len(request["items"])
+        deadline = time.perf_counter() + self.window_s
+        while count < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                other, message = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            items = message.get("items") if message is not None and message.get("op") == "segment" else None
+            if isinstance(items, list) and count + len(items) <= self.max_batch:
+                batch.append((other, message))
+                count += len(items)
+            else:
+                self._deferred.append((other, message))
+        return batch
+
+    def _segment(self, batch: List[Tuple[_HostedWorker, dict]]):
+        from app.services.birefnet_service import birefnet_service
+
+        # Views into each client's ring, per request: a bad offset/shape fails that request only
+        images, accepted = [], []
+        for worker, request in batch:
+            try:
+                inputs, outputs = [], []
+                for item in request["items"]:
+                    height, width = item["in"][1][:2]
+                    view = _array(worker.shm, item["in"])
+                    inputs.append(Image.frombuffer("RGB", (width, height), view, "raw", "RGB", 0, 1))
+                    outputs.append(_array(worker.shm, item["out"]))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                worker.reply({"id": request.get("id"), "ok": False, "error": f"bad segment request: {e}"})
+                continue
+            images.extend(inputs)
+            accepted.append((worker, request, outputs))
+        if not accepted:
+            return
+        try:
+            results = birefnet_service.segment_batch(images)
+        except Exception as e:
+            for worker, request, _ in accepted:
+                worker.reply({"id": request["id"], "ok": False, "error": str(e)})
+            return
+        finally:
+            del images
+
+        count = len(results)
+        self.batch_sizes[count] += 1
+        if count > 1:
+            print(f"📦 Host batch of {count} from {len({w.pid for w, _, _ in accepted})} worker(s)")
+        results = iter(results)
+        for worker, request, outputs in accepted:
+            masks = [next(results) for _ in outputs]
+            try:
+                for out, (rgba, _) in zip(outputs, masks):
+                    out[...] = np.asarray(rgba.getchannel("A"))
+            except ValueError as e:
+                worker.reply({"id": request["id"], "ok": False, "error": f"bad segment output view: {e}"})
+                continue
+            worker.reply({"id": request["id"], "ok": True, "quality": [quality for _, quality in masks], "batch": count})
+
+    def _upscale(self, worker: _HostedWorker, request: dict) -> dict:
+        from app.services.upscale_service import upscale_service
+
+        upscale_service._ensure_initialized()
+        if upscale_service._upsampler is None:
+            raise RuntimeError("Real-ESRGAN not available on the model host")
+        item = request["items"][0]
+        output, _ = upscale_service._upsampler.enhance(_array(worker.shm, item["in"]), outscale=request.get("outscale", 4))
+        out = _array(worker.shm, item["out"])
+        if output.shape != out.shape:
+            raise RuntimeError(f"unexpected output shape {output.shape}, expected {out.shape}")
+        out[...] = output
+        return {"shapes": [output.shape]}
+
+    def _run(self, worker: _HostedWorker, request: dict, handler):
+        try:
+            fields = handler(worker, request)
+        except Exception as e:
+            worker.reply({"id": request["id"], "ok": False, "error": str(e)})
+            return
+        worker.reply({"id": request["id"], "ok": True, "batch": 1, **fields})
+
+
+# Singleton
+model_host_client = ModelHostClient()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Shared model host for multi-worker deployments")
+    parser.add_argument("--address", default=settings.MODEL_HOST_ADDRESS or os.path.join(settings.CACHE_DIR, "model-host.sock"))
+    parser.add_argument("--window-ms", type=float, default=settings.BIREFNET_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=settings.BIREFNET_MAX_BATCH)
+    parser.add_argument("--preload", nargs="*", default=["birefnet"], help="Models to load before accepting work (birefnet, rembg, realesrgan)")
+    args = parser.parse_args()
+
+    authkey = settings.MODEL_HOST_AUTHKEY.encode() or new_launch_key(args.address)
+    host = ModelHost(args.address, authkey, args.window_ms / 1000.0, args.max_batch)
+    host.preload(args.preload)
+    host.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
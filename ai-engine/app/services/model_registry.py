@@ -0,0 +1,602 @@
+"""
+Model Registry - Which models stay loaded, under a memory budget.
+
+Each service registers how to load and unload its model and how big it is:
+
+    model_registry.register("lbm", lbm_service, size_mb=6000)
+
+and callers hold a reference for as long as they use it:
+
+    with model_registry.use("lbm") as lbm:
+        relit, info = lbm.apply_studio_lighting(...)
+
+Models stay resident after use. Loading one that doesn't fit its pool's
+budget evicts idle models (no references, not pinned) until it does,
+cheapest-to-lose first: a model's priority is the clock at its last use plus
+its reload cost per GB (GreedyDual-Size), so small models that are slow to
+bring back per byte (u2netp, BiRefNet) stay resident next to a big diffusion
+model whenever the budget allows, and a 22 GB FLUX that ran a while ago goes
+first. A model is never evicted while a request holds it; when nothing idle
+is left the load goes ahead over budget (with a warning) rather than block.
+
+Pools: "gpu" models count against MODEL_VRAM_BUDGET_MB on CUDA and against
+MODEL_RAM_BUDGET_MB on MPS/CPU (unified memory); "cpu" models (ONNX
+sessions) always count against RAM. Size estimates are replaced by the
+measured CUDA allocation after a load.
+
+Models a service loads on its own (outside the registry) are picked up at the
+next registry call and are the first candidates for eviction.
+
+Tiers (CUDA only): a model registered with host_attr= isn't destroyed when
+it's evicted from VRAM. Its weights move to pinned host RAM (the "host" tier,
+MODEL_HOST_TIER_MB) and come back with async copies on a side stream, well
+under a second where from_pretrained takes tens. Whether an evicted model is
+worth host RAM follows the recent request mix: models acquired within the
+last MODEL_MIX_WINDOW acquires are demoted, others (and whatever the host
+budget pushes out, least requested first) go to "disk" and reload from their
+checkpoints, or from the artifact cache's memory-mapped safetensors where the
+service uses it. The prefetcher promotes a demoted model in the background
+while the previous pipeline stage runs if the VRAM budget has room for it.
+model_promotion_seconds{model, tier} records what bringing a model back cost
+from each tier.
+"""
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from app.config import get_settings
+from app.services.metrics import metrics
+
+_MB = 1024 * 1024
+
+# Module that registers each model, so callers can use() a model before its service is imported
+_PROVIDERS = {
+    "birefnet": "app.services.birefnet_service",
+    "u2netp": "app.services.birefnet_service",
+    "flux": "app.services.flux_generation_service",
+    "lbm": "app.services.lbm_relighting_service",
+    "supir": "app.services.supir_upscaling_service",
+    "lama": "app.services.lama_inpainting_service",
+    "realesrgan": "app.services.upscale_service",
+    "iclight": "app.services.iclight_service",
+    "dpt-depth": "app.services.depth_service",
+    "qwen-vlm": "app.services.vlm_director_service",
+    "sdxl-controlnet": "app.services.studio_regeneration_service",
+    "sdxl-turbo": "app.services.hybrid_service",
+    "turbo": "app.services.turbo_service",
+}
+
+
+class _Entry:
+    __slots__ = (
+        "name", "service", "load", "unload", "loaded", "size_mb", "pool", "load_s",
+        "weights", "host_attr", "resident", "host_copy", "refs", "pins", "priority", "last_used",
+    )
+
+    def __init__(self, name, service, load, unload, loaded, size_mb, pool, load_s, weights, host_attr):
+        self.name = name
+        self.service = service
+        self.load = load
+        self.unload = unload
+        self.loaded = loaded
+        self.size_mb = float(size_mb)
+        self.pool = pool
+        self.load_s = load_s
+        self.weights = list(weights)
+        self.host_attr = host_attr
+        self.resident = False
+        self.host_copy: Any = None  # (host_attr value in pinned RAM, its device) while demoted
+        self.refs = 0
+        self.pins = 0
+        self.priority = 0.0
+        self.last_used: Optional[float] = None
+
+
+class ModelRegistry:
+    def __init__(self):
+        settings = get_settings()
+        self._configured_mb = {
+            "vram": settings.MODEL_VRAM_BUDGET_MB,
+            "ram": settings.MODEL_RAM_BUDGET_MB,
+            "host": settings.MODEL_HOST_TIER_MB,
+        }
+        self._host_tier = settings.MODEL_HOST_TIER_ENABLED
+        self._budgets_mb: Dict[str, float] = {}
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()  # bookkeeping (refs, residency flags)
+        self._residency = threading.RLock()  # one load / eviction at a time
+        self._clock = 0.0
+        self._mix: deque = deque(maxlen=max(1, settings.MODEL_MIX_WINDOW))  # names of recent acquires
+        self._promoter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-promote")
+        self.evictions = 0
+        self.demotions = 0
+        self.promotions = 0
+
+    # ---- registration ----
+
+    def register(
+        self,
+        name: str,
+        service: Any,
+        size_mb: float,
+        load: str = "load_model",
+        unload: str = "unload_model",
+        loaded: Optional[Callable[[Any], bool]] = None,
+        pool: str = "gpu",
+        load_cost_s: Optional[float] = None,
+        weights: Sequence[str] = (),
+        host_attr: Optional[str] = None,
+    ):
+        """
+        Register a service's model. load/unload name the service's methods;
+        loaded(service) reports whether the model is in memory (used to notice
+        loads that bypass the registry). load_cost_s seeds the reload cost
+        until a real load has been timed (default: size / 200 MB/s).
+        weights lists the HuggingFace repo ids / checkpoint paths the load
+        reads, for weight_prefetcher. host_attr names the service attribute
+        holding all of the model's weights (a torch module or a diffusers
+        pipeline placed on the device, no CPU offload hooks); such models are
+        demoted to pinned host RAM instead of unloaded.
+        """
+        with self._lock:
+            self._entries[name] = _Entry(
+                name, service, load, unload, loaded, size_mb, pool,
+                load_cost_s if load_cost_s is not None else size_mb / 200.0, weights, host_attr,
+            )
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def is_resident(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.resident
+
+    def is_demoted(self, name: str) -> bool:
+        """True while the model's weights wait in pinned host RAM."""
+        entry = self._entries.get(name)
+        return entry is not None and entry.host_copy is not None
+
+    def weights_of(self, name: str) -> List[str]:
+        return list(self._entry(name).weights)
+
+    def _entry(self, name: str) -> _Entry:
+        if name not in self._entries and name in _PROVIDERS:
+            import importlib
+            importlib.import_module(_PROVIDERS[name])  # registers on import
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"Model '{name}' is not registered") from None
+
+    # ---- references ----
+
+    def acquire(self, name: str, **load_kwargs) -> Any:
+        """Take a reference to the model, loading it (and evicting others) if needed. Returns the service."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.refs += 1
+            self._touch(entry)
+            self._mix.append(name)
+            if entry.resident:
+                return entry.service
+        try:
+            with self._residency:
+                if not entry.resident:
+                    self._load(entry, load_kwargs)
+        except BaseException:
+            with self._lock:
+                entry.refs -= 1
+            raise
+        return entry.service
+
+    def release(self, name: str):
+        """Drop a reference. The model stays resident until the budget needs the room."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.refs = max(0, entry.refs - 1)
+            self._touch(entry)
+
+    @contextmanager
+    def use(self, name: str, **load_kwargs) -> Iterator[Any]:
+        service = self.acquire(name, **load_kwargs)
+        try:
+            yield service
+        finally:
+            self.release(name)
+
+    def restore(self, name: str) -> bool:
+        """
+        For services that load lazily on their own: bring a demoted model back
+        (instead of reloading it from disk). False if it isn't demoted.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry.host_copy is None:
+            return False
+        self.acquire(name)
+        self.release(name)
+        return True
+
+    def pin(self, name: str):
+        """Keep the model resident (once loaded) until unpin()."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.pins += 1
+
+    def unpin(self, name: str):
+        entry = self._entry(name)
+        with self._lock:
+            entry.pins = max(0, entry.pins - 1)
+
+    # ---- residency ----
+
+    def _touch(self, entry: _Entry):
+        """GreedyDual-Size priority: clock + reload seconds per GB. Call with _lock held."""
+        entry.last_used = time.time()
+        entry.priority = self._clock + entry.load_s / max(entry.size_mb / 1024.0, 0.001)
+
+    def _pool(self, entry: _Entry) -> str:
+        return "vram" if entry.pool == "gpu" and _cuda() is not None else "ram"
+
+    def _budget_mb(self, pool: str) -> float:
+        if pool not in self._budgets_mb:
+            configured = self._configured_mb[pool]
+            if configured > 0:
+                self._budgets_mb[pool] = float(configured)
+            elif pool == "vram":
+                self._budgets_mb[pool] = _cuda().get_device_properties(0).total_memory * 0.9 / _MB
+            else:
+                import psutil
+                share = 0.25 if pool == "host" else 0.6
+                self._budgets_mb[pool] = psutil.virtual_memory().total * share / _MB
+        return self._budgets_mb[pool]
+
+    def _sync(self):
+        """Notice models loaded outside the registry. Call with _lock held."""
+        for entry in self._entries.values():
+            if not entry.resident and entry.loaded is not None:
+                try:
+                    if entry.loaded(entry.service):
+                        entry.resident = True
+                        entry.priority = 0.0  # unknown use: first to go
+                        entry.host_copy = None  # the service reloaded it itself; the demoted copy is stale
+                except Exception:
+                    pass
+
+    def _used_mb(self, pool: str) -> float:
+        if pool == "host":
+            return sum(e.size_mb for e in self._entries.values() if e.host_copy is not None)
+        return sum(e.size_mb for e in self._entries.values() if e.resident and self._pool(e) == pool)
+
+    def _demand(self, entry: _Entry) -> float:
+        """Share of the recent acquires that asked for this model. Call with _lock held."""
+        return Counter(self._mix)[entry.name] / len(self._mix) if self._mix else 0.0
+
+    def _demotable(self, entry: _Entry) -> bool:
+        return (
+            self._host_tier and entry.host_attr is not None and self._pool(entry) == "vram"
+            and getattr(entry.service, entry.host_attr, None) is not None
+        )
+
+    def _host_room(self, entry: _Entry, incoming: Optional[_Entry] = None) -> Optional[List[_Entry]]:
+        """
+        Demoted models to drop (to disk) so entry fits the host tier, least
+        requested first and none requested more than entry; None if it
+        doesn't fit even then. incoming is a demoted model about to be
+        promoted (its host RAM is about to free up). Call with _lock held.
+        """
+        demand = self._demand(entry)
+        used = self._used_mb("host")
+        if incoming is not None and incoming.host_copy is not None:
+            used -= incoming.size_mb
+        excess = used + entry.size_mb - self._budget_mb("host")
+        dropped = []
+        candidates = sorted(
+            (e for e in self._entries.values() if e.host_copy is not None and e is not entry and e is not incoming),
+            key=lambda e: (self._demand(e), e.priority),
+        )
+        for candidate in candidates:
+            if excess <= 0:
+                break
+            if self._demand(candidate) > demand:
+                break
+            excess -= candidate.size_mb
+            dropped.append(candidate)
+        return dropped if excess <= 0 else None
+
+    def _make_room(self, entry: _Entry) -> List[_Entry]:
+        """Pick idle victims (lowest priority first) so entry fits. Call with _lock held."""
+        pool = self._pool(entry)
+        excess = self._used_mb(pool) + entry.size_mb - self._budget_mb(pool)
+        victims = []
+        candidates = sorted(
+            (e for e in self._entries.values()
+             if e.resident and e is not entry and e.refs == 0 and e.pins == 0 and self._pool(e) == pool),
+            key=lambda e: e.priority,
+        )
+        for victim in candidates:
+            if excess <= 0:
+                break
+            victim.resident = False
+            self._clock = max(self._clock, victim.priority)
+            excess -= victim.size_mb
+            victims.append(victim)
+        if excess > 0:
+            print(f"⚠️ Loading {entry.name} puts the {pool} pool {excess:.0f}MB over budget (everything else is in use)")
+        return victims
+
+    def _load(self, entry: _Entry, load_kwargs: Dict[str, Any]):
+        with self._lock:
+            self._sync()
+            victims = [] if entry.resident else self._make_room(entry)
+        for victim in victims:
+            self._evict_entry(victim, reason=f"make room for {entry.name}", incoming=entry)
+        if victims:
+            _empty_device_cache()
+        if entry.resident:
+            return  # loaded by its service in the meantime
+        if entry.host_copy is not None:
+            self._promote(entry)
+            return
+
+        from app.services.weight_prefetcher import weight_prefetcher
+        weight_prefetcher.claim(entry.name)  # VRAM is free now; finish reading the files first
+        allocated = _cuda_allocated()
+        start = time.perf_counter()
+        getattr(entry.service, entry.load)(**load_kwargs)
+        entry.load_s = time.perf_counter() - start
+        metrics.observe("model_promotion_seconds", entry.load_s, model=entry.name, tier="disk")
+        if allocated is not None and self._pool(entry) == "vram":
+            measured = (_cuda_allocated() - allocated) / _MB
+            if measured > 1:
+                entry.size_mb = measured
+        with self._lock:
+            entry.resident = True
+            self._touch(entry)
+        print(f"📦 {entry.name} resident ({entry.size_mb:.0f}MB, loaded in {entry.load_s:.1f}s)")
+
+    def _evict_entry(self, entry: _Entry, reason: str, to: Optional[str] = None, incoming: Optional[_Entry] = None):
+        """
+        Take an entry (already marked non-resident) off the device: to the
+        host tier if it's demotable and recently requested (or to="host") and
+        fits there, otherwise unload it. Call with _residency held.
+        """
+        dropped = None
+        if to != "disk" and self._demotable(entry):
+            with self._lock:
+                if to == "host" or self._demand(entry) > 0:
+                    dropped = self._host_room(entry, incoming)
+        if dropped is not None:
+            for other in dropped:
+                self._drop_host_copy(other, reason=f"make host room for {entry.name}")
+            try:
+                self._demote(entry, reason)
+                return
+            except Exception as e:
+                print(f"⚠️ Demoting {entry.name} failed ({e}), unloading it")
+        self._unload(entry, reason)
+
+    def _demote(self, entry: _Entry, reason: str):
+        idle = f", idle {time.time() - entry.last_used:.0f}s" if entry.last_used else ""
+        start = time.perf_counter()
+        value = getattr(entry.service, entry.host_attr)
+        device = _to_host(value)
+        setattr(entry.service, entry.host_attr, None)
+        entry.host_copy = (value, device)
+        self.demotions += 1
+        metrics.inc("model_demotions_total", model=entry.name)
+        print(f"⏬ Demoted {entry.name} ({entry.size_mb:.0f}MB{idle}) to pinned host RAM to {reason} ({time.perf_counter() - start:.1f}s)")
+
+    def _promote(self, entry: _Entry):
+        """Copy a demoted model's weights back to its device. Call with _residency held."""
+        value, device = entry.host_copy
+        start = time.perf_counter()
+        _to_device(value, device)
+        setattr(entry.service, entry.host_attr, value)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            entry.host_copy = None
+            entry.resident = True
+            self._touch(entry)
+        self.promotions += 1
+        metrics.observe("model_promotion_seconds", elapsed, model=entry.name, tier="host")
+        print(f"⏫ {entry.name} back on {device} from host RAM in {elapsed:.2f}s (a load from disk took {entry.load_s:.1f}s)")
+
+    def _drop_host_copy(self, entry: _Entry, reason: str):
+        print(f"🧹 Dropping {entry.name} ({entry.size_mb:.0f}MB) from host RAM to {reason}")
+        entry.host_copy = None
+        self.evictions += 1
+        metrics.inc("model_evictions_total", model=entry.name)
+
+    def _unload(self, entry: _Entry, reason: str):
+        idle = f", idle {time.time() - entry.last_used:.0f}s" if entry.last_used else ""
+        print(f"🧹 Unloading {entry.name} ({entry.size_mb:.0f}MB{idle}) to {reason}")
+        try:
+            getattr(entry.service, entry.unload)()
+        except Exception as e:
+            print(f"⚠️ Unloading {entry.name} failed: {e}")
+        self.evictions += 1
+        metrics.inc("model_evictions_total", model=entry.name)
+
+    def promote_async(self, name: str) -> bool:
+        """
+        Start copying a demoted model back to the device in the background,
+        if the VRAM budget has room for it without evicting anything. The
+        next acquire waits for the copy instead of starting its own.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry.host_copy is None or not self._fits(entry):
+            return False
+        self._promoter.submit(self._promote_background, entry)
+        return True
+
+    def _fits(self, entry: _Entry) -> bool:
+        with self._lock:
+            pool = self._pool(entry)
+            return self._used_mb(pool) + entry.size_mb <= self._budget_mb(pool)
+
+    def _promote_background(self, entry: _Entry):
+        with self._residency:
+            if entry.resident or entry.host_copy is None or not self._fits(entry):
+                return
+            try:
+                self._promote(entry)
+            except Exception as e:
+                print(f"⚠️ Background promotion of {entry.name} failed: {e}")
+
+    def evict(self, name: str, to: Optional[str] = None) -> bool:
+        """
+        Take the model off the device now if nothing holds it: to pinned host
+        RAM or unloaded, per the request mix, or forced with to="host" /
+        to="disk" (which also drops a demoted copy). Returns True if it moved.
+        """
+        entry = self._entry(name)
+        with self._residency:
+            with self._lock:
+                self._sync()
+                if entry.refs or entry.pins:
+                    return False
+                if not entry.resident:
+                    if to != "disk" or entry.host_copy is None:
+                        return False
+                    demoted = True
+                else:
+                    demoted = False
+                    entry.resident = False
+            if demoted:
+                self._drop_host_copy(entry, reason="free memory")
+            else:
+                self._evict_entry(entry, reason="free memory", to=to)
+            _empty_device_cache()
+        return True
+
+    def unload_all(self, include_pinned: bool = False) -> List[str]:
+        """Unload every idle model (pinned ones too if asked), demoted copies included. Returns the names unloaded."""
+        with self._residency:
+            with self._lock:
+                self._sync()
+                victims = [
+                    e for e in self._entries.values()
+                    if e.resident and e.refs == 0 and (include_pinned or e.pins == 0)
+                ]
+                for victim in victims:
+                    victim.resident = False
+                demoted = [e for e in self._entries.values() if e.host_copy is not None]
+            for victim in victims:
+                self._unload(victim, reason="free memory")
+            for entry in demoted:
+                self._drop_host_copy(entry, reason="free memory")
+            _empty_device_cache()
+        return [e.name for e in victims + demoted]
+
+    def reclaimable_mb(self) -> Dict[str, float]:
+        """Memory the registry would free on demand (idle resident models, demoted copies), per "vram" / "ram"."""
+        with self._lock:
+            reclaimable = {"vram": 0.0, "ram": 0.0}
+            for e in self._entries.values():
+                if e.resident and e.refs == 0 and e.pins == 0:
+                    reclaimable[self._pool(e)] += e.size_mb
+                elif e.host_copy is not None:
+                    reclaimable["ram"] += e.size_mb
+            return reclaimable
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._sync()
+            now = time.time()
+            pools = {self._pool(e) for e in self._entries.values()}
+            if self._host_tier and any(e.host_attr for e in self._entries.values()) and _cuda() is not None:
+                pools.add("host")
+            return {
+                "pools": {
+                    pool: {"budget_mb": round(self._budget_mb(pool)), "used_mb": round(self._used_mb(pool))}
+                    for pool in sorted(pools)
+                },
+                "models": {
+                    e.name: {
+                        "resident": e.resident,
+                        "tier": "device" if e.resident else "host" if e.host_copy is not None else "disk",
+                        "demand": round(self._demand(e), 3),
+                        "pool": self._pool(e),
+                        "size_mb": round(e.size_mb),
+                        "refs": e.refs,
+                        "pinned": e.pins > 0,
+                        "load_s": round(e.load_s, 2),
+                        "idle_s": round(now - e.last_used, 1) if e.last_used else None,
+                    }
+                    for e in self._entries.values()
+                },
+                "evictions": self.evictions,
+                "demotions": self.demotions,
+                "promotions": self.promotions,
+            }
+
+
+def _cuda():
+    """torch, if it's already imported and CUDA is up; the registry never imports torch itself."""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+def _cuda_allocated() -> Optional[int]:
+    cuda = _cuda()
+    return cuda.memory_allocated() if cuda is not None else None
+
+
+def _modules(value) -> List[Any]:
+    """The torch modules holding a model's weights: the model itself, or a diffusers pipeline's components."""
+    import torch
+    if isinstance(value, torch.nn.Module):
+        return [value]
+    components = getattr(value, "components", None) or {}
+    return [c for c in components.values() if isinstance(c, torch.nn.Module)]
+
+
+def _to_host(value) -> str:
+    """Move the weights to pinned CPU memory. Returns the device they were on."""
+    modules = _modules(value)
+    device = next((str(p.device) for m in modules for p in m.parameters()), "cuda")
+    for module in modules:
+        module._apply(lambda t: t.to("cpu").pin_memory())
+    return device
+
+
+def _to_device(value, device: str):
+    """Copy the weights back from pinned memory on a side stream (overlapping whatever runs on the default one)."""
+    cuda = _cuda()
+    stream = cuda.Stream()
+    default = cuda.default_stream()
+
+    def move(t):
+        moved = t.to(device, non_blocking=True)
+        moved.record_stream(default)  # allocated on the side stream, used on the default one
+        return moved
+
+    with cuda.stream(stream):
+        for module in _modules(value):
+            module._apply(move)
+    stream.synchronize()
+
+
+def _empty_device_cache():
+    import gc
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        try:
+            torch.mps.empty_cache()
+        except AttributeError:
+            pass
+
+
+# Singleton
+model_registry = ModelRegistry()
@@ -0,0 +1,207 @@
+"""
+ONNX Session Pool - The process's rembg sessions, a few per model, checked out per call.
+
+One onnxruntime session run from several threads at once serializes on its
+own thread pool: concurrent CPU requests queued behind each other and each
+call fought the others for the same intra-op threads. The pool owns the
+sessions for every rembg model (u2netp, u2net, isnet) instead:
+
+- up to REMBG_SESSIONS per model, created on demand (0 = sized to the
+  cores: one per two cores, at most 4)
+- each limited to REMBG_SESSION_THREADS intra-op threads (0 = the cores
+  split between the sessions), so N concurrent calls use the machine once
+  rather than N times over
+- a call checks a session out, runs, checks it back in; when all are busy
+  it waits for the next one to come back
+
+    with onnx_session_pool.session("u2netp") as session:
+        rgba = remove(image, session=session)
+    rgba = onnx_session_pool.remove(image)  # same thing
+
+Checkouts, waits and the time spent waiting are reported per model at
+/studio/health and as onnx_session_* metrics.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from PIL import Image
+
+from app.config import get_settings
+from app.services.metrics import metrics
+
+# Pool name -> rembg model name
+REMBG_MODELS = {"u2netp": "u2netp", "u2net": "u2net", "isnet": "isnet-general-use"}
+MAX_AUTO_SESSIONS = 4
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # what this container may use, not the host's count
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def new_rembg_session(model: str, threads: int):
+    """A rembg session for model with its own onnxruntime thread limit (CPU)."""
+    name = REMBG_MODELS.get(model, model)
+    try:
+        from rembg.sessions import sessions_class
+    except ImportError:
+        from rembg import new_session
+        print("⚠️ This rembg doesn't expose its session classes; session thread limits not applied")
+        return new_session(model_name=name, providers=["CPUExecutionProvider"])
+    from app.services.birefnet_onnx import session_options
+    session_class = next((cls for cls in sessions_class if cls.name() == name), None)
+    if session_class is None:
+        raise ValueError(f"Unknown rembg model '{model}' ({', '.join(REMBG_MODELS)})")
+    return session_class(name, session_options(threads, 1), providers=["CPUExecutionProvider"])
+
+
+class _ModelPool:
+    """Sessions of one model: idle ones, how many exist, who's waiting."""
+
+    def __init__(self, model: str, size: int, threads: int):
+        self.model = model
+        self.size = size
+        self.threads = threads
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        self._created = 0  # sessions alive (idle + checked out)
+        self._generation = 0  # bumped by close(); older sessions are dropped on checkin
+        self.waiting = 0
+        self.checkouts = 0
+        self.waits = 0
+        self._wait_times = deque(maxlen=1000)
+
+    def checkout(self):
+        start = time.perf_counter()
+        create = False
+        with self._cond:
+            waited = False
+            while not self._idle and self._created >= self.size:
+                waited = True
+                self.waiting += 1
+                try:
+                    self._cond.wait()
+                finally:
+                    self.waiting -= 1
+            if self._idle:
+                session = self._idle.pop()
+            else:
+                self._created += 1
+                create = True
+            generation = self._generation
+            self.checkouts += 1
+            self.waits += waited
+
+        if create:
+            try:
+                print(f"⏳ Loading {self.model} session {self._created}/{self.size} ({self.threads} threads)...")
+                session = new_rembg_session(self.model, self.threads)
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        wait = time.perf_counter() - start
+        self._wait_times.append(wait)
+        metrics.observe("onnx_session_wait_seconds", wait, model=self.model)
+        return session, generation
+
+    def checkin(self, session, generation: int):
+        with self._cond:
+            if generation == self._generation:
+                self._idle.append(session)
+            else:
+                self._created -= 1  # closed while checked out
+            self._cond.notify()
+
+    def close(self):
+        """Drop the idle sessions now and the busy ones when they come back."""
+        with self._cond:
+            self._created -= len(self._idle)
+            self._idle.clear()
+            self._generation += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        pct = lambda p: round(waits[math.ceil(p / 100.0 * len(waits)) - 1] * 1000, 1) if waits else None  # nearest rank
+        with self._cond:
+            return {
+                "size": self.size,
+                "threads_per_session": self.threads,
+                "sessions": self._created,
+                "idle": len(self._idle),
+                "busy": self._created - len(self._idle),
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "waited": self.waits,
+                "wait_ms": {"p50": pct(50), "p95": pct(95)},
+            }
+
+
+class OnnxSessionPool:
+    def __init__(self):
+        settings = get_settings()
+        cores = _cores()
+        self.size = settings.REMBG_SESSIONS or max(1, min(MAX_AUTO_SESSIONS, cores // 2))
+        self.threads = settings.REMBG_SESSION_THREADS or max(1, cores // self.size)
+        self._lock = threading.Lock()
+        self._pools: Dict[str, _ModelPool] = {}
+
+    def _pool(self, model: str) -> _ModelPool:
+        with self._lock:
+            if model not in self._pools:
+                self._pools[model] = _ModelPool(model, self.size, self.threads)
+            return self._pools[model]
+
+    @contextmanager
+    def session(self, model: str = "u2netp") -> Iterator[Any]:
+        """Check out one of model's sessions for the duration of the block."""
+        pool = self._pool(model)
+        session, generation = pool.checkout()
+        try:
+            yield session
+        finally:
+            pool.checkin(session, generation)
+
+    def remove(self, image: Image.Image, model: str = "u2netp", **kwargs) -> Image.Image:
+        """rembg.remove on a pooled session of model."""
+        from rembg import remove
+        with self.session(model) as session:
+            return remove(image, session=session, **kwargs)
+
+    def warm(self, model: str = "u2netp"):
+        """Make sure model has at least one session (the model registry's load)."""
+        with self.session(model):
+            pass
+
+    def close(self, model: Optional[str] = None):
+        """Free model's sessions (all models' with None)."""
+        with self._lock:
+            pools = [self._pools[model]] if model in self._pools else [] if model else list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def loaded(self, model: str = "u2netp") -> bool:
+        pool = self._pools.get(model)
+        return pool is not None and pool.stats()["sessions"] > 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pools = dict(self._pools)
+        return {
+            "sessions_per_model": self.size,
+            "threads_per_session": self.threads,
+            "models": {model: pool.stats() for model, pool in pools.items()},
+        }
+
+
+# Singleton
+onnx_session_pool = OnnxSessionPool()
@@ -12,7 +12,7 @@ Architecture:
 import os
 import time
 import asyncio
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 from PIL import Image
 from io import BytesIO
 import torch
@@ -26,6 +26,8 @@ from app.services.rendering_service import rendering_service
 from app.services.birefnet_service import birefnet_service
 from app.services.compositing_service import compositing_service
 from app.services.upscale_service import upscale_service
+from app.services.inference_executor import inference_executor
+from app.services.metrics import metrics
 
 
 class PlanBPipeline:
@@ -55,7 +57,8 @@ class PlanBPipeline:
         angles: Optional[List[str]] = None,
         add_shadow: bool = True,
         upscale: bool = True,
-        foreground_ratio: float = 0.85
+        foreground_ratio: float = 0.85,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Tuple[Dict[str, Image.Image], Dict]:
         """
         Process product photo through Plan B pipeline.
@@ -67,6 +70,7 @@ class PlanBPipeline:
             add_shadow: Add drop shadow in compositing
             upscale: Apply Real-ESRGAN upscaling (2x)
             foreground_ratio: Ratio of frame occupied by product (0.5-1.0)
+            progress_callback: Called as progress(stage, "started"/"completed", **info)
 
         Returns:
             (dict of {angle: Image}, metadata dict)
@@ -76,6 +80,7 @@ class PlanBPipeline:
         """
         if angles is None:
             angles = ["front", "side", "back"]
+        progress = metrics.stage_reporter("plan-b", progress_callback)
 
         start_time = time.time()
         metadata = {
@@ -95,10 +100,13 @@ class PlanBPipeline:
             print("\n📸 PHASE 1: Segmentation (BiRefNet)")
             print("-" * 70)
             stage_start = time.time()
+            progress("segmentation", "started")
 
-            rgba_product = birefnet_service.remove_background(image)
+            # Model stages go to the GPU owner thread; the rest of Plan B runs on the caller's lane
+            rgba_product = await inference_executor.run_gpu("birefnet", birefnet_service.remove_background, image)
             stage_time = time.time() - stage_start
             metadata["stages"]["segmentation"] = stage_time
+            progress("segmentation", "completed", seconds=stage_time)
             print(f"   ✅ Completed in {stage_time:.1f}s")
             print(f"      Extracted product with transparent background")
 
@@ -106,6 +114,7 @@ class PlanBPipeline:
             print("\n🎨 PHASE 2: 3D Reconstruction (Replicate API)")
             print("-" * 70)
             stage_start = time.time()
+            progress("reconstruction", "started")
 
             glb_path = await replicate_3d_service.reconstruct_3d(
                 rgba_product,
@@ -118,6 +127,7 @@ class PlanBPipeline:
 
             stage_time = time.time() - stage_start
             metadata["stages"]["reconstruction"] = stage_time
+            progress("reconstruction", "completed", seconds=stage_time)
             metadata["cost"] = replicate_3d_service.cost_per_call
             print(f"   ✅ 3D model generated in {stage_time:.1f}s")
             print(f"   💰 Cost: ${metadata['cost']:.2f}")
@@ -126,6 +136,7 @@ class PlanBPipeline:
             print("\n🖼️  PHASE 3: Rendering ({} angle(s))".format(len(angles)))
             print("-" * 70)
             stage_start = time.time()
+            progress("rendering", "started")
 
             try:
                 rendered_views = rendering_service.render_multiple_angles(
@@ -134,6 +145,7 @@ class PlanBPipeline:
                 )
                 stage_time = time.time() - stage_start
                 metadata["stages"]["rendering"] = stage_time
+                progress("rendering", "completed", seconds=stage_time)
                 print(f"   ✅ Rendered {len(angles)} view(s) in {stage_time:.1f}s")
                 for angle in angles:
                     print(f"      • {angle}: {rendered_views[angle].size}")
@@ -150,6 +162,7 @@ class PlanBPipeline:
             print("\n✏️  PHASE 4: Compositing")
             print("-" * 70)
             stage_start = time.time()
+            progress("compositing", "started")
 
             composited_views = {}
             for angle, view_img in rendered_views.items():
@@ -172,6 +185,7 @@ class PlanBPipeline:
 
             stage_time = time.time() - stage_start
             metadata["stages"]["compositing"] = stage_time
+            progress("compositing", "completed", seconds=stage_time)
             print(f"   ✅ Completed in {stage_time:.1f}s")
 
             # PHASE 5: Upscaling (Plan A service)
@@ -179,17 +193,13 @@ class PlanBPipeline:
                 print("\n✨ PHASE 5: Polish (Real-ESRGAN)")
                 print("-" * 70)
                 stage_start = time.time()
+                progress("upscaling", "started")
 
-                final_views = {}
-                for angle, comp_img in composited_views.items():
-                    # Clear MPS cache before upscaling
-                    if self.device == "mps":
-                        torch.mps.empty_cache()
-
-                    final_views[angle] = upscale_service.enhance(comp_img, scale=2)
+                final_views = await inference_executor.run_gpu("realesrgan", self._polish, composited_views)
 
                 stage_time = time.time() - stage_start
                 metadata["stages"]["upscaling"] = stage_time
+                progress("upscaling", "completed", seconds=stage_time)
                 print(f"   ✅ Completed in {stage_time:.1f}s")
             else:
                 final_views = composited_views
@@ -225,6 +235,17 @@ class PlanBPipeline:
             metadata["error"] = str(e)
             raise
 
+    def _polish(self, views: Dict[str, Image.Image]) -> Dict[str, Image.Image]:
+        """Upscale every view (on the GPU owner thread)."""
+        final_views = {}
+        for angle, comp_img in views.items():
+            # Clear MPS cache before upscaling
+            if self.device == "mps":
+                torch.mps.empty_cache()
+
+            final_views[angle] = upscale_service.enhance(comp_img, scale=2)
+        return final_views
+
     async def _fallback_plan_a(
         self,
         rgba_image: Image.Image,
@@ -269,7 +290,7 @@ class PlanBPipeline:
             # Upscale if requested
             if upscale:
                 start_time = time.time()
-                result = upscale_service.enhance(composited, scale=2)
+                result = await inference_executor.run_gpu("realesrgan", upscale_service.enhance, composited, scale=2)
                 metadata["stages"]["upscaling"] = time.time() - start_time
             else:
                 result = composited
@@ -14,14 +14,18 @@ class QwenEditService:
         """
         Smart Lane: Sequential Loading (Encoder -> VAE/DiT GGUF)
         """
+        from io import BytesIO
+        from app.services.inference_executor import inference_executor
+
+        contents = await image_file.read()
+        input_image = Image.open(BytesIO(contents)).convert("RGB")
+        return await inference_executor.run_gpu("qwen", self.edit_image, input_image, prompt)
+
+    def edit_image(self, input_image: Image.Image, prompt: str) -> str:
+        """Synchronous body of edit (runs on the GPU owner thread). Returns output path."""
         import gc
         
         try:
-             # Read Image
-            contents = await image_file.read()
-            from io import BytesIO
-            input_image = Image.open(BytesIO(contents)).convert("RGB")
-            
             # 1. Load Text Encoder (15GB)
             print("🐼 Step 1: Loading Text Encoder (15GB)...")
             from transformers import Qwen2_5_VLForConditionalGeneration, Qwen2Tokenizer, Qwen2VLProcessor
@@ -12,6 +12,7 @@ from typing import Optional
 from PIL import Image
 from io import BytesIO
 import time
+from app.services.tracing import traced
 
 
 class Replicate3DService:
@@ -63,6 +64,8 @@ class Replicate3DService:
         except Exception as e:
             print(f"⚠️ Could not write spend record: {e}")
         print(f"💰 Replicate today's spend: ${spend:.3f} / ${self.daily_cap:.2f} cap")
+        from app.services.metrics import metrics
+        metrics.inc("replicate_spend_usd_total", amount)
 
     async def validate_token(self) -> bool:
         """
@@ -95,6 +98,7 @@ class Replicate3DService:
             print(f"⚠️  Could not validate token: {e}")
             return False
 
+    @traced("replicate.reconstruct_3d")
     async def reconstruct_3d(
         self,
         image: Image.Image,
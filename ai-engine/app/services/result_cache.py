@@ -0,0 +1,314 @@
+"""
+Result Cache - Content-addressed cache for studio outputs.
+
+Sellers retry, and the frontend re-requests /enhance, /showcase and
+/fetch_stock for the same photo. Results are keyed by a hash of the input
+bytes plus the normalized parameters that affect the output, and kept in two
+tiers:
+- memory: LRU bounded by RESULT_CACHE_MEMORY_MB
+- disk:   one file per entry under RESULT_CACHE_DIR, LRU (by mtime) bounded
+          by RESULT_CACHE_DISK_MB, survives restarts
+
+Entries expire after RESULT_CACHE_TTL_S. Every entry carries a digest of its
+content, which the routers use as a strong ETag for If-None-Match.
+
+get/put are coroutines: disk reads, the digest encode and disk writes run on
+the executor's I/O lane, never on the event loop. put only encodes the image
+the response returns; the rest (every image encoded, the disk copy, the
+memory entry swapped for its encoded bytes and re-sized) happens in the
+background after the response has gone out.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+from app.services.inference_executor import inference_executor
+from app.utils.image_result import ImageResult
+
+# Bump when pipeline output changes so stale entries stop matching
+CACHE_VERSION = "3"  # 3: boundary refinement, per-device precision policies, pooled u2netp
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, (tuple, list)):
+        return "x".join(str(v) for v in value)
+    return value
+
+
+class CacheEntry:
+    """A cached result dict (ImageResult values + JSON metadata) and its digest."""
+
+    __slots__ = ("result", "digest", "created_at", "size")
+
+    def __init__(self, result: Dict[str, Any], digest: str, created_at: float, size: int):
+        self.result = result
+        self.digest = digest
+        self.created_at = created_at
+        self.size = size
+
+    def etag(self, representation: str = "bin") -> str:
+        """Strong ETag for one representation of the entry (raw image or JSON)."""
+        return f'"{self.digest[:40]}.{representation}"'
+
+
+class ResultCache:
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.RESULT_CACHE_ENABLED
+        self.directory = settings.RESULT_CACHE_DIR
+        self.memory_limit = settings.RESULT_CACHE_MEMORY_MB * 1024 * 1024
+        self.disk_limit = settings.RESULT_CACHE_DISK_MB * 1024 * 1024
+        self.ttl_s = settings.RESULT_CACHE_TTL_S
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None  # key -> file size, oldest first
+        self._disk_bytes = 0
+        self._disk_lock = threading.RLock()  # disk index is touched from I/O lane threads
+        self._writes: set = set()  # background encodes / disk writes in flight (see _settle)
+        self._stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0,
+            "memory_evictions": 0, "disk_evictions": 0, "expired": 0,
+        }
+
+    # ---- keys ----
+
+    @staticmethod
+    def make_key(namespace: str, data: bytes = b"", **params) -> str:
+        """sha256 over the input bytes and the normalized parameters."""
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_VERSION}:{namespace}:".encode())
+        digest.update(data)
+        normalized = {k: _normalize(v) for k, v in params.items() if v is not None}
+        digest.update(json.dumps(normalized, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    # ---- lookup ----
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._expired(entry):
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry
+            self._drop_memory(key)
+            self._stats["expired"] += 1
+            await inference_executor.run_io("result-cache", self._drop_disk, key)
+            self._stats["misses"] += 1
+            return None
+
+        entry = await inference_executor.run_io("result-cache", self._read_disk, key)
+        if entry is not None:
+            self._stats["disk_hits"] += 1
+            self._remember(key, entry)
+            return entry
+
+        self._stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, result: Dict[str, Any], returned: str = "image_data", store: bool = True) -> CacheEntry:
+        """
+        Store a result dict and return its entry (with the digest for the ETag).
+        Works when disabled (or store=False, e.g. output of a memory-pressure
+        fallback) too, so routes can always compute an ETag.
+
+        The digest covers the request key, the fields and only the `returned`
+        image (what binary responses send); every other image is a function
+        of the key's input, so it needn't be encoded here.
+        """
+        images = {k: v for k, v in result.items() if isinstance(v, ImageResult)}
+        fields = {k: v for k, v in result.items() if not isinstance(v, ImageResult)}
+        try:
+            fields_json = json.dumps(fields, sort_keys=True)
+        except TypeError:
+            fields_json = None  # not JSON-safe: memory tier only
+
+        digest = await inference_executor.run_io(
+            "result-cache", self._digest, key, images.get(returned), fields_json or repr(sorted(fields.items()))
+        )
+        # Until _settle has encoded everything: what the images hold right now
+        size = sum(image.nbytes for image in images.values()) + len(fields_json or "")
+        entry = CacheEntry(dict(result), digest, time.time(), size)
+        if not self.enabled or not store:
+            return entry
+
+        self._stats["puts"] += 1
+        self._remember(key, entry)
+        task = asyncio.ensure_future(self._settle(key, entry, images, fields_json))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+        return entry
+
+    async def _settle(self, key: str, entry: CacheEntry, images: Dict[str, ImageResult], fields_json: Optional[str]):
+        """After the response: encode every image, write the disk copy, re-size the memory entry by its bytes."""
+        try:
+            compact = await inference_executor.run_io("result-cache", self._encode, key, entry, images, fields_json)
+        except Exception as e:
+            print(f"⚠️ Result cache encode failed, dropping entry: {e}")
+            self._drop_memory(key)
+            return
+        if self._memory.get(key, entry) is entry:  # also when it was too big before encoding
+            self._remember(key, compact)
+
+    def _encode(self, key: str, entry: CacheEntry, images: Dict[str, ImageResult], fields_json: Optional[str]) -> CacheEntry:
+        # Bytes only from here on: the decoded images go once the request is done with them
+        encoded = {name: ImageResult.from_bytes(image.data, media_type=image.media_type) for name, image in images.items()}
+        if fields_json is not None:
+            self._write_disk(key, entry, encoded, fields_json)
+        size = sum(len(image.data) for image in encoded.values()) + len(fields_json or "")
+        return CacheEntry({**entry.result, **encoded}, entry.digest, entry.created_at, size)
+
+    @staticmethod
+    def _digest(key: str, image: Optional[ImageResult], fields: str) -> str:
+        digest = hashlib.sha256(key.encode())
+        if image is not None:
+            digest.update(image.data)  # the encode the response needs anyway
+        digest.update(fields.encode())
+        return digest.hexdigest()
+
+    # ---- memory tier ----
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.created_at > self.ttl_s
+
+    def _remember(self, key: str, entry: CacheEntry):
+        if entry.size > self.memory_limit:
+            return
+        self._drop_memory(key)
+        self._memory[key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self.memory_limit and self._memory:
+            old_key, _ = next(iter(self._memory.items()))
+            self._drop_memory(old_key)
+            self._stats["memory_evictions"] += 1
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.size
+
+    # ---- disk tier ----
+    # File layout: [4-byte header length][JSON header][image blobs...]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        # Callers hold _disk_lock
+        if self._disk is None:
+            files = []
+            if os.path.isdir(self.directory):
+                for root, _, names in os.walk(self.directory):
+                    for name in names:
+                        if name.endswith(".bin"):
+                            stat = os.stat(os.path.join(root, name))
+                            files.append((stat.st_mtime, name[:-4], stat.st_size))
+            self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def _write_disk(self, key: str, entry: CacheEntry, images: Dict[str, ImageResult], fields_json: str):
+        if entry.size > self.disk_limit:
+            return
+        header = {
+            "digest": entry.digest,
+            "created_at": entry.created_at,
+            "fields": fields_json,
+            "images": [[name, image.media_type, len(image.data)] for name, image in sorted(images.items())],
+        }
+        header_bytes = json.dumps(header).encode()
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack(">I", len(header_bytes)))
+                f.write(header_bytes)
+                for name in sorted(images):
+                    f.write(images[name].data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Result cache write failed: {e}")
+            return
+
+        with self._disk_lock:
+            index = self._disk_index()
+            self._drop_disk_index(key)
+            index[key] = os.path.getsize(path)
+            self._disk_bytes += index[key]
+            while self._disk_bytes > self.disk_limit and len(index) > 1:
+                old_key = next(iter(index))
+                self._drop_disk(old_key)
+                self._stats["disk_evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                (header_len,) = struct.unpack(">I", f.read(4))
+                header = json.loads(f.read(header_len))
+                if time.time() - header["created_at"] > self.ttl_s:
+                    self._stats["expired"] += 1
+                    self._drop_disk(key)
+                    return None
+                result = json.loads(header["fields"])
+                for name, media_type, length in header["images"]:
+                    result[name] = ImageResult.from_bytes(f.read(length), media_type=media_type)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"⚠️ Result cache entry unreadable, dropping: {e}")
+            self._drop_disk(key)
+            return None
+
+        os.utime(path)  # LRU by mtime across restarts
+        with self._disk_lock:
+            index = self._disk_index()
+            if key in index:
+                index.move_to_end(key)
+        return CacheEntry(result, header["digest"], header["created_at"], os.path.getsize(path))
+
+    def _drop_disk_index(self, key: str):
+        index = self._disk_index()
+        size = index.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _drop_disk(self, key: str):
+        with self._disk_lock:
+            self._drop_disk_index(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    # ---- reporting ----
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self._stats,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "memory_mb": round(self._memory_bytes / (1024 * 1024), 1),
+            "disk_entries": len(self._disk) if self._disk is not None else None,
+            "disk_mb": round(self._disk_bytes / (1024 * 1024), 1) if self._disk is not None else None,
+        }
+
+
+# Singleton
+result_cache = ResultCache()
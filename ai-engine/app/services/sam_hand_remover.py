@@ -7,6 +7,7 @@ import numpy as np
 from PIL import Image
 import cv2
 import os
+from app.services.metrics import metrics
 
 
 class SAMHandRemover:
@@ -22,6 +23,7 @@ class SAMHandRemover:
         self.model_path = "models/sam_vit_b.pth"
         self.device = "cpu"  # MPS has issues with SAM
         
+    @metrics.timed_load("sam", lambda s: s.sam is not None)
     def load_model(self):
         """Load SAM model"""
         if self.sam is not None:
@@ -0,0 +1,148 @@
+"""
+Segmentation Batcher - Dynamic micro-batching for BiRefNet background removal.
+
+QuickSell uploads fan out into several /enhance and /showcase requests at
+once, and each used to run its own batch-of-one forward pass. With batching
+enabled (BIREFNET_BATCHING=1) requests that arrive within
+BIREFNET_BATCH_WINDOW_MS are collected (up to BIREFNET_MAX_BATCH), run as
+one batched 1024x1024 pass on the GPU lane, and the masks are fanned back out.
+
+Tracks the batch-size distribution and the delay the window adds, so the
+window/max batch can be tuned for throughput vs. p50 latency per device.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from app.config import get_settings
+from app.services.inference_executor import inference_executor
+from app.services.tracing import tracer
+from app.utils.image_context import ImageContext
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]  # nearest rank, as in the benchmarks
+
+
+class SegmentationBatcher:
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.BIREFNET_BATCHING
+        self.window_s = settings.BIREFNET_BATCH_WINDOW_MS / 1000.0
+        self.max_batch = max(1, settings.BIREFNET_MAX_BATCH)
+        self._pending: List[Tuple[Image.Image, asyncio.Future, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Metrics
+        self.batch_sizes: Counter = Counter()
+        self._queue_delays = deque(maxlen=2000)  # seconds spent waiting for the window
+        self._forward_times = deque(maxlen=500)  # seconds per batched call (incl. GPU lane wait)
+        if self.enabled:
+            print(f"📦 BiRefNet micro-batching on (window {settings.BIREFNET_BATCH_WINDOW_MS:.0f}ms, max batch {self.max_batch})")
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def segment(self, image: Union[Image.Image, ImageContext], mode: Optional[str] = None) -> Tuple[Image.Image, Optional[float]]:
+        """
+        Remove the background. Returns (rgba, alpha_quality). mode: BiRefNet
+        serving mode (default: the service's). Photos already segmented by
+        any endpoint come from the segmentation cache without a model pass.
+        """
+        from app.services.birefnet_service import birefnet_for
+        from app.services.segmentation_cache import segmentation_cache
+        service = birefnet_for(mode)
+        ctx = image if isinstance(image, ImageContext) else ImageContext.from_pil(image)
+        # Hashing / PNG coding a 12MP mask is a few ms: off the event loop, never on the GPU lane
+        cached = await inference_executor.run_io("segmentation-cache", segmentation_cache.lookup, ctx, service.cache_source())
+        if cached is not None:
+            tracer.annotate(segmentation_cache="hit")
+            rgba, info = cached
+            return rgba, info.quality
+        rgba, quality = await self._segment(ctx, service)
+        await inference_executor.run_io("segmentation-cache", segmentation_cache.store, ctx, rgba)
+        return rgba, quality
+
+    async def _segment(self, image: ImageContext, service) -> Tuple[Image.Image, Optional[float]]:
+        if service._registry_name != "birefnet":
+            # Other modes are rare per-request picks: not worth a batch window of their own
+            return (await self._run_batch([image], service))[0]
+        if not self.enabled:
+            return (await self._run_batch([image]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_s, self._flush)
+        # The batched forward pass is traced under whichever request flushed it
+        with tracer.span("segmentation_batcher.wait"):
+            return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            # Overflow starts its own window
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window_s, self._flush)
+        if batch:
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[Image.Image, asyncio.Future, float]]):
+        flushed = time.perf_counter()
+        for _, _, enqueued in batch:
+            self._queue_delays.append(flushed - enqueued)
+        try:
+            results = await self._run_batch([image for image, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, images: List[Image.Image], service=None):
+        from app.services.birefnet_service import birefnet_service
+        service = service or birefnet_service
+        start = time.perf_counter()
+        tracer.annotate(batch=len(images))
+        results = await inference_executor.run_gpu("birefnet", service.segment_batch, images)
+        self._forward_times.append(time.perf_counter() - start)
+        self.batch_sizes[len(images)] += 1
+        if len(images) > 1:
+            print(f"📦 BiRefNet batch of {len(images)} in {self._forward_times[-1]:.2f}s")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        delays = list(self._queue_delays)
+        forwards = list(self._forward_times)
+        batches = sum(self.batch_sizes.values())
+        ms = lambda v: None if v is None else round(v * 1000, 1)
+        return {
+            "enabled": self.enabled,
+            "window_ms": round(self.window_s * 1000, 1),
+            "max_batch": self.max_batch,
+            "batches": batches,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "mean_batch_size": round(sum(k * v for k, v in self.batch_sizes.items()) / batches, 2) if batches else None,
+            "queue_delay_ms": {"p50": ms(_percentile(delays, 50)), "p95": ms(_percentile(delays, 95))},
+            "batch_time_ms": {"p50": ms(_percentile(forwards, 50)), "p95": ms(_percentile(forwards, 95))},
+        }
+
+
+# Singleton
+segmentation_batcher = SegmentationBatcher()
@@ -0,0 +1,345 @@
+"""
+Segmentation Cache - One segmentation per photo, whichever endpoint sees it first.
+
+A seller's photo goes through /studio/enhance, /studio/showcase and often
+/process-3d-plan-b, and each used to run BiRefNet (or u2netp) on the same
+pixels. Masks are cached by what the pixels look like, not by the upload's
+bytes, so a re-encoded or re-uploaded copy of the photo still hits:
+
+    key  = (segmenter, width x height, 64-bit difference hash of the image)
+    hit  = an entry for the same segmenter and size whose hash is within
+           HASH_DISTANCE bits (re-encoding flips a few bits on flat
+           backgrounds), and whose 32x32 thumbnail is within
+           SEGMENTATION_CACHE_MAX_DIFF (mean abs difference, 0-255) of the
+           request's, so two different photos that happen to hash alike
+           don't share a mask
+
+The segmenter is part of the key (BiRefNet mode + backend, u2netp, the model
+host): a lighter model's mask never answers for a heavier one. Masks made by
+a fallback under memory pressure aren't stored at all.
+
+Entries hold the alpha as PNG plus the MaskInfo fields, in a memory LRU
+(SEGMENTATION_CACHE_MEMORY_MB) and one file each on disk
+(SEGMENTATION_CACHE_DISK_MB, LRU by mtime, survives restarts), and expire
+after SEGMENTATION_CACHE_TTL_S. Hit rates are exported with the result
+cache's as cache_requests_total{cache="segmentation"}.
+"""
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.config import get_settings
+from app.services.admission_control import note_degradation
+from app.utils.image_context import ImageContext
+from app.utils.mask_info import MaskInfo
+
+# Bump when segmentation output changes so stale masks stop matching
+CACHE_VERSION = "1"
+THUMB_SIZE = 32
+HASH_DISTANCE = 10  # max differing dHash bits for an entry to be checked against the thumbnail
+MAX_CANDIDATES = 3
+# Sources that are a stand-in for the requested segmenter (pressure fallbacks): never cached
+TRANSIENT_SUFFIX = ":transient"
+
+
+def fingerprint(image: Image.Image) -> Tuple[int, np.ndarray]:
+    """(64-bit difference hash, 32x32 RGB thumbnail) of an image."""
+    thumb = image.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BOX, reducing_gap=2.0)
+    gray = np.asarray(thumb.convert("L").resize((9, 8), Image.BOX), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0]), np.asarray(thumb)
+
+
+class _Entry(NamedTuple):
+    meta: Dict[str, Any]  # MaskInfo fields, size, created_at
+    thumb: bytes
+    alpha_png: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.thumb) + len(self.alpha_png) + 256
+
+
+class SegmentationCache:
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.SEGMENTATION_CACHE_ENABLED
+        self.directory = settings.SEGMENTATION_CACHE_DIR
+        self.memory_limit = settings.SEGMENTATION_CACHE_MEMORY_MB * 1024 * 1024
+        self.disk_limit = settings.SEGMENTATION_CACHE_DISK_MB * 1024 * 1024
+        self.ttl_s = settings.SEGMENTATION_CACHE_TTL_S
+        self.max_diff = settings.SEGMENTATION_CACHE_MAX_DIFF
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None  # key -> file size, oldest first
+        self._disk_bytes = 0
+        # "<source digest>-<w>x<h>" -> {key: dhash} over both tiers, for near-hash lookups
+        self._groups: Dict[str, Dict[str, int]] = {}
+        self._stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "collisions": 0,
+            "memory_evictions": 0, "disk_evictions": 0, "expired": 0,
+        }
+
+    # ---- keys ----
+
+    @staticmethod
+    def _fingerprint(ctx: ImageContext) -> Tuple[int, np.ndarray]:
+        return ctx.cached("segmentation_fingerprint", lambda: fingerprint(ctx.pil))
+
+    @staticmethod
+    def group(source: str, size: Tuple[int, int]) -> str:
+        digest = hashlib.sha256(f"{CACHE_VERSION}:{source}".encode()).hexdigest()[:16]
+        return f"{digest}-{size[0]}x{size[1]}"
+
+    def make_key(self, source: str, size: Tuple[int, int], dhash: int) -> str:
+        return f"{self.group(source, size)}-{dhash:016x}"
+
+    def _candidates(self, group: str, dhash: int) -> List[str]:
+        """Keys in the group within HASH_DISTANCE of dhash, nearest first."""
+        with self._lock:
+            self._disk_index()
+            entries = list(self._groups.get(group, {}).items())
+        near = sorted((bin(other ^ dhash).count("1"), key) for key, other in entries)
+        return [key for distance, key in near[:MAX_CANDIDATES] if distance <= HASH_DISTANCE]
+
+    def _index(self, key: str):
+        group, _, dhash = key.rpartition("-")
+        self._groups.setdefault(group, {})[key] = int(dhash, 16)
+
+    def _unindex(self, key: str):
+        """Forget key once neither tier has it."""
+        if key in self._memory or (self._disk is not None and key in self._disk):
+            return
+        group = key.rpartition("-")[0]
+        members = self._groups.get(group, {})
+        members.pop(key, None)
+        if not members:
+            self._groups.pop(group, None)
+
+    # ---- lookup ----
+
+    def lookup(self, ctx: ImageContext, source: str) -> Optional[Tuple[Image.Image, MaskInfo]]:
+        """(rgba, MaskInfo) if this segmenter already cut out these pixels; fills ctx like a segmentation would."""
+        if not self.enabled:
+            return None
+        dhash, thumb = self._fingerprint(ctx)
+        for key in self._candidates(self.group(source, ctx.size), dhash):
+            entry, tier = self._get(key)
+            if entry is None:
+                continue
+            if time.time() - entry.meta["created_at"] > self.ttl_s:
+                self._drop(key)
+                self._stats["expired"] += 1
+            elif not self._same_pixels(entry, thumb):
+                self._stats["collisions"] += 1
+            else:
+                self._stats[f"{tier}_hits"] += 1
+                return self._restore(ctx, source, entry)
+        self._stats["misses"] += 1
+        return None
+
+    def _get(self, key: str) -> Tuple[Optional[_Entry], str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "memory"
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry, "disk"
+
+    @staticmethod
+    def _restore(ctx: ImageContext, source: str, entry: _Entry) -> Tuple[Image.Image, MaskInfo]:
+        meta = entry.meta
+        alpha = np.asarray(Image.open(io.BytesIO(entry.alpha_png)))
+        info = MaskInfo(
+            alpha, tuple(meta["bbox"]) if meta["bbox"] else None, meta["area"], meta["components"],
+            meta["quality"], tuple(meta["touches"]),
+        )
+        rgba = ctx.pil.convert("RGBA")
+        rgba.putalpha(info.mask())
+        ctx.set("alpha_mask", info.mask())
+        ctx.set("mask_info", info)
+        ctx.set("segmented_by", source)
+        return rgba, info
+
+    def _same_pixels(self, entry: _Entry, thumb: np.ndarray) -> bool:
+        cached = np.frombuffer(entry.thumb, dtype=np.uint8).reshape(thumb.shape)
+        return float(np.abs(cached.astype(np.int16) - thumb).mean()) <= self.max_diff
+
+    # ---- store ----
+
+    def store(self, ctx: ImageContext, rgba: Image.Image):
+        """
+        Cache what segmentation left on ctx (its source, MaskInfo). Fallbacks
+        are skipped, and noted as a degradation of the calling request (which
+        may not have run the shared batched pass that made them itself).
+        """
+        source = ctx.get("segmented_by")
+        if source and source.endswith(TRANSIENT_SUFFIX):
+            note_degradation(f"birefnet->{source[:-len(TRANSIENT_SUFFIX)]}")
+            return
+        if not self.enabled or not source:
+            return
+        info = ctx.cached("mask_info", lambda: MaskInfo.from_image(rgba))
+        dhash, thumb = self._fingerprint(ctx)
+        key = self.make_key(source, ctx.size, dhash)
+        png = io.BytesIO()
+        Image.fromarray(info.alpha).save(png, format="PNG", compress_level=1)  # masks compress well even at level 1
+        entry = _Entry(
+            {
+                "created_at": time.time(),
+                "source": source,
+                "bbox": list(info.bbox) if info.bbox else None,
+                "area": info.area,
+                "components": info.components,
+                "quality": info.quality,
+                "touches": list(info.touches),
+            },
+            thumb.tobytes(),
+            png.getvalue(),
+        )
+        self._stats["puts"] += 1
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    # ---- memory tier ----
+
+    def _remember(self, key: str, entry: _Entry):
+        if entry.size > self.memory_limit:
+            return
+        with self._lock:
+            self._drop_memory(key)
+            self._memory[key] = entry
+            self._memory_bytes += entry.size
+            self._index(key)
+            while self._memory_bytes > self.memory_limit and self._memory:
+                evicted = next(iter(self._memory))
+                self._drop_memory(evicted)
+                self._unindex(evicted)
+                self._stats["memory_evictions"] += 1
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.size
+
+    def _drop(self, key: str):
+        with self._lock:
+            self._drop_memory(key)
+            self._drop_disk(key)
+            self._unindex(key)
+
+    # ---- disk tier ----
+    # File layout: [4-byte header length][JSON header][thumbnail][alpha PNG]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[-2:], f"{key}.seg")
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        if self._disk is None:
+            files = []
+            if os.path.isdir(self.directory):
+                for root, _, names in os.walk(self.directory):
+                    for name in names:
+                        if name.endswith(".seg"):
+                            stat = os.stat(os.path.join(root, name))
+                            files.append((stat.st_mtime, name[:-4], stat.st_size))
+            self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+            self._disk_bytes = sum(self._disk.values())
+            for key in self._disk:
+                self._index(key)
+        return self._disk
+
+    def _write_disk(self, key: str, entry: _Entry):
+        if entry.size > self.disk_limit:
+            return
+        header = json.dumps({**entry.meta, "thumb": len(entry.thumb), "alpha": len(entry.alpha_png)}).encode()
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack(">I", len(header)))
+                f.write(header)
+                f.write(entry.thumb)
+                f.write(entry.alpha_png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Segmentation cache write failed: {e}")
+            return
+
+        with self._lock:
+            index = self._disk_index()
+            self._drop_disk_index(key)
+            index[key] = os.path.getsize(path)
+            self._disk_bytes += index[key]
+            self._index(key)
+            while self._disk_bytes > self.disk_limit and len(index) > 1:
+                evicted = next(iter(index))
+                self._drop_disk(evicted)
+                self._unindex(evicted)
+                self._stats["disk_evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[_Entry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                (header_len,) = struct.unpack(">I", f.read(4))
+                meta = json.loads(f.read(header_len))
+                thumb = f.read(meta.pop("thumb"))
+                alpha_png = f.read(meta.pop("alpha"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"⚠️ Segmentation cache entry unreadable, dropping: {e}")
+            self._drop(key)
+            return None
+        os.utime(path)  # LRU by mtime across restarts
+        with self._lock:
+            index = self._disk_index()
+            if key in index:
+                index.move_to_end(key)
+        return _Entry(meta, thumb, alpha_png)
+
+    def _drop_disk_index(self, key: str):
+        size = self._disk_index().pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _drop_disk(self, key: str):
+        self._drop_disk_index(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    # ---- reporting ----
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self._stats,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "memory_mb": round(self._memory_bytes / (1024 * 1024), 1),
+            "disk_entries": len(self._disk) if self._disk is not None else None,
+            "disk_mb": round(self._disk_bytes / (1024 * 1024), 1) if self._disk is not None else None,
+        }
+
+
+# Singleton
+segmentation_cache = SegmentationCache()
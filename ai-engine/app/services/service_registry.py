@@ -0,0 +1,85 @@
+"""
+Service Registry - Heavy services, imported on first use.
+
+Importing a service module can pull in torch / diffusers / transformers or a
+cloud SDK, which costs seconds on a cold container before uvicorn even
+listens. Routers and orchestrators don't import those modules at the top;
+they resolve the singleton here when a request needs it:
+
+    turbo = services.get("turbo")      # None if it can't be imported here (e.g. no torch)
+    sota = services.require("sota-v2")  # raises ServiceUnavailable instead
+
+An import failure is remembered (and logged once), so a CPU-only deploy
+doesn't retry a missing torch on every request. `python main.py
+--profile-startup` checks that none of this creeps back into the cold import.
+"""
+import importlib
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# name -> (module, singleton attribute)
+_SERVICES: Dict[str, Tuple[str, str]] = {
+    "turbo": ("app.services.turbo_service", "turbo_service"),
+    "qwen": ("app.services.qwen_service", "qwen_service"),
+    "triposr": ("app.services.triposr_service", "triposr_service"),
+    "vision": ("app.services.vision_service", "vision_service"),
+    "upscale": ("app.services.upscale_service", "upscale_service"),
+    "stock": ("app.services.stock_service", "stock_service"),
+    "gemini-analysis": ("app.services.gemini_analysis_service", "gemini_analysis_service"),
+    "sota-v2": ("app.services.sota_pipeline_v2", "sota_pipeline"),
+    "local-enhanced": ("app.services.local_enhanced_pipeline", "local_enhanced_pipeline"),
+}
+
+
+class ServiceUnavailable(RuntimeError):
+    pass
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+
+    def get(self, name: str) -> Optional[Any]:
+        """The service's singleton, importing its module on first use; None if it can't be imported."""
+        if name in self._services:
+            return self._services[name]
+        if name in self._errors:
+            return None
+        module, attr = _SERVICES[name]
+        with self._lock:  # one import at a time; a second caller waits for the first
+            if name in self._services:
+                return self._services[name]
+            if name in self._errors:
+                return None
+            try:
+                service = getattr(importlib.import_module(module), attr)
+            except Exception as e:
+                self._errors[name] = f"{type(e).__name__}: {e}"
+                print(f"⚠️  Service '{name}' unavailable: {self._errors[name]}")
+                return None
+            self._services[name] = service
+            return service
+
+    def require(self, name: str) -> Any:
+        service = self.get(name)
+        if service is None:
+            raise ServiceUnavailable(f"Service '{name}' is unavailable here ({self._errors.get(name)})")
+        return service
+
+    def loaded(self, name: str) -> Optional[Any]:
+        """The service if something already imported it; never imports."""
+        module, attr = _SERVICES[name]
+        return self._services.get(name) or getattr(sys.modules.get(module), attr, None)
+
+    def stats(self) -> Dict[str, str]:
+        return {
+            name: "loaded" if name in self._services else f"unavailable ({self._errors[name]})" if name in self._errors else "not loaded"
+            for name in _SERVICES
+        }
+
+
+# Singleton
+services = ServiceRegistry()
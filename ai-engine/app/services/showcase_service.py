@@ -1,29 +1,15 @@
 """
 Showcase Photo Service - Creates professional product photos
-Uses rembg for background removal + Pillow for white/gradient background
+Uses BiRefNet (rembg u2netp fallback) for background removal + Pillow for white/gradient background
 Optionally uses upscaling for higher quality output
 """
-import io
 from PIL import Image, ImageDraw, ImageFilter
 from typing import Optional
-import base64
-
-# rembg will be imported at runtime to handle cases where not installed
-def get_rembg():
-    try:
-        from rembg import remove, new_session
-        # On CPU-only servers (Render), u2netp is ~10x faster than standard models
-        print("💡 Initializing High-Speed Background Removal (u2netp)...")
-        try:
-            session = new_session(model_name="u2netp")
-        except Exception as e:
-            print(f"⚠️ Failed to load u2netp ({e}), falling back to default")
-            session = new_session()
-        return remove, session
-    except ImportError as e:
-        print(f"⚠️ rembg not installed. Error: {e}")
-        print(" Using fallback (no background removal).")
-        return None, None
+from app.services.metrics import metrics
+from app.utils.image_context import ImageContext
+from app.utils.image_result import ImageResult
+from app.utils.mask_info import MaskInfo
+from app.services.tracing import traced, tracer
 
 # Import upscale service
 def get_upscale_service():
@@ -43,36 +29,21 @@ class ShowcaseService:
     
     
     def __init__(self):
-        self._rembg_session = None
-        self._remove_bg_func = None
         self.upscale_service = get_upscale_service() # This one seems fine (just import check)
         print("📸 Showcase Service initialized (Lazy Loading)")
 
-    @property
-    def rembg_session(self):
-        if self._rembg_session is None:
-            print("⏳ Lazy Loading rembg model...")
-            remove, session = get_rembg()
-            self._remove_bg_func = remove
-            self._rembg_session = session
-            print("✅ rembg model loaded")
-        return self._rembg_session
-
-    @property
-    def remove_bg(self):
-        if self._remove_bg_func is None:
-            _ = self.rembg_session # Trigger load
-        return self._remove_bg_func
-    
+    @traced("showcase.create")
     async def create_showcase(
         self, 
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         background: str = "white",  # white, gradient, transparent
         add_shadow: bool = True,
         output_size: tuple = (1024, 1024),
         product_hint: str = "",  # Product name for context (future use for smart masking)
         apply_upscale: bool = True,  # NEW: Apply upscaling for better quality
-        return_original: bool = True  # NEW: Return original image too
+        return_original: bool = True,  # NEW: Return original image too
+        image_context: Optional[ImageContext] = None,  # already-decoded input (skips decoding image_bytes)
+        segmentation: Optional[str] = None  # BiRefNet serving mode, e.g. "general-lite-int8" (default: BIREFNET_MODE / BIREFNET_CPU_MODE)
     ) -> dict:
         """
         Creates a professional showcase photo.
@@ -86,70 +57,79 @@ class ShowcaseService:
         start = time.time()
         
         try:
-            from app.services.birefnet_service import birefnet_service
             from app.services.enhance_service import enhance_service
-            from starlette.concurrency import run_in_threadpool
+            from app.services.inference_executor import inference_executor
+            from app.services.segmentation_batcher import segmentation_batcher
+
+            # The upload is decoded once here; every stage below works off views of it
+            ctx = image_context or ImageContext.from_bytes(image_bytes)
 
             # Step 0: Pre-enhance raw photo (CLAHE + denoise + sharpen)
             # Applied before bg removal so rembg works on a cleaner image
             print("   🌟 Step 0: Pre-enhancing photo (CLAHE/denoise/sharpen)...")
             step_start = time.time()
-            enhanced_bytes = await run_in_threadpool(enhance_service.enhance_product, image_bytes)
+            with tracer.span("showcase.enhance", size=f"{ctx.size[0]}x{ctx.size[1]}"):
+                try:
+                    # Thread lane: the decoded pixels are shared, not pickled to a worker process
+                    enhanced_bgr = await inference_executor.run_native("enhance", enhance_service.enhance_array, ctx.bgr)
+                    enhanced = ImageContext.from_bgr(enhanced_bgr)
+                except Exception as e:
+                    print(f"⚠️ Enhancement failed: {e}. Using original.")
+                    enhanced = ctx
             print(f"      ✅ Pre-enhanced in {time.time()-step_start:.2f}s")
+            metrics.observe("stage_duration_seconds", time.time() - step_start, pipeline="showcase", stage="enhance")
 
             # Step 1: Remove background
             print("   ✂️ Step A: Removing background (BiRefNet/rembg)...")
             step_start = time.time()
 
-            # Use BiRefNet in a threadpool to avoid blocking event loop
-            input_pil = Image.open(io.BytesIO(enhanced_bytes)).convert("RGB")
-            fg_image_pil = await run_in_threadpool(birefnet_service.remove_background, input_pil)
+            # BiRefNet on the GPU lane; concurrent requests may share a batched pass
+            with tracer.span("showcase.segmentation"):
+                fg_image_pil, alpha_quality = await segmentation_batcher.segment(enhanced, segmentation)
             fg_image = fg_image_pil.convert("RGBA")
 
-            # Confidence of the cutout (0-100). Low = ambiguous mask, e.g.
-            # cluttered/low-contrast scene. Surfaced to the caller so the UI
-            # can warn the seller or suggest a cleaner photo.
-            alpha_quality = birefnet_service.last_alpha_quality
+            # alpha_quality: confidence of the cutout (0-100). Low = ambiguous
+            # mask, e.g. cluttered/low-contrast scene. Surfaced to the caller so
+            # the UI can warn the seller or suggest a cleaner photo.
 
             print(f"      ✅ Background removed in {time.time()-step_start:.2f}s (quality: {alpha_quality})")
+            metrics.observe("stage_duration_seconds", time.time() - step_start, pipeline="showcase", stage="segmentation")
+
+            # Everything below works on the product's bounding box only
+            # (a couple of pixels of margin keep the soft edge intact)
+            mask_info = enhanced.cached("mask_info", lambda: MaskInfo.from_image(fg_image))
+            fg_image = fg_image.crop(mask_info.roi(margin=2))
+            alpha_mask = mask_info.crop(margin=2).mask()
                 
             # Step 1.5: Upscale for better quality (NEW)
             if apply_upscale and self.upscale_service and background != "transparent":
                 print("   🔬 Step A.5: Upscaling for quality...")
                 upscale_start = time.time()
-                # Preserve alpha before upscaling (Real-ESRGAN works on RGB)
-                alpha_mask = fg_image.split()[-1]
-                # Save fg to bytes, upscale, reload
-                fg_buffer = io.BytesIO()
+                # Alpha is kept aside (alpha_mask) since Real-ESRGAN works on RGB
                 # Composite onto a light matte to avoid dark edge halos
                 matte_color = (255, 255, 255) if background != "gradient" else (248, 248, 248)
                 fg_rgb = Image.new("RGB", fg_image.size, matte_color)
                 fg_rgb.paste(fg_image, mask=alpha_mask)
-                fg_rgb.save(fg_buffer, format="PNG")
-                fg_buffer.seek(0)
-                
-                # Upscale service is likely async or should be checked too
-                # Assuming it is async based on 'await' usage in original code
+
+                # Hand the PIL image straight over - no PNG/JPEG/base64 round trip
                 upscale_result = await self.upscale_service.upscale_image(
-                    fg_buffer.getvalue(),
+                    fg_rgb,
                     target_size=output_size,
                     enhance_colors=True
                 )
-                
-                # Reload the upscaled image and restore alpha
-                upscaled_data = upscale_result.get("image_data", "")
-                if upscaled_data.startswith("data:"):
-                    upscaled_data = upscaled_data.split(",", 1)[1]
-                upscaled_rgb = Image.open(io.BytesIO(base64.b64decode(upscaled_data))).convert("RGB")
+                upscaled_rgb = upscale_result["image_data"].to_pil().convert("RGB")
                 # Restore alpha at upscaled size to avoid black backgrounds
                 alpha_up = alpha_mask.resize(upscaled_rgb.size, Image.Resampling.LANCZOS)
                 alpha_up = alpha_up.filter(ImageFilter.GaussianBlur(radius=0.5))
                 fg_image = upscaled_rgb.convert("RGBA")
                 fg_image.putalpha(alpha_up)
                 print(f"      ✅ Upscaled in {time.time()-upscale_start:.2f}s")
+                metrics.observe("stage_duration_seconds", time.time() - upscale_start, pipeline="showcase", stage="upscaling")
             
             # Step 2: Create background
             print(f"   🎨 Step B: Creating {background} background...")
+            step_start = time.time()
+            compositing_span = tracer.start_span("showcase.compositing", background=background)
             if background == "gradient":
                 bg_image = self._create_gradient_bg(output_size)
             elif background == "transparent":
@@ -179,41 +159,35 @@ class ShowcaseService:
             )
             bg_image.paste(fg_image, position, fg_image)
             print(f"      ✅ Product placed at {position}")
+            tracer.end_span(compositing_span)
+            metrics.observe("stage_duration_seconds", time.time() - step_start, pipeline="showcase", stage="compositing")
             
-            # Convert to bytes
-            print("   📦 Step F: Encoding to base64...")
-            output_buffer = io.BytesIO()
+            # Wrap the result - encoding happens once, when the router needs bytes
             final_image = bg_image.convert("RGB") if background != "transparent" else bg_image
-            final_image.save(output_buffer, format="PNG" if background == "transparent" else "JPEG", quality=95)
-            output_buffer.seek(0)
-            
-            # Convert to base64 for API response
-            b64_image = base64.b64encode(output_buffer.getvalue()).decode()
-            
-            # Also encode original image if requested
-            original_b64 = None
+            image_result = ImageResult.from_pil(
+                final_image, format="PNG" if background == "transparent" else "JPEG", quality=95
+            )
+
+            # Also keep the original image if requested
+            original_result = None
             if return_original:
-                original_buffer = io.BytesIO()
-                original_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                # Already decoded in the context - no second decode of the upload
                 # Resize original to same dimensions for easy comparison
-                original_img = self._fit_to_canvas(original_img.convert("RGBA"), output_size, padding=0.1)
-                original_final_buffer = io.BytesIO()
-                original_img.convert("RGB").save(original_final_buffer, format="JPEG", quality=90)
-                original_final_buffer.seek(0)
-                original_b64 = base64.b64encode(original_final_buffer.getvalue()).decode()
-            
+                original_img = self._fit_to_canvas(ctx.pil.convert("RGBA"), output_size, padding=0.1)
+                original_result = ImageResult.from_pil(original_img.convert("RGB"), format="JPEG", quality=90)
+
             print("✅ Showcase photo created!")
             result = {
                 "status": "success",
-                "image_data": f"data:image/{'png' if background == 'transparent' else 'jpeg'};base64,{b64_image}",
+                "image_data": image_result,
                 "dimensions": output_size,
                 "alpha_quality": alpha_quality,
                 "low_quality": alpha_quality is not None and alpha_quality < 60,
             }
 
             # Add original image if requested
-            if original_b64:
-                result["original_image_data"] = f"data:image/jpeg;base64,{original_b64}"
+            if original_result is not None:
+                result["original_image_data"] = original_result
 
             return result
             
@@ -253,15 +227,18 @@ class ShowcaseService:
         shadow_layer = Image.new("RGBA", fg.size, (0, 0, 0, 40))  # Semi-transparent black
         shadow_layer.putalpha(fg.split()[-1])  # Use foreground alpha
         
-        # Position shadow slightly offset and blurred
+        # Blur only the product's neighbourhood (3 sigma around it), not the whole canvas
+        margin = 45
+        local = Image.new("RGBA", (fg.width + 2 * margin, fg.height + 2 * margin), (0, 0, 0, 0))
+        local.paste(shadow_layer, (margin, margin), shadow_layer)
+        local = local.filter(ImageFilter.GaussianBlur(radius=15))
+        
+        # Position shadow slightly offset
         shadow_pos = (
-            (canvas_size[0] - fg.width) // 2 + 5,
-            (canvas_size[1] - fg.height) // 2 + 10
+            (canvas_size[0] - fg.width) // 2 + 5 - margin,
+            (canvas_size[1] - fg.height) // 2 + 10 - margin
         )
-        shadow.paste(shadow_layer, shadow_pos, shadow_layer)
-        
-        # Blur the shadow
-        shadow = shadow.filter(ImageFilter.GaussianBlur(radius=15))
+        shadow.paste(local, shadow_pos)
         
         return shadow
 
@@ -5,15 +5,17 @@ Orchestrates: BiRefNet → FLUX.1-dev → LBM → Compositing → SUPIR
 Cost: $0.00 per image (all local on L4/T4)
 Time: 17-24 seconds per image
 Quality: Amazon/eBay-beating professional photography
-VRAM: Peak 22GB on L4, handles efficiently via sequential loading
+VRAM: Peak 22GB on L4; residency is budgeted by the model registry
 """
-import torch
 import gc
 import time
 from PIL import Image
 from io import BytesIO
-from typing import Optional, Tuple, Dict
+from typing import Callable, Optional, Tuple, Dict
 from app.config import DeviceConfig, DeviceProfile, DeviceProfile
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
+from app.services.weight_prefetcher import weight_prefetcher
 
 
 class SotaPipelineV2:
@@ -27,17 +29,14 @@ class SotaPipelineV2:
     4. Compositing (1s) - Place on white background with shadow
     5. SUPIR Upscaling (4-5s) - Semantic detail enhancement
 
-    Key Innovation: Sequential model loading/unloading keeps peak VRAM under 24GB
+    Models are held through the model registry for each phase; it keeps them
+    resident between requests and evicts idle ones when a phase needs the room.
     """
 
     def __init__(self):
         self.device = DeviceConfig.get_device()
         self.device_profile = DeviceProfile.get_profile()
-        self.birefnet = None
-        self.flux = None
-        self.lbm = None
         self.compositing = None
-        self.supir = None
         self.config = {
             "enable_flux": True,
             "enable_relighting": True,
@@ -48,71 +47,12 @@ class SotaPipelineV2:
             "output_height": 1024,
         }
 
-    def _load_birefnet(self):
-        """Load BiRefNet for background removal."""
-        if self.birefnet is None:
-            from app.services.birefnet_service import BiRefNetService
-            self.birefnet = BiRefNetService()
-            self.birefnet.load_model(variant="massive")
-
-    def _load_flux(self):
-        """Load FLUX.1-dev for photorealistic generation."""
-        if self.flux is None and self.config["enable_flux"]:
-            from app.services.flux_generation_service import FluxGenerationService
-            self.flux = FluxGenerationService()
-            self.flux.load_pipeline()
-
-    def _load_lbm(self):
-        """Load LBM Relighting for studio lighting."""
-        if self.lbm is None and self.config["enable_relighting"]:
-            from app.services.lbm_relighting_service import LBMRelightingService
-            self.lbm = LBMRelightingService()
-            self.lbm.load_model()
-
     def _load_compositing(self):
         """Load compositing service for background placement."""
         if self.compositing is None:
             from app.services.compositing_service import CompositingService
             self.compositing = CompositingService()
 
-    def _load_supir(self):
-        """Load SUPIR for semantic upscaling."""
-        if self.supir is None and self.config["enable_upscaling"]:
-            from app.services.supir_upscaling_service import SupirUpscalingService
-            self.supir = SupirUpscalingService()
-            self.supir.load_model(scale=self.config["upscale_factor"])
-
-    def _unload_birefnet(self):
-        """Unload BiRefNet to free VRAM."""
-        if self.birefnet is not None:
-            del self.birefnet
-            self.birefnet = None
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-
-    def _unload_flux(self):
-        """Unload FLUX.1-dev to free VRAM."""
-        if self.flux is not None:
-            self.flux.unload_model()
-            del self.flux
-            self.flux = None
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-
-    def _unload_lbm(self):
-        """Unload LBM to free VRAM."""
-        if self.lbm is not None:
-            self.lbm.unload_model()
-            del self.lbm
-            self.lbm = None
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-
-    def _unload_supir(self):
-        """Unload SUPIR to free VRAM."""
-        if self.supir is not None:
-            self.supir.unload_model()
-            del self.supir
-            self.supir = None
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-
     async def process(
         self,
         image: Image.Image,
@@ -121,7 +61,8 @@ class SotaPipelineV2:
         lighting_style: str = "soft_studio",
         enable_upscaling: bool = True,
         upscale_factor: int = 2,
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Tuple[Image.Image, Dict]:
         """
         Process a product image through the full SOTA pipeline.
@@ -134,6 +75,7 @@ class SotaPipelineV2:
             enable_upscaling: Use SUPIR for final upscaling
             upscale_factor: Upscaling multiplier (2 or 4)
             custom_prompt: Custom FLUX prompt (optional)
+            progress_callback: Called as progress(stage, "started"/"completed", **info)
 
         Returns:
             (result_image, metadata) - Final result and processing metadata
@@ -143,170 +85,15 @@ class SotaPipelineV2:
         if self._should_use_clean_enhance():
             print(f"\n🖥️  Local Device Detected — Using Clean & Enhance Pipeline")
             return await self._process_clean_enhance(
-                image, enable_relighting, lighting_style, enable_upscaling, upscale_factor
+                image, enable_relighting, lighting_style, enable_upscaling, upscale_factor,
+                progress_callback
             )
         else:
             print(f"\n☁️  Cloud Device Detected — Using FLUX.1-dev Pipeline")
             return await self._process_flux_regeneration(
                 image, enable_flux_regeneration, enable_relighting, lighting_style,
-                enable_upscaling, upscale_factor, custom_prompt
-            )
-
-        pipeline_start = time.time()
-        metadata = {
-            "stages": {},
-            "timings": {},
-            "config": {
-                "enable_flux": enable_flux_regeneration,
-                "enable_relighting": enable_relighting,
-                "lighting_style": lighting_style,
-                "enable_upscaling": enable_upscaling,
-                "upscale_factor": upscale_factor,
-            }
-        }
-
-        try:
-            # Convert to RGB if needed
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            # Phase 1: BiRefNet Segmentation
-            print("📸 Phase 1: BiRefNet Segmentation...")
-            phase_start = time.time()
-            self._load_birefnet()
-            rgba_product = self.birefnet.remove_background(image)
-            metadata["stages"]["segmentation"] = "BiRefNet"
-            metadata["timings"]["segmentation"] = time.time() - phase_start
-            print(f"   ✅ Complete in {metadata['timings']['segmentation']:.1f}s")
-
-            # Free BiRefNet VRAM before loading FLUX
-            self._unload_birefnet()
-
-            # Phase 2: FLUX.1-dev Regeneration (optional)
-            result = rgba_product
-            if enable_flux_regeneration:
-                print("🌟 Phase 2: FLUX.1-dev Generation...")
-                phase_start = time.time()
-                self._load_flux()
-
-                # Extract product dimensions for better generation
-                prompt = custom_prompt or (
-                    "professional product photography, studio lighting, "
-                    "white background, product centered, clean, sharp, "
-                    "high quality, detailed, Amazon-ready listing photo"
-                )
-
-                generated, gen_meta = self.flux.generate(
-                    prompt=prompt,
-                    width=self.config["output_width"],
-                    height=self.config["output_height"],
-                    num_inference_steps=25,
-                    guidance_scale=3.5
-                )
-
-                result = generated
-                metadata["stages"]["generation"] = "FLUX.1-dev"
-                metadata["timings"]["generation"] = time.time() - phase_start
-                print(f"   ✅ Complete in {metadata['timings']['generation']:.1f}s")
-
-                # Free FLUX VRAM
-                self._unload_flux()
-
-            # Phase 3: LBM Relighting (optional)
-            if enable_relighting:
-                print(f"💡 Phase 3: LBM Relighting ({lighting_style})...")
-                phase_start = time.time()
-                self._load_lbm()
-
-                # Create product mask for relighting
-                if enable_flux_regeneration:
-                    # For generated images, relight entire image
-                    mask = Image.new("L", result.size, 255)
-                else:
-                    # For original images, use alpha channel as mask
-                    if rgba_product.mode == "RGBA":
-                        mask = rgba_product.split()[3]
-                    else:
-                        mask = Image.new("L", rgba_product.size, 255)
-
-                relit, relight_meta = self.lbm.apply_studio_lighting(
-                    result,
-                    mask=mask,
-                    style=lighting_style,
-                    intensity=1.0
-                )
-
-                result = relit
-                metadata["stages"]["relighting"] = "LBM"
-                metadata["timings"]["relighting"] = time.time() - phase_start
-                print(f"   ✅ Complete in {metadata['timings']['relighting']:.1f}s")
-
-                # Free LBM VRAM
-                self._unload_lbm()
-
-            # Phase 4: Compositing (always done)
-            print("🎨 Phase 4: Compositing...")
-            phase_start = time.time()
-            self._load_compositing()
-
-            # If we don't have transparent product, composite anyway
-            if result.mode != "RGBA":
-                result = result.convert("RGB")
-
-            # Place on white background with shadow
-            composited = self.compositing.place_on_white_background(
-                result if result.mode == "RGBA" else rgba_product,
-                background_size=(1024, 1024),
-                padding_percent=0.05
+                enable_upscaling, upscale_factor, custom_prompt, progress_callback
             )
-            composited = self.compositing.add_drop_shadow(composited, shadow_opacity=0.2)
-
-            result = composited
-            metadata["stages"]["compositing"] = "PIL"
-            metadata["timings"]["compositing"] = time.time() - phase_start
-            print(f"   ✅ Complete in {metadata['timings']['compositing']:.1f}s")
-
-            # Phase 5: SUPIR Upscaling (optional)
-            if enable_upscaling:
-                print(f"🔍 Phase 5: SUPIR Upscaling ({upscale_factor}x)...")
-                phase_start = time.time()
-                self._load_supir()
-
-                upscaled, upscale_meta = self.supir.upscale(
-                    result,
-                    scale=upscale_factor
-                )
-
-                result = upscaled
-                metadata["stages"]["upscaling"] = "SUPIR"
-                metadata["timings"]["upscaling"] = time.time() - phase_start
-                print(f"   ✅ Complete in {metadata['timings']['upscaling']:.1f}s")
-
-                # Free SUPIR VRAM
-                self._unload_supir()
-
-            # Calculate total time and size
-            total_time = time.time() - pipeline_start
-            metadata["total_time"] = total_time
-            metadata["output_size"] = result.size
-            metadata["success"] = True
-
-            print(f"\n🎉 Pipeline Complete!")
-            print(f"   Total time: {total_time:.1f}s")
-            print(f"   Output: {result.size[0]}x{result.size[1]} (Quality: Amazon/eBay-grade)")
-
-            # Cleanup
-            gc.collect()
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-
-            return result, metadata
-
-        except Exception as e:
-            import traceback
-            print(f"❌ Pipeline failed: {e}")
-            traceback.print_exc()
-            raise RuntimeError(f"SOTA V2 pipeline failed at processing: {e}") from e
-
 
     def _should_use_clean_enhance(self) -> bool:
         """Determine if device should use Clean & Enhance pipeline."""
@@ -318,10 +105,12 @@ class SotaPipelineV2:
         enable_relighting: bool,
         lighting_style: str,
         enable_upscaling: bool,
-        upscale_factor: int
+        upscale_factor: int,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Tuple[Image.Image, Dict]:
         """Clean & Enhance pipeline (local path)."""
-        from app.services.local_enhanced_pipeline import local_enhanced_pipeline
+        from app.services.service_registry import services
+        local_enhanced_pipeline = services.require("local-enhanced")
         
         return await local_enhanced_pipeline.process(
             image,
@@ -329,7 +118,8 @@ class SotaPipelineV2:
             enable_relighting=enable_relighting,
             lighting_style=lighting_style,
             enable_upscaling=enable_upscaling,
-            upscale_factor=upscale_factor
+            upscale_factor=upscale_factor,
+            progress_callback=progress_callback
         )
 
     async def _process_flux_regeneration(
@@ -340,10 +130,12 @@ class SotaPipelineV2:
         lighting_style: str,
         enable_upscaling: bool,
         upscale_factor: int,
-        custom_prompt: Optional[str]
+        custom_prompt: Optional[str],
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Tuple[Image.Image, Dict]:
         """FLUX.1-dev pipeline (cloud path) - regeneration."""
         # Original SOTA V2 logic here (refactored from process)
+        progress = metrics.stage_reporter("sota-v2", progress_callback)
         pipeline_start = time.time()
         metadata = {
             "pipeline_mode": "flux-regeneration",
@@ -360,19 +152,22 @@ class SotaPipelineV2:
             # Phase 1: BiRefNet
             print("📸 Phase 1: BiRefNet Segmentation...")
             phase_start = time.time()
-            self._load_birefnet()
-            rgba_product = self.birefnet.remove_background(image)
+            progress("segmentation", "started")
+            # Read the next stage's weights while this one runs
+            self._prefetch_after("segmentation", enable_flux_regeneration, enable_relighting, enable_upscaling)
+            with model_registry.use("birefnet") as birefnet:
+                rgba_product, mask_info = birefnet.remove_background(image, return_info=True)
             metadata["stages"]["segmentation"] = "BiRefNet"
             metadata["timings"]["segmentation"] = time.time() - phase_start
             print(f"   ✅ Complete in {metadata['timings']['segmentation']:.1f}s")
-            self._unload_birefnet()
+            progress("segmentation", "completed", seconds=metadata["timings"]["segmentation"])
 
             # Phase 2: FLUX.1-dev
             result = rgba_product
             if enable_flux_regeneration:
                 print("🌟 Phase 2: FLUX.1-dev Generation...")
                 phase_start = time.time()
-                self._load_flux()
+                progress("generation", "started")
 
                 prompt = custom_prompt or (
                     "professional product photography, studio lighting, "
@@ -380,25 +175,27 @@ class SotaPipelineV2:
                     "high quality, detailed, Amazon-ready listing photo"
                 )
 
-                generated, gen_meta = self.flux.generate(
-                    prompt=prompt,
-                    width=self.config["output_width"],
-                    height=self.config["output_height"],
-                    num_inference_steps=25,
-                    guidance_scale=3.5
-                )
+                self._prefetch_after("generation", enable_flux_regeneration, enable_relighting, enable_upscaling)
+                with model_registry.use("flux") as flux:
+                    generated, gen_meta = flux.generate(
+                        prompt=prompt,
+                        width=self.config["output_width"],
+                        height=self.config["output_height"],
+                        num_inference_steps=25,
+                        guidance_scale=3.5
+                    )
 
                 result = generated
                 metadata["stages"]["generation"] = "FLUX.1-dev"
                 metadata["timings"]["generation"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['generation']:.1f}s")
-                self._unload_flux()
+                progress("generation", "completed", seconds=metadata["timings"]["generation"])
 
             # Phase 3: LBM Relighting
             if enable_relighting:
                 print(f"💡 Phase 3: LBM Relighting ({lighting_style})...")
                 phase_start = time.time()
-                self._load_lbm()
+                progress("relighting", "started")
 
                 if enable_flux_regeneration:
                     mask = Image.new("L", result.size, 255)
@@ -408,55 +205,67 @@ class SotaPipelineV2:
                     else:
                         mask = Image.new("L", rgba_product.size, 255)
 
-                relit, relight_meta = self.lbm.apply_studio_lighting(
-                    result,
-                    mask=mask,
-                    style=lighting_style,
-                    intensity=1.0
-                )
+                self._prefetch_after("relighting", enable_flux_regeneration, enable_relighting, enable_upscaling)
+                with model_registry.use("lbm") as lbm:
+                    relit, relight_meta = lbm.apply_studio_lighting(
+                        result,
+                        mask=mask,
+                        style=lighting_style,
+                        intensity=1.0
+                    )
 
                 result = relit
                 metadata["stages"]["relighting"] = "LBM"
                 metadata["timings"]["relighting"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['relighting']:.1f}s")
-                self._unload_lbm()
+                progress("relighting", "completed", seconds=metadata["timings"]["relighting"])
 
             # Phase 4: Compositing
             print("🎨 Phase 4: Compositing...")
             phase_start = time.time()
             self._load_compositing()
+            progress("compositing", "started")
 
             if result.mode != "RGBA":
                 result = result.convert("RGB")
 
-            composited = self.compositing.place_on_white_background(
-                result if result.mode == "RGBA" else rgba_product,
+            product = result if result.mode == "RGBA" else rgba_product
+            # The cutout's mask info only describes the cutout itself, not a generated/relit image
+            product_info = mask_info if product is rgba_product else None
+            composited, placed = self.compositing.place_on_white_background(
+                product,
                 background_size=(1024, 1024),
-                padding_percent=0.05
+                padding_percent=0.05,
+                mask_info=product_info,
+                return_info=True
+            )
+            composited = self.compositing.add_drop_shadow(
+                composited, shadow_opacity=0.2, mask_info=placed if product_info is not None else None
             )
-            composited = self.compositing.add_drop_shadow(composited, shadow_opacity=0.2)
 
             result = composited
             metadata["stages"]["compositing"] = "PIL"
             metadata["timings"]["compositing"] = time.time() - phase_start
             print(f"   ✅ Complete in {metadata['timings']['compositing']:.1f}s")
+            progress("compositing", "completed", seconds=metadata["timings"]["compositing"])
 
             # Phase 5: SUPIR Upscaling
             if enable_upscaling:
                 print(f"🔍 Phase 5: SUPIR Upscaling ({upscale_factor}x)...")
                 phase_start = time.time()
-                self._load_supir()
+                progress("upscaling", "started")
 
-                upscaled, upscale_meta = self.supir.upscale(
-                    result,
-                    scale=upscale_factor
-                )
+                with model_registry.use("supir", scale=upscale_factor) as supir:
+                    upscaled, upscale_meta = supir.upscale(
+                        result,
+                        scale=upscale_factor
+                    )
 
                 result = upscaled
                 metadata["stages"]["upscaling"] = "SUPIR"
                 metadata["timings"]["upscaling"] = time.time() - phase_start
                 print(f"   ✅ Complete in {metadata['timings']['upscaling']:.1f}s")
-                self._unload_supir()
+                progress("upscaling", "completed", seconds=metadata["timings"]["upscaling"])
 
             total_time = time.time() - pipeline_start
             metadata["total_time"] = total_time
@@ -468,6 +277,7 @@ class SotaPipelineV2:
             print(f"   Output: {result.size[0]}x{result.size[1]} (Quality: Amazon/eBay-grade)")
 
             gc.collect()
+            import torch  # already loaded by the stages; kept out of the module import
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             elif torch.backends.mps.is_available():
@@ -481,6 +291,16 @@ class SotaPipelineV2:
             traceback.print_exc()
             raise RuntimeError(f"SOTA V2 FLUX pipeline failed: {e}") from e
 
+    def _prefetch_after(self, stage: str, flux: bool, relighting: bool, upscaling: bool):
+        """Start reading the weights of the first enabled model stage after `stage`."""
+        stages = [("generation", "flux", flux), ("relighting", "lbm", relighting), ("upscaling", "supir", upscaling)]
+        names = [name for name, _, _ in stages]
+        following = stages[names.index(stage) + 1:] if stage in names else stages
+        for next_stage, model, enabled in following:
+            if enabled:
+                weight_prefetcher.prefetch(model, stage=next_stage)
+                return
+
     def get_device_info(self) -> Dict:
         """Get device and pipeline selection info."""
         return {
@@ -488,8 +308,8 @@ class SotaPipelineV2:
             "pipeline_mode": "clean-enhance" if self._should_use_clean_enhance() else "flux-regen"
         }
 
-    
-        def get_config(self) -> Dict:
+
+    def get_config(self) -> Dict:
         """Get current pipeline configuration."""
         return self.config
 
@@ -504,6 +324,7 @@ class SotaPipelineV2:
 
     def get_memory_usage(self) -> Dict:
         """Get current GPU/CPU memory usage."""
+        import torch
         if torch.cuda.is_available():
             reserved = torch.cuda.memory_reserved(0) / 1e9
             allocated = torch.cuda.memory_allocated(0) / 1e9
@@ -528,14 +349,10 @@ class SotaPipelineV2:
             }
 
     def cleanup(self):
-        """Force cleanup of all loaded models."""
+        """Unload this pipeline's models now (those not in use by another request)."""
         print("🧹 Forcing cleanup of all models...")
-        self._unload_birefnet()
-        self._unload_flux()
-        self._unload_lbm()
-        self._unload_supir()
-        gc.collect()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        for name in ("birefnet", "flux", "lbm", "supir"):
+            model_registry.evict(name)
         print("   ✅ Cleanup complete")
 
 
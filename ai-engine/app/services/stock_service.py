@@ -1,17 +1,20 @@
 from duckduckgo_search import DDGS
 import requests
-import base64
 import random
+from app.utils.image_result import ImageResult
+from app.services.tracing import traced
 
 class StockImageService:
     """
     Fetches professional product stock images from the web.
     """
     
+    @traced("stock.find_product_image")
     def find_product_image(self, product_name: str) -> dict:
         """
         Searches for a high-quality product image with a white background.
-        Returns dict with image_url and base64 data.
+        Returns dict with image_url and the downloaded bytes as an ImageResult
+        (served as-is, no re-encode; base64 only if a route returns JSON).
         """
         # Primary and Fallback queries
         queries = [
@@ -55,12 +58,13 @@ class StockImageService:
                         }
                         response = requests.get(image_url, timeout=7, headers=headers)
                         if response.status_code == 200:
-                            image_data = base64.b64encode(response.content).decode('utf-8')
+                            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+                            media_type = content_type if content_type.startswith("image/") else "image/jpeg"
                             return {
                                 "source": "stock_search",
                                 "query_used": query,
                                 "image_url": image_url,
-                                "image_data": f"data:image/jpeg;base64,{image_data}"
+                                "image_data": ImageResult.from_bytes(response.content, media_type=media_type)
                             }
                     except Exception as download_error:
                         print(f"      ⚠️ Download failed: {download_error}")
@@ -73,6 +77,7 @@ class StockImageService:
         print("❌ Final: No stock images found after all attempts.")
         return None
 
+    @traced("stock.search_web")
     def search_web(self, query: str) -> str:
         """
         Performs a text search and returns a summary string of top results.
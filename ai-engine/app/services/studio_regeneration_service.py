@@ -16,6 +16,8 @@ from diffusers import (
     AutoencoderKL,
     DPMSolverMultistepScheduler
 )
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class StudioRegenerationService:
@@ -23,6 +25,7 @@ class StudioRegenerationService:
         self.pipeline = None
         self.device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
         
+    @metrics.timed_load("sdxl-controlnet", lambda s: s.pipeline is not None)
     def load_pipeline(self, low_memory: bool = False):
         """Load SDXL + ControlNet Depth pipeline"""
         if self.pipeline is not None:
@@ -217,9 +220,8 @@ class StudioRegenerationService:
         Returns:
             (isolated_product, depth_map, studio_result)
         """
-        from services.birefnet_service import birefnet_service
-        from services.depth_service import depth_service
-        import gc
+        from app.services.birefnet_service import birefnet_service
+        from app.services.depth_service import depth_service
         
         # Quality presets
         quality_settings = {
@@ -236,45 +238,31 @@ class StudioRegenerationService:
         # Step 1: Remove background
         print("\n🔸 Step 1/3: Background Removal (BiRefNet)")
         isolated_product = birefnet_service.remove_and_place_on_white(original_image)
-        # FORCE UNLOAD BiRefNet
-        if hasattr(birefnet_service, 'model'):
-            del birefnet_service.model
-            birefnet_service.model = None
-            # FORCE GARBAGE COLLECTION
-            gc.collect()
-            if self.device == "mps":
-                torch.mps.empty_cache() 
-            elif self.device == "cuda":
-                torch.cuda.empty_cache()
-            print("   🗑️ Unloaded BiRefNet")
         print("   ✅ Product isolated")
         
         # Step 2: Extract depth
         print("\n🔸 Step 2/3: Depth Extraction (DPT)")
-        depth_map = depth_service.estimate_depth(isolated_product)
-        # FORCE UNLOAD DPT
-        depth_service.unload()
-        print("   🗑️ Unloaded DPT")
+        with model_registry.use("dpt-depth"):
+            depth_map = depth_service.estimate_depth(isolated_product)
         print("   ✅ Depth map extracted")
         
         # Step 3: Generate studio image
         print("\n🔸 Step 3/3: Studio Generation (SDXL + ControlNet)")
         
-        # Enable aggressive memory saving for SDXL
-        self.load_pipeline(low_memory=True)
-        
-        # Load Lightning LoRA if fast mode requested
-        if quality == "fast":
-            self.load_lightning_lora()
-            print("   ⚡ FAST MODE: Using SDXL Lightning (4 steps)")
-        
-        studio_result = self.generate_studio_image(
-            product_image=isolated_product,
-            depth_map=depth_map,
-            prompt=studio_prompt,
-            num_inference_steps=settings["steps"],
-            controlnet_conditioning_scale=settings["scale"]
-        )
+        # Enable aggressive memory saving for SDXL (idle BiRefNet / DPT get evicted if it doesn't fit)
+        with model_registry.use("sdxl-controlnet", low_memory=True):
+            # Load Lightning LoRA if fast mode requested
+            if quality == "fast":
+                self.load_lightning_lora()
+                print("   ⚡ FAST MODE: Using SDXL Lightning (4 steps)")
+
+            studio_result = self.generate_studio_image(
+                product_image=isolated_product,
+                depth_map=depth_map,
+                prompt=studio_prompt,
+                num_inference_steps=settings["steps"],
+                controlnet_conditioning_scale=settings["scale"]
+            )
         print("   ✅ Studio image generated")
         
         print("\n" + "=" * 60)
@@ -353,6 +341,7 @@ class StudioRegenerationService:
         
         return comparison
     
+    @metrics.timed_unload("sdxl-controlnet", lambda s: s.pipeline is not None)
     def unload(self):
         """Free memory by unloading the pipeline"""
         if self.pipeline is not None:
@@ -372,3 +361,8 @@ class StudioRegenerationService:
 
 # Singleton instance
 studio_regen_service = StudioRegenerationService()
+model_registry.register(
+    "sdxl-controlnet", studio_regen_service, size_mb=8000, load="load_pipeline", unload="unload",
+    weights=["diffusers/controlnet-depth-sdxl-1.0", "madebyollin/sdxl-vae-fp16-fix", "stabilityai/stable-diffusion-xl-base-1.0"],
+    loaded=lambda s: s.pipeline is not None,
+)
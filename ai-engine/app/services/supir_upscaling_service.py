@@ -10,6 +10,8 @@ import gc
 import time
 from typing import Optional, Tuple
 from app.config import DeviceConfig
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 
 class SupirUpscalingService:
@@ -34,6 +36,7 @@ class SupirUpscalingService:
         self.is_loaded = False
         self.use_fallback = False
 
+    @metrics.timed_load("supir", lambda s: s.is_loaded)
     def load_model(self, scale: int = 2):
         """
         Load SUPIR upscaling model or fallback to Real-ESRGAN.
@@ -104,10 +107,11 @@ class SupirUpscalingService:
         Load Real-ESRGAN as fallback for upscaling.
         """
         try:
-            from app.services.upscale_service import UpscaleService
+            from app.services.upscale_service import upscale_service
 
-            self.esrgan_model = UpscaleService()
-            self.esrgan_model.load_model(scale_factor=scale)
+            # The process-wide instance: its upsampler is shared, not loaded twice
+            self.esrgan_model = upscale_service
+            self.esrgan_model._ensure_initialized()
             return True
 
         except Exception as e:
@@ -291,7 +295,7 @@ class SupirUpscalingService:
         Upscale using Real-ESRGAN fallback.
         """
         try:
-            return self.esrgan_model.upscale(image, scale_factor=scale)
+            return self.esrgan_model.enhance(image, scale=scale)
         except Exception as e:
             print(f"⚠️  Real-ESRGAN failed: {e}")
             return self._upscale_pil(image, scale)
@@ -335,6 +339,7 @@ class SupirUpscalingService:
 
         return results
 
+    @metrics.timed_unload("supir", lambda s: s.is_loaded)
     def unload_model(self):
         """
         Unload model to free GPU memory.
@@ -347,6 +352,7 @@ class SupirUpscalingService:
             del self.esrgan_model
             self.esrgan_model = None
 
+        self.is_loaded = False
         gc.collect()
         torch.cuda.empty_cache() if torch.cuda.is_available() else None
         print("🧹 SUPIR/ESRGAN model unloaded from GPU")
@@ -380,3 +386,7 @@ class SupirUpscalingService:
 
 # Singleton instance for the API
 supir_service = SupirUpscalingService()
+model_registry.register(
+    "supir", supir_service, size_mb=10000, loaded=lambda s: s.is_loaded,
+    weights=["stabilityai/stable-diffusion-x4-upscaler"],
+)
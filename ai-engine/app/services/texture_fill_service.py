@@ -4,9 +4,12 @@ Uses actual textures from the product to fill missing areas.
 NO AI generation - just intelligent texture sampling/mirroring.
 """
 from PIL import Image, ImageOps
+from typing import Optional
 import cv2
 import numpy as np
 
+from app.utils.mask_info import MaskInfo
+
 
 class TextureFillService:
     """
@@ -18,8 +21,10 @@ class TextureFillService:
     def __init__(self):
         self.expansion_pixels = 64
     
-    def detect_crop(self, image: Image.Image) -> dict:
+    def detect_crop(self, image: Image.Image, mask_info: Optional[MaskInfo] = None) -> dict:
         """Detect if product touches edges (cropped)"""
+        if mask_info is not None:
+            return mask_info.crop_info()
         if image.mode != "RGBA":
             image = image.convert("RGBA")
             
@@ -37,13 +42,13 @@ class TextureFillService:
         crop_info["is_cropped"] = any([crop_info[k] for k in ["top", "bottom", "left", "right"]])
         return crop_info
     
-    def smart_fill(self, image: Image.Image) -> Image.Image:
+    def smart_fill(self, image: Image.Image, mask_info: Optional[MaskInfo] = None) -> Image.Image:
         """
         Main entry: Detect crop -> Expand -> Texture-aware fill -> White BG
         Uses the product's own textures to extend missing areas.
         """
         print("🔍 Checking for cropped edges...")
-        crop_info = self.detect_crop(image)
+        crop_info = self.detect_crop(image, mask_info)
         
         if not crop_info["is_cropped"]:
             print("   ✅ No cropping detected. Placing on white.")
@@ -99,13 +104,13 @@ class TextureFillService:
         
         return result
     
-    def mirror_extend(self, image: Image.Image) -> Image.Image:
+    def mirror_extend(self, image: Image.Image, mask_info: Optional[MaskInfo] = None) -> Image.Image:
         """
         Alternative: Extend edges by mirroring edge pixels.
         100% texture preservation - just mirrors what's already there.
         """
         print("🔍 Checking for cropped edges...")
-        crop_info = self.detect_crop(image)
+        crop_info = self.detect_crop(image, mask_info)
         
         if not crop_info["is_cropped"]:
             print("   ✅ No cropping. Placing on white.")
@@ -0,0 +1,286 @@
+"""
+Tracing - Lightweight spans for per-request latency breakdowns.
+
+Every HTTP request and async job gets an in-memory trace (the main.py
+middleware / JobService; a job's trace id is its job id). Spans nest
+through contextvars, so they follow awaits, asyncio tasks and the executor's
+thread lanes (which copy the request context); CPU-pool calls show up as the
+executor span only.
+
+    with tracer.span("showcase.segmentation", size=ctx.size):
+        ...
+
+    @traced("birefnet.segment_batch")
+    def segment_batch(self, images): ...
+
+A trace is written to TRACE_DIR when TRACING_ENABLED=1, or when the client
+asks for it with a debug_id form field / X-Debug-Id header (which becomes the
+trace id). Files are Chrome trace JSON (open in chrome://tracing or
+ui.perfetto.dev) or OTLP/JSON with TRACE_FORMAT=otlp. Spans outside a
+trace (e.g. the startup warmup) are dropped.
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.config import get_settings
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error", "thread", "_token")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.thread = threading.current_thread().name
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.debug_id: Optional[str] = None
+        self.export_requested = False
+        self.spans: List[Span] = []  # appended from lane threads too (list.append is atomic)
+
+    def adopt(self, debug_id: Optional[str]):
+        """Use the client's debug id as the trace id and make sure the trace gets written."""
+        if not debug_id:
+            return
+        self.debug_id = debug_id
+        self.export_requested = True
+        if re.fullmatch(r"[0-9a-f]{32}", debug_id):
+            self.trace_id = debug_id
+        else:
+            # OTLP wants 16 bytes of hex; keep the original as the file name / attribute
+            self.trace_id = hashlib.sha256(debug_id.encode()).hexdigest()[:32]
+
+    @property
+    def file_stem(self) -> str:
+        return re.sub(r"[^A-Za-z0-9._-]", "_", self.debug_id or self.trace_id)[:100]
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total milliseconds per span name (handy for logs)."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            if span.end_ns is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return totals
+
+    # ---- exporters ----
+
+    def to_chrome(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        threads: Dict[str, int] = {}
+        events = []
+        for span in self.spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            args = {k: _jsonable(v) for k, v in span.attributes.items()}
+            args.update(span_id=span.span_id, parent_id=span.parent_id)
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name, "ph": "X", "pid": pid, "tid": tid,
+                "ts": span.start_ns / 1000, "dur": ((span.end_ns or span.start_ns) - span.start_ns) / 1000,
+                "args": args,
+            })
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for name, tid in threads.items()
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, "debug_id": self.debug_id, "name": self.name},
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        def attrs(values: Dict[str, Any]) -> List[dict]:
+            out = []
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    out.append({"key": key, "value": {"boolValue": value}})
+                elif isinstance(value, int):
+                    out.append({"key": key, "value": {"intValue": str(value)}})
+                elif isinstance(value, float):
+                    out.append({"key": key, "value": {"doubleValue": value}})
+                else:
+                    out.append({"key": key, "value": {"stringValue": str(value)}})
+            return out
+
+        spans = []
+        for span in self.spans:
+            item = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": attrs({**span.attributes, "thread.name": span.thread}),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+        resource = {"service.name": get_settings().PROJECT_NAME, "process.pid": os.getpid()}
+        if self.debug_id:
+            resource["debug_id"] = self.debug_id
+        return {"resourceSpans": [{
+            "resource": {"attributes": attrs(resource)},
+            "scopeSpans": [{"scope": {"name": "guardian-ai"}, "spans": spans}],
+        }]}
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+class Tracer:
+    def __init__(self):
+        settings = get_settings()
+        self.export_all = settings.TRACING_ENABLED
+        self.directory = settings.TRACE_DIR
+        self.format = settings.TRACE_FORMAT
+
+    # ---- traces ----
+
+    @contextmanager
+    def trace(self, name: str, debug_id: Optional[str] = None, trace_id: Optional[str] = None) -> Iterator[Trace]:
+        """Root of a request's (or job's) spans. Exports on exit if enabled or requested."""
+        trace = Trace(name, trace_id)
+        trace.adopt(debug_id)
+        trace_token = _current_trace.set(trace)
+        try:
+            with self.span(name) as root:
+                yield trace
+        finally:
+            _current_trace.reset(trace_token)
+            if self.export_all or trace.export_requested:
+                self.export(trace, root)
+
+    @property
+    def current_trace(self) -> Optional[Trace]:
+        return _current_trace.get()
+
+    def adopt(self, debug_id: Optional[str]):
+        """Make the current request's trace use (and export under) the client's debug id."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.adopt(debug_id)
+
+    # ---- spans ----
+
+    def start_span(self, name: str, **attributes) -> Optional[Span]:
+        """Open a span and make it current. Pair with end_span() in the same task."""
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+        parent = _current_span.get()
+        span = Span(name, parent.span_id if parent else None, attributes)
+        span._token = _current_span.set(span)
+        trace.spans.append(span)
+        return span
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None):
+        if span is None or span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        try:
+            _current_span.reset(span._token)
+        except ValueError:
+            pass  # ended from another context; the parent link is already recorded
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Span for the block; yields None (and costs ~nothing) outside a trace."""
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    def annotate(self, **attributes):
+        """Attach attributes to the current span."""
+        span = _current_span.get()
+        if span is not None and _current_trace.get() is not None:
+            span.set(**attributes)
+
+    # ---- export ----
+
+    def export(self, trace: Trace, root: Optional[Span] = None):
+        now = time.time_ns()
+        for span in trace.spans:
+            if span.end_ns is None:
+                span.end_ns = now
+                span.error = span.error or "unfinished"
+        payload = trace.to_otlp() if self.format == "otlp" else trace.to_chrome()
+        path = os.path.join(self.directory, f"{trace.file_stem}.{self.format}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(payload, f)
+        except OSError as e:
+            print(f"⚠️ Trace export failed: {e}")
+            return
+        top = sorted(trace.breakdown().items(), key=lambda kv: -kv[1])[:5]
+        total = f"{root.duration_ms:.0f}ms" if root is not None and root.duration_ms is not None else "?"
+        print(f"🔎 Trace {trace.file_stem} ({total}) → {path}")
+        print("   " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in top))
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run the (sync or async) function inside a span."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Singleton
+tracer = Tracer()
@@ -5,6 +5,8 @@ import os
 import torch
 import numpy as np
 from fastapi import UploadFile
+from app.services.metrics import metrics
+from app.services.model_registry import model_registry
 
 class TurboService:
     def __init__(self):
@@ -12,9 +14,12 @@ class TurboService:
         self.pipeline = None
         self.model_id = "stabilityai/sdxl-turbo"
 
+    @metrics.timed_load("turbo", lambda s: bool(s.pipeline))
     def load_pipeline(self):
         if self.pipeline:
             return
+        if model_registry.restore("turbo"):
+            return
         
         print("⚡ Loading SDXL Lightning + ControlNet Depth (Phase 9 Perfection)...")
         try:
@@ -48,6 +53,12 @@ class TurboService:
             print(error_msg)
             raise e
 
+    def unload_pipeline(self):
+        """Drop the pipeline (the registry clears the device cache, or keeps it in host RAM instead)."""
+        if self.pipeline:
+            self.pipeline = None
+            print("🧹 SDXL Lightning pipeline unloaded")
+
     def get_depth_image(self, image: Image.Image):
         from transformers import pipeline as hf_pipeline
         depth_estimator = hf_pipeline("depth-estimation", model="Intel/dpt-large")
@@ -127,9 +138,16 @@ class TurboService:
         return final_img, final_mask
 
     async def agentic_edit(self, image_file: UploadFile, target_text: str, prompt: str, negative_prompt: str = "", strength: float = 0.65) -> str:
+        from app.services.inference_executor import inference_executor
+        contents = await image_file.read()
+        return await inference_executor.run_gpu(
+            "turbo", self.agentic_edit_bytes, contents, target_text, prompt, negative_prompt, strength
+        )
+
+    def agentic_edit_bytes(self, contents: bytes, target_text: str, prompt: str, negative_prompt: str = "", strength: float = 0.65) -> str:
+        """Synchronous body of agentic_edit (runs on the GPU owner thread)."""
         try:
             self.load_pipeline()
-            contents = await image_file.read()
             from io import BytesIO
             raw_image = Image.open(BytesIO(contents)).convert("RGB")
             input_image = raw_image.resize((1024, 1024))
@@ -231,3 +249,8 @@ class TurboService:
         return result
 
 turbo_service = TurboService()
+model_registry.register(
+    "turbo", turbo_service, size_mb=9000, load="load_pipeline", unload="unload_pipeline",
+    weights=["diffusers/controlnet-depth-sdxl-1.0-small", "SG161222/RealVisXL_V4.0", "ByteDance/SDXL-Lightning"],
+    host_attr="pipeline", loaded=lambda s: s.pipeline is not None,
+)
@@ -4,24 +4,21 @@ Uses the realesrgan package or falls back to Pillow-based enhancement
 """
 import io
 from PIL import Image, ImageEnhance, ImageFilter
-from typing import Tuple
-import base64
+from typing import Tuple, Union
+from app.utils.image_result import ImageResult
+from app.services.admission_control import admission_controller
+from app.services.metrics import metrics
+from app.services.model_handles import HandleKey, model_handles
+from app.services.model_registry import model_registry
+from app.services.tracing import traced
 
 # Try to import Real-ESRGAN
 def get_realesrgan_upsampler():
     try:
         from realesrgan import RealESRGANer
         from basicsr.archs.rrdbnet_arch import RRDBNet
-        import torch
-        
-        # Determine device
-        if torch.backends.mps.is_available():
-            device = "mps"  # Mac Apple Silicon
-        elif torch.cuda.is_available():
-            device = "cuda"
-        else:
-            device = "cpu"
         
+        device = _realesrgan_device()
         print(f"🔧 Loading Real-ESRGAN on {device}...")
         
         # RealESRGAN_x4plus model (general purpose, good quality)
@@ -47,6 +44,18 @@ def get_realesrgan_upsampler():
         return None
 
 
+def _realesrgan_device() -> str:
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.backends.mps.is_available():
+        return "mps"  # Mac Apple Silicon
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
 class UpscaleService:
     """
     Image upscaling and enhancement service.
@@ -55,18 +64,67 @@ class UpscaleService:
     
     def __init__(self):
         self._upsampler = None
+        self._handle = None  # share of the pooled upsampler (model_handles)
         self._initialized = False
         print("📈 Upscale Service initialized (lazy loading)")
     
+    @metrics.timed_load("realesrgan", lambda s: s._initialized)
     def _ensure_initialized(self):
-        """Lazy load the upsampler"""
+        """Lazy load the upsampler (not needed when the model host runs it)"""
         if not self._initialized:
-            self._upsampler = get_realesrgan_upsampler()
+            from app.services.model_host import model_host_client
+            if not model_host_client.enabled:
+                self._upsampler = self._load_upsampler()
             self._initialized = True
+
+    def _load_upsampler(self):
+        """Real-ESRGAN x4plus, shared with every other UpscaleService (None when unavailable)."""
+        if self._handle is None:
+            key = HandleKey("RealESRGAN_x4plus", "x4", _realesrgan_device(), "float32")
+            try:
+                self._handle = model_handles.acquire(key, get_realesrgan_upsampler)
+            except RuntimeError:
+                return None  # get_realesrgan_upsampler already said why
+        return self._handle.value
+
+    @property
+    def _available(self) -> bool:
+        from app.services.model_host import model_host_client
+        return self._upsampler is not None or model_host_client.enabled
+
+    def _use_realesrgan(self) -> bool:
+        """
+        Real-ESRGAN for this call, loading it on first use, unless it's
+        unavailable or memory pressure picks Pillow. Pressure only decides
+        this call: nothing is loaded then, and the next call tries again.
+        """
+        if self._initialized and not self._available:
+            return False
+        if admission_controller.degraded("realesrgan", "pillow"):
+            return False
+        self._ensure_initialized()
+        return self._available
+
+    @traced("upscale.realesrgan")
+    def _realesrgan(self, img_np):
+        """Real-ESRGAN 4x on the shared model host if configured, else in-process."""
+        from app.services.model_host import ModelHostUnavailable, model_host_client
+        if model_host_client.enabled:
+            try:
+                return model_host_client.upscale(img_np, outscale=4)
+            except ModelHostUnavailable as e:
+                model_host_client.note_fallback()
+                print(f"⚠️ Model host unavailable ({e}), upscaling in-process")
+                if self._upsampler is None:
+                    self._upsampler = self._load_upsampler()
+        if self._upsampler is None:
+            return None, None
+        return self._upsampler.enhance(img_np, outscale=4)
     
+    @traced("upscale.upscale_image")
     async def upscale_image(
         self,
-        image_bytes: bytes,
+        image: Union[bytes, Image.Image, ImageResult],
         target_size: Tuple[int, int] = (1024, 1024),
         enhance_colors: bool = True
     ) -> dict:
@@ -77,16 +135,21 @@ class UpscaleService:
         2. Resize to target size
         3. Enhance colors/contrast
         
-        Returns dict with base64 image data.
+        Accepts encoded bytes, a PIL image or an ImageResult, so in-process
+        callers can skip the encode/decode hop entirely.
+        Returns dict whose "image_data" is an ImageResult (JPEG, lazily encoded).
         """
         import time
         start = time.time()
         
-        self._ensure_initialized()
-        
         try:
-            # Open image
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            # Open image (only decode when we were handed bytes)
+            if isinstance(image, ImageResult):
+                image = image.to_pil()
+            if isinstance(image, Image.Image):
+                img = image.convert("RGB") if image.mode != "RGB" else image
+            else:
+                img = Image.open(io.BytesIO(image)).convert("RGB")
             original_size = img.size
             print(f"   📏 Input: {original_size[0]}x{original_size[1]}")
             
@@ -94,19 +157,19 @@ class UpscaleService:
             upscaled = None
             use_fallback = True
             
-            if self._upsampler:
+            if self._use_realesrgan():
                 try:
                     # Use Real-ESRGAN
                     print("   🔬 Upscaling with Real-ESRGAN...")
                     import numpy as np
-                    from starlette.concurrency import run_in_threadpool
+                    from app.services.inference_executor import inference_executor
                     
                     img_np = np.array(img)
                     if img_np.dtype != np.uint8:
                          img_np = img_np.astype(np.uint8)
                          
-                    # Run inference in threadpool (CPU/GPU bound)
-                    output, _ = await run_in_threadpool(self._upsampler.enhance, img_np, outscale=4)
+                    # Run inference on the GPU owner thread
+                    output, _ = await inference_executor.run_gpu("realesrgan", self._realesrgan, img_np)
                     
                     # Validation
                     if output is not None and output.mean() > 5:
@@ -139,21 +202,15 @@ class UpscaleService:
                 print("   🎨 Enhancing colors...")
                 upscaled = self._enhance_image(upscaled)
             
-            # Convert to base64
-            buffer = io.BytesIO()
-            upscaled.save(buffer, format="JPEG", quality=95)
-            buffer.seek(0)
-            b64_data = base64.b64encode(buffer.getvalue()).decode()
-            
             elapsed = time.time() - start
             print(f"   ✅ Upscale complete in {elapsed:.2f}s")
             
             return {
                 "status": "success",
-                "image_data": f"data:image/jpeg;base64,{b64_data}",
+                "image_data": ImageResult.from_pil(upscaled, format="JPEG", quality=95),
                 "original_size": original_size,
                 "final_size": (upscaled.width, upscaled.height),
-                "method": "realesrgan" if self._upsampler else "pillow"
+                "method": "pillow" if use_fallback else "realesrgan"
             }
             
         except Exception as e:
@@ -187,6 +244,7 @@ class UpscaleService:
 
         return img
 
+    @traced("upscale.enhance")
     def enhance(self, image: Image.Image, scale: int = 2) -> Image.Image:
         """
         Synchronous upscaling method for pipeline use.
@@ -200,21 +258,19 @@ class UpscaleService:
         """
         import numpy as np
 
-        self._ensure_initialized()
-
         try:
             # Ensure RGB
             if image.mode != "RGB":
                 image = image.convert("RGB")
 
-            if scale == 4 and self._upsampler:
+            if scale == 4 and self._use_realesrgan():
                 # Use Real-ESRGAN 4x
                 img_np = np.array(image)
                 if img_np.dtype != np.uint8:
                     img_np = img_np.astype(np.uint8)
 
                 try:
-                    output, _ = self._upsampler.enhance(img_np, outscale=4)
+                    output, _ = self._realesrgan(img_np)
                     if output is not None and output.mean() > 5:
                         return Image.fromarray(output)
                 except:
@@ -233,6 +289,9 @@ class UpscaleService:
     def cleanup(self):
         """Cleanup and free model memory."""
         import gc
+        if self._handle is not None:
+            self._handle.release()  # freed once no other instance holds it
+            self._handle = None
         self._upsampler = None
         self._initialized = False
         gc.collect()
@@ -240,3 +299,8 @@ class UpscaleService:
 
 # Singleton instance
 upscale_service = UpscaleService()
+model_registry.register(
+    "realesrgan", upscale_service, size_mb=70,
+    load="_ensure_initialized", unload="cleanup",
+    loaded=lambda s: s._upsampler is not None,
+)
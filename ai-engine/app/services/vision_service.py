@@ -1,5 +1,6 @@
 from PIL import Image
 import io
+from app.services.metrics import metrics
 
 try:
     import torch
@@ -18,6 +19,7 @@ class VisionService:
         self.processor = None
         self.model = None
 
+    @metrics.timed_load("vision", lambda s: bool(s.model))
     def load_model(self):
         if self.model:
             return
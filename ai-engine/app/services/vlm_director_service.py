@@ -10,6 +10,9 @@ from PIL import Image
 from typing import Optional, List, Dict, Any
 from dataclasses import dataclass
 import gc
+from app.services.metrics import metrics
+from app.services.model_handles import HandleKey, model_handles
+from app.services.model_registry import model_registry
 
 
 @dataclass
@@ -43,8 +46,10 @@ class VLMDirectorService:
             else "cpu"
         )
         self.model_id = "Qwen/Qwen2-VL-7B-Instruct"  # 7B unified model
+        self._handle = None  # share of the pooled weights (model_handles)
         self._load_count = 0
 
+    @metrics.timed_load("qwen-vlm", lambda s: s.model is not None)
     def load_model(self):
         """Load Qwen-Image-2.0 from HuggingFace."""
         if self.model is not None:
@@ -53,25 +58,12 @@ class VLMDirectorService:
         print(f"🔮 Loading Qwen-Image-2.0 (7B) on {self.device}...")
 
         try:
-            from transformers import AutoProcessor, Qwen2VLForConditionalGeneration
-
-            # Load processor
-            self.processor = AutoProcessor.from_pretrained(
-                self.model_id,
-                trust_remote_code=True,
-            )
-
-            # Load model in float16 for memory efficiency
-            self.model = Qwen2VLForConditionalGeneration.from_pretrained(
-                self.model_id,
-                torch_dtype=torch.float16,
-                low_cpu_mem_usage=True,
-                trust_remote_code=True,
+            # Shared with every other VLMDirectorService in the process
+            self._handle = model_handles.acquire(
+                HandleKey(self.model_id, "", self.device, "float16"),
+                lambda: _load_qwen_vl(self.model_id, self.device),
             )
-
-            # Move to device
-            self.model = self.model.to(self.device)
-            self.model.eval()
+            self.processor, self.model = self._handle.value
 
             print(f"✅ Qwen-Image-2.0 loaded on {self.device}")
             self._load_count += 1
@@ -266,12 +258,14 @@ CRITICAL: Only respond with the JSON object. No other text."""
             quality_score=0.7 if not issues else 0.5,
         )
 
+    @metrics.timed_unload("qwen-vlm", lambda s: s.model is not None)
     def unload(self):
         """Unload model to free memory."""
         if self.model is not None and self.model != "fallback":
             print("🧹 Unloading Qwen-Image-2.0...")
-            del self.model
-            del self.processor
+            if self._handle is not None:
+                self._handle.release()  # freed once no other instance holds it
+                self._handle = None
             self.model = None
             self.processor = None
             gc.collect()
@@ -286,5 +280,25 @@ CRITICAL: Only respond with the JSON object. No other text."""
             print("   ✅ Memory freed")
 
 
+def _load_qwen_vl(model_id: str, device: str):
+    from transformers import AutoProcessor, Qwen2VLForConditionalGeneration
+
+    processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+    # Load model in float16 for memory efficiency
+    model = Qwen2VLForConditionalGeneration.from_pretrained(
+        model_id,
+        torch_dtype=torch.float16,
+        low_cpu_mem_usage=True,
+        trust_remote_code=True,
+    )
+    model = model.to(device)
+    model.eval()
+    return processor, model
+
+
 # Singleton instance
 vlm_director_service = VLMDirectorService()
+model_registry.register(
+    "qwen-vlm", vlm_director_service, size_mb=16000, unload="unload", weights=["Qwen/Qwen2-VL-7B-Instruct"],
+    loaded=lambda s: s.model not in (None, "fallback"),
+)
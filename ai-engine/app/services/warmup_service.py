@@ -0,0 +1,213 @@
+"""
+Warmup Service - Load and exercise models before traffic arrives.
+
+The plan is declarative (WARMUP_PLAN): which models to load and which input
+shapes to run through them, so first requests don't pay for weight loading,
+CUDA context / allocator growth, cuDNN autotuning or onnxruntime's per-shape
+setup:
+
+    WARMUP_PLAN="u2netp@512; birefnet@1024*1,1024*4; realesrgan@256,512; clipseg@352"
+
+Each step is `model@shape[,shape...]`; a shape is `WxH` or `N` (square),
+optionally `*B` for a batch of B. GPU steps run one after another on the
+device's owner thread (the same lane requests use, so the autotuned kernels
+and cached allocations are the ones requests hit); CPU steps (ONNX sessions)
+run alongside them. A step that fails is reported and skipped: warmup never
+keeps the engine from starting.
+
+GET /ready answers 503 until every step has finished, so a load balancer or
+orchestrator holds traffic back until then; /health stays a liveness check.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import get_settings
+from app.services.metrics import metrics
+
+Shape = Tuple[int, int, int]  # width, height, batch
+
+
+class WarmupStep(NamedTuple):
+    model: str
+    shapes: Tuple[Shape, ...]
+
+
+def parse_plan(spec: str) -> List[WarmupStep]:
+    """'u2netp@512; birefnet@1024*1,1024*4' -> [WarmupStep(...), ...]. Unknown models raise ValueError."""
+    steps = []
+    for item in spec.replace("\n", ";").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, shapes = item.partition("@")
+        model = model.strip()
+        if model not in _WARMERS:
+            raise ValueError(f"Unknown warmup model '{model}' (known: {', '.join(sorted(_WARMERS))})")
+        parsed = []
+        for token in (shapes or _WARMERS[model][2]).split(","):
+            size, _, batch = token.strip().partition("*")
+            width, _, height = size.partition("x")
+            parsed.append((int(width), int(height or width), int(batch or 1)))
+        steps.append(WarmupStep(model, tuple(parsed)))
+    return steps
+
+
+# ---- warmers: (lane, fn(width, height, batch), default shape) ----
+# Each runs the model's real request path at the given input size.
+
+def _blank(width: int, height: int):
+    from PIL import Image
+    return Image.new("RGB", (width, height), (128, 128, 128))
+
+
+def _model_host_runs_it() -> bool:
+    from app.services.model_host import model_host_client
+    return model_host_client.enabled
+
+
+def _warm_u2netp(width: int, height: int, batch: int):
+    from app.services.birefnet_service import birefnet_service
+    for _ in range(batch):
+        birefnet_service._rembg_remove(_blank(width, height))
+
+
+def _warm_birefnet(width: int, height: int, batch: int):
+    from app.services.birefnet_service import birefnet_service
+    birefnet_service.segment_batch([_blank(width, height) for _ in range(batch)])
+
+
+def _warm_realesrgan(width: int, height: int, batch: int):
+    import numpy as np
+    from app.services.upscale_service import upscale_service
+    upscale_service._ensure_initialized()
+    if upscale_service._upsampler is None:
+        raise RuntimeError("Real-ESRGAN is not available here")
+    for _ in range(batch):
+        upscale_service._realesrgan(np.full((height, width, 3), 128, dtype=np.uint8))
+
+
+def _warm_clipseg(width: int, height: int, batch: int):
+    from app.services.service_registry import services
+    vision = services.require("vision")
+    for _ in range(batch):
+        vision.get_mask(_blank(width, height), "product")
+
+
+def _warm_depth(width: int, height: int, batch: int):
+    from app.services.depth_service import depth_service
+    from app.services.model_registry import model_registry
+    with model_registry.use("dpt-depth"):
+        import torch
+        inputs = depth_service.processor(images=[_blank(width, height)] * batch, return_tensors="pt").to(depth_service.device)
+        with torch.no_grad():
+            depth_service.model(**inputs)
+
+
+_WARMERS: Dict[str, Tuple[str, Callable[[int, int, int], None], str]] = {
+    "u2netp": ("cpu", _warm_u2netp, "512"),
+    "birefnet": ("gpu", _warm_birefnet, "1024"),
+    "realesrgan": ("gpu", _warm_realesrgan, "256,512"),
+    "clipseg": ("gpu", _warm_clipseg, "352"),
+    "dpt-depth": ("gpu", _warm_depth, "384"),
+}
+# Served by the model host when MODEL_HOST_ADDRESS is set: nothing to warm here
+_HOSTED = {"u2netp", "birefnet", "realesrgan"}
+
+
+class WarmupService:
+    def __init__(self):
+        settings = get_settings()
+        self.plan_spec = settings.WARMUP_PLAN
+        self.cudnn_benchmark = settings.CUDNN_BENCHMARK
+        self.steps: List[WarmupStep] = []
+        self.results: Dict[str, dict] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def start(self) -> Optional[asyncio.Task]:
+        """Run the plan in the background (call from the startup event)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        self.started_at = time.time()
+        try:
+            self.steps = parse_plan(self.plan_spec)
+        except ValueError as e:
+            print(f"⚠️ Invalid WARMUP_PLAN ({e}), skipping warmup")
+            self.steps = []
+        self.results = {step.model: {"status": "pending"} for step in self.steps}
+        if self.steps:
+            print(f"🔥 Warming up: {self.plan_spec}")
+        try:
+            lanes: Dict[str, List[WarmupStep]] = {}
+            for step in self.steps:
+                lanes.setdefault(_WARMERS[step.model][0], []).append(step)
+            await asyncio.gather(*(self._run_lane(lane, steps) for lane, steps in lanes.items()))
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+        failed = [name for name, result in self.results.items() if result["status"] == "failed"]
+        print(f"🚀 Warmup finished in {self.finished_at - self.started_at:.1f}s"
+              + (f" ({', '.join(failed)} failed)" if failed else ""))
+
+    async def _run_lane(self, lane: str, steps: List[WarmupStep]):
+        from app.services.inference_executor import inference_executor
+        loop = asyncio.get_running_loop()
+        for step in steps:
+            result = self.results[step.model]
+            if step.model in _HOSTED and _model_host_runs_it():
+                result["status"] = "skipped (model host)"
+                continue
+            result["status"] = "running"
+            start = time.perf_counter()
+            try:
+                if lane == "gpu":
+                    await inference_executor.run_gpu(step.model, self._run_step, step, lane)
+                else:
+                    await loop.run_in_executor(None, self._run_step, step, lane)
+            except Exception as e:
+                result.update(status="failed", error=f"{type(e).__name__}: {e}")
+                print(f"⚠️ Warmup of {step.model} failed (non-fatal): {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            result.update(status="done", seconds=round(elapsed, 2), shapes=[list(shape) for shape in step.shapes])
+            metrics.observe("warmup_step_seconds", elapsed, model=step.model)
+            print(f"🔥 {step.model} warm ({len(step.shapes)} shape(s), {elapsed:.1f}s)")
+
+    def _run_step(self, step: WarmupStep, lane: str):
+        _, warm, _ = _WARMERS[step.model]
+        if lane == "gpu" and self.cudnn_benchmark:
+            _enable_cudnn_benchmark()
+        for width, height, batch in step.shapes:
+            warm(width, height, batch)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "plan": self.plan_spec,
+            "steps": self.results,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 1) if self.started_at else None,
+        }
+
+
+def _enable_cudnn_benchmark():
+    """Autotune conv algorithms per input shape; the warmup shapes get tuned before requests arrive."""
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = True
+
+
+# Singleton
+warmup_service = WarmupService()
@@ -0,0 +1,150 @@
+"""
+Weight Prefetcher - Read the next stage's weights while the current one runs.
+
+The sequential pipelines (SOTA v2, local-enhanced) run one model per stage,
+and a cold stage spends much of its load time reading checkpoint files. While
+stage N computes, the pipeline asks for stage N+1's weights:
+
+    weight_prefetcher.prefetch("flux", stage="generation")
+
+A background thread reads that model's cached files (see the registry's
+weights=) once through, so they are in the page cache when the model loads.
+Nothing is moved to the device here: the model registry loads the model as
+usual (after evicting whatever it has to), and first waits for an unfinished
+prefetch of the same model so the two don't read the same files twice.
+
+Per model and stage, prefetch_hidden_seconds records the read time the
+earlier stage covered and prefetch_wait_seconds the part the load still had
+to wait for. Only files already on disk are read; nothing is downloaded.
+A model the registry demoted to host RAM is promoted instead (if VRAM has
+room for it), since there is nothing to read.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.services.metrics import metrics
+
+_WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pth", ".pt", ".ckpt", ".onnx")
+_CHUNK = 16 * 1024 * 1024
+
+
+class _Job:
+    __slots__ = ("name", "stage", "future", "read_s", "bytes")
+
+    def __init__(self, name: str, stage: Optional[str]):
+        self.name = name
+        self.stage = stage
+        self.future: Optional[Future] = None
+        self.read_s = 0.0
+        self.bytes = 0
+
+
+class WeightPrefetcher:
+    def __init__(self):
+        self.enabled = get_settings().WEIGHT_PREFETCH_ENABLED
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, _Job] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="weight-prefetch")
+        self.hidden_s = 0.0
+        self.wait_s = 0.0
+        self.prefetched = 0
+
+    def prefetch(self, name: str, stage: Optional[str] = None) -> bool:
+        """Queue a background read of the model's weights. False if disabled, resident or already queued."""
+        if not self.enabled:
+            return False
+        from app.services.model_registry import model_registry
+        if model_registry.is_resident(name):
+            return False
+        if model_registry.is_demoted(name):
+            return model_registry.promote_async(name)  # weights are in host RAM, not on disk
+        with self._lock:
+            queued = self._jobs.get(name)
+            if queued is not None and not queued.future.done():
+                return False
+            job = self._jobs[name] = _Job(name, stage)
+            job.future = self._executor.submit(self._read, job)
+        return True
+
+    def _read(self, job: _Job):
+        from app.services.model_registry import model_registry
+        start = time.perf_counter()
+        buffer = bytearray(_CHUNK)
+        for path in _weight_files(model_registry.weights_of(job.name)):
+            try:
+                with open(path, "rb", buffering=0) as f:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    while True:
+                        read = f.readinto(buffer)
+                        if not read:
+                            break
+                        job.bytes += read
+            except OSError as e:
+                print(f"⚠️ Prefetch of {path} failed: {e}")
+        job.read_s = time.perf_counter() - start
+        if job.bytes:
+            print(f"📥 Prefetched {job.name} weights ({job.bytes / 1024 ** 2:.0f}MB in {job.read_s:.1f}s)")
+
+    def claim(self, name: str):
+        """Called by the registry right before it loads name: wait for (or cancel) its prefetch and record the overlap."""
+        with self._lock:
+            job = self._jobs.pop(name, None)
+        if job is None or job.future.cancel():
+            return  # nothing queued, or it hadn't started: the load reads the files itself
+        start = time.perf_counter()
+        try:
+            job.future.result()
+        except Exception as e:
+            print(f"⚠️ Prefetch of {name} failed: {e}")
+            return
+        waited = time.perf_counter() - start
+        if not job.bytes:
+            return
+        hidden = max(0.0, job.read_s - waited)
+        stage = job.stage or name
+        metrics.observe("prefetch_hidden_seconds", hidden, model=name, stage=stage)
+        metrics.observe("prefetch_wait_seconds", waited, model=name, stage=stage)
+        metrics.inc("prefetch_bytes_total", job.bytes, model=name)
+        with self._lock:
+            self.hidden_s += hidden
+            self.wait_s += waited
+            self.prefetched += 1
+        print(f"📥 {name}: {hidden:.1f}s of weight reads hidden behind the previous stage (waited {waited:.1f}s)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queued": sorted(self._jobs),
+                "prefetched": self.prefetched,
+                "hidden_s": round(self.hidden_s, 2),
+                "wait_s": round(self.wait_s, 2),
+            }
+
+
+def _weight_files(sources: List[str]) -> List[str]:
+    """Checkpoint files on disk for each source: a HuggingFace repo id (from the local cache only) or a path."""
+    files = []
+    for source in sources:
+        path = os.path.expanduser(source)
+        if not os.path.exists(path) and "/" in source and not source.startswith(("/", "~", ".")):
+            try:
+                from huggingface_hub import snapshot_download
+                path = snapshot_download(source, local_files_only=True)
+            except Exception:
+                continue  # not downloaded yet: the load will fetch it
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, _, names in os.walk(path):
+            files += [os.path.join(root, n) for n in sorted(names) if n.endswith(_WEIGHT_SUFFIXES)]
+    return files
+
+
+# Singleton
+weight_prefetcher = WeightPrefetcher()
@@ -0,0 +1,159 @@
+"""
+Image Context - One decoded upload shared by every stage of a request.
+
+A showcase/enhance request used to decode the same upload several times
+(router, cv2.imdecode in the enhancer, Image.open after a JPEG round trip,
+and again for the "original" comparison image). An ImageContext decodes once
+and hands out views of the same pixels:
+
+- .bgr / .rgb: numpy uint8 arrays (one is a channel-reversed view of the
+  other, no copy). Read-only, since they're shared.
+- .pil: a PIL RGB image mapped onto the same buffer. Marked read-only so an
+  accidental in-place edit can't write through to the arrays; stages that
+  edit in place should .copy() (or .convert()) first, as they'd share it.
+- .cached(name, fn): memo for derived forms (model input tensors, masks,
+  resized variants), so later stages reuse earlier work.
+"""
+import io
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class ImageContext:
+    __slots__ = ("_data", "_bgr", "_rgb", "_pil", "_derived")
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        bgr: Optional[np.ndarray] = None,
+        rgb: Optional[np.ndarray] = None,
+        pil: Optional[Image.Image] = None,
+    ):
+        if data is None and bgr is None and rgb is None and pil is None:
+            raise ValueError("ImageContext needs bytes, an array or a PIL image")
+        self._data = data
+        self._bgr = self._freeze(bgr)
+        self._rgb = self._freeze(rgb)
+        self._pil = pil.convert("RGB") if pil is not None and pil.mode != "RGB" else pil
+        self._derived: Dict[str, Any] = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ImageContext":
+        """Wrap encoded upload bytes. Decoding happens on first pixel access."""
+        return cls(data=data)
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "ImageContext":
+        return cls(pil=image)
+
+    @classmethod
+    def from_bgr(cls, array: np.ndarray) -> "ImageContext":
+        """Wrap an OpenCV-style BGR uint8 array (e.g. an enhancer's output)."""
+        return cls(bgr=array)
+
+    @classmethod
+    def from_rgb(cls, array: np.ndarray) -> "ImageContext":
+        return cls(rgb=array)
+
+    @staticmethod
+    def _freeze(array: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if array is not None and array.flags.writeable:
+            array = array.view()
+            array.flags.writeable = False
+        return array
+
+    # ---- pixel views ----
+
+    def _decode(self):
+        """Decode the upload once. cv2 first (applies EXIF orientation, like the enhancer did)."""
+        bgr = None
+        try:
+            import cv2
+            bgr = cv2.imdecode(np.frombuffer(self._data, np.uint8), cv2.IMREAD_COLOR)
+        except ImportError:
+            pass
+        if bgr is not None:
+            self._bgr = self._freeze(bgr)
+            return
+        # Formats cv2 can't read: let PIL raise a proper error for non-images
+        image = Image.open(io.BytesIO(self._data)).convert("RGB")
+        self._rgb = self._freeze(np.asarray(image))
+
+    @property
+    def data(self) -> Optional[bytes]:
+        """The original encoded bytes, if the context was built from an upload."""
+        return self._data
+
+    @property
+    def bgr(self) -> np.ndarray:
+        if self._bgr is None:
+            if self._rgb is None and self._pil is None:
+                self._decode()
+            if self._bgr is None:
+                self._bgr = self.rgb[..., ::-1]
+        return self._bgr
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            if self._pil is not None:
+                self._rgb = self._freeze(np.asarray(self._pil))
+            else:
+                bgr = self.bgr  # may decode straight to RGB
+                if self._rgb is None:
+                    self._rgb = bgr[..., ::-1]
+        return self._rgb
+
+    @property
+    def pil(self) -> Image.Image:
+        """Shared RGB PIL image (copy-on-write). Decoded/converted once."""
+        if self._pil is None:
+            rgb = self.rgb
+            if not rgb.flags.c_contiguous:
+                # Channel-reversed view of BGR: materialize RGB once and keep it
+                rgb = self._freeze(np.ascontiguousarray(rgb))
+                self._rgb = rgb
+            height, width = rgb.shape[:2]
+            image = Image.frombuffer("RGB", (width, height), rgb, "raw", "RGB", 0, 1)
+            image.readonly = 1  # in-place edits copy instead of writing into the shared buffer
+            self._pil = image
+        return self._pil
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), like PIL."""
+        if self._pil is not None:
+            return self._pil.size
+        array = self._bgr if self._bgr is not None else self.rgb
+        return (array.shape[1], array.shape[0])
+
+    # ---- derived forms ----
+
+    def cached(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Return the derived form `name`, computing it on first use."""
+        if name not in self._derived:
+            self._derived[name] = compute()
+        return self._derived[name]
+
+    def set(self, name: str, value: Any):
+        """Attach a derived form produced elsewhere (e.g. the alpha mask from segmentation)."""
+        self._derived[name] = value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self._derived.get(name, default)
+
+    def resized(self, size: Tuple[int, int], resample=Image.Resampling.LANCZOS) -> Image.Image:
+        return self.cached(f"resized:{size[0]}x{size[1]}", lambda: self.pil.resize(size, resample))
+
+    def thumbnail(self, max_side: int = 512) -> Image.Image:
+        def make():
+            image = self.pil.copy()
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            return image
+        return self.cached(f"thumbnail:{max_side}", make)
+
+    def __repr__(self) -> str:
+        decoded = self._bgr is not None or self._rgb is not None or self._pil is not None
+        return f"<ImageContext {'decoded ' + str(self.size) if decoded else 'encoded'}>"
@@ -0,0 +1,137 @@
+"""
+Image Result - Encoded image payload passed between services and routers.
+
+Services used to hand back "data:image/...;base64," strings which the routers
+immediately split and b64decode again just to send binary. An ImageResult
+instead carries the PIL/numpy image (or already-encoded bytes) and encodes
+lazily: at most one JPEG/PNG encode per result, and base64 only at the JSON
+edge when a client actually asked for JSON.
+"""
+import base64
+import io
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+_FORMAT_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+_MEDIA_TYPE_FORMATS = {v: k for k, v in _FORMAT_MEDIA_TYPES.items()}
+
+
+class ImageResult:
+    """
+    An image result that is encoded at most once.
+
+    Holds either a decoded image (PIL or numpy RGB/RGBA array), encoded bytes,
+    or both. `.data` encodes on first access and caches the bytes; `.to_pil()`
+    decodes on first access and caches the image.
+    """
+
+    __slots__ = ("_image", "_data", "format", "quality", "media_type")
+
+    def __init__(
+        self,
+        image: Optional[Union[Image.Image, np.ndarray]] = None,
+        data: Optional[bytes] = None,
+        format: str = "JPEG",
+        quality: int = 95,
+        media_type: Optional[str] = None,
+    ):
+        if image is None and data is None:
+            raise ValueError("ImageResult needs an image or encoded bytes")
+        self._image = image
+        self._data = data
+        self.format = format.upper()
+        self.quality = quality
+        self.media_type = media_type or _FORMAT_MEDIA_TYPES.get(self.format, "application/octet-stream")
+
+    @classmethod
+    def from_pil(cls, image: Image.Image, format: str = "JPEG", quality: int = 95) -> "ImageResult":
+        return cls(image=image, format=format, quality=quality)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, format: str = "JPEG", quality: int = 95) -> "ImageResult":
+        """Wrap an RGB/RGBA uint8 array (no copy until encode time)."""
+        return cls(image=array, format=format, quality=quality)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, media_type: str = "image/jpeg") -> "ImageResult":
+        """Wrap bytes that are already encoded (e.g. a downloaded stock photo)."""
+        return cls(data=data, format=_MEDIA_TYPE_FORMATS.get(media_type, "JPEG"), media_type=media_type)
+
+    @classmethod
+    def from_data_uri(cls, uri: str) -> "ImageResult":
+        """Adapter for providers that still hand back data URIs."""
+        header, _, payload = uri.partition(",")
+        media_type = header[len("data:"):].split(";", 1)[0] if header.startswith("data:") else "image/jpeg"
+        return cls.from_bytes(base64.b64decode(payload), media_type=media_type or "image/jpeg")
+
+    @property
+    def data(self) -> bytes:
+        """Encoded bytes. Encodes once on first access."""
+        if self._data is None:
+            image = self._image
+            if isinstance(image, np.ndarray):
+                image = Image.fromarray(image)
+            if self.format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            if self.format == "JPEG":
+                image.save(buffer, format="JPEG", quality=self.quality)
+            else:
+                image.save(buffer, format=self.format)
+            self._data = buffer.getvalue()
+        return self._data
+
+    def to_pil(self) -> Image.Image:
+        """Decoded PIL image. Decodes once if only bytes are held."""
+        if isinstance(self._image, np.ndarray):
+            self._image = Image.fromarray(self._image)
+        if self._image is None:
+            image = Image.open(io.BytesIO(self._data))
+            image.load()
+            self._image = image
+        return self._image
+
+    @property
+    def size(self) -> tuple:
+        if isinstance(self._image, np.ndarray):
+            return (self._image.shape[1], self._image.shape[0])
+        return self.to_pil().size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held right now (encoded and/or decoded), without encoding anything."""
+        held = len(self._data) if self._data is not None else 0
+        if isinstance(self._image, np.ndarray):
+            held += self._image.nbytes
+        elif self._image is not None:
+            held += self._image.width * self._image.height * len(self._image.getbands())
+        return held
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self.format == "JPEG" else self.format.lower()
+
+    def to_data_uri(self) -> str:
+        """Base64 data URI for JSON responses — the only place we base64."""
+        return f"data:{self.media_type};base64,{base64.b64encode(self.data).decode()}"
+
+    def __repr__(self) -> str:
+        state = "encoded" if self._data is not None else "decoded"
+        return f"<ImageResult {self.media_type} {state}>"
+
+
+def encode_for_json(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a shallow copy of a service result dict with every ImageResult
+    value replaced by its data URI, ready to be returned as JSON.
+    """
+    return {
+        key: value.to_data_uri() if isinstance(value, ImageResult) else value
+        for key, value in payload.items()
+    }
@@ -0,0 +1,153 @@
+"""
+Mask Info - What every stage wants to know about a cutout, computed once.
+
+After segmentation the alpha used to be re-scanned by each stage: the
+cleanup's connected components, the quality score, the compositor's "non
+white" mask for the shadow, fitting to the canvas, the fill services' edge
+checks. MaskInfo is built in one pass (one connectedComponentsWithStats
+over the alpha, everything else inside the product's bounding box) and
+carries:
+
+- alpha: the cleaned mask (largest component only), uint8 HxW
+- bbox: tight (x0, y0, x1, y1) of the product (alpha > 10), None if empty
+- area / components: foreground pixels, components found before cleanup
+- quality: the 0-100 confidence score (see score_alpha)
+- touches: image edges the product touches ("top", "bottom", ...)
+
+Stages crop to roi() and work on the product's pixels only.
+"""
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+FG_THRESHOLD = 10  # alpha above this counts as product (cleanup, scoring, edge checks)
+ALPHA_MID_LOW, ALPHA_MID_HIGH = 40, 230  # the "model isn't sure" band
+EDGES = ("top", "bottom", "left", "right")
+
+Box = Tuple[int, int, int, int]
+
+
+def score_alpha(mid_count: int, fg_count: int, total: int) -> float:
+    """
+    Cutout confidence 0-100 from how many foreground pixels sit in the
+    mid-alpha band. 0 for degenerate cutouts (almost nothing kept, or almost
+    nothing removed).
+    """
+    if total == 0:
+        return 0.0
+    fg_frac = fg_count / total
+    if fg_frac < 0.01 or fg_frac > 0.99:
+        return 0.0
+    mid_frac = mid_count / max(fg_count, 1)
+    # Empirically calibrated against u2netp output (which always leaves a
+    # soft antialiased rim, so even clean cutouts run ~0.20-0.25 mid):
+    #   clean product on plain bg     ~0.25 -> ~78  (pass, >=60)
+    #   subject occluded / ghosting   ~0.45 -> ~46  (warn)
+    #   low-contrast / cluttered scene ~0.70 -> ~16  (warn)
+    # Anchor 0.25 -> 78 and slope so 0.45 -> ~46.
+    score = max(0.0, 100.0 - ((mid_frac - 0.25) * 160.0) - 22.0)
+    return round(min(100.0, score), 1)
+
+
+def _bbox(fg: np.ndarray) -> Optional[Box]:
+    rows, cols = np.flatnonzero(fg.any(axis=1)), np.flatnonzero(fg.any(axis=0))
+    if rows.size == 0:
+        return None
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+class MaskInfo(NamedTuple):
+    alpha: np.ndarray
+    bbox: Optional[Box]
+    area: int
+    components: int
+    quality: Optional[float]
+    touches: Tuple[str, ...]
+
+    @classmethod
+    def analyze(cls, alpha: np.ndarray, cleanup: bool = True) -> "MaskInfo":
+        """
+        One pass over a uint8 alpha. cleanup keeps only the largest connected
+        component of alpha > FG_THRESHOLD (soft edges of that component stay
+        soft), like BiRefNet's post-processing always did.
+        """
+        alpha = np.ascontiguousarray(alpha, dtype=np.uint8)
+        height, width = alpha.shape
+        fg = alpha > FG_THRESHOLD
+        components = 0
+        if cleanup:
+            import cv2
+            count, labels, stats, _ = cv2.connectedComponentsWithStats(fg.view(np.uint8), connectivity=8)
+            components = count - 1
+            if components == 0:
+                return cls(alpha, None, 0, 0, 0.0, ())
+            largest = int(np.argmax(stats[1:, cv2.CC_STAT_AREA])) + 1
+            left, top, w, h, area = (int(v) for v in stats[largest])
+            bbox = (left, top, left + w, top + h)
+            if components > 1:
+                alpha = np.where(labels == largest, alpha, 0).astype(np.uint8)
+        else:
+            bbox = _bbox(fg)
+            if bbox is None:
+                return cls(alpha, None, 0, 0, 0.0, ())
+            area = int(fg.sum())
+            components = 1
+
+        x0, y0, x1, y1 = bbox
+        roi = alpha[y0:y1, x0:x1]
+        mid = int(((roi > ALPHA_MID_LOW) & (roi < ALPHA_MID_HIGH)).sum())  # all > FG_THRESHOLD already
+        touches = tuple(edge for edge, hit in zip(EDGES, (y0 == 0, y1 == height, x0 == 0, x1 == width)) if hit)
+        return cls(alpha, bbox, area, components, score_alpha(mid, area, alpha.size), touches)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, cleanup: bool = False) -> "MaskInfo":
+        """From an RGBA image's alpha (fully opaque if it has none)."""
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        return cls.analyze(np.asarray(image.getchannel("A")), cleanup=cleanup)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.alpha.shape[1], self.alpha.shape[0]
+
+    @property
+    def is_cropped(self) -> bool:
+        return bool(self.touches)
+
+    def crop_info(self) -> dict:
+        """The fill services' detect_crop() dict."""
+        info = {edge: edge in self.touches for edge in EDGES}
+        info["is_cropped"] = self.is_cropped
+        return info
+
+    def roi(self, margin: int = 0) -> Box:
+        """bbox grown by margin pixels, within the image (the whole image when empty)."""
+        width, height = self.size
+        if self.bbox is None:
+            return 0, 0, width, height
+        x0, y0, x1, y1 = self.bbox
+        return max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin)
+
+    def mask(self) -> Image.Image:
+        return Image.fromarray(self.alpha)
+
+    def crop(self, margin: int = 0) -> "MaskInfo":
+        """The same analysis in roi(margin) coordinates (for an image cropped the same way)."""
+        x0, y0, x1, y1 = self.roi(margin)
+        bbox = None if self.bbox is None else (self.bbox[0] - x0, self.bbox[1] - y0, self.bbox[2] - x0, self.bbox[3] - y0)
+        # Touching the original image's edge is what the fill services care about, so it's kept
+        return self._replace(alpha=self.alpha[y0:y1, x0:x1], bbox=bbox)
+
+    def placed(self, alpha: np.ndarray, offset: Tuple[int, int], canvas_size: Tuple[int, int]) -> "MaskInfo":
+        """
+        The product's (resized) alpha pasted at offset on a canvas: bbox from
+        the pasted alpha alone, quality carried over, nothing rescanned.
+        """
+        canvas = np.zeros((canvas_size[1], canvas_size[0]), dtype=np.uint8)
+        x, y = offset
+        canvas[y:y + alpha.shape[0], x:x + alpha.shape[1]] = alpha
+        fg = alpha > FG_THRESHOLD
+        local = _bbox(fg)
+        bbox = None if local is None else (local[0] + x, local[1] + y, local[2] + x, local[3] + y)
+        return MaskInfo(canvas, bbox, int(fg.sum()), self.components, self.quality, ())
@@ -3,32 +3,25 @@ Memory Management Utility
 Manages RAM usage by cleaning up unused models and clearing GPU caches.
 """
 import gc
-import os
-import subprocess
 
 
 def get_memory_usage() -> dict:
-    """Get current system memory usage (macOS)."""
+    """Current memory usage of this container (cgroup v2 limit if set, else the host) and the GPU."""
+    from app.services.memory_sampler import memory_sampler
     try:
-        result = subprocess.run(['top', '-l', '1', '-s', '0'], capture_output=True, text=True)
-        lines = result.stdout.split('\n')
-        
-        for line in lines:
-            if 'PhysMem:' in line:
-                # Parse: PhysMem: 14G used (2087M wired, 2700M compressor), 1983M unused.
-                parts = line.split()
-                used_idx = parts.index('used')
-                unused_idx = [i for i, p in enumerate(parts) if 'unused' in p]
-                
-                return {
-                    'used': parts[1] if len(parts) > 1 else 'N/A',
-                    'unused': parts[unused_idx[0] - 1] if unused_idx else 'N/A',
-                    'raw': line
-                }
+        sample = memory_sampler.sample(fresh=True)
     except Exception as e:
         return {'error': str(e)}
-    
-    return {'raw': 'Unable to parse memory info'}
+    info = sample.to_dict()
+    raw = f"RAM: {info['ram_used_gb']}G used of {info['ram_limit_gb']}G ({info['ram_source']}), {info['ram_available_gb']}G free"
+    if info['gpu_total_gb'] is not None:
+        raw += f" | GPU: {info['gpu_used_gb']}G used of {info['gpu_total_gb']}G"
+    return {
+        'used': f"{info['ram_used_gb']}G",
+        'unused': f"{info['ram_available_gb']}G",
+        'raw': raw,
+        **info,
+    }
 
 
 def cleanup_torch():
@@ -53,45 +46,13 @@ def cleanup_torch():
 
 
 def unload_all_models():
-    """Unload all loaded AI models from memory."""
+    """Unload every registered model that no request is using (see app.services.model_registry)."""
+    from app.services.model_registry import model_registry
+
     print("🔄 Unloading all AI models...")
-    
-    try:
-        # Unload BiRefNet
-        from app.services.birefnet_service import birefnet_service
-        if birefnet_service.model is not None:
-            birefnet_service.model.to("cpu")
-            del birefnet_service.model
-            birefnet_service.model = None
-            birefnet_service.is_loaded = False
-            print("  ✅ BiRefNet unloaded")
-    except Exception as e:
-        print(f"  ℹ️ BiRefNet: {e}")
-    
-    try:
-        # Unload Hybrid Service components
-        from app.services.hybrid_service import hybrid_service
-        hybrid_service._offload_birefnet()
-        hybrid_service._offload_sdxl()
-        print("  ✅ Hybrid service cleared")
-    except Exception as e:
-        print(f"  ℹ️ Hybrid service: {e}")
-    
-    try:
-        # Unload IC-Light if loaded
-        from app.services.iclight_service import iclight_service
-        if iclight_service.is_loaded:
-            if iclight_service.unet:
-                iclight_service.unet.to("cpu")
-            if iclight_service.vae:
-                iclight_service.vae.to("cpu")
-            if iclight_service.text_encoder:
-                iclight_service.text_encoder.to("cpu")
-            iclight_service.is_loaded = False
-            print("  ✅ IC-Light unloaded")
-    except Exception as e:
-        print(f"  ℹ️ IC-Light: {e}")
-    
+    for name in model_registry.unload_all(include_pinned=True):
+        print(f"  ✅ {name} unloaded")
+
     # Final cleanup
     cleanup_torch()
 
@@ -0,0 +1,126 @@
+"""
+Startup profile - What a cold `import main` costs, module by module.
+
+    python main.py --profile-startup
+    python main.py --profile-startup --budget-ms 2500 --runs 3 --out startup.json
+
+Imports main in fresh interpreters under `python -X importtime` (so nothing
+is already cached in sys.modules), and reports the median total plus the
+most expensive top-level packages and app modules. Exits 1 when the median
+exceeds the budget (STARTUP_IMPORT_BUDGET_MS) or when a --forbid module
+(torch, diffusers, transformers by default) is imported at all, so CI catches
+a heavy service import creeping back in. A failing import also exits 1.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from app.config import get_settings
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+FORBIDDEN = ["torch", "diffusers", "transformers"]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) per import, in -X importtime order."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def profile_once(target: str, cwd: str) -> Tuple[List[Tuple[str, int, int, int]], str]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    error = ""
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+    return rows, error
+
+
+def summarize(rows: List[Tuple[str, int, int, int]], top: int) -> dict:
+    total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    packages: Dict[str, int] = {}
+    for module, _, cumulative, depth in rows:
+        if depth == 0:
+            root = module.split(".")[0]
+            packages[root] = packages.get(root, 0) + cumulative
+    app_modules = sorted(
+        ((module, self_us, cumulative) for module, self_us, cumulative, _ in rows
+         if module == "main" or module.startswith("app.")),
+        key=lambda row: -row[2],
+    )
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "packages": [{"package": p, "ms": round(us / 1000, 1)} for p, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]],
+        "app_modules": [
+            {"module": m, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+            for m, s, c in app_modules[:top]
+        ],
+        "modules_imported": len(rows),
+    }
+
+
+def main(argv=None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Cold import profile of the AI engine")
+    parser.add_argument("--profile-startup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--target", default="main", help="Module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to time; the median counts")
+    parser.add_argument("--budget-ms", type=float, default=settings.STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--forbid", nargs="*", default=FORBIDDEN, help="Top-level packages that must not be imported")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--out", help="Write the report JSON here")
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    runs = []
+    for _ in range(max(1, args.runs)):
+        rows, error = profile_once(args.target, cwd)
+        if error:
+            print(f"❌ import {args.target} failed: {error}")
+            return 1
+        runs.append(rows)
+
+    totals = [summarize(rows, args.top)["total_ms"] for rows in runs]
+    median = statistics.median(totals)
+    middle = sorted(range(len(totals)), key=totals.__getitem__)[len(totals) // 2]
+    report = summarize(runs[middle], args.top)
+    report.update(runs_ms=totals, median_ms=median, budget_ms=args.budget_ms)
+    imported = {module.split(".")[0] for module, _, _, _ in runs[0]}
+    report["forbidden_imported"] = sorted(imported & set(args.forbid))
+
+    print(f"🧪 Cold import of {args.target}: median {median:.0f}ms over {len(totals)} run(s) (budget {args.budget_ms:.0f}ms)")
+    print("   Top-level packages:")
+    for row in report["packages"]:
+        print(f"     {row['ms']:>8.1f} ms  {row['package']}")
+    print("   App modules (cumulative / self):")
+    for row in report["app_modules"]:
+        print(f"     {row['cumulative_ms']:>8.1f} / {row['self_ms']:>7.1f} ms  {row['module']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📁 Report saved to: {args.out}")
+
+    failed = False
+    if report["forbidden_imported"]:
+        print(f"❌ Imported at startup but should load lazily: {', '.join(report['forbidden_imported'])}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"❌ Cold import {median:.0f}ms exceeds the {args.budget_ms:.0f}ms budget")
+        failed = True
+    if not failed:
+        print("✅ Within budget")
+    return 1 if failed else 0
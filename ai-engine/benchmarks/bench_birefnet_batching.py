@@ -0,0 +1,127 @@
+"""
+Benchmark: BiRefNet dynamic micro-batching — throughput vs. latency.
+
+Fires bursts of concurrent segmentation requests (like a QuickSell upload
+fanning out into /enhance + /showcase calls) through the segmentation
+batcher, with batching off and at several window / max-batch settings, and
+reports throughput plus p50/p95 request latency and the batch-size histogram.
+
+Runs the real model when torch + BiRefNet are available. --simulate uses a
+cost model instead (fixed per-pass overhead + per-image cost) so the window
+logic can be tuned on machines without a GPU.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_birefnet_batching.py --requests 16 --windows 5 10 20 --max-batch 4
+    python benchmarks/bench_birefnet_batching.py --simulate 120,35 --out batching.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+
+def synthetic_inputs(count: int, size: int):
+    """Plain backgrounds with an off-centre product block, varied per request."""
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", (size, size), (235 - i % 20, 235, 230))
+        block = Image.new("RGB", (size // 2, size // 3), (40 + i * 7 % 180, 60, 90))
+        image.paste(block, (size // 4, size // 3))
+        images.append(image)
+    return images
+
+
+def install_simulated_model(fixed_ms: float, per_image_ms: float):
+    """Swap segment_batch for a cost model: one pass = fixed + n * per_image."""
+    from app.services.birefnet_service import birefnet_service
+
+    def segment_batch(images):
+        time.sleep((fixed_ms + per_image_ms * len(images)) / 1000.0)
+        return [(image.convert("RGBA"), 100.0) for image in images]
+
+    birefnet_service.segment_batch = segment_batch
+
+
+async def run_burst(batcher, images, spread_ms: float) -> dict:
+    """Submit all images within spread_ms (uniformly) and wait for every mask."""
+    latencies = []
+
+    async def one(index, image):
+        await asyncio.sleep(spread_ms / 1000.0 * index / max(1, len(images) - 1))
+        start = time.perf_counter()
+        await batcher.segment(image)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i, image) for i, image in enumerate(images)))
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        "throughput_ips": round(len(images) / elapsed, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 1),
+    }
+
+
+async def run(args) -> list:
+    from app.services.segmentation_batcher import SegmentationBatcher
+
+    images = synthetic_inputs(args.requests, args.size)
+    configs = [("off", None, 1)] + [(f"{w}ms x{args.max_batch}", w, args.max_batch) for w in args.windows]
+    results = []
+
+    # Warm up (model load / JIT) so it doesn't land in the first config
+    warm = SegmentationBatcher()
+    warm.enabled = False
+    await warm.segment(images[0])
+
+    for label, window_ms, max_batch in configs:
+        batcher = SegmentationBatcher()
+        batcher.enabled = window_ms is not None
+        batcher.window_s = (window_ms or 0) / 1000.0
+        batcher.max_batch = max_batch
+        row = {"config": label, **(await run_burst(batcher, images, args.spread_ms))}
+        row["batch_size_histogram"] = batcher.stats()["batch_size_histogram"]
+        row["queue_delay_ms"] = batcher.stats()["queue_delay_ms"]
+        results.append(row)
+        print(
+            f"📊 {label:<14} {row['throughput_ips']:>7.2f} img/s   p50 {row['p50_ms']:>8.1f} ms"
+            f"   p95 {row['p95_ms']:>8.1f} ms   batches {row['batch_size_histogram']}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=16, help="Concurrent requests per burst")
+    parser.add_argument("--spread-ms", type=float, default=20.0, help="Arrival spread of the burst")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--windows", type=float, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--simulate", help="FIXED_MS,PER_IMAGE_MS cost model instead of the real model")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    if args.simulate:
+        fixed_ms, per_image_ms = (float(v) for v in args.simulate.split(","))
+        install_simulated_model(fixed_ms, per_image_ms)
+
+    print(f"🧪 BiRefNet micro-batching ({args.requests} requests, {args.size}px, {'simulated' if args.simulate else 'real model'})")
+    print("=" * 60)
+    results = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
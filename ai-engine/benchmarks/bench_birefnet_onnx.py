@@ -0,0 +1,158 @@
+"""
+Benchmark: BiRefNet on onnxruntime vs. PyTorch CPU vs. rembg u2netp.
+
+Runs the same images through:
+
+- torch      BiRefNetService(mode, backend="torch") on the CPU
+- onnx-b<N>  the fixed-batch export, IO-bound buffers (one row per --threads value)
+- onnx-dyn   the dynamic-batch export, at each --batch size
+- u2netp     the rembg fallback the CPU boxes use today
+
+and reports load time, p50/p95 latency per call and images/s. Exports missing
+graphs into the artifact cache first (needs torch); with the graphs already
+exported, the onnx rows need onnxruntime only. Backends that can't run here
+are reported as skipped.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_birefnet_onnx.py --mode general-lite --threads 0 4 8
+    python benchmarks/bench_birefnet_onnx.py --mode general-lite-int8 --batch 1 4 --runs 10 --out onnx.json
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+
+def synthetic_inputs(count: int, size: int):
+    """Plain backgrounds with an off-centre product block, varied per image."""
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", (size, size), (235 - i % 20, 235, 230))
+        block = Image.new("RGB", (size // 2, size // 3), (40 + i * 7 % 180, 60, 90))
+        image.paste(block, (size // 4, size // 3))
+        images.append(image)
+    return images
+
+
+def time_calls(fn, images, batch: int, runs: int) -> dict:
+    """fn(list of images) over `runs` batches of `batch` images, after one untimed call."""
+    batches = [[images[(r * batch + i) % len(images)] for i in range(batch)] for r in range(runs)]
+    fn(batches[0])
+    latencies = []
+    start = time.perf_counter()
+    for part in batches:
+        t = time.perf_counter()
+        fn(part)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        "batch": batch,
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 1),
+        "images_per_s": round(batch * runs / elapsed, 2),
+    }
+
+
+def bench_torch(mode: str, images, batches, runs):
+    from app.services.birefnet_service import BiRefNetService
+    service = BiRefNetService(mode, backend="torch")
+    service.device = "cpu"
+    start = time.perf_counter()
+    service.load_model()
+    load_s = time.perf_counter() - start
+    if service.model in (None, "rembg"):
+        return [{"backend": "torch", "skipped": "torch / weights unavailable"}]
+    rows = [{"backend": "torch", "load_s": round(load_s, 2), **time_calls(service._segment_local, images, b, runs)} for b in batches]
+    service.unload_model()
+    return rows
+
+
+def bench_onnx(mode: str, images, batches, runs, fixed_batch: int, threads):
+    from app.services import birefnet_onnx
+    from app.services.birefnet_service import BIREFNET_VARIANTS, parse_mode
+    variant, quantized = parse_mode(mode)
+    model_id = BIREFNET_VARIANTS[variant]
+    rows = []
+    for label, export_batch, sizes in ((f"onnx-b{fixed_batch}", fixed_batch, [fixed_batch]), ("onnx-dyn", None, batches)):
+        try:
+            path = birefnet_onnx.export(model_id, export_batch, quantized)
+        except Exception as e:
+            rows.append({"backend": label, "skipped": f"export failed: {e}"})
+            continue
+        for intra in threads:
+            try:
+                start = time.perf_counter()
+                model = birefnet_onnx.OnnxBiRefNet(path, "cpu", intra_op_threads=intra)
+                load_s = time.perf_counter() - start
+            except Exception as e:
+                rows.append({"backend": label, "threads": intra, "skipped": str(e)})
+                continue
+            for b in sizes:
+                rows.append({"backend": label, "threads": intra, "load_s": round(load_s, 2), **time_calls(model.predict, images, b, runs)})
+            del model
+            gc.collect()
+    return rows
+
+
+def bench_u2netp(images, runs):
+    try:
+        from rembg import new_session, remove
+        start = time.perf_counter()
+        session = new_session(model_name="u2netp", providers=["CPUExecutionProvider"])
+        load_s = time.perf_counter() - start
+    except Exception as e:
+        return [{"backend": "u2netp", "skipped": str(e)}]
+    run = lambda part: [remove(image, session=session) for image in part]
+    return [{"backend": "u2netp", "load_s": round(load_s, 2), **time_calls(run, images, 1, runs)}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="general-lite", help="BiRefNet mode (variant, optionally -int8)")
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4], help="Batch sizes for torch / onnx-dyn")
+    parser.add_argument("--fixed-batch", type=int, default=1, help="Batch size of the fixed-shape export")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="onnxruntime intra-op threads (0 = default)")
+    parser.add_argument("--runs", type=int, default=5, help="Timed calls per configuration")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["torch", "onnx", "u2netp"])
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    images = synthetic_inputs(args.images, args.size)
+    print(f"🧪 BiRefNet {args.mode} on CPU: torch vs onnxruntime vs u2netp ({args.size}px, {args.runs} runs)")
+    print("=" * 60)
+    results = []
+    if "torch" not in args.skip:
+        results += bench_torch(args.mode, images, args.batch, args.runs)
+    if "onnx" not in args.skip:
+        results += bench_onnx(args.mode, images, args.batch, args.runs, args.fixed_batch, args.threads)
+    if "u2netp" not in args.skip:
+        results += bench_u2netp(images, args.runs)
+
+    for row in results:
+        label = row["backend"] + (f" t{row['threads']}" if "threads" in row else "")
+        if "skipped" in row:
+            print(f"⏭️  {label:<16} skipped: {row['skipped']}")
+        else:
+            print(
+                f"📊 {label:<16} batch {row['batch']:>2}   p50 {row['p50_ms']:>8.1f} ms   p95 {row['p95_ms']:>8.1f} ms"
+                f"   {row['images_per_s']:>6.2f} img/s   (load {row['load_s']}s)"
+            )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"mode": args.mode, "results": results}, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
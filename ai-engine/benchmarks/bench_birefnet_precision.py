@@ -0,0 +1,170 @@
+"""
+Benchmark: BiRefNet inference policies (dtype, memory format, torch.compile) per device.
+
+For each device (cpu, and cuda / mps when present) and each policy spec,
+loads BiRefNetService(mode) with that InferencePolicy and reports load time,
+p50/p95 latency of the 1024px forward pass per batch size, images/s, and how
+far its masks are from the float32 reference on the same device (mean abs
+alpha difference in 0-255 levels, IoU of alpha > 127). A policy passes when
+its mean difference stays under --tolerance.
+
+Specs are BIREFNET_POLICY strings ("auto" = the device default). Specs a
+device can't run (half precision on MPS) are reported as skipped.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_birefnet_precision.py --mode general-lite
+    python benchmarks/bench_birefnet_precision.py --devices cuda --batch 1 4 \\
+        --policies auto "dtype=bfloat16,channels_last=1" "compile=max-autotune" --out precision.json
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+REFERENCE = "dtype=float32,channels_last=0,compile=off,tf32=0"
+DEFAULT_POLICIES = [
+    "auto",
+    "dtype=float32,channels_last=1",
+    "dtype=float16,channels_last=1",
+    "dtype=bfloat16,channels_last=1",
+    "dtype=float16,channels_last=1,compile=max-autotune-no-cudagraphs",
+]
+
+
+def synthetic_inputs(count: int, size: int):
+    """Textured backgrounds with a dark product shape, varied per image."""
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(count):
+        pixels = rng.normal(220 - i * 5, 10, (size, size, 3)).clip(0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((size * 0.2, size * (0.2 + i * 0.02), size * 0.8, size * 0.85), fill=(40 + i * 10, 50, 70))
+        draw.rectangle((size * 0.48, size * 0.05, size * 0.52, size * 0.3), fill=(40, 50, 70))
+        images.append(image)
+    return images
+
+
+def load(mode: str, device: str, spec: str):
+    from app.services.birefnet_service import BiRefNetService, inference_policy
+    service = BiRefNetService(mode, backend="torch")
+    service.device = device
+    service.policy = inference_policy(device, spec)
+    start = time.perf_counter()
+    service.load_model()
+    load_s = time.perf_counter() - start
+    if service.model in (None, "rembg"):
+        return None, load_s
+    return service, load_s
+
+
+def run_policy(mode: str, device: str, spec: str, images, batches, runs, reference):
+    import torch
+    try:
+        service, load_s = load(mode, device, spec)
+    except ValueError as e:
+        return {"device": device, "policy": spec, "skipped": str(e)}
+    if service is None:
+        return {"device": device, "policy": spec, "skipped": "torch / weights unavailable"}
+    row = {"device": device, "policy": spec, "resolved": str(service.policy), "load_s": round(load_s, 2), "batches": []}
+    try:
+        masks = [mask for i in range(0, len(images), max(batches)) for mask in service._predict(images[i:i + max(batches)])]
+        for batch in batches:
+            parts = [[images[(r * batch + i) % len(images)] for i in range(batch)] for r in range(runs)]
+            service._predict(parts[0])  # compile / autotune for this shape
+            latencies = []
+            for part in parts:
+                if device.startswith("cuda"):
+                    torch.cuda.synchronize()
+                t = time.perf_counter()
+                service._predict(part)
+                latencies.append(time.perf_counter() - t)
+            ordered = sorted(latencies)
+            row["batches"].append({
+                "batch": batch,
+                "p50_ms": round(statistics.median(ordered) * 1000, 1),
+                "p95_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 1),
+                "images_per_s": round(batch * runs / sum(latencies), 2),
+            })
+    except Exception as e:
+        row["skipped"] = f"inference failed: {e}"
+        return row
+    finally:
+        service.unload_model()
+        gc.collect()
+        if device.startswith("cuda"):
+            torch.cuda.empty_cache()
+
+    if reference is not None:
+        diffs = [np.abs(a.astype(np.int16) - b).mean() for a, b in zip(masks, reference)]
+        ious = [((a > 127) & (b > 127)).sum() / max(((a > 127) | (b > 127)).sum(), 1) for a, b in zip(masks, reference)]
+        row["mask_diff"] = round(float(np.mean(diffs)), 3)
+        row["iou"] = round(float(np.mean(ious)), 4)
+    row["masks"] = masks
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="general-lite", help="BiRefNet mode (not -int8: that's the CPU quantization path)")
+    parser.add_argument("--devices", nargs="+", default=None, help="cpu cuda mps (default: everything present)")
+    parser.add_argument("--policies", nargs="+", default=DEFAULT_POLICIES, help="BIREFNET_POLICY specs to compare")
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--runs", type=int, default=10, help="Timed calls per batch size")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Max mean alpha difference vs float32 (0-255 levels)")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    try:
+        import torch
+    except ImportError:
+        print("⏭️  torch isn't installed here; nothing to compare")
+        return
+    devices = args.devices or ["cpu"] + ["cuda"] * torch.cuda.is_available() + ["mps"] * torch.backends.mps.is_available()
+    images = synthetic_inputs(args.images, 1024)
+    print(f"🧪 BiRefNet {args.mode} inference policies on {', '.join(devices)} ({args.runs} runs, batches {args.batch})")
+    print("=" * 60)
+
+    results = []
+    for device in devices:
+        baseline = run_policy(args.mode, device, REFERENCE, images, args.batch, args.runs, None)
+        reference = baseline.pop("masks", None)
+        baseline["policy"] = "float32 reference"
+        results.append(baseline)
+        for spec in args.policies:
+            row = run_policy(args.mode, device, spec, images, args.batch, args.runs, reference)
+            row.pop("masks", None)
+            if "mask_diff" in row:
+                row["within_tolerance"] = row["mask_diff"] <= args.tolerance
+            results.append(row)
+
+    for row in results:
+        label = f"{row['device']:<5} {row['policy']}"
+        if "skipped" in row:
+            print(f"⏭️  {label}: skipped ({row['skipped']})")
+            continue
+        quality = ""
+        if "mask_diff" in row:
+            quality = f"   Δalpha {row['mask_diff']:.3f}   IoU {row['iou']:.4f}   {'✅' if row['within_tolerance'] else '❌'}"
+        print(f"📊 {label}  [{row['resolved']}]  (load {row['load_s']}s){quality}")
+        for b in row["batches"]:
+            print(f"      batch {b['batch']:>2}   p50 {b['p50_ms']:>8.1f} ms   p95 {b['p95_ms']:>8.1f} ms   {b['images_per_s']:>6.2f} img/s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"mode": args.mode, "tolerance": args.tolerance, "results": results}, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
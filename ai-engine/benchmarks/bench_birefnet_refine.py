@@ -0,0 +1,139 @@
+"""
+Benchmark: coarse-to-fine BiRefNet segmentation vs. the single 1024px pass.
+
+For each image, runs the current path (whole image at 1024x1024, mask
+LANCZOS-upsampled) and coarse-to-fine (the same coarse pass plus native-
+resolution tiles along the uncertain boundary band) and reports latency,
+_score_alpha_quality and the width of the soft edge (mid-alpha pixels per
+pixel of outline; lower = crisper). Synthetic inputs
+come with a ground-truth mask, so they also get alpha MAE and IoU.
+
+Thumbnails are timed separately: the 512px input path against forcing 1024.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_birefnet_refine.py --images ~/phone-photos
+    python benchmarks/bench_birefnet_refine.py --size 4000x3000 --max-tiles 8 16 --out refine.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def synthetic_photo(width: int, height: int, seed: int):
+    """A dark product with thin parts (a handle, a strap) on a light textured background, plus its mask."""
+    rng = np.random.default_rng(seed)
+    truth = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(truth)
+    draw.ellipse((width * 0.25, height * 0.3, width * 0.75, height * 0.85), fill=255)
+    draw.rectangle((width * 0.49, height * 0.05, width * 0.51, height * 0.3), fill=255)
+    draw.line((width * 0.3, height * 0.4, width * 0.1, height * 0.1), fill=255, width=max(2, width // 400))
+    background = rng.normal(225, 8, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    product = rng.normal(60, 12, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    pixels = np.where(np.asarray(truth)[..., None] > 127, product, background)
+    return Image.fromarray(pixels), np.asarray(truth)
+
+
+def edge_softness(alpha: np.ndarray) -> float:
+    """Mid-alpha pixels per outline pixel: ~1-2 for a crisp edge, grows as the edge blurs."""
+    import cv2
+    outline = cv2.morphologyEx((alpha > 127).astype(np.uint8), cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8)).sum()
+    mid = ((alpha > 40) & (alpha < 230)).sum()
+    return round(float(mid / max(outline, 1)), 2)
+
+
+def run(service, image, refine: bool, max_tiles: int):
+    service.refine = refine
+    service.refine_max_tiles = max_tiles
+    start = time.perf_counter()
+    rgba, quality = service._segment_local([image])[0]
+    return rgba, quality, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of large photos (default: synthetic with ground truth)")
+    parser.add_argument("--count", type=int, default=4, help="Synthetic images / max photos to use")
+    parser.add_argument("--size", default="4000x3000", help="Synthetic image size (12MP by default)")
+    parser.add_argument("--mode", default=None, help="BiRefNet mode (default: this host's policy)")
+    parser.add_argument("--max-tiles", type=int, nargs="+", default=[12])
+    parser.add_argument("--thumbnail", type=int, default=400, help="Thumbnail size for the 512 vs 1024 comparison")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    from app.services import birefnet_service as module
+    service = module.BiRefNetService(args.mode)
+    service.load_model()
+    if service.model in (None, "rembg"):
+        print("⏭️  BiRefNet isn't available here (fell back to rembg); nothing to compare")
+        return
+
+    if args.images:
+        directory = os.path.expanduser(args.images)
+        names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+        inputs = [(n, Image.open(os.path.join(directory, n)).convert("RGB"), None) for n in names[:args.count]]
+    else:
+        width, _, height = args.size.partition("x")
+        inputs = [(f"synthetic-{i}", *synthetic_photo(int(width), int(height or width), i)) for i in range(args.count)]
+
+    print(f"🧪 Coarse-to-fine BiRefNet ({service.loaded_mode}, {service.backend}, {service.device}), {len(inputs)} images")
+    print("=" * 60)
+    service._segment_local([inputs[0][1]])  # warm
+    configs = [("single-pass", False, 0)] + [(f"refine x{n}", True, n) for n in args.max_tiles]
+    results = []
+    for label, refine, max_tiles in configs:
+        rows = []
+        for name, image, truth in inputs:
+            rgba, quality, elapsed = run(service, image, refine, max_tiles)
+            alpha = np.asarray(rgba.getchannel("A"))
+            row = {"image": name, "ms": round(elapsed * 1000, 1), "alpha_quality": quality, "edge_softness": edge_softness(alpha)}
+            if truth is not None:
+                fg, true_fg = alpha > 127, truth > 127
+                row["iou"] = round(float((fg & true_fg).sum() / max((fg | true_fg).sum(), 1)), 4)
+                row["alpha_mae"] = round(float(np.abs(alpha.astype(np.float32) - truth).mean() / 255.0), 4)
+            rows.append(row)
+        summary = {
+            "config": label,
+            "p50_ms": round(statistics.median(r["ms"] for r in rows), 1),
+            "edge_softness": round(statistics.mean(r["edge_softness"] for r in rows), 2),
+            "alpha_quality": round(statistics.mean(r["alpha_quality"] or 0 for r in rows), 1),
+            "images": rows,
+        }
+        if all("iou" in r for r in rows):
+            summary["iou"] = round(statistics.mean(r["iou"] for r in rows), 4)
+            summary["alpha_mae"] = round(statistics.mean(r["alpha_mae"] for r in rows), 4)
+        results.append(summary)
+        print(
+            f"📊 {label:<14} p50 {summary['p50_ms']:>8.1f} ms   edge softness {summary['edge_softness']:>6.2f}"
+            f"   quality {summary['alpha_quality']:>5.1f}"
+            + (f"   IoU {summary['iou']:.4f}   MAE {summary['alpha_mae']:.4f}" if "iou" in summary else "")
+        )
+
+    thumbnails = {}
+    if service.backend == "torch":
+        thumb = inputs[0][1].resize((args.thumbnail, args.thumbnail * inputs[0][1].height // inputs[0][1].width))
+        for size in (module.THUMBNAIL_INPUT_SIZE, module.INPUT_SIZE):
+            service._input_size = lambda image, size=size: size
+            service._segment_local([thumb])
+            start = time.perf_counter()
+            for _ in range(5):
+                service._segment_local([thumb])
+            thumbnails[size] = round((time.perf_counter() - start) / 5 * 1000, 1)
+            print(f"📊 thumbnail {thumb.width}x{thumb.height} at {size}px input: {thumbnails[size]:.1f} ms")
+        del service._input_size
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"mode": service.loaded_mode, "results": results, "thumbnail_ms": thumbnails}, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
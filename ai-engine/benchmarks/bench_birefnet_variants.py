@@ -0,0 +1,152 @@
+"""
+Benchmark: BiRefNet serving modes — quality vs. speed against massive.
+
+Loads each mode (a variant, optionally "-int8" for dynamic int8 quantization
+on CPU), runs every image through it, and reports load time, p50/p95
+latency per image and, against the reference mode's masks: the mean
+_score_alpha_quality delta, IoU of the foreground (alpha > 127) and mean
+absolute alpha difference. Use it to pick BIREFNET_CPU_MODE / BIREFNET_MODE
+for a host.
+
+Images come from --images (jpg/png/webp; use a few real listing photos) or
+are synthetic when it's omitted. Modes that fall back to rembg (no torch,
+weights unavailable) are reported as skipped.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_birefnet_variants.py --images ~/listing-photos --device cpu
+    python benchmarks/bench_birefnet_variants.py --modes massive general-lite general-lite-int8 --runs 3 --out variants.json
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MODES = ["massive", "massive-int8", "general-lite", "general-lite-int8"]
+
+
+def load_images(directory: str, limit: int):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    return [(name, Image.open(os.path.join(directory, name)).convert("RGB")) for name in names[:limit]]
+
+
+def synthetic_inputs(count: int, size: int):
+    """Plain backgrounds with an off-centre product block, varied per image."""
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", (size, size), (235 - i % 20, 235, 230))
+        block = Image.new("RGB", (size // 2, size // 3), (40 + i * 7 % 180, 60, 90))
+        image.paste(block, (size // 4 + i * 5 % 40, size // 3))
+        images.append((f"synthetic-{i}", image))
+    return images
+
+
+def run_mode(mode: str, device: str, images, runs: int):
+    """(row, alphas) for one mode; row is None if the mode didn't load."""
+    from app.services.birefnet_service import BiRefNetService
+
+    service = BiRefNetService(mode)
+    service.device = device
+    start = time.perf_counter()
+    service.load_model()
+    load_s = time.perf_counter() - start
+    if service.model in (None, "rembg"):
+        return None, None
+
+    service._segment_local([images[0][1]])  # first pass pays for allocation / kernel setup
+    latencies, qualities, alphas = [], [], []
+    for _, image in images:
+        for run in range(runs):
+            start = time.perf_counter()
+            rgba, quality = service._segment_local([image])[0]
+            latencies.append(time.perf_counter() - start)
+        qualities.append(quality)
+        alphas.append(np.asarray(rgba.getchannel("A")))
+    service.unload_model()
+    gc.collect()
+
+    ordered = sorted(latencies)
+    row = {
+        "mode": mode,
+        "loaded": service.loaded_mode or mode,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 1),
+        "alpha_quality": round(statistics.mean(q for q in qualities if q is not None), 2) if any(q is not None for q in qualities) else None,
+        "qualities": qualities,
+    }
+    return row, alphas
+
+
+def compare(row: dict, alphas, reference: dict, reference_alphas):
+    """Fill in quality deltas / mask agreement vs. the reference mode."""
+    ious, maes = [], []
+    for alpha, ref in zip(alphas, reference_alphas):
+        fg, ref_fg = alpha > 127, ref > 127
+        union = np.logical_or(fg, ref_fg).sum()
+        ious.append(np.logical_and(fg, ref_fg).sum() / union if union else 1.0)
+        maes.append(np.abs(alpha.astype(np.float32) - ref.astype(np.float32)).mean() / 255.0)
+    deltas = [q - r for q, r in zip(row["qualities"], reference["qualities"]) if q is not None and r is not None]
+    row["quality_delta"] = round(statistics.mean(deltas), 2) if deltas else None
+    row["worst_quality_delta"] = round(min(deltas), 2) if deltas else None
+    row["iou"] = round(float(statistics.mean(ious)), 4)
+    row["alpha_mae"] = round(float(statistics.mean(maes)), 4)
+    row["speedup"] = round(reference["p50_ms"] / row["p50_ms"], 2) if row["p50_ms"] else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of test photos (default: synthetic)")
+    parser.add_argument("--limit", type=int, default=20, help="Use at most this many images")
+    parser.add_argument("--size", type=int, default=1024, help="Synthetic image size")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES)
+    parser.add_argument("--reference", default="massive", help="Mode the others are compared against")
+    parser.add_argument("--device", default="cpu", help="cpu, cuda or mps (int8 modes are CPU-only)")
+    parser.add_argument("--runs", type=int, default=1, help="Timed passes per image")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    from app.services.birefnet_service import parse_mode
+    for mode in [args.reference] + args.modes:
+        parse_mode(mode)  # fail fast on typos
+
+    images = load_images(os.path.expanduser(args.images), args.limit) if args.images else synthetic_inputs(min(args.limit, 8), args.size)
+    modes = [args.reference] + [m for m in args.modes if m != args.reference]
+    print(f"🧪 BiRefNet modes on {args.device} ({len(images)} images, reference {args.reference})")
+    print("=" * 60)
+
+    results, reference, reference_alphas = [], None, None
+    for mode in modes:
+        row, alphas = run_mode(mode, args.device, images, args.runs)
+        if row is None:
+            print(f"⏭️  {mode}: not available here (fell back to rembg), skipped")
+            results.append({"mode": mode, "skipped": True})
+            continue
+        if mode == args.reference:
+            reference, reference_alphas = row, alphas
+        if reference is not None:
+            compare(row, alphas, reference, reference_alphas)
+        results.append(row)
+        print(
+            f"📊 {mode:<20} load {row['load_s']:>6.1f}s   p50 {row['p50_ms']:>8.1f} ms   p95 {row['p95_ms']:>8.1f} ms"
+            f"   quality {row['alpha_quality']}"
+            + (f" ({row['quality_delta']:+})   IoU {row['iou']:.3f}   MAE {row['alpha_mae']:.3f}   x{row['speedup']}"
+               if mode != args.reference and "iou" in row else "")
+        )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"device": args.device, "images": [name for name, _ in images], "results": results}, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
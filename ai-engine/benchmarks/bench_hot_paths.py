@@ -0,0 +1,282 @@
+"""
+Benchmark: CPU image hot paths, with a regression gate.
+
+Times the pure CPU steps every enhance / showcase / studio request goes
+through, on synthetic product photos (seeded, so every run sees the same
+pixels) at 512, 1024, 2048 and 4032 px:
+
+    enhance.enhance_product           CLAHE / denoise / sharpen, JPEG in and out
+    birefnet.cleanup_mask             largest-component mask cleanup
+    birefnet.score_alpha_quality      cutout confidence score
+    compositing.place_on_white        RGBA product onto a white canvas
+    compositing.add_drop_shadow       shadow from the non-white pixels
+    showcase.gradient_bg              background gradient
+    showcase.create_shadow            blurred alpha shadow
+    upscale.pillow_2x                 UpscaleService.enhance on the Pillow path
+    lbm.numpy_lighting                procedural relighting fallback
+
+Nothing touches the network or loads a model: the upscaler is pinned to its
+Pillow fallback and LBM is built without its pipeline. A case whose module
+can't be imported here (e.g. LBM without torch) is reported as skipped.
+
+Results (median / p95 / min ms per case and size, plus library versions) go
+to --out. A case that raises fails the run. With --baseline, the run exits 1 when any case's median is more
+than --max-regression percent slower than the baseline's; override single
+cases with --threshold CASE=PCT. Compare baselines from the same machine.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_hot_paths.py --out hot_paths.json
+    python benchmarks/bench_hot_paths.py --baseline hot_paths.json --max-regression 15
+    python benchmarks/bench_hot_paths.py --sizes 512 1024 --cases showcase. compositing.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+SIZES = [512, 1024, 2048, 4032]
+
+
+class Inputs:
+    """Synthetic product photo at one size: textured product on a soft backdrop, with its alpha."""
+
+    def __init__(self, size: int, seed: int):
+        rng = np.random.default_rng(seed + size)
+        height = size * 3 // 4  # phone-camera aspect
+
+        # Backdrop: vertical gradient + sensor noise
+        ramp = np.linspace(225, 190, height, dtype=np.float32)[:, None, None]
+        backdrop = np.broadcast_to(ramp, (height, size, 3)) + rng.normal(0, 4, (height, size, 3))
+
+        # Product: ellipse + neck, a stray fragment (a "hand") for the cleanup pass
+        alpha = Image.new("L", (size, height), 0)
+        draw = ImageDraw.Draw(alpha)
+        draw.ellipse((size * 0.30, height * 0.30, size * 0.70, height * 0.90), fill=255)
+        draw.rectangle((size * 0.47, height * 0.08, size * 0.53, height * 0.35), fill=255)
+        draw.ellipse((size * 0.82, height * 0.75, size * 0.90, height * 0.85), fill=160)
+        alpha = alpha.filter(ImageFilter.GaussianBlur(radius=max(1, size // 256)))
+        alpha_np = np.asarray(alpha, dtype=np.float32)[..., None] / 255.0
+
+        texture = np.array([70, 45, 30], np.float32) + rng.normal(0, 12, (height, size, 3))
+        pixels = backdrop * (1 - alpha_np) + texture * alpha_np
+        self.rgb = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+        self.alpha = alpha
+        self.rgba = self.rgb.copy()
+        self.rgba.putalpha(alpha)
+
+        buffer = io.BytesIO()
+        self.rgb.save(buffer, format="JPEG", quality=92)
+        self.jpeg = buffer.getvalue()
+
+        # Product already on white (what add_drop_shadow gets in the pipelines)
+        self.on_white = Image.new("RGB", self.rgb.size, (255, 255, 255))
+        self.on_white.paste(self.rgb, (0, 0), alpha)
+
+
+def build_cases() -> dict:
+    """case name -> (setup() -> fn(inputs)) ; setup raises ImportError when unavailable."""
+
+    def enhance():
+        from app.services.enhance_service import EnhanceService
+        service = EnhanceService()
+        return lambda inp: service.enhance_product(inp.jpeg)
+
+    def cleanup_mask():
+        from app.services.birefnet_service import birefnet_service
+        return lambda inp: birefnet_service._cleanup_mask(inp.alpha)
+
+    def score_alpha():
+        from app.services.birefnet_service import birefnet_service
+        return lambda inp: birefnet_service._score_alpha_quality(inp.rgba)
+
+    def place_on_white():
+        from app.services.compositing_service import compositing_service
+        return lambda inp: compositing_service.place_on_white_background(inp.rgba, background_size=inp.rgb.size)
+
+    def drop_shadow():
+        from app.services.compositing_service import compositing_service
+        return lambda inp: compositing_service.add_drop_shadow(inp.on_white)
+
+    def gradient_bg():
+        from app.services.showcase_service import showcase_service
+        return lambda inp: showcase_service._create_gradient_bg(inp.rgb.size)
+
+    def create_shadow():
+        from app.services.showcase_service import showcase_service
+        return lambda inp: showcase_service._create_shadow(inp.rgba, inp.rgb.size)
+
+    def upscale():
+        from app.services.model_host import model_host_client
+        from app.services.upscale_service import upscale_service
+        model_host_client.enabled = False
+        upscale_service._initialized = True  # skip loading Real-ESRGAN: Pillow path only
+        upscale_service._upsampler = None
+        return lambda inp: upscale_service.enhance(inp.rgb, scale=2)
+
+    def lbm_lighting():
+        from app.services.lbm_relighting_service import LBMRelightingService
+        service = LBMRelightingService.__new__(LBMRelightingService)  # no device / pipeline setup
+        params = service._get_lighting_params("soft_studio", 1.0)
+        return lambda inp: service._apply_numpy_lighting(inp.rgb, inp.alpha, params)
+
+    return {
+        "enhance.enhance_product": enhance,
+        "birefnet.cleanup_mask": cleanup_mask,
+        "birefnet.score_alpha_quality": score_alpha,
+        "compositing.place_on_white": place_on_white,
+        "compositing.add_drop_shadow": drop_shadow,
+        "showcase.gradient_bg": gradient_bg,
+        "showcase.create_shadow": create_shadow,
+        "upscale.pillow_2x": upscale,
+        "lbm.numpy_lighting": lbm_lighting,
+    }
+
+
+def time_case(fn, inputs: Inputs, repeat: int, warmup: int, budget_s: float) -> dict:
+    """Up to `repeat` timed runs; stops early (after at least 3) once budget_s is spent."""
+    for _ in range(warmup):
+        fn(inputs)
+    samples = []
+    began = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(inputs)
+        samples.append((time.perf_counter() - start) * 1000)
+        if len(samples) >= 3 and time.perf_counter() - began > budget_s:
+            break
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[math.ceil(0.95 * len(samples)) - 1], 3),  # nearest rank
+        "min_ms": round(samples[0], 3),
+        "runs": len(samples),
+    }
+
+
+def environment() -> dict:
+    import PIL
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+    }
+    try:
+        import cv2
+        info["opencv"] = cv2.__version__
+        info["opencv_threads"] = cv2.getNumThreads()
+    except ImportError:
+        pass
+    return info
+
+
+def find_regressions(results: dict, baseline: dict, max_regression: float, thresholds: dict) -> list:
+    regressions = []
+    for case, sizes in results["cases"].items():
+        allowed = thresholds.get(case, max_regression)
+        for size, row in sizes.items():
+            before = baseline.get("cases", {}).get(case, {}).get(size)
+            if not before or "median_ms" not in before or "median_ms" not in row:
+                continue
+            change = (row["median_ms"] - before["median_ms"]) / before["median_ms"] * 100
+            row["vs_baseline_pct"] = round(change, 1)
+            if change > allowed:
+                regressions.append((case, size, before["median_ms"], row["median_ms"], change, allowed))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Long-side sizes in px")
+    parser.add_argument("--cases", nargs="+", help="Only cases starting with any of these prefixes")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per case and size")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--budget-s", type=float, default=30.0, help="Per case and size; slow cases stop after 3 runs")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--threads", type=int, default=0, help="Pin OpenCV threads (0 = library default)")
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=15.0, help="Allowed median slowdown in percent")
+    parser.add_argument("--threshold", action="append", default=[], metavar="CASE=PCT",
+                        help="Per-case override of --max-regression (repeatable)")
+    args = parser.parse_args()
+
+    thresholds = {}
+    for item in args.threshold:
+        case, _, pct = item.partition("=")
+        thresholds[case] = float(pct)
+    if args.threads:
+        import cv2
+        cv2.setNumThreads(args.threads)
+
+    cases = build_cases()
+    if args.cases:
+        cases = {name: setup for name, setup in cases.items() if any(name.startswith(p) for p in args.cases)}
+
+    print(f"🧪 CPU hot paths ({', '.join(str(s) for s in args.sizes)} px, {args.repeat} runs)")
+    print("=" * 60)
+    results = {"environment": environment(), "settings": {"repeat": args.repeat, "warmup": args.warmup, "budget_s": args.budget_s, "seed": args.seed}, "cases": {}, "skipped": {}, "errors": {}}
+
+    functions = {}
+    for name, setup in cases.items():
+        try:
+            functions[name] = setup()
+        except ImportError as e:
+            results["skipped"][name] = f"{type(e).__name__}: {e}"
+            print(f"⏭️  {name}: skipped ({e})")
+
+    for size in args.sizes:
+        inputs = Inputs(size, args.seed)
+        for name, fn in functions.items():
+            try:
+                row = time_case(fn, inputs, args.repeat, args.warmup, args.budget_s)
+            except Exception as e:
+                results["errors"][f"{name}@{size}"] = f"{type(e).__name__}: {e}"
+                print(f"❌ {name:<30} {size:>5}px   {type(e).__name__}: {e}")
+                continue
+            results["cases"].setdefault(name, {})[str(size)] = row
+            print(f"📊 {name:<30} {size:>5}px   median {row['median_ms']:>9.2f} ms   p95 {row['p95_ms']:>9.2f} ms")
+        del inputs
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression, thresholds)
+        results["regressions"] = [
+            {"case": case, "size": size, "baseline_ms": before, "median_ms": now, "change_pct": round(change, 1), "allowed_pct": allowed}
+            for case, size, before, now, change, allowed in regressions
+        ]
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+    if results["errors"]:
+        print(f"\n❌ {len(results['errors'])} case(s) raised: {', '.join(results['errors'])}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) vs. {args.baseline}:")
+        for case, size, before, now, change, allowed in regressions:
+            print(f"   {case} @ {size}px: {before:.2f} → {now:.2f} ms (+{change:.1f}% > {allowed:.0f}%)")
+    if regressions or results["errors"]:
+        sys.exit(1)
+    if args.baseline:
+        print(f"\n✅ No regressions vs. {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
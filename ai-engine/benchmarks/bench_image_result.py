@@ -0,0 +1,153 @@
+"""
+Benchmark: data-URI round trips vs ImageResult raw bytes.
+
+Replays the per-request byte shuffling that the studio routes used to do
+(encode → base64 → data URI → split → b64decode) against the ImageResult path
+(encode once, send bytes) on synthetic photos, and reports bytes copied and
+CPU time per request.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_image_result.py --sizes 1024 2048 --iterations 20 --out results.json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image
+
+from app.utils.image_result import ImageResult
+
+
+def synthetic_photo(size: int) -> Image.Image:
+    """Noisy gradient with a product-ish blob — compresses like a real photo."""
+    rng = np.random.default_rng(size)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = np.stack([200 - 60 * y, 190 - 40 * x, 180 + 30 * y * x], axis=-1)
+    blob = ((x - 0.5) ** 2 + (y - 0.55) ** 2) < 0.08
+    base[blob] = [40, 60, 90]
+    base += rng.normal(0, 6, base.shape)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+
+# --- Legacy paths (what the services + routers did before) ---
+
+def legacy_send_binary(image: Image.Image) -> dict:
+    """Service: JPEG + base64 data URI. Router: split + b64decode."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    encoded = buffer.getvalue()
+    b64 = base64.b64encode(encoded).decode()
+    uri = f"data:image/jpeg;base64,{b64}"
+    payload = base64.b64decode(uri.split(",")[1])
+    return {"out": len(payload), "copied": len(encoded) + len(b64) * 2 + len(uri) + len(payload)}
+
+
+def legacy_upscale_hop(image: Image.Image) -> dict:
+    """Showcase → upscale → showcase: PNG encode, decode, JPEG + base64, decode, decode."""
+    fg_buffer = io.BytesIO()
+    image.save(fg_buffer, format="PNG")
+    png = fg_buffer.getvalue()
+    img = Image.open(io.BytesIO(png)).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    jpeg = buffer.getvalue()
+    uri = f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode()}"
+    raw = base64.b64decode(uri.split(",", 1)[1])
+    back = Image.open(io.BytesIO(raw)).convert("RGB")
+    pixels = back.width * back.height * 3
+    return {"out": pixels, "copied": len(png) + pixels * 2 + len(jpeg) + len(uri) * 2 + len(raw)}
+
+
+def legacy_stock_passthrough(data: bytes) -> dict:
+    b64 = base64.b64encode(data).decode("utf-8")
+    uri = f"data:image/jpeg;base64,{b64}"
+    b64_str = uri.split(",")[1]
+    payload = base64.b64decode(b64_str)
+    return {"out": len(payload), "copied": len(b64) + len(uri) + len(b64_str) + len(payload)}
+
+
+# --- ImageResult paths ---
+
+def new_send_binary(image: Image.Image) -> dict:
+    data = ImageResult.from_pil(image, format="JPEG", quality=95).data
+    return {"out": len(data), "copied": len(data)}
+
+
+def new_upscale_hop(image: Image.Image) -> dict:
+    back = ImageResult.from_pil(image).to_pil()
+    return {"out": back.width * back.height * 3, "copied": 0}
+
+
+def new_stock_passthrough(data: bytes) -> dict:
+    payload = ImageResult.from_bytes(data).data
+    return {"out": len(payload), "copied": 0}
+
+
+def measure(fn, arg, iterations: int) -> dict:
+    fn(arg)  # warm caches / codecs
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    copied = 0
+    for _ in range(iterations):
+        copied += fn(arg)["copied"]
+    return {
+        "cpu_ms": round((time.process_time() - cpu_start) * 1000 / iterations, 3),
+        "wall_ms": round((time.perf_counter() - wall_start) * 1000 / iterations, 3),
+        "bytes_copied": copied // iterations,
+    }
+
+
+def run(sizes, iterations: int) -> list:
+    results = []
+    for size in sizes:
+        image = synthetic_photo(size)
+        stock_bytes = ImageResult.from_pil(image).data
+        cases = [
+            ("binary_response", legacy_send_binary, new_send_binary, image),
+            ("showcase_upscale_hop", legacy_upscale_hop, new_upscale_hop, image),
+            ("stock_passthrough", legacy_stock_passthrough, new_stock_passthrough, stock_bytes),
+        ]
+        for name, legacy_fn, new_fn, arg in cases:
+            legacy = measure(legacy_fn, arg, iterations)
+            new = measure(new_fn, arg, iterations)
+            row = {
+                "case": name,
+                "size": size,
+                "legacy": legacy,
+                "image_result": new,
+                "cpu_ms_saved": round(legacy["cpu_ms"] - new["cpu_ms"], 3),
+                "bytes_saved": legacy["bytes_copied"] - new["bytes_copied"],
+            }
+            results.append(row)
+            print(
+                f"📊 {name:<22} {size:>5}px  cpu {legacy['cpu_ms']:>8.2f} → {new['cpu_ms']:>8.2f} ms"
+                f"   copied {legacy['bytes_copied'] / 1e6:>7.2f} → {new['bytes_copied'] / 1e6:>7.2f} MB"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    print("🧪 ImageResult vs data-URI round trip")
+    print("=" * 60)
+    results = run(args.sizes, args.iterations)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
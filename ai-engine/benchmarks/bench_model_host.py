@@ -0,0 +1,205 @@
+"""
+Benchmark: shared model host vs. models loaded in every worker.
+
+Starts N worker processes that each fire --requests segmentation calls (one at
+a time, like one worker's GPU lane), either
+- in-process: every worker loads its own model, or
+- host:       one model host process owns the model; workers send pixels
+              over shared memory and the host batches across workers,
+and reports throughput, p50/p95 latency, host batch sizes and the summed
+memory (PSS) of all processes. Run with --workers 1 4 to compare 1 vs. N.
+
+Runs the real model when torch + BiRefNet are available. --simulate uses a
+cost model (fixed per-pass overhead + per-image cost, one shared "device"
+lock, MODEL_MB of resident weights per loaded copy) so the transport and
+memory effect can be measured without a GPU.
+
+Usage (from ai-engine/):
+    python benchmarks/bench_model_host.py --workers 1 4 --requests 16
+    python benchmarks/bench_model_host.py --workers 1 2 4 --simulate 120,35,400 --out host.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import psutil
+from PIL import Image
+
+
+def synthetic_image(index: int, size: int) -> Image.Image:
+    image = Image.new("RGB", (size, size), (235 - index % 20, 235, 230))
+    block = Image.new("RGB", (size // 2, size // 3), (40 + index * 7 % 180, 60, 90))
+    image.paste(block, (size // 4, size // 3))
+    return image
+
+
+def memory_mb(proc: psutil.Process) -> float:
+    """PSS where available, so shared-memory rings aren't counted once per process."""
+    try:
+        return proc.memory_full_info().pss / (1024 * 1024)
+    except (AttributeError, psutil.AccessDenied):
+        return proc.memory_info().rss / (1024 * 1024)
+
+
+def install_simulated_model(simulate: str, device_lock):
+    """One pass = fixed + n * per_image while holding the shared device lock."""
+    from app.services.birefnet_service import birefnet_service
+
+    fixed_ms, per_image_ms, model_mb = (float(v) for v in simulate.split(","))
+
+    def segment_local(images):
+        if birefnet_service.model is None:
+            # "Load" on first local use; touched, so it counts as resident
+            birefnet_service.model = np.ones(int(model_mb * 1024 * 1024), np.uint8)
+        with device_lock:
+            time.sleep((fixed_ms + per_image_ms * len(images)) / 1000.0)
+        images = [item.pil if hasattr(item, "pil") else item for item in images]
+        return [(image.convert("RGBA"), 100.0) for image in images]
+
+    def segment_batch(images):
+        from app.services.model_host import ModelHostUnavailable, model_host_client
+        if model_host_client.enabled:
+            try:
+                return birefnet_service._segment_remote(images)
+            except ModelHostUnavailable as e:
+                print(f"⚠️ Host unavailable in benchmark: {e}")
+        return segment_local(images)
+
+    birefnet_service.segment_batch = segment_batch
+
+
+def run_host(address: str, window_ms: float, max_batch: int, simulate, device_lock, ready):
+    from app.services.model_host import ModelHost
+
+    host = ModelHost(address, b"bench", window_ms / 1000.0, max_batch)
+    if simulate:
+        install_simulated_model(simulate, device_lock)
+    else:
+        host.preload(["birefnet"])
+    ready.set()
+    host.serve_forever()
+
+
+def run_worker(index: int, address, requests: int, size: int, simulate, device_lock, start, results):
+    from app.services.birefnet_service import birefnet_service
+    from app.services.model_host import model_host_client
+
+    model_host_client.address = address or ""
+    model_host_client.authkey = b"bench"
+    model_host_client.enabled = bool(address)
+    if simulate:
+        install_simulated_model(simulate, device_lock)
+
+    images = [synthetic_image(index * requests + i, size) for i in range(requests)]
+    birefnet_service.segment_batch(images[:1])  # load / connect before the clock starts
+    start.wait()
+
+    latencies = []
+    for image in images:
+        began = time.perf_counter()
+        birefnet_service.segment_batch([image])
+        latencies.append(time.perf_counter() - began)
+    results.put({
+        "latencies": latencies,
+        "memory_mb": memory_mb(psutil.Process()),
+        "host_batches": dict(model_host_client.host_batch_sizes),
+    })
+
+
+def run_config(args, workers: int, use_host: bool) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    device_lock = ctx.Lock()
+    start, results = ctx.Event(), ctx.Queue()
+    address = os.path.join(tempfile.mkdtemp(prefix="model-host-"), "host.sock") if use_host else None
+
+    host = None
+    if use_host:
+        ready = ctx.Event()
+        host = ctx.Process(
+            target=run_host,
+            args=(address, args.window_ms, args.max_batch, args.simulate, device_lock, ready),
+            daemon=True,
+        )
+        host.start()
+        ready.wait()
+        while not os.path.exists(address):
+            time.sleep(0.05)
+
+    procs = [
+        ctx.Process(target=run_worker, args=(i, address, args.requests, args.size, args.simulate, device_lock, start, results))
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    time.sleep(args.settle_s)  # let every worker load/connect
+
+    began = time.perf_counter()
+    start.set()
+    rows = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - began
+    for proc in procs:
+        proc.join()
+
+    memory = sum(row["memory_mb"] for row in rows)
+    if host is not None:
+        memory += memory_mb(psutil.Process(host.pid))
+        host.terminate()
+        host.join()
+
+    latencies = sorted(v for row in rows for v in row["latencies"])
+    batches = {}
+    for row in rows:
+        for size, count in row["host_batches"].items():
+            batches[str(size)] = batches.get(str(size), 0) + count
+    return {
+        "mode": "host" if use_host else "in-process",
+        "workers": workers,
+        "throughput_ips": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[math.ceil(0.95 * len(latencies)) - 1] * 1000, 1),
+        "total_memory_mb": round(memory, 1),
+        "per_worker_mb": [round(row["memory_mb"], 1) for row in rows],
+        "host_batch_size_histogram": dict(sorted(batches.items(), key=lambda kv: int(kv[0]))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Worker counts to compare")
+    parser.add_argument("--requests", type=int, default=16, help="Sequential requests per worker")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--window-ms", type=float, default=10.0, help="Host batching window")
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--settle-s", type=float, default=2.0, help="Wait for workers to load before timing")
+    parser.add_argument("--simulate", help="FIXED_MS,PER_IMAGE_MS,MODEL_MB cost model instead of the real model")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    print(f"🧪 Model host vs. in-process ({args.size}px, {'simulated' if args.simulate else 'real model'})")
+    print("=" * 60)
+    results = []
+    for workers in args.workers:
+        for use_host in (False, True):
+            row = run_config(args, workers, use_host)
+            results.append(row)
+            print(
+                f"📊 {row['mode']:<10} x{workers:<2} {row['throughput_ips']:>7.2f} img/s   p50 {row['p50_ms']:>8.1f} ms"
+                f"   p95 {row['p95_ms']:>8.1f} ms   mem {row['total_memory_mb']:>8.1f} MB   batches {row['host_batch_size_histogram']}"
+            )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
+import sys
+
+if __name__ == "__main__" and "--profile-startup" in sys.argv:
+    # Before anything heavy is imported: the profile runs in fresh interpreters
+    from app.utils.startup_profile import main as profile_startup
+    sys.exit(profile_startup(sys.argv[1:]))
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings, DeviceConfig
@@ -36,6 +43,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+from fastapi.responses import JSONResponse
+from app.services.service_registry import ServiceUnavailable
+
+@app.exception_handler(ServiceUnavailable)
+async def service_unavailable(request, exc: ServiceUnavailable):
+    """A lazily imported service that can't load here (e.g. no torch on a CPU deploy)."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 from app.routers import studio
 
 from app.routers import brain
@@ -45,6 +60,46 @@ print("🧠 Brain router loaded (Graceful fallback active)")
 
 app.include_router(studio.router, prefix="/api/v1/studio", tags=["studio"])
 
+from app.routers import jobs
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
+
+_ADMITTED_PREFIXES = (f"{settings.API_V1_STR}/studio", f"{settings.API_V1_STR}/brain")
+
+@app.middleware("http")
+async def admit_under_memory_pressure(request, call_next):
+    """Queue or shed new model work when memory is tight instead of getting OOM-killed mid-request."""
+    if request.method == "POST" and request.url.path.startswith(_ADMITTED_PREFIXES):
+        from app.services.admission_control import Overloaded, admission_controller
+        try:
+            await admission_controller.admit(request.url.path)
+        except Overloaded as e:
+            return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    return await call_next(request)
+
+@app.middleware("http")
+async def report_queue_wait(request, call_next):
+    """Surface time spent waiting on the inference executor for this request."""
+    from app.services.inference_executor import track_calls
+    from app.services.metrics import metrics
+    from app.services.tracing import tracer
+    start = time.perf_counter()
+    with tracer.trace(f"{request.method} {request.url.path}", debug_id=request.headers.get("x-debug-id")) as trace:
+        with track_calls() as calls:
+            response = await call_next(request)
+        # Route template, not the raw path, so ids don't explode the label set
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        tracer.annotate(route=route, status=response.status_code)
+    response.headers["X-Trace-Id"] = trace.trace_id
+    if metrics.enabled:
+        metrics.observe(
+            "http_request_duration_seconds", time.perf_counter() - start,
+            route=route, method=request.method, status=response.status_code
+        )
+    if calls:
+        response.headers["X-Queue-Wait-Ms"] = str(round(sum(c["queue_wait_s"] for c in calls) * 1000))
+        response.headers["X-Inference-Ms"] = str(round(sum(c["run_s"] for c in calls) * 1000))
+    return response
+
 # Serve Static Files (Playground / Outputs)
 from fastapi.staticfiles import StaticFiles
 import os
@@ -78,21 +133,22 @@ async def startup_event():
     
     asyncio.create_task(self_ping())
 
-    # Warm up the rembg u2netp session so the first real request doesn't pay the load cost
-    async def warmup_rembg():
-        await asyncio.sleep(30)  # let uvicorn fully start + give slack for slow machines
-        try:
-            from starlette.concurrency import run_in_threadpool
-            from app.services.birefnet_service import birefnet_service
-            from PIL import Image
-            # Use a realistic size so onnxruntime JIT-compiles at the right input shape
-            warmup_img = Image.new("RGB", (512, 512), (128, 128, 128))
-            await run_in_threadpool(birefnet_service._rembg_remove, warmup_img)
-            print("🚀 rembg u2netp session warmed up")
-        except Exception as e:
-            print(f"⚠️ rembg warmup failed (non-fatal): {e}")
-
-    asyncio.create_task(warmup_rembg())
+    # Load and exercise the WARMUP_PLAN models; /ready reports 503 until done
+    from app.services.warmup_service import warmup_service
+    warmup_service.start()
+
+    # Async job workers (one per GPU/CPU slot)
+    from app.services.job_service import job_service
+    await job_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.services.job_service import job_service
+    from app.services.inference_executor import inference_executor
+    from app.services.model_host import model_host_client
+    await job_service.stop()
+    inference_executor.shutdown()
+    model_host_client.close()
 
 @app.get("/")
 def read_root():
@@ -106,3 +162,18 @@ def read_root():
 def health_check():
     return {"status": "healthy", "timestamp": time.time()}
 
+@app.get("/ready")
+def readiness_check():
+    """503 until the startup warmup plan has run, so traffic never hits a cold model."""
+    from app.services.warmup_service import warmup_service
+    stats = warmup_service.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    from fastapi.responses import PlainTextResponse
+    from app.services.metrics import metrics
+    if not metrics.enabled:
+        return PlainTextResponse("metrics disabled (METRICS_ENABLED=0)\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
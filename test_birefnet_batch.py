@@ -19,8 +19,9 @@ def process_all_images():
     from app.services.birefnet_service import birefnet_service
     
     # Find all test images
-    test_dir = "/Users/badenath/Downloads/test"
-    output_dir = "/Users/badenath/Documents/travel website/marketplace/ai-engine/static/birefnet_gallery"
+    # Input folder: first CLI arg, else BIREFNET_TEST_DIR, else ./test
+    test_dir = sys.argv[1] if len(sys.argv) > 1 else os.getenv("BIREFNET_TEST_DIR", "test")
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai-engine", "static", "birefnet_gallery")
     os.makedirs(output_dir, exist_ok=True)
     
     # Get all image files